@@ -0,0 +1,164 @@
+# async_runtime.py
+#
+# Alternative runtime: the control loop and its I/O as cooperating asyncio
+# tasks on one thread, instead of LiDAR / controller / telemetry / config
+# threads around a blocking, paced main loop (ControlLoop.run()).
+#
+#   lidar      - the TF-Luna's file descriptor (and any other range
+#                sensor's, sensors.py) registered with loop.add_reader()
+#                (what pyserial-asyncio does underneath); ports without a
+#                fileno() are polled every LIDAR_POLL_SEC
+#   controller - ControllerInput.poll(0) every CTRL_POLL_SEC
+#   control    - ControlLoop.tick() on the LoopScheduler's deadlines,
+#                waiting with asyncio.sleep() instead of blocking
+#   telemetry  - TelemetryRecorder.flush() every flush_sec
+#   config     - ConfigService.poll() every poll_sec (with a config file)
+#
+# The tasks run under one supervisor. When the control task finishes its
+# ticks/seconds, a task fails, or the run is cancelled (Ctrl-C under
+# asyncio.run()), every other task is cancelled and awaited, then
+# ControlLoop.shutdown() runs. A failing task stops the motors itself before
+# anything else is cancelled, and the supervisor stops them again, so the
+# car never keeps driving on a dead loop.
+#
+# Needs a real clock (hal.Clock); the simulator's virtual time is driven by
+# ControlLoop.tick() directly.
+#
+# Usage:
+#   RUNTIME = "asyncio" in the control script (or its config file), or
+#   python async_runtime.py
+
+import asyncio
+
+import rc_car_modes_bluetooth_fix_good as car
+
+LIDAR_POLL_SEC = 0.002      # ports without a file descriptor
+CTRL_POLL_SEC = 0.005
+
+
+def stop_motors():
+    """Stop the motors if they were brought up."""
+    if car.motor_out is not None:
+        car.stop_motors()
+
+
+class AsyncRuntime:
+    def __init__(self, loop, lidar_poll_sec=LIDAR_POLL_SEC, ctrl_poll_sec=CTRL_POLL_SEC):
+        self.loop = loop            # a ControlLoop, not started yet
+        self.lidar_poll_sec = lidar_poll_sec
+        self.ctrl_poll_sec = ctrl_poll_sec
+        self.ticks = 0
+
+    async def run(self, ticks=None, seconds=None):
+        """start(), run the tasks until the control task is done or one fails, shutdown()."""
+        cl = self.loop
+        aio = asyncio.get_running_loop()
+        try:
+            await aio.run_in_executor(None, cl.start, "tasks")
+            jobs = [("control", self.control(ticks, seconds)),
+                    ("lidar", self.lidar()),
+                    ("controller", self.controller())]
+            if cl.telemetry is not None:
+                jobs.append(("telemetry", self.telemetry()))
+            if cl.config.path is not None:
+                jobs.append(("config", self.config()))
+            tasks = [aio.create_task(self._guard(name, coro), name=name) for name, coro in jobs]
+            await self._supervise(tasks)
+        finally:
+            stop_motors()
+            cl.shutdown()
+        return self.ticks
+
+    async def _guard(self, name, coro):
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            stop_motors()       # now, before the other tasks are even cancelled
+            self.loop.log(f"[ASYNC] {name} task failed: {e!r} -> MOTORS STOPPED")
+            raise
+
+    async def _supervise(self, tasks):
+        """Wait for the first task to end; cancel and await the rest; re-raise a failure."""
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for t in done:
+            if not t.cancelled() and t.exception() is not None:
+                raise t.exception()
+
+    # ---- tasks ----
+    async def control(self, ticks, seconds):
+        cl = self.loop
+        sched = cl.sched
+        clock = cl.clock
+        sched.start()
+        end = clock.monotonic() + seconds if seconds is not None else None
+        while (ticks is None or self.ticks < ticks) and (end is None or clock.monotonic() < end):
+            # Even when late, yield once so the I/O tasks get in between ticks
+            await asyncio.sleep(max(0.0, sched.delay()))
+            sched.begin()
+            cl.tick()
+            sched.done()
+            self.ticks += 1
+
+    async def lidar(self):
+        cl = self.loop
+        await asyncio.wrap_future(cl.bringup.futures["lidar"])     # start() doesn't wait for it
+        ser, parser, clock = cl.lidar_ser, cl.lidar_parser, cl.clock
+        sensors = cl.sensors
+        fileno = getattr(ser, "fileno", None)
+        fds = [fileno()] + [s.fileno() for s in sensors.sensors] if fileno is not None else [None]
+        if None in fds:
+            while True:
+                if ser.in_waiting:
+                    car.lidar_poll(ser, parser, clock)
+                sensors.poll(clock.monotonic())
+                await asyncio.sleep(self.lidar_poll_sec)
+
+        # The other range sensors' ports wake the same task
+        aio = asyncio.get_running_loop()
+        readable = asyncio.Event()
+        for fd in fds:
+            aio.add_reader(fd, readable.set)
+        try:
+            while True:
+                await readable.wait()
+                readable.clear()
+                if ser.in_waiting:      # never block in read(): only what has arrived
+                    car.lidar_poll(ser, parser, clock)
+                sensors.poll(clock.monotonic())
+        finally:
+            for fd in fds:
+                aio.remove_reader(fd)
+
+    async def controller(self):
+        inp = self.loop.input
+        while True:
+            inp.poll(0.0)
+            await asyncio.sleep(self.ctrl_poll_sec)
+
+    async def telemetry(self):
+        rec = self.loop.telemetry
+        while True:
+            await asyncio.sleep(rec.flush_sec)
+            rec.flush()
+
+    async def config(self):
+        config = self.loop.config
+        while True:
+            await asyncio.sleep(config.poll_sec)
+            config.poll()
+
+
+def run(loop, ticks=None, seconds=None):
+    """Run a ControlLoop on the asyncio runtime (blocking); returns the ticks run."""
+    return asyncio.run(AsyncRuntime(loop).run(ticks, seconds))
+
+
+if __name__ == "__main__":
+    car.main(runtime="asyncio")
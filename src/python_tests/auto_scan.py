@@ -0,0 +1,132 @@
+# auto_scan.py
+#
+# Scan-then-choose helper for the "scan" AUTO strategy.
+#
+# The TF-Luna only looks straight ahead, so to see around itself the car
+# spins in place once. Every LiDAR sample of the spin is kept with the
+# (dead-reckoned) heading it was taken at, interpolated between ticks by its
+# timestamp. When the turn is complete the samples are folded into an
+# angular histogram of `sectors` candidate directions:
+#
+#   clearance[i] - how far the car could drive along sector i's centre line:
+#                  the nearest sample inside a corridor half_width_cm either
+#                  side of it (widening by `spread` per cm for heading error),
+#                  from any direction, so a wall running alongside counts and
+#                  not just what is straight ahead. The `outliers` nearest
+#                  hits are ignored (TF-Luna spikes); unseen sectors are 0.
+#   choose()     - the sector with the best clearance (capped, so "far" vs
+#                  "farther" doesn't matter), times an optional weight per
+#                  sector, e.g. how much floor that way the car hasn't
+#                  driven over yet (Footprint.unvisited())
+#
+# Headings are radians CCW, in the same frame as odometry.DeadReckoning.
+
+import math
+
+import numpy as np
+
+TWO_PI = 2.0 * math.pi
+
+
+def wrap_angle(a):
+    """Angle in (-pi, pi]."""
+    return math.atan2(math.sin(a), math.cos(a))
+
+
+class SectorScan:
+    def __init__(self, sectors=16, capacity=1024):
+        self.sectors = sectors
+        self.width = TWO_PI / sectors
+        self.angles = np.zeros(capacity)    # relative to the start heading
+        self.dists = np.zeros(capacity)
+        self.reset(0.0, 0.0)
+
+    def reset(self, t, heading):
+        self.start = heading
+        self.last = heading
+        self.last_t = t
+        self.turned = 0.0       # signed rotation since reset, radians
+        self.count = 0
+
+    def add(self, t, heading, ts, dists):
+        """Heading at time t, plus the samples (times ts, cm) since the last add()."""
+        step = wrap_angle(heading - self.last)
+        rel = self.turned
+        dt = t - self.last_t
+        self.turned += step
+        self.last = heading
+        self.last_t = t
+        keep = dists > 0
+        n = min(int(np.count_nonzero(keep)), len(self.dists) - self.count)
+        if n <= 0:
+            return
+        frac = np.clip((ts[keep][:n] - (t - dt)) / dt, 0.0, 1.0) if dt > 0 else 1.0
+        i = self.count
+        self.angles[i:i + n] = rel + step * frac
+        self.dists[i:i + n] = dists[keep][:n]
+        self.count += n
+
+    def headings(self):
+        """Centre heading of every sector, in the odometry frame."""
+        return self.start + (np.arange(self.sectors) + 0.5) * self.width
+
+    def clearance(self, half_width_cm, spread=0.0, outliers=2):
+        """Free distance (cm) along every sector's centre line (see above)."""
+        n = self.count
+        if n <= outliers:
+            return np.zeros(self.sectors)
+        paths = (np.arange(self.sectors) + 0.5) * self.width
+        delta = self.angles[:n][None, :] - paths[:, None]          # [sector, sample]
+        d = self.dists[:n][None, :]
+        along = d * np.cos(delta)
+        side = np.abs(d * np.sin(delta))
+        hit = (along > 0) & (side < half_width_cm + along * spread)
+        clear = np.partition(np.where(hit, along, np.inf), outliers, axis=1)[:, outliers]
+        # A direction nobody looked at is not open
+        seen = (np.abs(np.cos(delta)) > math.cos(0.5 * self.width)) & (np.cos(delta) > 0)
+        clear[~seen.any(axis=1)] = 0.0
+        return clear
+
+    def choose(self, clear, cap_cm, weights=None):
+        """(heading, clearance_cm) of the most open sector, or None if nothing was seen."""
+        score = np.minimum(clear, cap_cm)
+        if weights is not None:
+            score = score * weights
+        i = int(np.argmax(score))
+        if score[i] <= 0:
+            return None
+        return wrap_angle(float(self.headings()[i])), float(clear[i])
+
+
+class Footprint:
+    """Floor the car has driven over: a set of cell_cm squares (dead-reckoned)."""
+
+    def __init__(self, cell_cm=20.0):
+        self.cell = float(cell_cm)
+        self.cells = set()
+
+    def reset(self):
+        self.cells.clear()
+
+    def mark(self, x, y):
+        self.cells.add((int(x // self.cell), int(y // self.cell)))
+
+    def unvisited(self, x, y, headings, reach_cm):
+        """Fraction of not-yet-driven cells along each heading from (x, y).
+
+        reach_cm: per-heading distance to look (e.g. the clearance, so floor
+        behind a wall doesn't count as something to cover).
+        """
+        headings = np.asarray(headings, dtype=np.float64)
+        reach = np.broadcast_to(np.asarray(reach_cm, dtype=np.float64), headings.shape)
+        steps = np.arange(1, int(reach.max() // self.cell) + 1) * self.cell
+        if not steps.size:
+            return np.zeros(headings.shape)
+        cx = np.floor((x + np.cos(headings)[:, None] * steps) / self.cell).astype(np.int64)
+        cy = np.floor((y + np.sin(headings)[:, None] * steps) / self.cell).astype(np.int64)
+        cells = self.cells
+        new = np.array([(a, b) not in cells for a, b in zip(cx.ravel().tolist(), cy.ravel().tolist())])
+        new = new.reshape(cx.shape)
+        valid = steps[None, :] <= reach[:, None]
+        n = valid.sum(axis=1)
+        return np.where(n > 0, (new & valid).sum(axis=1) / np.maximum(n, 1), 0.0)
@@ -0,0 +1,147 @@
+# bench_async_runtime.py
+#
+# Threaded runtime (ControlLoop.run(): LiDAR / controller / telemetry threads
+# around a paced loop) vs the asyncio runtime (async_runtime.py) on the same
+# simulated workload, in real time:
+#
+#   LiDAR       a pty opened with real pyserial; a feeder thread writes
+#               TF-Luna frames into it at 100 Hz (a wall 40..200 cm away,
+#               coming and going), so both runtimes read a real file
+#               descriptor with real termios timeouts
+#   controller  sim.ScriptedGamepad on the wall clock: arm, GUARD, full stick
+#   motors      no-op pins
+#   telemetry   recorded to a temporary session folder
+#
+# Per runtime:
+#   CPU     process CPU time / wall time (all threads, feeder included)
+#   jitter  how late each tick started vs its deadline (p50 / p99 / max)
+#   age     age of the newest LiDAR sample when a tick reads it
+#
+# Usage:
+#   python bench_async_runtime.py [seconds]
+
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import serial
+
+import async_runtime
+import rc_car_modes_bluetooth_fix_good as car
+from hal import Clock, Hardware, MotorPins
+from loop_timing import Histogram
+from sim import ScriptedGamepad, press
+from telemetry import TelemetryRecorder
+from tfluna import encode_frame
+
+LIDAR_RATE_HZ = 100
+
+
+class NullMotors(MotorPins):
+    def set_output(self, pin):
+        pass
+
+    def write(self, pin, level):
+        pass
+
+    def set_PWM_dutycycle(self, pin, duty):
+        pass
+
+
+class PtyLidar:
+    """A TF-Luna on the far end of a pty."""
+
+    def __init__(self):
+        self.master, self.slave = os.openpty()
+        self.name = os.ttyname(self.slave)
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._feed, daemon=True)
+
+    def _feed(self):
+        period = 1.0 / LIDAR_RATE_HZ
+        t0 = time.monotonic()
+        k = 0
+        while not self.stop.is_set():
+            k += 1
+            d = 120 + 80 * math.sin(2 * math.pi * 0.2 * k * period)
+            os.write(self.master, encode_frame(int(d), 3000, 40.0))
+            delay = t0 + k * period - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def open(self):
+        return serial.Serial(self.name, 115200, timeout=0.05)
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class MeasuredLoop(car.ControlLoop):
+    """ControlLoop that also records the LiDAR sample age seen by each tick."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.age = Histogram()
+
+    def tick(self):
+        super().tick()
+        sample, _ = car.lidar.read(0)
+        if sample is not None:
+            self.age.record(int((self.clock.monotonic() - sample.t) * 1e9))
+
+
+def run(runtime, seconds):
+    dev = PtyLidar()
+    dev.start()
+    clock = Clock()
+    fwd = -1.0 if car.FORWARD_IS_NEGATIVE else 1.0
+    script = press(0.2, car.BTN_A) + press(0.4, car.BTN_X)
+    script += [(0.6, "axis", car.LEFT_AXIS_Y, fwd), (0.6, "axis", car.RIGHT_AXIS_Y, fwd)]
+    hw = Hardware(clock, NullMotors(), dev.open, ScriptedGamepad(clock, script), realtime=True)
+    tmp = tempfile.mkdtemp(prefix="bench-runtime-")
+    rec = TelemetryRecorder(os.path.join(tmp, "session"), clock)
+    loop = MeasuredLoop(hw, log=lambda msg: None, telemetry=rec)
+
+    cpu0 = time.process_time()
+    wall0 = time.monotonic()
+    if runtime == "asyncio":
+        async_runtime.run(loop, seconds=seconds)
+    else:
+        loop.run(seconds=seconds)
+    wall = time.monotonic() - wall0
+    cpu = time.process_time() - cpu0
+    dev.close()
+    shutil.rmtree(tmp)
+    return loop, cpu / wall
+
+
+def ms(ns):
+    return ns / 1e6
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    print(f"{seconds:.0f} s per runtime, LOOP_DT={car.LOOP_DT * 1000:.0f} ms, LiDAR {LIDAR_RATE_HZ} Hz")
+    print(f"{'runtime':8s} {'ticks':>6s} {'CPU':>6s} {'jitter p50':>11s} {'p99':>8s} {'max':>8s} "
+          f"{'age p50':>9s} {'p99':>8s} {'overruns':>9s}")
+    for runtime in ("threads", "asyncio"):
+        loop, cpu = run(runtime, seconds)
+        s = loop.sched
+        j = s.jitter
+        print(f"{runtime:8s} {s.ticks:6d} {cpu * 100:5.1f}% {ms(j.percentile(50)):8.3f} ms "
+              f"{ms(j.percentile(99)):5.3f} ms {ms(j.max):5.3f} ms "
+              f"{ms(loop.age.percentile(50)):6.3f} ms {ms(loop.age.percentile(99)):5.3f} ms {s.overruns:9d}")
+
+
+if __name__ == "__main__":
+    main()
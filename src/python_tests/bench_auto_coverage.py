@@ -0,0 +1,79 @@
+# bench_auto_coverage.py
+#
+# AUTO strategies on the simulator: "roomba" (random turn after backing off)
+# vs "scan" (spin once, head for the most open / least explored sector).
+#
+# For every room and seed the real control loop runs AUTO for the given
+# simulated time and reports, from the simulator's true pose:
+#   - area covered: floor swept by the robot's footprint (5 cm cells)
+#   - m^2/min over the first minutes, coverage % of the room at the end
+#   - collisions/hour (robot body touching a wall or box)
+#
+# Usage:
+#   python bench_auto_coverage.py [minutes] [seeds]
+
+import random
+import sys
+import time
+
+import rc_car_modes_bluetooth_fix_good as car
+from bench_sim_modes import scenario_auto
+from sim import Coverage, Simulator, World, car_pins
+from sweep import WORLDS
+
+ROOMS = [("empty 4x3 m",) + WORLDS["empty"], ("boxes 4x3 m",) + WORLDS["boxes"],
+         ("boxes 6x5 m",) + WORLDS["large"]]
+EARLY_MIN = 3       # "area per minute" is measured over this first stretch
+
+
+def run(strategy, room, seed, minutes):
+    name, w, h, boxes = room
+    world = World.room(w, h, boxes=boxes)
+    world.place_randomly(random.Random(seed), boxes)
+
+    old = car.AUTO_STRATEGY
+    car.AUTO_STRATEGY = strategy
+    sim = Simulator(world, car_pins(car), script=scenario_auto(), spike_prob=0.01, seed=seed)
+    loop = car.ControlLoop(sim.hardware(), log=lambda msg: None, rng=random.Random(seed))
+    cov = Coverage(w, h, world.radius)
+    ticks = int(minutes * 60 / car.LOOP_DT)
+    early_tick = int(EARLY_MIN * 60 / car.LOOP_DT)
+    early = None
+    t0 = time.perf_counter()
+    loop.start()
+    try:
+        for k in range(ticks):
+            loop.tick()
+            sim.clock.sleep(car.LOOP_DT)
+            cov.mark(world.x, world.y)
+            if k == early_tick:
+                early = cov.m2()
+    finally:
+        loop.shutdown()
+        car.AUTO_STRATEGY = old
+    wall = time.perf_counter() - t0
+
+    return {
+        "early": (early if early is not None else cov.m2()) / min(EARLY_MIN, minutes),
+        "pct": 100.0 * cov.m2() / cov.free_m2(boxes),
+        "coll_h": world.collisions / (minutes / 60.0),
+        "wall": wall,
+    }
+
+
+def main():
+    minutes = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    seeds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    print(f"AUTO coverage, {minutes:.0f} simulated min per run, {seeds} seeds (mean)")
+    print(f"{'room':12s} {'strategy':8s} {'m^2/min (first ' + str(EARLY_MIN) + ' min)':>24s} "
+          f"{'covered %':>10s} {'collisions/h':>13s}")
+    for room in ROOMS:
+        for strategy in ("roomba", "scan"):
+            rs = [run(strategy, room, seed, minutes) for seed in range(seeds)]
+            mean = {k: sum(r[k] for r in rs) / len(rs) for k in rs[0]}
+            print(f"{room[0]:12s} {strategy:8s} {mean['early']:24.2f} {mean['pct']:10.1f} "
+                  f"{mean['coll_h']:13.0f}   ({mean['wall']:.1f} s/run)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# bench_controller_input.py
+#
+# Controller input: per-tick polling (old loop) vs ControllerInput's event
+# thread.
+#
+# FakeEventPad behaves like an event backend: a "user" thread presses
+# buttons at random moments, some taps shorter than a control tick, and
+# unplugs/replugs the pad now and then. Both designs run a 50 Hz loop over
+# the same input and report:
+#   - per-tick input cost in the loop and memory allocated per tick
+#   - taps seen vs taps made (polling misses taps between two ticks)
+#   - press-to-visible latency (time until the loop could act on it)
+#
+# Usage:
+#   python bench_controller_input.py [seconds]
+
+import queue
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+from controller_input import ControllerInput
+from hal import Clock, Gamepad
+from loop_timing import Histogram
+
+LOOP_DT = 0.02
+NUM_BUTTONS = 16
+
+
+class FakeEventPad(Gamepad):
+    """Button/axis state plus an event queue, like pygame with one pad."""
+
+    def __init__(self):
+        self.buttons = [0] * NUM_BUTTONS
+        self.axes = [0.0] * 6
+        self.plugged = True
+        self.q = queue.Queue()
+
+    # "user" side
+    def set_button(self, i, value):
+        self.buttons[i] = value
+        self.q.put(("button", i, value))
+
+    def unplug(self):
+        self.plugged = False
+        self.buttons = [0] * NUM_BUTTONS
+        self.q.put(("removed", 0, 0))
+
+    def plug(self):
+        self.plugged = True
+        self.q.put(("added", 0, 0))
+
+    # event backend
+    def wait_events(self, timeout):
+        try:
+            out = [self.q.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                out.append(self.q.get_nowait())
+            except queue.Empty:
+                return out
+
+    # polling backend
+    def pump(self):
+        pass
+
+    def connected(self):
+        return self.plugged
+
+    def reconnect(self):
+        return self.plugged
+
+    def get_name(self):
+        return "Fake pad"
+
+    def get_numbuttons(self):
+        return NUM_BUTTONS
+
+    def get_button(self, i):
+        return self.buttons[i]
+
+    def get_axis(self, i):
+        return self.axes[i]
+
+    def get_numaxes(self):
+        return len(self.axes)
+
+
+def user(pad, seconds, presses, seed=0):
+    """Random taps (5..60 ms) on buttons 0..7 and an unplug every ~3 s."""
+    rng = random.Random(seed)
+    end = time.monotonic() + seconds
+    next_unplug = time.monotonic() + 3.0
+    while time.monotonic() < end:
+        time.sleep(rng.uniform(0.02, 0.12))
+        if time.monotonic() >= next_unplug:
+            pad.unplug()
+            time.sleep(0.3)
+            pad.plug()
+            next_unplug = time.monotonic() + 3.0
+            continue
+        b = rng.randrange(8)
+        presses.append((time.monotonic(), b))
+        pad.set_button(b, 1)
+        time.sleep(rng.uniform(0.005, 0.06))
+        pad.set_button(b, 0)
+
+
+def run(design, seconds):
+    pad = FakeEventPad()
+    clock = Clock()
+    presses = []
+    seen = []
+    cost = Histogram(lo_ns=100)
+    alloc = 0
+
+    inp = None
+    prev = [0] * NUM_BUTTONS
+    if design == "events":
+        inp = ControllerInput(pad, clock)
+        inp.connect()
+        inp.start()
+    else:
+        pad.wait_events = lambda timeout: None      # pure polling, like the old loop
+
+    th = threading.Thread(target=user, args=(pad, seconds, presses), daemon=True)
+    th.start()
+    tracemalloc.start()
+    next_t = time.monotonic()
+    ticks = 0
+    while th.is_alive():
+        next_t += LOOP_DT
+        time.sleep(max(0.0, next_t - time.monotonic()))
+        before = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter_ns()
+        if design == "events":
+            state = inp.state
+            pressed = 0
+            events = inp.events
+            while events:
+                _, btn, down = events.popleft()
+                if down:
+                    pressed |= 1 << btn
+            connected = state.connected
+        else:
+            pad.pump()
+            connected = pad.connected()
+            pressed = 0
+            if connected:
+                buttons = [pad.get_button(i) for i in range(pad.get_numbuttons())]
+                for i in range(len(buttons)):
+                    if buttons[i] == 1 and prev[i] == 0:
+                        pressed |= 1 << i
+                prev = buttons
+            else:
+                prev = [0] * NUM_BUTTONS
+        cost.record(time.perf_counter_ns() - t0)
+        alloc += max(0, tracemalloc.get_traced_memory()[0] - before)
+        ticks += 1
+        now = time.monotonic()
+        for b in range(NUM_BUTTONS):
+            if pressed >> b & 1:
+                seen.append((now, b))
+    tracemalloc.stop()
+    if inp is not None:
+        inp.stop()
+
+    # Match each press to the first tick that saw that button afterwards
+    lat = Histogram(lo_ns=1_000)
+    j = 0
+    for t, b in presses:
+        while j < len(seen) and seen[j][0] < t:
+            j += 1
+        for k in range(j, len(seen)):
+            if seen[k][1] == b:
+                lat.record(int((seen[k][0] - t) * 1e9))
+                break
+    print(f"{design:7s}: {len(seen)}/{len(presses)} taps seen, "
+          f"{alloc / ticks:5.0f} B allocated/tick")
+    print("         " + cost.format("tick input"))
+    print("         " + lat.format("press->loop"))
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    run("polling", seconds)
+    run("events", seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# bench_drive_modes.py
+#
+# Every drive mode's tick (drive_modes.py), headless: no simulator run, no
+# hardware, just the mode and a synthetic tick stream, a million ticks each
+# by default. The modes are the ones ControlLoop.make_modes() registers, so
+# a new mode is benched as soon as it's added; run this after adding or
+# changing one to catch a slow tick.
+#
+# The stream: both sticks forward, the range ahead sweeping 10..210 cm
+# (so GUARD brakes and AUTO backs off / turns / rescans), a LiDAR sample per
+# tick in lidar_history, and dead reckoning of the mode's own output (AUTO
+# "scan" turns toward what it saw). Each tick fills the reused DriveInput
+# the way ControlLoop does. "(harness)" is a mode that does nothing: the
+# cost of the stream itself, subtracted from the others in "- harness".
+# VARIANTS adds rows for settings that take a mode down another code path.
+#
+# Also timed: switching modes (ModeRegistry.next, exit + enter) with the
+# built-in modes and with 30 registered, which should cost the same.
+#
+# Usage:
+#   python bench_drive_modes.py [ticks] [budget us]
+# With a budget, exits 1 if any mode's tick costs more than that.
+
+import math
+import random
+import sys
+import time
+
+import rc_car_modes_bluetooth_fix_good as car
+from drive_modes import DriveInput, DriveMode, DriveOutput, ModeRegistry
+from sim import Simulator, World, car_pins
+
+# Settings that switch a mode to another code path: benched as extra rows
+VARIANTS = ((car.MODE_GUARD, {"GUARD_BRAKING": "linear"}), (car.MODE_AUTO, {"AUTO_STRATEGY": "scan"}))
+
+
+class IdleMode(DriveMode):
+    name = "(harness)"
+
+    def tick(self, inp, out):
+        pass
+
+
+def make_loop(**settings):
+    """A ControlLoop (never started) for its modes and odometry, with settings applied."""
+    sim = Simulator(World.room(400, 300), car_pins(car), script=[], seed=1)
+    loop = car.ControlLoop(sim.hardware(), log=lambda msg: None, rng=random.Random(1))
+    if settings:
+        loop.config.set(0.0, "bench", **settings)
+    car.cfg = loop.config.current
+    return loop
+
+
+def run(mode, odom, ticks):
+    """ns per tick over ticks ticks of the synthetic stream."""
+    c = car.cfg
+    history = car.lidar_history
+    history.reset()
+    odom.reset()
+    inp = DriveInput()
+    out = DriveOutput()
+    fwd = -1.0 if c.FORWARD_IS_NEGATIVE else 1.0
+    axes = [0.0] * 6
+    axes[c.LEFT_AXIS_Y] = fwd
+    axes[c.RIGHT_AXIS_Y] = fwd
+    inp.axes = axes
+    inp.fresh = True
+    dt = c.LOOP_DT
+    mode.enter(inp)
+
+    now = 0.0
+    t0 = time.perf_counter_ns()
+    for k in range(ticks):
+        now += dt
+        odom.step(now, out.left, out.right)
+        dist = 10.0 + (k % 400) * 0.5 + 40.0 * abs(math.sin(odom.heading))
+        history.push(now, dist, 1000)
+        inp.now = now
+        inp.dist = dist
+        inp.prev_left = out.left
+        inp.prev_right = out.right
+        mode.tick(inp, out)
+    ns = (time.perf_counter_ns() - t0) / ticks
+    mode.exit(inp)
+    return ns
+
+
+def time_switches(registry, n):
+    inp = DriveInput()
+    t0 = time.perf_counter_ns()
+    for _ in range(n):
+        registry.next(inp)
+    return (time.perf_counter_ns() - t0) / n
+
+
+def main():
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    budget_us = float(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    loop = make_loop()
+    harness = run(IdleMode(), loop.odom, ticks)
+    rows = [(m.name, run(m, loop.odom, ticks)) for m in loop.modes.modes]
+    for index, settings in VARIANTS:
+        loop = make_loop(**settings)
+        label = " ".join(str(v) for v in settings.values())
+        rows.append((f"{loop.modes.modes[index].name} {label}", run(loop.modes.modes[index], loop.odom, ticks)))
+
+    print(f"{ticks} ticks per mode")
+    print(f"{'mode':14s} {'tick':>9s} {'- harness':>10s}")
+    print(f"{'(harness)':14s} {harness / 1000:6.2f} us")
+    slow = []
+    for name, ns in rows:
+        own = max(0.0, ns - harness) / 1000
+        print(f"{name:14s} {ns / 1000:6.2f} us {own:7.2f} us")
+        if budget_us is not None and own > budget_us:
+            slow.append(name)
+
+    # Switching: every mode exited and entered in turn (AUTO "scan" starts a scan)
+    loop = make_loop(AUTO_STRATEGY="scan")
+    n = max(1000, ticks // 10)
+    for count in (len(loop.modes), 30):
+        modes = loop.make_modes(car.cfg)
+        modes += [IdleMode() for _ in range(count - len(modes))]
+        ns = time_switches(ModeRegistry(modes), n)
+        print(f"switch, {count:2d} modes {ns / 1000:6.2f} us")
+
+    car.cfg = car.make_config(log=lambda msg: None).current
+    if slow:
+        print(f"over the {budget_us} us budget: {', '.join(slow)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# bench_guard_braking.py
+#
+# GUARD braking in the simulator: old distance-linear clamp vs TTC braking.
+#
+# For several joystick speeds the car starts facing a wall, is armed, put in
+# GUARD and driven straight at the wall with the stick held forward. Reported
+# per run:
+#   stop     - final sensor-to-wall distance (target: STOP_DISTANCE_CM)
+#   min      - closest it ever got (overshoot = STOP_DISTANCE_CM - min)
+#   avg      - average ground speed from first motion until it settled
+#   settle   - time from pushing the stick to standing still
+#   hit      - collisions
+#
+# Usage:
+#   python bench_guard_braking.py
+
+import random
+
+import rc_car_modes_bluetooth_fix_good as car
+from sim import Simulator, World, car_pins, press
+
+START_CM = 300          # sensor-to-wall distance at start
+STICKS = (0.3, 0.5, 0.75, 1.0)
+HOLD_SEC = 20.0
+WHEEL_TAUS = (0.08, 0.35)   # light/snappy vs heavy/coasting chassis (sim.World wheel lag)
+
+
+def run(braking, stick, tau):
+    car.GUARD_BRAKING = braking
+    fwd = -stick if car.FORWARD_IS_NEGATIVE else stick
+    t_go = 1.5
+    script = press(0.5, car.BTN_A) + press(1.0, car.BTN_X)
+    script += [(t_go, "axis", car.LEFT_AXIS_Y, fwd), (t_go, "axis", car.RIGHT_AXIS_Y, fwd)]
+
+    # Long corridor, robot at the left end facing +x
+    world = World.room(START_CM + 200, 120, start=(0, 60.0, 0.0), wheel_tau_sec=tau)
+    world.x = world.radius + 200 - world.sensor_offset     # sensor START_CM from the far wall
+    sim = Simulator(world, car_pins(car), script=script, seed=2)
+    loop = car.ControlLoop(sim.hardware(), log=lambda msg: None, rng=random.Random(0))
+
+    loop.start()
+    t0 = sim.clock.t
+    x0 = world.x
+    samples = []
+    try:
+        while sim.clock.t - t0 < t_go + HOLD_SEC:
+            loop.tick()
+            sim.clock.sleep(car.LOOP_DT)
+            samples.append((sim.clock.t - t0, world.x, world.range_ahead()))
+    finally:
+        loop.shutdown()
+
+    final = samples[-1][2]
+    closest = min(r for _, _, r in samples)
+    travelled = samples[-1][1] - x0
+    moving = [(t, x) for t, x, _ in samples if x - x0 > 0.5]
+    settled = [t for t, x, _ in samples if x - x0 >= travelled - 0.5]
+    if moving and settled:
+        dt = settled[0] - moving[0][0]
+        avg = travelled / dt if dt > 0 else 0.0
+        settle = settled[0] - t_go
+    else:
+        avg = 0.0
+        settle = float("nan")
+    return final, closest, avg, settle, world.collisions
+
+
+def main():
+    stop = car.STOP_DISTANCE_CM
+    print(f"STOP_DISTANCE_CM={stop} SLOW_DISTANCE_CM={car.SLOW_DISTANCE_CM} "
+          f"decel={car.GUARD_DECEL_CM_S2} cm/s^2 latency={car.GUARD_LATENCY_SEC} s\n")
+    print(f"{'braking':8s} {'stick':>5s} {'stop':>7s} {'min':>7s} {'overshoot':>9s} {'avg':>9s} {'settle':>7s} {'hit':>4s}")
+    for tau in WHEEL_TAUS:
+        print(f"-- wheel lag {tau:.2f} s")
+        for stick in STICKS:
+            for braking in ("linear", "ttc"):
+                final, closest, avg, settle, hits = run(braking, stick, tau)
+                print(f"{braking:8s} {stick:5.2f} {final:6.1f}cm {closest:6.1f}cm {max(0.0, stop - closest):8.1f}cm "
+                      f"{avg:6.1f}cm/s {settle:6.2f}s {hits:4d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# bench_lidar_channel.py
+#
+# Microbenchmark: old lidar_lock globals vs the lock-free LidarChannel.
+#
+# A writer thread publishes samples as fast as it can (worst case for
+# contention; the real sensor does 100-250 Hz) while the main thread plays
+# the control loop and reads the latest sample in a tight loop. Reported:
+#   - reader call latency histogram (what the control tick pays)
+#   - reader / writer throughput
+#   - torn reads (writer stores dist == strength == seq, reader checks them)
+#
+# Usage:
+#   python bench_lidar_channel.py [seconds]
+
+import sys
+import threading
+import time
+
+from lidar_channel import LidarChannel
+from loop_timing import Histogram
+
+
+class LockedLidar:
+    """The old design: module globals behind one threading.Lock."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dist = None
+        self.strength = None
+        self.last_time = 0.0
+        self.ok = 0
+        self.bad = 0
+
+    def publish(self, d, s, temp, t):
+        with self.lock:
+            self.ok += 1
+            self.dist = d
+            self.strength = s
+            self.last_time = t
+
+    def get(self, now):
+        with self.lock:
+            dist = self.dist
+            strength = self.strength
+            age = (now - self.last_time) if self.last_time else 999.0
+            ok = self.ok
+            bad = self.bad
+        return dist, strength, age, ok, bad
+
+
+def get_channel(ch, now, last_seq):
+    sample, new = ch.read(last_seq)
+    if sample is None:
+        return None, None, 999.0, 0, ch.bad, 0, 0
+    return sample.dist_cm, sample.strength, now - sample.t, ch.seq, ch.bad, sample.seq, new
+
+
+def writer(target, stop, counter):
+    n = 0
+    mono = time.monotonic
+    while not stop.is_set():
+        n += 1
+        target.publish(n, n, 25.0, mono())
+    counter.append(n)
+
+
+def bench(name, target, read_fn, seconds):
+    stop = threading.Event()
+    written = []
+    t = threading.Thread(target=writer, args=(target, stop, written))
+    t.start()
+
+    hist = Histogram(lo_ns=50)
+    torn = 0
+    reads = 0
+    clock = time.perf_counter_ns
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        t0 = clock()
+        out = read_fn(time.monotonic())
+        hist.record(clock() - t0)
+        reads += 1
+        if out[0] is not None and out[0] != out[1]:
+            torn += 1
+
+    stop.set()
+    t.join()
+    print(f"{name:8s} reads={reads / seconds:10.0f}/s  writes={written[0] / seconds:10.0f}/s  torn={torn}")
+    print("         " + hist.format("read"))
+    print(f"         p99.9={hist.percentile(99.9) / 1e3:.1f} us  reads over 1 ms: "
+          f"{sum(c for b, c in zip(hist.bounds, hist.counts) if b > 1_000_000)}")
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+
+    locked = LockedLidar()
+    bench("lock", locked, locked.get, seconds)
+
+    ch = LidarChannel()
+    state = {"seq": 0}
+
+    def read(now):
+        out = get_channel(ch, now, state["seq"])
+        state["seq"] = out[5]
+        return out
+
+    bench("channel", ch, read, seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# bench_loop_timing.py
+#
+# Does the 50 Hz loop really run at 50 Hz?
+#
+# Runs a fake control tick with variable work (and optional CPU-hog threads
+# to mimic a loaded Pi) two ways, on the real clock:
+#   old      - work, then time.sleep(LOOP_DT)
+#   deadline - LoopScheduler (absolute deadlines on monotonic_ns)
+# and prints period / work / jitter histograms for both.
+#
+# Usage:
+#   python bench_loop_timing.py [seconds] [hog_threads]
+
+import random
+import sys
+import threading
+import time
+
+from hal import Clock
+from loop_timing import Histogram, LoopScheduler
+
+LOOP_DT = 0.02
+WORK_MS_MIN = 1.0
+WORK_MS_MAX = 6.0
+
+
+def busy(ms):
+    end = time.perf_counter() + ms / 1000.0
+    while time.perf_counter() < end:
+        pass
+
+
+def hog(stop):
+    x = 0
+    while not stop.is_set():
+        x = (x * 31 + 7) % 1000003
+
+
+def run_old(seconds, rng):
+    period = Histogram()
+    last = None
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        now = time.monotonic_ns()
+        if last is not None:
+            period.record(now - last)
+        last = now
+        busy(rng.uniform(WORK_MS_MIN, WORK_MS_MAX))
+        time.sleep(LOOP_DT)
+    return period
+
+
+def run_deadline(seconds, rng):
+    sched = LoopScheduler(LOOP_DT, Clock())
+    sched.start()
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        sched.wait()
+        busy(rng.uniform(WORK_MS_MIN, WORK_MS_MAX))
+        sched.done()
+    return sched
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    hogs = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+    stop = threading.Event()
+    for _ in range(hogs):
+        threading.Thread(target=hog, args=(stop,), daemon=True).start()
+
+    print(f"target period {LOOP_DT * 1000:.1f} ms, work {WORK_MS_MIN}-{WORK_MS_MAX} ms, "
+          f"{hogs} hog thread(s), {seconds:.0f} s per run\n")
+    try:
+        period = run_old(seconds, random.Random(1))
+        print("old (work + sleep):")
+        print("       " + period.format("period"))
+        print(f"       effective rate {1e9 / period.mean():.1f} Hz\n")
+
+        sched = run_deadline(seconds, random.Random(1))
+        print("deadline scheduler:")
+        print(sched.report())
+        print(f"       effective rate {1e9 / sched.period.mean():.1f} Hz")
+    finally:
+        stop.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# bench_motor_output.py
+#
+# pigpio round-trips per tick: old set_motor() vs motor_output.MotorOutput.
+#
+# FakePigpio counts every call and sleeps CALL_SEC in each one, standing in
+# for a socket round-trip to the pigpio daemon. Both output paths are driven
+# with the same per-tick (left, right) speeds:
+#
+#   idle     - disarmed, stop_motors() every tick
+#   cruise   - AUTO-like: long forward runs, reverse, turn
+#   stick    - MANUAL with a slowly moving, slightly noisy stick
+#   sim-auto - the real ControlLoop in AUTO on the simulator
+#
+# Usage:
+#   python bench_motor_output.py [ticks] [call_ms]
+
+import math
+import random
+import sys
+import time
+
+import rc_car_modes_bluetooth_fix_good as car
+from bench_sim_modes import BOXES, scenario_auto
+from hal import MotorPins
+from motor_output import MotorOutput
+from sim import Simulator, SimMotors, World, car_pins
+
+CHANNELS = [(car.ENA, car.IN1, car.IN2), (car.ENB, car.IN3, car.IN4)]
+
+
+class FakePigpio(MotorPins):
+    def __init__(self, call_sec):
+        self.call_sec = call_sec
+        self.calls = 0
+
+    def _call(self):
+        self.calls += 1
+        if self.call_sec:
+            time.sleep(self.call_sec)
+
+    def set_output(self, pin):
+        self._call()
+
+    def write(self, pin, level):
+        self._call()
+
+    def set_PWM_dutycycle(self, pin, duty):
+        self._call()
+
+    def set_bank_1(self, bits):
+        self._call()
+
+    def clear_bank_1(self, bits):
+        self._call()
+
+
+def legacy_set_motor(pi, ena, in1, in2, speed):
+    """set_motor() before MotorOutput."""
+    if speed > 0:
+        pi.write(in1, 1)
+        pi.write(in2, 0)
+    elif speed < 0:
+        pi.write(in1, 0)
+        pi.write(in2, 1)
+        speed = -speed
+    else:
+        pi.write(in1, 0)
+        pi.write(in2, 0)
+    pi.set_PWM_dutycycle(ena, int(max(0, min(100, speed)) * 2.55))
+
+
+# -----------------------------
+# Speed sequences
+# -----------------------------
+def seq_idle(n):
+    return [(0, 0)] * n
+
+
+def seq_cruise(n):
+    out = []
+    fwd, rev, turn = -car.AUTO_FWD_SPEED, -car.AUTO_REV_SPEED, car.AUTO_TURN_SPEED
+    while len(out) < n:
+        out += [(fwd, fwd)] * 150 + [(rev, rev)] * 30 + [(-turn, turn)] * 30
+    return out[:n]
+
+
+def seq_stick(n, seed=0):
+    rng = random.Random(seed)
+    out = []
+    for k in range(n):
+        base = -0.8 * math.sin(2 * math.pi * k * car.LOOP_DT / 6.0)
+        left = car.axis_to_speed(base + rng.gauss(0, 0.01))
+        right = car.axis_to_speed(base * 0.9 + rng.gauss(0, 0.01))
+        out.append((left, right))
+    return out
+
+
+def seq_sim_auto(n):
+    """Per-tick commands of the real loop in AUTO, taken from the sim's pins."""
+    world = World.room(400, 300, boxes=BOXES)
+    sim = Simulator(world, car_pins(car), script=scenario_auto(), seed=1)
+    loop = car.ControlLoop(sim.hardware(), log=lambda msg: None, rng=random.Random(1))
+    out = []
+    loop.start()
+    try:
+        for _ in range(n):
+            loop.tick()
+            out.append((loop.left_speed, loop.right_speed))
+            sim.clock.sleep(car.LOOP_DT)
+    finally:
+        loop.shutdown()
+    return out
+
+
+# -----------------------------
+# Runs
+# -----------------------------
+def run_legacy(seq, call_sec):
+    pi = FakePigpio(call_sec)
+    t0 = time.perf_counter()
+    for left, right in seq:
+        legacy_set_motor(pi, car.ENA, car.IN1, car.IN2, left)
+        legacy_set_motor(pi, car.ENB, car.IN3, car.IN4, right)
+    return pi.calls, time.perf_counter() - t0
+
+
+def run_cached(seq, call_sec):
+    pi = FakePigpio(call_sec)
+    out = MotorOutput(pi, CHANNELS)
+    t0 = time.perf_counter()
+    for left, right in seq:
+        out.drive(left, right)
+    return pi.calls, time.perf_counter() - t0
+
+
+def check_equivalent(seq):
+    """Both paths must leave the pins in the same state after every tick."""
+    a = SimMotors(*car_pins(car))
+    b = SimMotors(*car_pins(car))
+    out = MotorOutput(b, CHANNELS)
+    out.setup()
+    for left, right in seq:
+        legacy_set_motor(a, car.ENA, car.IN1, car.IN2, left)
+        legacy_set_motor(a, car.ENB, car.IN3, car.IN4, right)
+        out.drive(left, right)
+        if a.wheel_duty() != b.wheel_duty():
+            return False
+    return True
+
+
+def main():
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    call_sec = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.0002
+    print(f"{ticks} ticks per sequence, {call_sec * 1e6:.0f} us per fake pigpio call, "
+          f"rates at {1 / car.LOOP_DT:.0f} Hz\n")
+    print(f"{'sequence':9s} {'legacy':>16s} {'cached':>16s} {'per tick':>20s} {'same pins':>9s}")
+    for name, make in (("idle", seq_idle), ("cruise", seq_cruise), ("stick", seq_stick),
+                       ("sim-auto", seq_sim_auto)):
+        seq = make(ticks)
+        calls_a, sec_a = run_legacy(seq, call_sec)
+        calls_b, sec_b = run_cached(seq, call_sec)
+        rate_a = calls_a / (ticks * car.LOOP_DT)
+        rate_b = calls_b / (ticks * car.LOOP_DT)
+        print(f"{name:9s} {rate_a:9.0f} calls/s {rate_b:9.0f} calls/s "
+              f"{sec_a / ticks * 1e6:7.0f} -> {sec_b / ticks * 1e6:5.0f} us "
+              f"{'yes' if check_equivalent(seq) else 'NO':>9s}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# bench_motor_shaping.py
+#
+# Output conditioning (motor_shaping.py), three ways:
+#
+# 1) closed loop: AUTO ("roomba", "scan") and GUARD in the bench_sim_modes
+#    room with MOTOR_SHAPING off and on (the default profile). Per run, from
+#    the per-tick motor commands: peak / RMS motor current of evaluate()'s
+#    motor model (fraction of stall at full duty), direct reversals, the
+#    largest command step, collisions, and the cost of the stage
+#    (profiler "tick;shape").
+# 2) offline: a grid of profiles (accel x jerk x reverse) evaluated at once
+#    on the unshaped AUTO session from 1), with BatchShaper. Reported: the
+#    table, and the time per profile vs stepping a MotorShaper per profile,
+#    also on the unshaped GUARD session (a stick: the commands change every
+#    few ticks, so evaluate() skips few of them).
+# 3) MotorShaper and BatchShaper give the same commands on that session,
+#    to the last bit, for every profile.
+#
+# Usage:
+#   python bench_motor_shaping.py [simulated seconds per run]
+
+import itertools
+import random
+import sys
+import time
+
+import numpy as np
+
+import rc_car_modes_bluetooth_fix_good as car
+from bench_sim_modes import BOXES, scenario_auto, scenario_guard
+from motor_shaping import BatchShaper, MotorShaper, Profile, evaluate, format_row
+from sim import Simulator, World, car_pins
+
+ACCELS = (200.0, 400.0, 800.0)
+JERKS = (0.0, 4000.0)
+REVERSES = (0.0, 0.06, 0.12)
+DEADBAND = "1:18, 100:100"
+
+
+def run(script, seconds, **settings):
+    """Per-tick (t, left, right) motor commands, collisions and the shape stage's mean cost (us)."""
+    sim = Simulator(World.room(400, 300, boxes=BOXES), car_pins(car), script=script, seed=1)
+    loop = car.ControlLoop(sim.hardware(), log=lambda msg: None, rng=random.Random(1))
+    if settings:
+        loop.config.set(0.0, "bench", **settings)
+    trace = []
+    tick = loop.tick
+
+    def traced():
+        tick()
+        trace.append((loop.clock.monotonic(), car.motor_cmd[0], car.motor_cmd[1]))
+    loop.tick = traced
+    sim.run(loop, seconds=seconds)
+    h = loop.prof.spans.get("tick;shape")
+    cost = h.mean() / 1000 if h is not None and h.count else 0.0
+    return np.array(trace), sim.world.collisions, cost
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 600.0
+
+    print(f"closed loop, {seconds:.0f} simulated s per run")
+    print(f"{'run':28s} {'peak':>6s} {'rms':>6s} {'lag %':>6s} {'reversals':>9s} {'max step':>8s} "
+          f"{'collisions':>10s} {'stage':>8s}")
+    raw = {}
+    for name, script, extra in (("AUTO roomba", scenario_auto(), {"AUTO_STRATEGY": "roomba"}),
+                                ("AUTO scan", scenario_auto(), {"AUTO_STRATEGY": "scan"}),
+                                ("GUARD", scenario_guard(), {})):
+        for shaping in (False, True):
+            trace, collisions, cost = run(script, seconds, MOTOR_SHAPING=shaping, **extra)
+            row = evaluate(trace[:, 0], trace[:, 1], trace[:, 2], [])[0]
+            label = f"{name}, shaping {'on' if shaping else 'off'}"
+            print(f"{format_row(label, row)} {collisions:10d} {cost:5.1f} us")
+            if not shaping:
+                raw.setdefault(name.split()[0], trace)
+
+    t, left, right = raw["AUTO"][:, 0], raw["AUTO"][:, 1], raw["AUTO"][:, 2]
+    profiles = [Profile(a, 0.0, j, r) for a, j, r in itertools.product(ACCELS, JERKS, REVERSES)]
+    t0 = time.perf_counter()
+    res = evaluate(t, left, right, profiles, DEADBAND)
+    batch = time.perf_counter() - t0
+    print(f"\noffline: AUTO roomba, shaping off ({len(t)} ticks), {len(profiles)} profiles, dead band "
+          f"\"{DEADBAND}\"")
+    print(f"{'accel / decel / jerk / reverse':28s} {'peak':>6s} {'rms':>6s} {'lag %':>6s} {'reversals':>9s} "
+          f"{'max step':>8s}")
+    print(format_row("as recorded", res[0]))
+    for p, row in zip(profiles, res[1:]):
+        print(format_row(f"{p.accel:g} / {p.decel:g} / {p.jerk:g} / {p.reverse_sec:g}", row))
+
+    # Same profiles, one MotorShaper each, tick by tick (what the car does)
+    n = len(t)
+    scalar_out = np.zeros((len(profiles), n, 2))
+    t0 = time.perf_counter()
+    for k, p in enumerate(profiles):
+        s = MotorShaper(*p, deadband=DEADBAND)
+        out = scalar_out[k]
+        for i in range(n):
+            a, b = s.step(t[i], left[i], right[i])
+            out[i] = s.compensate(round(a)), s.compensate(round(b))
+    scalar = time.perf_counter() - t0
+    print(f"evaluate(): {batch * 1000 / len(profiles):.1f} ms per profile (all at once, incl. the motor model); "
+          f"MotorShaper: {scalar * 1000 / len(profiles):.1f} ms per profile, "
+          f"{scalar / (len(profiles) * n) * 1e6:.2f} us per tick")
+
+    b = BatchShaper(2 * len(profiles), *(np.repeat([p[i] for p in profiles], 2) for i in range(4)),
+                    deadband=DEADBAND)
+    target = np.zeros(2 * len(profiles))
+    mismatched = 0
+    for i in range(n):
+        target[0::2] = left[i]
+        target[1::2] = right[i]
+        out = b.compensate(np.rint(b.step(t[i], target))).reshape(-1, 2)
+        mismatched += int(np.count_nonzero(out != scalar_out[:, i]))
+    print(f"MotorShaper vs BatchShaper: {mismatched} mismatched commands of {2 * n * len(profiles)}")
+
+    g = raw["GUARD"]
+    t0 = time.perf_counter()
+    evaluate(g[:, 0], g[:, 1], g[:, 2], profiles, DEADBAND)
+    batch = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for p in profiles:
+        s = MotorShaper(*p, deadband=DEADBAND)
+        for i in range(len(g)):
+            a, b = s.step(g[i, 0], g[i, 1], g[i, 2])
+            s.compensate(round(a)), s.compensate(round(b))
+    scalar = time.perf_counter() - t0
+    changes = int(np.count_nonzero(np.any(np.diff(g[:, 1:], axis=0) != 0, axis=1)))
+    print(f"GUARD, shaping off ({len(g)} ticks, {changes} command changes): evaluate() "
+          f"{batch * 1000 / len(profiles):.1f} ms per profile; MotorShaper {scalar * 1000 / len(profiles):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
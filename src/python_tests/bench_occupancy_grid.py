@@ -0,0 +1,164 @@
+# bench_occupancy_grid.py
+#
+# Occupancy-grid mapping cost and quality.
+#
+#   1. Raw update() throughput for batches of rays (random headings/ranges).
+#   2. The real control loop on the simulator with mapping on, patrolling in
+#      GUARD (drive straight, spin in place, repeat): per-tick cost of
+#      update_map() against the 20 ms loop budget, dead-reckoning drift vs
+#      the simulator's true pose, and how far the mapped obstacle cells are
+#      from the real walls. Dead reckoning only knows the commands, so any
+#      collision (wheels stalled against a wall) shows up as drift.
+#   3. save()/load() size and time.
+#
+# The Pi 4 runs this kind of NumPy-call-bound code roughly 5-8x slower than
+# a desktop core; the budget column assumes 8x.
+#
+# Usage:
+#   python bench_occupancy_grid.py [ticks]
+
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import rc_car_modes_bluetooth_fix_good as car
+from bench_sim_modes import BOXES
+from loop_timing import Histogram
+from occupancy_grid import OccupancyGrid
+from sim import Simulator, World, _point_segment_dist2, car_pins, press
+
+PI_SLOWDOWN = 8
+
+
+def bench_batches():
+    rng = np.random.default_rng(0)
+    print("update() throughput")
+    for rays in (1, 2, 8, 32, 128):
+        grid = OccupancyGrid(car.MAP_CELL_CM)
+        n = max(200, 4000 // rays)
+        h = rng.uniform(0, 2 * math.pi, (n, 1))
+        d = rng.uniform(20, 400, (n, rays))
+        t0 = time.perf_counter()
+        for k in range(n):
+            grid.update(0.0, 0.0, np.cos(h[k]) * d[k], np.sin(h[k]) * d[k], d[k] < 800)
+        sec = time.perf_counter() - t0
+        print(f"  {rays:4d} rays/call: {sec / n * 1e6:7.1f} us/call  {n * rays / sec:9.0f} rays/s")
+
+
+def scenario_patrol(seconds, seed=0):
+    """Arm, GUARD, then: stick forward 2.5 s, spin in place 0.3..1.0 s, repeat."""
+    rng = random.Random(seed)
+    fwd = -0.8 if car.FORWARD_IS_NEGATIVE else 0.8
+    script = press(0.5, car.BTN_A) + press(1.0, car.BTN_X)
+    t = 2.0
+    while t < seconds:
+        script += [(t, "axis", car.LEFT_AXIS_Y, fwd), (t, "axis", car.RIGHT_AXIS_Y, fwd)]
+        t += 2.5
+        spin = rng.choice([-0.7, 0.7])
+        script += [(t, "axis", car.LEFT_AXIS_Y, spin), (t, "axis", car.RIGHT_AXIS_Y, -spin)]
+        t += rng.uniform(0.3, 1.0)
+    return script
+
+
+def bench_loop(name, boxes, ticks):
+    world = World.room(400, 300, boxes=boxes)
+    x0, y0, h0 = world.x, world.y, world.heading
+    sim = Simulator(world, car_pins(car), script=scenario_patrol(ticks * car.LOOP_DT), seed=1)
+    loop = car.ControlLoop(sim.hardware(), log=lambda msg: None, rng=random.Random(1))
+
+    cost = Histogram(lo_ns=1_000)
+    update_map = loop.update_map
+
+    def timed(now):
+        t0 = time.perf_counter_ns()
+        update_map(now)
+        cost.record(time.perf_counter_ns() - t0)
+
+    loop.update_map = timed
+    drift = []
+    loop.start()
+    try:
+        for k in range(ticks):
+            loop.tick()
+            sim.clock.sleep(car.LOOP_DT)
+            if k % 500 == 499:
+                drift.append(_drift(loop.odom, world, x0, y0, h0))
+    finally:
+        loop.shutdown()
+
+    grid = loop.grid
+    budget = car.LOOP_DT * 1e9
+    print(f"\ncontrol loop, GUARD patrol, {name}, {ticks} ticks ({ticks * car.LOOP_DT:.0f} s simulated)")
+    print("  " + cost.format("update_map"))
+    print(f"  p99 x{PI_SLOWDOWN} (Pi estimate) = {cost.percentile(99) * PI_SLOWDOWN / 1e6:.2f} ms "
+          f"= {100 * cost.percentile(99) * PI_SLOWDOWN / budget:.1f}% of the {budget / 1e6:.0f} ms tick")
+    print(f"  {grid.rays} rays, {len(grid.tiles)} tiles, {grid.explored_m2():.1f} m^2 explored "
+          f"(room {400 * 300 / 1e4:.0f} m^2), odometer {world.odometer_cm / 100:.1f} m, "
+          f"collisions {world.collisions}")
+    if drift:
+        dist = [d for d, _ in drift]
+        ang = [abs(math.degrees(a)) for _, a in drift]
+        print(f"  dead-reckoning drift: final {dist[-1]:.1f} cm / {ang[-1]:.1f} deg, "
+              f"worst {max(dist):.1f} cm / {max(ang):.1f} deg")
+    _wall_error(grid, world, x0, y0, h0)
+    return grid
+
+
+def _to_world(x, y, x0, y0, h0):
+    c, s = math.cos(h0), math.sin(h0)
+    return x0 + c * x - s * y, y0 + s * x + c * y
+
+
+def _drift(odom, world, x0, y0, h0):
+    wx, wy = _to_world(odom.x, odom.y, x0, y0, h0)
+    dh = math.atan2(math.sin(odom.heading + h0 - world.heading), math.cos(odom.heading + h0 - world.heading))
+    return math.hypot(wx - world.x, wy - world.y), dh
+
+
+def _wall_error(grid, world, x0, y0, h0):
+    dense, ox, oy = grid.to_dense()
+    rows, cols = np.nonzero(dense > 1.0)
+    if not rows.size:
+        print("  no occupied cells")
+        return
+    xs = ox + (cols + 0.5) * grid.cell
+    ys = oy + (rows + 0.5) * grid.cell
+    err = []
+    for x, y in zip(xs.tolist(), ys.tolist()):
+        wx, wy = _to_world(x, y, x0, y0, h0)
+        err.append(math.sqrt(min(_point_segment_dist2(wx, wy, *seg) for seg in world.segments)))
+    err = np.array(err)
+    print(f"  occupied cells: {err.size}, distance to nearest real wall "
+          f"median {np.median(err):.1f} cm, p90 {np.percentile(err, 90):.1f} cm")
+
+
+def bench_files(grid):
+    path = os.path.join(tempfile.mkdtemp(prefix="grid-bench-"), "map.npz")
+    t0 = time.perf_counter()
+    grid.save(path)
+    t1 = time.perf_counter()
+    back = OccupancyGrid.load(path)
+    t2 = time.perf_counter()
+    raw = len(grid.tiles) * grid.tile * grid.tile * 4
+    print(f"\nsave {os.path.getsize(path) / 1024:.1f} KiB (float32 tiles {raw / 1024:.0f} KiB) "
+          f"in {(t1 - t0) * 1000:.1f} ms, load {(t2 - t1) * 1000:.1f} ms, "
+          f"{back.known_cells()}/{grid.known_cells()} known cells after round trip")
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+
+
+def main():
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 30_000
+    bench_batches()
+    bench_loop("empty room", [], ticks)
+    grid = bench_loop("room with boxes", BOXES, ticks)
+    bench_files(grid)
+
+
+if __name__ == "__main__":
+    main()
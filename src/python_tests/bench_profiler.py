@@ -0,0 +1,92 @@
+# bench_profiler.py
+#
+# Cost of the per-stage tick profile (profiler.py, PROFILE setting).
+#
+# The control loop runs in the simulator (GUARD, sticks forward on and off,
+# LiDAR inline) with PROFILE off and on, alternating in blocks (a fresh,
+# identical run each) so drift and cache effects hit both the same. Only
+# tick() itself is timed, not the simulated physics around it. Reported:
+#   lap      - one Profiler.lap() call in isolation
+#   tick     - mean tick() time, profile off / on
+#   overhead - measured: the difference (within run-to-run noise here)
+#              expected: laps per tick x lap cost
+#              both as a share of the tick's own work and of LOOP_DT
+#
+# Then the profile of the "on" runs as the loop would dump it (Y / SIGUSR1),
+# plus its profile.folded lines.
+#
+# Usage:
+#   python bench_profiler.py [ticks per block] [blocks]
+
+import random
+import sys
+import time
+
+import rc_car_modes_bluetooth_fix_good as car
+from bench_sim_modes import BOXES, scenario_guard
+from profiler import Profiler
+from replay import settings
+from sim import Simulator, World, car_pins
+
+
+def lap_cost(n=1_000_000):
+    prof = Profiler()
+    t = prof.now()
+    t0 = time.perf_counter_ns()
+    for _ in range(n):
+        t = prof.lap("tick;x", t)
+    return (time.perf_counter_ns() - t0) / n
+
+
+def run_block(profile, ticks):
+    """(ns spent inside tick() over ticks ticks, the loop) on a fresh simulator."""
+    world = World.room(400, 300, boxes=BOXES)
+    sim = Simulator(world, car_pins(car), script=scenario_guard(), seed=1)
+    with settings({"PROFILE": profile}):
+        loop = car.ControlLoop(sim.hardware(), log=lambda msg: None, rng=random.Random(1))
+        loop.start()
+        spent = 0
+        clock = sim.clock
+        try:
+            for _ in range(ticks):
+                t0 = time.perf_counter_ns()
+                loop.tick()
+                spent += time.perf_counter_ns() - t0
+                clock.sleep(car.LOOP_DT)
+        finally:
+            loop.shutdown()
+    return spent, loop
+
+
+def main():
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    blocks = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    lap = lap_cost()
+    print(f"lap: {lap:.0f} ns")
+
+    spent = {False: 0, True: 0}
+    for _ in range(blocks):
+        for profile in (False, True):
+            ns, loop = run_block(profile, ticks)
+            spent[profile] += ns
+    n = ticks * blocks
+    off = spent[False] / n
+    on = spent[True] / n
+    laps = sum(h.count for stack, h in loop.prof.spans.items() if stack != "tick") / ticks
+    period = car.LOOP_DT * 1e9
+    print(f"tick: off {off / 1000:.1f} us, on {on / 1000:.1f} us over {n} ticks each")
+    for name, ns in (("measured", on - off), ("expected", laps * lap)):
+        print(f"overhead {name}: {ns / 1000:5.2f} us per tick = {ns / off * 100:5.2f}% of the tick's work, "
+              f"{ns / period * 100:.3f}% of LOOP_DT ({car.LOOP_DT * 1000:.0f} ms)")
+    print(f"          ({laps:.1f} laps per tick, LiDAR reads included)")
+
+    print()
+    print(loop.prof.report("tick", car.LOOP_DT))
+    print(loop.prof.report("tick;io;lidar"))
+    print()
+    for line in loop.prof.folded():
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# bench_replay.py
+#
+# Record sessions in the simulator, replay them, and check the replay
+# reproduces the recorded motor commands tick for tick.
+#
+#   1. Records a few simulator sessions (AUTO and GUARD, with a controller
+#      drop-out) with the real TelemetryRecorder.
+#   2. Replays each one with unchanged settings: expect 0 mismatched ticks.
+#   3. Batch-replays all of them with overrides, one process vs a pool, and
+#      reports how much the new settings change the output.
+#   4. Sweeps two configs (unchanged, OVERRIDES) over two of the sessions
+#      the way sweep.py --sessions does: they must score differently (the
+#      recorded settings must not win over the swept ones).
+#
+# Usage:
+#   python bench_replay.py [seconds per session] [sessions]
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import rc_car_modes_bluetooth_fix_good as car
+from bench_sim_modes import BOXES, scenario_auto, scenario_guard
+from replay import format_summary, replay_many, replay_session
+from sim import Simulator, World, car_pins
+from sweep import run_sweep
+from telemetry import TelemetryRecorder
+
+OVERRIDES = {"AUTO_STOP_CM": 50, "SLOW_DISTANCE_CM": 90, "GUARD_DECEL_CM_S2": 100}
+
+
+def record(path, script, seconds, seed):
+    script = script + [(seconds * 0.5, "disconnect", 0, 0), (seconds * 0.5 + 1.3, "connect", 0, 0)]
+    world = World.room(400, 300, boxes=BOXES)
+    sim = Simulator(world, car_pins(car), script=script, seed=seed, spike_prob=0.01)
+    rec = TelemetryRecorder(path, sim.clock, flush_sec=0.02)
+    loop = car.ControlLoop(sim.hardware(), log=lambda msg: None, rng=random.Random(seed), telemetry=rec)
+    return sim.run(loop, seconds=seconds)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 120.0
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    tmp = tempfile.mkdtemp(prefix="replay-bench-")
+    try:
+        sessions = []
+        t0 = time.perf_counter()
+        for i in range(count):
+            path = os.path.join(tmp, f"session-{i:02d}")
+            script = scenario_auto() if i % 2 == 0 else scenario_guard()
+            record(path, script, seconds, seed=i)
+            sessions.append(path)
+        print(f"recorded {count} x {seconds:.0f} s sessions in {time.perf_counter() - t0:.1f} s\n")
+
+        print("-- replay, unchanged settings")
+        exact = 0
+        for path in sessions:
+            s = replay_session(path).summary
+            exact += s["mismatched"] == 0
+            print(format_summary(s))
+        print(f"{exact}/{count} sessions reproduced exactly\n")
+
+        print("-- batch replay with " + ", ".join(f"{k}={v}" for k, v in OVERRIDES.items()))
+        for workers in (1, None):
+            t0 = time.perf_counter()
+            summaries = replay_many(sessions, OVERRIDES, workers=workers)
+            sec = time.perf_counter() - t0
+            ticks = sum(s["ticks"] for s in summaries)
+            changed = sum(s["mismatched"] for s in summaries)
+            label = "1 process" if workers == 1 else f"pool ({os.cpu_count()} cpus)"
+            print(f"{label:18s}: {ticks} ticks in {sec:5.2f} s ({ticks / sec:7.0f} ticks/s), "
+                  f"{changed} ticks ({100.0 * changed / ticks:.1f}%) differ from the recording")
+
+        print("\n-- sweep over recorded sessions: unchanged vs the overrides")
+        rows = run_sweep([{}, OVERRIDES], sessions[:2], [0], seconds, workers=1, log=lambda msg: None)
+        scores = {}
+        for index, target, _, metrics in rows:
+            scores.setdefault(index, []).append(metrics["changed_pct"])
+            print(f"config {index}: {target}: {metrics['changed_pct']:.1f}% of ticks changed")
+        if scores[0] == scores[1]:
+            print("the swept settings made no difference: sessions mode is replaying the recorded config")
+            raise SystemExit(1)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# bench_sensor_fusion.py
+#
+# Range sensors (sensors.py) from 1 to 8 TF-Lunas.
+#
+# pty: k emulated TF-Lunas (tfluna_emulator.PtyTFLuna, 100 Hz each, in a
+# separate process) read in real time by
+#   threads   a thread per port, each in a blocking read with a serial
+#             timeout (what copying lidar_thread_fn per sensor gives)
+#   selector  SensorRegistry.serve(): one thread, one selector for all ports
+# while a ~50 Hz consumer looks at every sensor's channel like a control tick
+# (randomised period, so its phase against the frames doesn't bias the age).
+# Reported per k: CPU (this process: readers + consumer), context switches
+# per second, frames parsed per second, and the age of the newest sample
+# when the consumer reads it (p50 / p99).
+#
+# simulator: AUTO in the bench_sim_modes room with the forward TF-Luna plus
+# k - 1 more around the car (front corners, sides, rear corners, rear;
+# FUSION_SECTORS = 8). Reported: tick cost (mean), the io + fusion stages
+# (mean, profiler), and collisions.
+#
+# Usage:
+#   python bench_sensor_fusion.py [seconds per pty run] [simulated seconds]
+
+import multiprocessing
+import random
+import resource
+import sys
+import threading
+import time
+
+import serial
+
+import rc_car_modes_bluetooth_fix_good as car
+from bench_sim_modes import BOXES, scenario_auto
+from hal import Clock
+from loop_timing import Histogram
+from sensors import Mount, RangeSensor, SensorRegistry
+from sim import Simulator, World, car_pins
+from tfluna_emulator import PtyTFLuna
+
+COUNTS = (1, 2, 4, 8)
+CONSUMER_DT = 0.02
+
+# The forward TF-Luna is the control script's own; these are the others, in order
+MOUNTS = (
+    ("rear", Mount(-12.0, 0.0, 180.0)),
+    ("left", Mount(0.0, 8.0, 90.0)),
+    ("right", Mount(0.0, -8.0, -90.0)),
+    ("front_left", Mount(8.0, 6.0, 45.0)),
+    ("front_right", Mount(8.0, -6.0, -45.0)),
+    ("rear_left", Mount(-10.0, 6.0, 135.0)),
+    ("rear_right", Mount(-10.0, -6.0, -135.0)),
+)
+
+
+def emulators(k, names, stop):
+    """Child process: k PtyTFLunas at 100 Hz until stop is set."""
+    devs = [PtyTFLuna(distance=lambda t, i=i: 100.0 + 10 * i).start() for i in range(k)]
+    names.put([d.name for d in devs])
+    stop.wait()
+    for d in devs:
+        d.close()
+
+
+def reader_threads(sensors, clock, stopped):
+    def run(s):
+        while not stopped():
+            s.feed(clock.monotonic(), s.parser.read_bytes(s.port))    # blocks up to the serial timeout
+    threads = [threading.Thread(target=run, args=(s,), daemon=True) for s in sensors]
+    for t in threads:
+        t.start()
+    return threads
+
+
+def run_pty(k, how, seconds):
+    ctx = multiprocessing.get_context("fork")
+    names, stop = ctx.Queue(), ctx.Event()
+    proc = ctx.Process(target=emulators, args=(k, names, stop), daemon=True)
+    proc.start()
+    clock = Clock()
+    sensors = [RangeSensor(f"s{i}", Mount(0.0, 0.0, 0.0), lambda n=n: serial.Serial(n, 115200, timeout=0.05))
+               for i, n in enumerate(names.get())]
+    reg = SensorRegistry(sensors)
+    reg.open()
+    done = False
+    if how == "selector":
+        threads = [threading.Thread(target=reg.serve, args=(clock, lambda: done), daemon=True)]
+        threads[0].start()
+    else:
+        threads = reader_threads(sensors, clock, lambda: done)
+
+    age = Histogram()
+    rng = random.Random(k)
+    time.sleep(0.5)     # streaming
+    frames0 = sum(s.channel.seq for s in sensors)
+    ru0 = resource.getrusage(resource.RUSAGE_SELF)
+    cpu0 = time.process_time()
+    t0 = time.monotonic()
+    next_t = t0
+    while time.monotonic() - t0 < seconds:
+        next_t += CONSUMER_DT * rng.uniform(0.5, 1.5)
+        time.sleep(max(0.0, next_t - time.monotonic()))
+        now = clock.monotonic()
+        for s in sensors:
+            sample = s.channel.snapshot()
+            if sample is not None:
+                age.record(int((now - sample.t) * 1e9))
+    wall = time.monotonic() - t0
+    cpu = time.process_time() - cpu0
+    ru = resource.getrusage(resource.RUSAGE_SELF)
+    frames = sum(s.channel.seq for s in sensors) - frames0
+    done = True
+    for t in threads:
+        t.join()
+    reg.close()
+    stop.set()
+    proc.join()
+    switches = (ru.ru_nvcsw + ru.ru_nivcsw) - (ru0.ru_nvcsw + ru0.ru_nivcsw)
+    return cpu / wall, switches / wall, frames / wall, age
+
+
+def run_sim(k, seconds):
+    sim = Simulator(World.room(400, 300, boxes=BOXES), car_pins(car), script=scenario_auto(), seed=1)
+    for name, mount in MOUNTS[:k - 1]:
+        sim.add_range_sensor(name, mount)
+    loop = car.ControlLoop(sim.hardware(), log=lambda msg: None, rng=random.Random(1))
+    sim.run(loop, seconds=seconds)
+    spans = loop.prof.spans
+
+    def mean(name):
+        h = spans.get(name)
+        return h.mean() / 1000 if h is not None and h.count else 0.0
+    return mean("tick"), mean("tick;io"), mean("tick;fusion"), sim.world.collisions
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    sim_sec = float(sys.argv[2]) if len(sys.argv) > 2 else 300.0
+
+    print(f"pty: k TF-Lunas at 100 Hz, {seconds:.0f} s per run, consumer every ~{CONSUMER_DT * 1000:.0f} ms")
+    print(f"{'k':>2s} {'reader':9s} {'CPU':>6s} {'switches/s':>11s} {'frames/s':>9s} {'age p50':>9s} {'p99':>8s}")
+    for k in COUNTS:
+        for how in ("threads", "selector"):
+            cpu, switches, fps, age = run_pty(k, how, seconds)
+            print(f"{k:2d} {how:9s} {cpu * 100:5.1f}% {switches:11.0f} {fps:9.0f} "
+                  f"{age.percentile(50) / 1e6:6.2f} ms {age.percentile(99) / 1e6:5.2f} ms")
+
+    print(f"\nsimulator: AUTO, {sim_sec:.0f} simulated s, forward TF-Luna + k - 1 more")
+    print(f"{'k':>2s} {'tick':>9s} {'io':>9s} {'fusion':>9s} {'collisions':>10s}")
+    for k in COUNTS:
+        tick, io, fusion, collisions = run_sim(k, sim_sec)
+        print(f"{k:2d} {tick:6.1f} us {io:6.1f} us {fusion:6.1f} us {collisions:10d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# bench_session_archive.py
+#
+# session_archive.py on a simulated session: GUARD driving into the walls,
+# with an E-stop (B) every ESTOP_EVERY s and a re-arm (A) 2 s later, recorded with the
+# real TelemetryRecorder.
+#
+# 1) write throughput: packing the session at a few zlib levels / row group
+#    sizes. Reported: records/s and MB/s of records in, how much smaller the
+#    archive is, and how many times faster than the car records ("x rec").
+#    Packing is one thread; run this on the car to see its CPU's numbers.
+# 2) the 2 s before every E-stop, for the LiDAR, controller and state
+#    streams: from the archive (blocks decompressed / all blocks) vs loading
+#    the session folder, and vs decompressing the whole archive. The three
+#    must give the same records.
+# 3) the archive unpacked back to a session folder replays with 0
+#    mismatched ticks.
+#
+# Usage:
+#   python bench_session_archive.py [simulated seconds]
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import rc_car_modes_bluetooth_fix_good as car
+from bench_replay import record
+from bench_sim_modes import scenario_guard
+from replay import replay_session
+from session_archive import STREAM_IDS, Archive, pack_session, unpack
+from sim import press
+from telemetry import load_session
+
+LEVELS = (1, 6)
+BLOCK_ROWS = (1024, 4096, 16384)
+WINDOW_SEC = 2.0
+QUERY_STREAMS = ("lidar", "controller", "state")
+REPEATS = 5
+ESTOP_EVERY = 60.0
+
+
+def scenario(seconds):
+    script = scenario_guard()
+    for t in np.arange(30.0, seconds - 2.0, ESTOP_EVERY):
+        script += press(t, car.BTN_B) + press(t + 2.0, car.BTN_A)
+    return script
+
+
+def timed(fn, repeats=REPEATS):
+    """(best wall time of repeats, fn's result)."""
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 600.0
+    tmp = tempfile.mkdtemp(prefix="archive-bench-")
+    try:
+        session = os.path.join(tmp, "session")
+        record(session, scenario(seconds), seconds, seed=1)
+        records = sum(len(a) for a in load_session(session).values())
+        raw = sum(a.nbytes for a in load_session(session).values())
+        print(f"session: {seconds:.0f} simulated s, {records} records, {raw / 1e6:.2f} MB")
+
+        print(f"\n{'level':>5s} {'rows':>6s} {'records/s':>10s} {'MB/s':>6s} {'smaller':>8s} {'x rec':>7s}")
+        path = os.path.join(tmp, "session.rca")
+        for level in LEVELS:
+            for rows in BLOCK_ROWS:
+                sec, (w, size) = timed(lambda: pack_session(session, path, rows, level), repeats=3)
+                print(f"{level:5d} {rows:6d} {records / sec:10.0f} {raw / sec / 1e6:6.1f} {raw / size:7.1f}x "
+                      f"{seconds / sec:6.0f}x")
+        w, size = pack_session(session, path)
+        print(f"events: {len(w.events)} ({size / 1e6:.2f} MB archive at the defaults)")
+
+        print(f"\n{WINDOW_SEC:g} s before every E-stop")
+        print(f"{'stream':10s} {'records':>8s} {'archive':>9s} {'blocks':>9s} {'folder':>9s} {'whole':>9s}")
+        with Archive(path) as arc:
+            whole = arc.load()
+            for stream in QUERY_STREAMS:
+                arc.blocks_read = 0
+                sec, wins = timed(lambda: arc.windows(stream, "estop", WINDOW_SEC))
+                blocks = arc.blocks_read // REPEATS
+                total = int(np.count_nonzero(arc.groups["stream"] == STREAM_IDS[stream]))
+                total *= len(whole[stream].dtype.names)
+
+                def from_records(data):
+                    rec = data[stream]
+                    return [rec[(rec["t"] >= t - WINDOW_SEC) & (rec["t"] < t)] for t, _ in wins]
+                folder_sec, ref = timed(lambda: from_records(load_session(session)))
+                whole_sec, ref2 = timed(lambda: from_records(arc.load()))
+                for (_, a), b, c in zip(wins, ref, ref2):
+                    if a.tobytes() != np.asarray(b).tobytes() or a.tobytes() != c.tobytes():
+                        raise SystemExit(f"{stream}: archive windows differ from the session's records")
+                n = sum(len(a) for _, a in wins)
+                print(f"{stream:10s} {n:8d} {sec * 1000:6.2f} ms {blocks:4d}/{total:<4d} "
+                      f"{folder_sec * 1000:6.2f} ms {whole_sec * 1000:6.2f} ms")
+
+        unpacked = os.path.join(tmp, "unpacked")
+        unpack(path, unpacked)
+        s = replay_session(unpacked).summary
+        print(f"\nunpacked session replays: {s['ticks']} ticks, {s['mismatched']} mismatched")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
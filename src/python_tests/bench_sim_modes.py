@@ -0,0 +1,59 @@
+# bench_sim_modes.py
+#
+# Runs the real control loop (rc_car_modes_bluetooth_fix_good.ControlLoop)
+# against the simulator and reports how much faster than real time it goes.
+#
+# Usage:
+#   python bench_sim_modes.py            # 100k ticks per scenario
+#   python bench_sim_modes.py 1000000    # a million ticks per scenario
+
+import random
+import sys
+import time
+
+import rc_car_modes_bluetooth_fix_good as car
+from sim import Simulator, World, car_pins, press
+
+BOXES = [(120, 80, 40, 40), (280, 200, 60, 30), (60, 220, 30, 50)]
+
+
+def scenario_auto():
+    # Arm, X twice -> AUTO
+    return press(0.5, car.BTN_A) + press(1.0, car.BTN_X) + press(1.5, car.BTN_X)
+
+
+def scenario_guard():
+    # Arm, X -> GUARD, then drive both sticks forward into the walls on and off
+    fwd = -1.0 if car.FORWARD_IS_NEGATIVE else 1.0
+    script = press(0.5, car.BTN_A) + press(1.0, car.BTN_X)
+    for k in range(2000):
+        t = 2.0 + k * 4.0
+        script += [(t, "axis", car.LEFT_AXIS_Y, fwd), (t, "axis", car.RIGHT_AXIS_Y, fwd),
+                   (t + 3.0, "axis", car.LEFT_AXIS_Y, -fwd * 0.5),
+                   (t + 3.0, "axis", car.RIGHT_AXIS_Y, fwd * 0.2)]
+    return script
+
+
+def run(name, script, ticks):
+    world = World.room(400, 300, boxes=BOXES)
+    sim = Simulator(world, car_pins(car), script=script, seed=1)
+    loop = car.ControlLoop(sim.hardware(), log=lambda msg: None, rng=random.Random(1))
+
+    t0 = time.perf_counter()
+    n = sim.run(loop, ticks=ticks)
+    wall = time.perf_counter() - t0
+    sim_sec = n * car.LOOP_DT
+
+    print(f"{name:6s}: {n} ticks in {wall:6.2f} s  ({n / wall:8.0f} ticks/s, "
+          f"{sim_sec / wall:6.1f}x real time)  collisions={world.collisions} "
+          f"odometer={world.odometer_cm / 100:.1f} m  lidar frames={sim.lidar.frames_sent}")
+
+
+def main():
+    ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    run("AUTO", scenario_auto(), ticks)
+    run("GUARD", scenario_guard(), ticks)
+
+
+if __name__ == "__main__":
+    main()
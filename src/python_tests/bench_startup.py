@@ -0,0 +1,178 @@
+# bench_startup.py
+#
+# Time-to-armable of ControlLoop.start() in real time, on simulated devices
+# that take as long as the real ones to come up:
+#
+#   motors      connecting to pigpiod                      PIGPIO_CONNECT_SEC
+#   lidar       opening the UART                           SERIAL_OPEN_SEC
+#               first frame after the stream command       LIDAR_FIRST_FRAME_SEC
+#   controller  import pygame + display/joystick init      PYGAME_INIT_SEC
+#               (pygame.init() adds audio, fonts, ...)     PYGAME_FULL_EXTRA_SEC
+#               paired pad enumerated after init           PAD_ENUM_SEC
+#
+# The latencies are rough Raspberry Pi 3 B+ figures; the [STARTUP] line the
+# script prints on the car gives the real ones. "serial" replays the
+# bring-up as it was before bringup.py (everything in turn, pygame.init(),
+# 0.3 s of LiDAR settle sleeps, 1 s controller polls) on the same devices.
+#
+# Usage:
+#   python bench_startup.py [runs]
+
+import statistics
+import sys
+import threading
+import time
+
+import rc_car_modes_bluetooth_fix_good as car
+from hal import Clock, Gamepad, Hardware, LidarPort, MotorPins
+from tfluna import CONTINUOUS_MODE_COMMAND, encode_frame
+
+PIGPIO_CONNECT_SEC = 0.05
+SERIAL_OPEN_SEC = 0.02
+LIDAR_FIRST_FRAME_SEC = 0.03
+LIDAR_RATE_HZ = 100
+PYGAME_INIT_SEC = 0.35
+PYGAME_FULL_EXTRA_SEC = 0.6
+PAD_ENUM_SEC = 0.1
+
+
+class SlowMotors(MotorPins):
+    def open(self):
+        time.sleep(PIGPIO_CONNECT_SEC)
+
+    def set_output(self, pin):
+        pass
+
+    def write(self, pin, level):
+        pass
+
+    def set_PWM_dutycycle(self, pin, duty):
+        pass
+
+
+class SlowLidar(LidarPort):
+    """Streams a fixed 150 cm at LIDAR_RATE_HZ, starting LIDAR_FIRST_FRAME_SEC after the command."""
+
+    def __init__(self):
+        time.sleep(SERIAL_OPEN_SEC)
+        self.start = None
+        self.sent = 0
+        self.buf = bytearray()
+        self.frame = encode_frame(150, 3000, 40.0)
+
+    def _fill(self):
+        if self.start is None:
+            return
+        due = int((time.monotonic() - self.start) * LIDAR_RATE_HZ)
+        if due > self.sent:
+            self.buf += self.frame * (due - self.sent)
+            self.sent = due
+
+    @property
+    def in_waiting(self):
+        self._fill()
+        return len(self.buf)
+
+    def read(self, n=1):
+        self._fill()
+        if not self.buf:
+            time.sleep(0.002)       # pyserial blocks up to its timeout
+        out = bytes(self.buf[:n])
+        del self.buf[:n]
+        return out
+
+    def write(self, data):
+        if self.start is None:
+            self.start = time.monotonic() + LIDAR_FIRST_FRAME_SEC
+        return len(data)
+
+
+class SlowGamepad(Gamepad):
+    def __init__(self, full_init=False):
+        self.full_init = full_init
+        self.visible_at = None
+
+    def open(self):
+        time.sleep(PYGAME_INIT_SEC + (PYGAME_FULL_EXTRA_SEC if self.full_init else 0.0))
+        self.visible_at = time.monotonic() + PAD_ENUM_SEC
+
+    def connected(self):
+        return True
+
+    def reconnect(self):
+        return self.visible_at is not None and time.monotonic() >= self.visible_at
+
+    def get_name(self):
+        return "simulated pad"
+
+    def get_numbuttons(self):
+        return 16
+
+    def get_button(self, i):
+        return 0
+
+    def get_axis(self, i):
+        return 0.0
+
+    def get_numaxes(self):
+        return 6
+
+
+def hardware():
+    return Hardware(Clock(), SlowMotors(), SlowLidar, SlowGamepad(), realtime=True)
+
+
+def parallel_startup():
+    """(time to armable, time to first LiDAR sample, [STARTUP] report) of ControlLoop.start()."""
+    loop = car.ControlLoop(hardware(), log=lambda msg: None)
+    t0 = time.monotonic()
+    loop.start()
+    armable = time.monotonic() - t0
+    lidar_ready = loop.bringup.futures["lidar"]
+    lidar_ready.result(2.0)
+    first = loop.bringup.times["lidar"][1]
+    loop.shutdown()
+    return armable, first, loop.bringup.report()
+
+
+def serial_startup():
+    """The bring-up before bringup.py, step by step on the same devices."""
+    t0 = time.monotonic()
+    motors = SlowMotors()
+    motors.open()
+    pad = SlowGamepad(full_init=True)
+    pad.open()                                  # pygame.init()
+    first = {}
+
+    def lidar_thread():
+        ser = SlowLidar()
+        time.sleep(0.2)
+        ser.write(CONTINUOUS_MODE_COMMAND)
+        time.sleep(0.1)
+        while not ser.in_waiting:
+            time.sleep(0.001)
+        first["t"] = time.monotonic() - t0
+
+    th = threading.Thread(target=lidar_thread, daemon=True)
+    th.start()
+    while not pad.reconnect():                  # "Waiting for controller..."
+        time.sleep(1)
+    armable = time.monotonic() - t0
+    th.join()
+    return armable, first["t"]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"startup on simulated devices, median of {runs} runs")
+    ser = [serial_startup() for _ in range(runs)]
+    par = [parallel_startup() for _ in range(runs)]
+    for name, rs in (("serial", ser), ("parallel", par)):
+        armable = statistics.median(r[0] for r in rs)
+        first = statistics.median(r[1] for r in rs)
+        print(f"{name:9s}: armable after {armable * 1000:6.0f} ms, first LiDAR sample after {first * 1000:6.0f} ms")
+    print(f"last parallel run: {par[-1][2]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# bench_telemetry_stream.py
+#
+# Load test of the live telemetry server (telemetry_stream.py): does a crowd
+# of subscribers slow the control loop down?
+#
+# The threaded runtime runs in real time as on the car (ControlLoop.run():
+# paced loop, LiDAR reader thread on a pty-backed TF-Luna emulator at
+# 100 Hz, scripted controller driving GUARD), with a TelemetryStreamer as
+# its telemetry sink. A second process opens N UDP clients on localhost and
+# services them with one selector:
+#   readers  subscribe at 1..50 Hz (mixed rates and LiDAR reductions) and
+#            read every packet
+#   stalled  every 4th client subscribes and never reads (its socket buffer
+#            fills; the kernel drops what doesn't fit)
+# All of them renew their lease. The server is given room for everyone
+# (max_clients, budget) so the cost of serving them is what's measured.
+#
+# Per client count:
+#   work    control tick duration (LoopScheduler.work: p50 / p99 / max)
+#   jitter  how late a tick started vs its deadline (p99 / max)
+#   age     LiDAR sample age when a tick reads it (p99)
+#   sent    packets sent per second, received by the reading clients
+#   drops   packets dropped by the server's per-client queues
+#
+# Usage:
+#   python bench_telemetry_stream.py [seconds per run] [client counts...]
+
+import json
+import multiprocessing
+import selectors
+import socket
+import sys
+import time
+
+import rc_car_modes_bluetooth_fix_good as car
+from bench_async_runtime import MeasuredLoop, NullMotors
+from hal import Clock, Hardware
+from sim import ScriptedGamepad, press
+from telemetry_stream import LEASE_SEC, MAX_DATAGRAM, STREAMS, TelemetryStreamer, subscribe_request
+from tfluna_emulator import PtyTFLuna
+
+CLIENT_COUNTS = (0, 1, 8, 32, 64)
+CLIENT_RATES = (50, 25, 10, 5, 1)
+STALLED_EVERY = 4
+
+
+def clients(port, n, seconds, ready, result):
+    """Client process: n UDP subscribers on one selector; puts (received, subscribed, busy)."""
+    sel = selectors.DefaultSelector()
+    socks = []
+    for i in range(n):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setblocking(False)
+        s.bind(("127.0.0.1", 0))
+        stalled = i % STALLED_EVERY == STALLED_EVERY - 1
+        req = subscribe_request(CLIENT_RATES[i % len(CLIENT_RATES)], STREAMS, ("minmax", "decimate")[i % 2])
+        socks.append((s, req))
+        if not stalled:
+            sel.register(s, selectors.EVENT_READ)
+    received = subscribed = busy = 0
+    renew = 0.0
+    end = None
+    ready.set()
+    while end is None or time.monotonic() < end:
+        now = time.monotonic()
+        if end is None:
+            end = now + seconds
+        if now >= renew:
+            for s, req in socks:
+                s.sendto(req, ("127.0.0.1", port))
+            renew = now + LEASE_SEC / 2
+        for key, _ in sel.select(0.05):
+            while True:
+                try:
+                    data = key.fileobj.recv(MAX_DATAGRAM)
+                except BlockingIOError:
+                    break
+                msg = json.loads(data)
+                if "op" not in msg:
+                    received += 1
+                elif msg["op"] == "subscribed":
+                    subscribed += 1
+                else:
+                    busy += 1
+    for s, _ in socks:
+        s.close()
+    result.put((received, subscribed, busy))
+
+
+def run(n, seconds):
+    dev = PtyTFLuna(distance=lambda t: 120.0 + 80.0 * ((t * 0.4) % 1.0)).start()
+    clock = Clock()
+    fwd = -1.0 if car.FORWARD_IS_NEGATIVE else 1.0
+    script = press(0.2, car.BTN_A) + press(0.4, car.BTN_X)
+    script += [(0.6, "axis", car.LEFT_AXIS_Y, fwd), (0.6, "axis", car.RIGHT_AXIS_Y, fwd)]
+    hw = Hardware(clock, NullMotors(), dev.open, ScriptedGamepad(clock, script), realtime=True)
+    streamer = TelemetryStreamer(clock, "127.0.0.1", 0, car.ENA, max_hz=50, max_clients=max(1, n),
+                                 budget_pps=100_000)
+    loop = MeasuredLoop(hw, log=lambda msg: None, telemetry=streamer)
+
+    proc = None
+    if n:
+        streamer.open()         # the clients need the port before the loop starts
+        ctx = multiprocessing.get_context("fork")
+        ready = ctx.Event()
+        result = ctx.Queue()
+        proc = ctx.Process(target=clients, args=(streamer.port, n, seconds + 1.0, ready, result), daemon=True)
+        proc.start()
+        ready.wait()
+
+    loop.run(seconds=seconds)
+    got = (0, 0, 0)
+    if proc is not None:
+        got = result.get()
+        proc.join()
+    streamer.close()
+    dev.close()
+    return loop, streamer, got
+
+
+def us(ns):
+    return ns / 1000
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    counts = [int(a) for a in sys.argv[2:]] or CLIENT_COUNTS
+    print(f"{seconds:.0f} s per run, LOOP_DT={car.LOOP_DT * 1000:.0f} ms, every {STALLED_EVERY}th client never reads")
+    print(f"{'clients':>7s} {'work p50':>9s} {'p99':>8s} {'max':>8s} {'jitter p99':>11s} {'max':>8s} "
+          f"{'age p99':>8s} {'overruns':>8s} {'sent/s':>7s} {'recv/s':>7s} {'drops':>6s} {'busy':>5s}")
+    for n in counts:
+        loop, streamer, (received, subscribed, busy) = run(n, seconds)
+        s = loop.sched
+        dropped = streamer.written["dropped"] + sum(c.dropped for c in streamer.clients.values())
+        print(f"{n:7d} {us(s.work.percentile(50)):6.0f} us {us(s.work.percentile(99)):5.0f} us "
+              f"{us(s.work.max):5.0f} us {us(s.jitter.percentile(99)):8.0f} us {us(s.jitter.max):5.0f} us "
+              f"{us(loop.age.percentile(99)):5.0f} us {s.overruns:8d} {streamer.written['packets'] / seconds:7.0f} "
+              f"{received / seconds:7.0f} {dropped:6d} {busy:5d}")
+
+
+if __name__ == "__main__":
+    main()
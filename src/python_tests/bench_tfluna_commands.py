@@ -0,0 +1,208 @@
+# bench_tfluna_commands.py
+#
+# TF-Luna commands (tfluna_commands.py) against the byte-level emulator
+# (tfluna_emulator.py), then the adaptive frame rate in the simulator.
+#
+# pty: the emulator runs on a pty in real time; pyserial, TFLunaParser and
+# TFLunaCommander talk to it exactly as they would to /dev/serial0 (a reader
+# thread parses the port, the main thread sends and polls). Each step is
+# checked and printed with its response latency (send -> matched by poll();
+# includes the reader's serial timeout when less than a frame is waiting):
+#   version, output format (cm / mm / ASCII), output off / on, frame rates
+#   (measured frames per second after each switch), save + soft reset,
+#   restore defaults, a command with a bad checksum (must get no response)
+#
+# simulator: GUARD runs (disarmed 10 s, then the bench_sim_modes stick
+# pattern) with the adaptive rate and with the fixed sensor default.
+# Reported, disarmed and armed: frames parsed per second and LiDAR
+# read + parse + publish time per second (profiler "tick;io;lidar;*").
+#
+# Usage:
+#   python bench_tfluna_commands.py [simulated seconds]
+
+import random
+import sys
+import threading
+import time
+
+import rc_car_modes_bluetooth_fix_good as car
+from bench_sim_modes import BOXES, scenario_guard
+from replay import settings
+from sim import Simulator, World, car_pins
+from tfluna import TFLunaParser
+from tfluna_commands import (
+    CMD_FRAME_RATE, FORMAT_CM, FORMAT_MM, FORMAT_PIX, TFLunaCommander, command,
+    format_version, get_version, restore_defaults, save_settings, set_frame_rate, set_output,
+    set_output_format, soft_reset,
+)
+from tfluna_emulator import PtyTFLuna
+
+RATES = (10, 20, 50, 100, 250)
+MEASURE_SEC = 1.0
+ACK_WAIT_SEC = 0.5
+IDLE_SEC = 10.0
+
+
+class Reader:
+    """Parses the port in its own thread, like the LiDAR reader."""
+
+    def __init__(self, ser):
+        self.ser = ser
+        self.parser = TFLunaParser()
+        self.frames = 0
+        self.last = None
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop.is_set():
+            for frame in self.parser.read(self.ser):
+                self.frames += 1
+                self.last = frame
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+
+
+def send(commander, cmd):
+    """Send and wait for the response: (ok, latency s, payload)."""
+    t0 = time.monotonic()
+    commander.send(cmd, t0)
+    cmd_id = cmd[2]
+    while time.monotonic() - t0 < ACK_WAIT_SEC:
+        commander.poll(time.monotonic())
+        if cmd_id not in commander.pending:
+            break
+        time.sleep(0.001)
+    hit = commander.confirmed.get(cmd_id)
+    if hit is not None and hit[0] is cmd and hit[2] >= t0:
+        return True, hit[2] - t0, hit[1]
+    return False, None, None
+
+
+def frame_rate(reader, sec=MEASURE_SEC):
+    time.sleep(0.1)                 # the old period runs out first
+    n0 = reader.frames
+    time.sleep(sec)
+    return (reader.frames - n0) / sec
+
+
+def check(name, ok, latency=None, detail=""):
+    lat = f"{latency * 1000:6.2f} ms" if latency is not None else "        -"
+    print(f"  {'ok  ' if ok else 'FAIL'} {name:28s} {lat}  {detail}")
+    return ok
+
+
+def main_pty():
+    print("pty emulator, pyserial + TFLunaParser + TFLunaCommander")
+    pty = PtyTFLuna(distance=lambda t: 123.0).start()
+    ser = pty.open()
+    reader = Reader(ser)
+    commander = TFLunaCommander(ser, reader.parser.responses, None, timeout=ACK_WAIT_SEC * 2, log=print)
+    em = pty.emulator
+    passed = []
+    try:
+        ok, lat, payload = send(commander, get_version())
+        passed.append(check("get_version", ok, lat, format_version(payload) if ok else ""))
+
+        ok, lat, _ = send(commander, set_output_format(FORMAT_MM))
+        time.sleep(0.05)
+        passed.append(check("format mm", ok and reader.last[0] == 1230, lat, f"123 cm reads {reader.last[0]}"))
+        ok, lat, _ = send(commander, set_output_format(FORMAT_PIX))
+        n = frame_rate(reader, 0.3)
+        passed.append(check("format ascii", ok and n == 0, lat, f"{n:.0f} binary frames/s"))
+        ok, lat, _ = send(commander, set_output_format(FORMAT_CM))
+        time.sleep(0.05)
+        passed.append(check("format cm", ok and reader.last[0] == 123, lat, f"123 cm reads {reader.last[0]}"))
+
+        ok, lat, _ = send(commander, set_output(False))
+        n = frame_rate(reader, 0.5)
+        passed.append(check("output off", ok and n == 0, lat, f"{n:.0f} frames/s"))
+        ok, lat, _ = send(commander, set_output(True))
+        n = frame_rate(reader, 0.5)
+        passed.append(check("output on", ok and n > 0, lat, f"{n:.0f} frames/s"))
+
+        for hz in RATES:
+            ok, lat, _ = send(commander, set_frame_rate(hz))
+            n = frame_rate(reader)
+            passed.append(check(f"frame rate {hz} Hz", ok and abs(n - hz) <= max(2, hz * 0.05), lat,
+                                f"measured {n:.0f} frames/s"))
+
+        send(commander, set_frame_rate(50))
+        ok, lat, _ = send(commander, save_settings())
+        passed.append(check("save (50 Hz)", ok and em.saved["rate_hz"] == 50, lat))
+        send(commander, set_frame_rate(250))
+        ok, lat, _ = send(commander, soft_reset())
+        passed.append(check("soft reset -> saved rate", ok and em.rate_hz == 50, lat, f"{em.rate_hz} Hz"))
+        ok, lat, _ = send(commander, restore_defaults())
+        passed.append(check("restore defaults", ok and em.rate_hz == 100, lat, f"{em.rate_hz} Hz"))
+
+        ignored = em.ignored
+        bad = bytearray(command(CMD_FRAME_RATE, (20).to_bytes(2, "little")))
+        bad[-1] ^= 0xFF
+        ser.write(bytes(bad))
+        time.sleep(0.2)
+        passed.append(check("bad checksum ignored", em.ignored > ignored and em.rate_hz == 100
+                            and not reader.parser.responses, None, f"rate still {em.rate_hz} Hz"))
+    finally:
+        reader.close()
+        ser.close()
+        pty.close()
+    p = reader.parser
+    print(f"  {sum(passed)}/{len(passed)} passed; parser ok={p.frames_ok} bad={p.bad}, "
+          f"emulator commands={em.commands} ignored={em.ignored}")
+    return all(passed)
+
+
+def run_sim(adaptive, seconds):
+    """({armed: frames/s}, {armed: LiDAR us per second}, commands sent)"""
+    script = [(t + IDLE_SEC, kind, i, v) for t, kind, i, v in scenario_guard()]
+    sim = Simulator(World.room(400, 300, boxes=BOXES), car_pins(car), script=script, seed=5)
+    with settings({"LIDAR_ADAPTIVE_RATE": adaptive}):
+        loop = car.ControlLoop(sim.hardware(), log=lambda msg: None, rng=random.Random(5))
+        loop.start()
+        clock = sim.clock
+        t0 = clock.t
+        frames = {False: 0, True: 0}
+        sec = {False: 0.0, True: 0.0}
+        lidar_ns = {False: 0, True: 0}
+        try:
+            while clock.t - t0 < seconds:
+                n = loop.lidar_parser.frames_ok
+                spans = [loop.prof.spans.get(s) for s in car.INLINE_LIDAR_SPANS]
+                ns = sum(h.total for h in spans if h is not None)
+                loop.tick()
+                clock.sleep(car.LOOP_DT)
+                frames[loop.armed] += loop.lidar_parser.frames_ok - n
+                sec[loop.armed] += car.LOOP_DT
+                spans = [loop.prof.spans.get(s) for s in car.INLINE_LIDAR_SPANS]
+                lidar_ns[loop.armed] += sum(h.total for h in spans if h is not None) - ns
+        finally:
+            loop.shutdown()
+    rate = {k: frames[k] / sec[k] if sec[k] else 0.0 for k in frames}
+    us = {k: lidar_ns[k] / 1000 / sec[k] if sec[k] else 0.0 for k in frames}
+    return rate, us, loop.lidar_cmd.sent
+
+
+def main_sim(seconds):
+    print(f"\nsimulator, GUARD: {IDLE_SEC:.0f} s disarmed, then {seconds - IDLE_SEC:.0f} s of stick pattern")
+    print(f"{'':9s} {'disarmed':>24s} {'armed':>24s}")
+    print(f"{'rate':9s} {'frames':>11s} {'lidar time':>12s} {'frames':>11s} {'lidar time':>12s} {'commands':>8s}")
+    for adaptive in (False, True):
+        rate, us, sent = run_sim(adaptive, seconds)
+        print(f"{'adaptive' if adaptive else 'fixed':9s} {rate[False]:6.1f} fr/s {us[False]:7.0f} us/s "
+              f"{rate[True]:6.1f} fr/s {us[True]:7.0f} us/s {sent:8d}")
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 120.0
+    ok = main_pty()
+    main_sim(seconds)
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
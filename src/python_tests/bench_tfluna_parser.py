@@ -0,0 +1,217 @@
+# bench_tfluna_parser.py
+#
+# Benchmark: old byte-at-a-time read_tfluna_frame_sync() vs TFLunaParser.
+#
+# Runs off the robot. Feeds both readers the same byte stream through a fake
+# serial port that behaves like the UART driver (in_waiting / read(n)), and
+# counts read() calls as a stand-in for syscalls.
+#
+# Usage:
+#   python bench_tfluna_parser.py                 # synthetic stream with noise
+#   python bench_tfluna_parser.py capture.bin     # raw bytes recorded from /dev/serial0
+#
+# If pyserial is installed (Linux), the same stream is also pushed through a
+# pty so both readers pay for real read() syscalls like on the Pi.
+#
+# Noise injected into the synthetic stream:
+#   - random garbage bursts between frames
+#   - single-byte corruptions inside frames (checksum failures)
+#   - truncated frames (dropped bytes)
+#   - stray 0x59 bytes (false headers)
+
+import os
+import pty
+import random
+import sys
+import threading
+import time
+
+from tfluna import TFLunaParser, encode_frame
+
+FRAMES = 200_000
+CHUNK_BYTES = 64        # bytes the UART hands us per wakeup (~5 ms @ 115200)
+NOISE_RATE = 0.02       # per-frame probability of each noise kind
+SEED = 1234
+
+
+class FakeSerial:
+    """Minimal pyserial stand-in that releases the stream in UART-sized chunks."""
+
+    def __init__(self, data, chunk=CHUNK_BYTES):
+        self.data = data
+        self.pos = 0
+        self.chunk = chunk
+        self.avail_end = 0
+        self.reads = 0
+
+    @property
+    def in_waiting(self):
+        if self.avail_end <= self.pos:
+            self.avail_end = min(len(self.data), self.pos + self.chunk)
+        return self.avail_end - self.pos
+
+    def read(self, n=1):
+        self.reads += 1
+        out = self.data[self.pos:self.pos + n]
+        self.pos += len(out)
+        return out
+
+    def done(self):
+        return self.pos >= len(self.data)
+
+
+def legacy_read_tfluna_frame_sync(ser):
+    # Verbatim copy of the reader that used to live in rc_car_modes_bluetooth_fix_good.py
+    b = ser.read(1)
+    if not b:
+        return None
+    while b[0] != 0x59:
+        b = ser.read(1)
+        if not b:
+            return None
+
+    b2 = ser.read(1)
+    if not b2 or b2[0] != 0x59:
+        return None
+
+    payload = ser.read(7)
+    if len(payload) != 7:
+        return None
+
+    frame = bytes([0x59, 0x59]) + payload
+    chk = sum(frame[:8]) & 0xFF
+    if chk != frame[8]:
+        return None
+
+    dist_cm = frame[2] + (frame[3] << 8)
+    strength = frame[4] + (frame[5] << 8)
+    return dist_cm, strength
+
+
+def make_stream(n_frames, noise_rate, seed):
+    rng = random.Random(seed)
+    out = bytearray()
+    clean = 0
+    for i in range(n_frames):
+        frame = bytearray(encode_frame(20 + (i % 800), 1000 + (i % 5000), 40.0))
+        r = rng.random()
+        if r < noise_rate:
+            out += bytes(rng.randrange(256) for _ in range(rng.randrange(1, 16)))
+        elif r < 2 * noise_rate:
+            k = rng.randrange(2, 9)
+            frame[k] ^= 1 << rng.randrange(8)
+            out += frame
+            continue
+        elif r < 3 * noise_rate:
+            out += frame[:rng.randrange(1, 9)]
+            continue
+        elif r < 4 * noise_rate:
+            out.append(0x59)
+        out += frame
+        clean += 1
+    return bytes(out), clean
+
+
+def bench_legacy(data):
+    ser = FakeSerial(data)
+    ok = bad = 0
+    t0 = time.perf_counter()
+    while not ser.done():
+        ser.in_waiting      # keep chunking identical to the parser run
+        if legacy_read_tfluna_frame_sync(ser):
+            ok += 1
+        else:
+            bad += 1
+    dt = time.perf_counter() - t0
+    return ok, bad, ser.reads, dt
+
+
+def bench_parser(data):
+    ser = FakeSerial(data)
+    parser = TFLunaParser()
+    ok = 0
+    t0 = time.perf_counter()
+    while not ser.done():
+        ok += len(parser.read(ser))
+    dt = time.perf_counter() - t0
+    return ok, parser, ser.reads, dt
+
+
+def bench_pty(data, use_parser):
+    """Push data through a pty and read it with a real serial.Serial."""
+    import serial
+
+    master, slave = pty.openpty()
+    ser = serial.Serial(os.ttyname(slave), 115200, timeout=0.2)
+
+    def writer():
+        view = memoryview(data)
+        for i in range(0, len(view), CHUNK_BYTES):
+            os.write(master, view[i:i + CHUNK_BYTES])
+
+    t = threading.Thread(target=writer, daemon=True)
+    ok = 0
+    parser = TFLunaParser()
+    t0 = time.thread_time()
+    t.start()
+    while True:
+        if use_parser:
+            frames = parser.read(ser)
+            ok += len(frames)
+            if not frames and not t.is_alive() and not ser.in_waiting:
+                break
+        else:
+            if legacy_read_tfluna_frame_sync(ser):
+                ok += 1
+            elif not t.is_alive() and not ser.in_waiting:
+                break
+    cpu = time.thread_time() - t0
+    ser.close()
+    os.close(master)
+    os.close(slave)
+    return ok, cpu
+
+
+def main():
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "rb") as f:
+            data = f.read()
+        expected = None
+        print(f"Recorded stream: {sys.argv[1]} ({len(data)} bytes)")
+    else:
+        data, expected = make_stream(FRAMES, NOISE_RATE, SEED)
+        print(f"Synthetic stream: {FRAMES} frames, {len(data)} bytes, noise={NOISE_RATE:.0%} per kind, seed={SEED}")
+
+    stream_sec = len(data) * 10 / 115200   # 10 bits per byte on the wire
+
+    ok, bad, reads, dt = bench_legacy(data)
+    print(f"legacy : {ok:8d} frames  bad={bad:6d}  reads={reads:8d}  "
+          f"{dt * 1000:8.1f} ms  ({ok / dt:10.0f} frames/s, {dt / stream_sec:6.2%} of real time)")
+    legacy_dt = dt
+
+    ok, parser, reads, dt = bench_parser(data)
+    print(f"parser : {ok:8d} frames  bad={parser.bad:6d}  reads={reads:8d}  "
+          f"{dt * 1000:8.1f} ms  ({ok / dt:10.0f} frames/s, {dt / stream_sec:6.2%} of real time)")
+    print(f"         resyncs={parser.resyncs} checksum_errors={parser.checksum_errors} "
+          f"bytes_skipped={parser.bytes_skipped}")
+
+    if expected is not None:
+        print(f"clean frames injected: {expected}")
+    print(f"speedup: {legacy_dt / dt:.1f}x")
+
+    try:
+        import serial  # noqa: F401
+    except ImportError:
+        print("pyserial not installed - skipping pty run")
+        return
+
+    print("\nReal serial reads through a pty (reader thread CPU time):")
+    ok, cpu_legacy = bench_pty(data, use_parser=False)
+    print(f"legacy : {ok:8d} frames  cpu={cpu_legacy * 1000:8.1f} ms  ({cpu_legacy / stream_sec:6.2%} of one core)")
+    ok, cpu_parser = bench_pty(data, use_parser=True)
+    print(f"parser : {ok:8d} frames  cpu={cpu_parser * 1000:8.1f} ms  ({cpu_parser / stream_sec:6.2%} of one core)")
+    print(f"speedup: {cpu_legacy / cpu_parser:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# bench_watchdog.py
+#
+# Motor watchdog (watchdog.py) under injected control-loop stalls.
+#
+# Simulator: the car is armed in MANUAL and driven down a long corridor at
+# full stick. Some way in, one tick blocks for STALL seconds (virtual time
+# keeps passing, as it would on the car), with the watchdog off and on.
+# Reported per run:
+#   trips     - watchdog trips
+#   reaction  - deadline -> both duties zeroed (physics steps are 10 ms)
+#   driven    - distance covered while the loop was blocked
+#   armed     - armed on the first tick after it (a trip disarms)
+#
+# Real time: the watchdog's own thread against a loop that feeds it every
+# LOOP_DT and then stalls, either blocked in a sleep (a hung pygame / serial
+# call: the GIL is released) or spinning in Python code (the thread has to
+# win the GIL back, sys.getswitchinterval()). Reaction p50 / p99 / max.
+#
+# Usage:
+#   python bench_watchdog.py [stalls per real-time case]
+
+import random
+import sys
+import time
+
+import rc_car_modes_bluetooth_fix_good as car
+from hal import Clock
+from replay import settings
+from sim import Simulator, World, car_pins, press
+from watchdog import Watchdog
+
+STALLS = (0.05, 0.2, 0.5, 1.0)
+STALL_AT = 3.0          # seconds after start, at full speed by then
+RT_STALL_SEC = 0.3
+
+
+def run_sim(stall, timeout):
+    """(trips, first reaction, cm driven during the stall, armed after it)"""
+    fwd = -1.0 if car.FORWARD_IS_NEGATIVE else 1.0
+    script = press(0.5, car.BTN_A)
+    script += [(1.0, "axis", car.LEFT_AXIS_Y, fwd), (1.0, "axis", car.RIGHT_AXIS_Y, fwd)]
+    world = World.room(3000, 120, start=(50.0, 60.0, 0.0))
+    sim = Simulator(world, car_pins(car), script=script, seed=3)
+    with settings({"WATCHDOG_TIMEOUT_SEC": timeout}):
+        loop = car.ControlLoop(sim.hardware(), log=lambda msg: None, rng=random.Random(0))
+        loop.start()
+        t0 = sim.clock.t
+        try:
+            while sim.clock.t - t0 < STALL_AT:
+                loop.tick()
+                sim.clock.sleep(car.LOOP_DT)
+            x0 = world.x
+            sim.clock.sleep(stall)
+            x1 = world.x
+            loop.tick()
+            armed = loop.armed
+        finally:
+            loop.shutdown()
+    trips = loop.watchdog.trips
+    return len(trips), trips[0].reaction if trips else None, x1 - x0, armed
+
+
+def main_sim():
+    timeout = car.WATCHDOG_TIMEOUT_SEC
+    print(f"simulator, full stick in MANUAL, WATCHDOG_TIMEOUT_SEC={timeout}")
+    print(f"{'stall':>6s} {'watchdog':>8s} {'trips':>5s} {'reaction':>9s} {'driven':>8s} {'armed':>6s}")
+    for stall in STALLS:
+        for t in (0.0, timeout):
+            trips, reaction, driven, armed = run_sim(stall, t)
+            r = f"{reaction * 1000:6.1f} ms" if reaction is not None else "       -"
+            print(f"{stall:5.2f}s {'on' if t else 'off':>8s} {trips:5d} {r:>9s} {driven:6.1f}cm {str(armed):>6s}")
+
+
+def rt_case(name, stall_fn, stalls, timeout):
+    clock = Clock()
+    wd = Watchdog(clock, timeout, lambda: None)
+    wd.start()
+    try:
+        for _ in range(stalls):
+            for _ in range(10):
+                wd.feed(clock.monotonic())
+                time.sleep(car.LOOP_DT)
+            wd.feed(clock.monotonic())
+            stall_fn(RT_STALL_SEC)
+        wd.feed(clock.monotonic())
+    finally:
+        wd.stop()
+    r = wd.reaction
+    print(f"{name:8s} {len(wd.trips):5d} {r.percentile(50) / 1e6:7.3f} ms {r.percentile(99) / 1e6:7.3f} ms "
+          f"{r.max / 1e6:7.3f} ms")
+
+
+def spin(sec):
+    end = time.monotonic() + sec
+    n = 0
+    while time.monotonic() < end:
+        n += 1
+    return n
+
+
+def main_rt(stalls):
+    timeout = car.WATCHDOG_TIMEOUT_SEC
+    print(f"\nreal time, {stalls} stalls of {RT_STALL_SEC * 1000:.0f} ms per case, timeout {timeout * 1000:.0f} ms, "
+          f"switch interval {sys.getswitchinterval() * 1000:.0f} ms")
+    print(f"{'stall':8s} {'trips':>5s} {'p50':>10s} {'p99':>10s} {'max':>10s}")
+    rt_case("blocked", time.sleep, stalls, timeout)
+    rt_case("busy", spin, stalls, timeout)
+
+
+def main():
+    stalls = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    main_sim()
+    main_rt(stalls)
+
+
+if __name__ == "__main__":
+    main()
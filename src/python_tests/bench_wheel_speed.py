@@ -0,0 +1,123 @@
+# bench_wheel_speed.py
+#
+# Closed-loop wheel speed control (wheel_speed.py, SPEED_CONTROL) vs the
+# open-loop duty commands, in the simulator.
+#
+# The car is armed in MANUAL in a long corridor and both sticks step to
+# STICK at t=1 s, i.e. a target of STICK * FULL_SPEED_CM_S. The same step
+# runs on a nominal chassis and on ones the motor model doesn't know about:
+#   low battery - 75% of the nominal top speed
+#   carpet      - static friction up (dead band duty 40 -> 70)
+# Reported per run, on the true ground speed (sim.World):
+#   rise     - 10% -> 90% of the target
+#   over     - overshoot above the target
+#   settle   - step -> staying within SETTLE_BAND of the target
+#   ss err   - mean error over the last second
+#   tick     - speed control stage cost (profiler "tick;speed" mean)
+#
+# Then calibrate() on the nominal chassis (what `python wheel_speed.py` does
+# on the car) against the motor model it replaces.
+#
+# Usage:
+#   python bench_wheel_speed.py [stick 0..1]
+
+import random
+import sys
+
+import rc_car_modes_bluetooth_fix_good as car
+from motor_output import MotorOutput
+from replay import settings
+from sim import MAX_WHEEL_SPEED_CM_S, Simulator, World, car_pins, press
+from wheel_speed import SpeedTable, calibrate
+
+STICK = 0.6
+STEP_AT = 1.0
+RUN_SEC = 4.0
+SETTLE_BAND = 0.05
+
+CHASSIS = (
+    ("nominal", {}),
+    ("low battery", {"max_speed_cm_s": MAX_WHEEL_SPEED_CM_S * 0.75}),
+    ("carpet", {"deadband_duty": 70}),
+)
+
+
+def run(speed_control, stick, world_kw):
+    """[(t since the step, ground speed)], speed stage mean ns (None if open loop)"""
+    fwd = -stick if car.FORWARD_IS_NEGATIVE else stick
+    script = press(0.5, car.BTN_A)
+    script += [(STEP_AT, "axis", car.LEFT_AXIS_Y, fwd), (STEP_AT, "axis", car.RIGHT_AXIS_Y, fwd)]
+    world = World.room(3000, 120, start=(50.0, 60.0, 0.0), **world_kw)
+    sim = Simulator(world, car_pins(car), script=script, seed=4)
+    samples = []
+    with settings({"SPEED_CONTROL": speed_control, "SPEED_CAL_FILE": ""}):
+        loop = car.ControlLoop(sim.hardware(), log=lambda msg: None, rng=random.Random(0))
+        loop.start()
+        t0 = sim.clock.t
+        try:
+            while sim.clock.t - t0 < RUN_SEC:
+                loop.tick()
+                sim.clock.sleep(car.LOOP_DT)
+                samples.append((sim.clock.t - t0 - STEP_AT, 0.5 * (world.v_left + world.v_right)))
+        finally:
+            loop.shutdown()
+    h = loop.prof.spans.get("tick;speed")
+    return samples, h.mean() if h is not None and h.count else None
+
+
+def step_metrics(samples, target):
+    after = [(t, v) for t, v in samples if t >= 0]
+    t10 = next((t for t, v in after if v >= 0.1 * target), None)
+    t90 = next((t for t, v in after if v >= 0.9 * target), None)
+    rise = t90 - t10 if t10 is not None and t90 is not None else None
+    over = max(0.0, max(v for _, v in after) - target) / target
+    settle = 0.0
+    for t, v in after:
+        if abs(v - target) > SETTLE_BAND * target:
+            settle = t
+    if settle >= after[-1][0]:
+        settle = None
+    tail = [v for t, v in after if t >= after[-1][0] - 1.0]
+    ss = sum(tail) / len(tail) - target
+    return rise, over, settle, ss
+
+
+def fmt_sec(sec):
+    return f"{sec * 1000:5.0f} ms" if sec is not None else "       -"
+
+
+def main_steps(stick):
+    target = stick * car.FULL_SPEED_CM_S
+    print(f"step to stick {stick} -> target {target:.1f} cm/s, band +-{SETTLE_BAND * 100:.0f}%")
+    print(f"{'chassis':12s} {'control':7s} {'rise':>8s} {'over':>6s} {'settle':>8s} {'ss err':>12s} {'tick':>8s}")
+    for name, kw in CHASSIS:
+        for closed in (False, True):
+            samples, ns = run(closed, stick, kw)
+            rise, over, settle, ss = step_metrics(samples, target)
+            cost = f"{ns / 1000:5.1f} us" if ns is not None else "       -"
+            print(f"{name:12s} {'closed' if closed else 'open':7s} {fmt_sec(rise)} {over * 100:5.1f}% {fmt_sec(settle)} "
+                  f"{ss:+6.1f} cm/s {cost}")
+
+
+def main_calibrate():
+    # Room to roam: the sweep covers ~15 m (positive commands drive backwards on this car)
+    sim = Simulator(World.room(6000, 120, start=(3000.0, 60.0, 0.0)), car_pins(car))
+    left, right = car_pins(car)
+    out = MotorOutput(sim.motors, [left, right], sim.clock)
+    out.setup()
+    table = calibrate(out, sim.encoders, sim.clock, car.ENCODER_COUNTS_PER_CM, log=lambda msg: None)
+    model = SpeedTable.model(car.ODOM_DEADBAND_PCT, car.FULL_SPEED_CM_S, car.MAX_SPEED)
+    print(f"\ncalibrate() on the nominal chassis ({len(table.cmds)} commands) vs the motor model")
+    print(f"{'cmd':>4s} {'left':>7s} {'right':>7s} {'model':>7s}")
+    for cmd in (0, 15, 20, 40, 60, 80, 100):
+        print(f"{cmd:4d} {table.speed(0, cmd):7.1f} {table.speed(1, cmd):7.1f} {model.speed(0, cmd):7.1f}")
+
+
+def main():
+    stick = float(sys.argv[1]) if len(sys.argv) > 1 else STICK
+    main_steps(stick)
+    main_calibrate()
+
+
+if __name__ == "__main__":
+    main()
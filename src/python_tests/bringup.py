@@ -0,0 +1,82 @@
+# bringup.py
+#
+# Parallel hardware bring-up with readiness futures.
+#
+# Connecting to pigpiod, opening the TF-Luna's UART and initialising pygame
+# plus finding the controller are independent and mostly spent waiting, so
+# they run side by side on a small thread pool instead of one after another.
+# Each phase is a Future; the loop waits for the ones it needs before it
+# can be armed (motors, controller) and lets the LiDAR finish on its own:
+# until the first sample arrives the guard logic already treats it as stale.
+#
+# Every phase and milestone is timed from the moment BringUp was created:
+#
+#   [STARTUP] motors 41 ms | controller 212 ms | armable 212 ms | lidar 57 ms
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BringUpError(RuntimeError):
+    pass
+
+
+class BringUp:
+    def __init__(self, clock, workers=4):
+        self.clock = clock
+        self.t0 = clock.monotonic()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bringup")
+        self.futures = {}
+        self.times = {}         # name -> (start, end) seconds since t0; end None while running
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        return self.clock.monotonic() - self.t0
+
+    def phase(self, name, fn, *args):
+        """Run fn(*args) on the pool; returns its Future."""
+        start = self.elapsed()
+        with self._lock:
+            self.times[name] = (start, None)
+
+        def run():
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.times[name] = (start, self.elapsed())
+
+        fut = self.pool.submit(run)
+        self.futures[name] = fut
+        return fut
+
+    def mark(self, name):
+        """Record a milestone (e.g. "armable") at the current time."""
+        t = self.elapsed()
+        with self._lock:
+            self.times[name] = (t, t)
+
+    def ready(self, *names, timeout=None):
+        """Wait for the named phases; a failed one raises BringUpError."""
+        for name in names:
+            try:
+                self.futures[name].result(timeout)
+            except BringUpError:
+                raise
+            except Exception as e:
+                raise BringUpError(f"{name}: {e}") from e
+
+    def close(self):
+        """Let running phases finish in the background."""
+        self.pool.shutdown(wait=False)
+
+    def report(self):
+        with self._lock:
+            items = sorted(self.times.items(), key=lambda kv: (kv[1][1] is None, kv[1][1] or 0.0))
+        parts = []
+        for name, (start, end) in items:
+            if end is None:
+                parts.append(f"{name} (running)")
+            else:
+                parts.append(f"{name} {end * 1000:.0f} ms")
+        return "[STARTUP] " + " | ".join(parts)
@@ -0,0 +1,227 @@
+# config.py
+#
+# Runtime settings for the control script: one immutable, typed Config
+# (a namedtuple of every setting) that is validated once and then swapped as
+# a whole, so a reader always sees a consistent set.
+#
+#   defaults   - the script's module-level settings (name -> value); their
+#                types are the schema: bools must be bools, ints ints,
+#                floats take ints too, strings take None (off)
+#   choices    - {name: allowed values} for mode-like strings
+#   limits     - {name: (lo, hi)} inclusive ranges for numbers
+#   order      - (lo_name, hi_name) pairs that must hold lo <= hi, checked on
+#                the whole config (the file, and every change applied)
+#   restart    - settings only read at startup (pins, ports, sizes of things
+#                built once); changing them at runtime is reported and
+#                ignored until the next start
+#
+# ConfigService optionally reads a JSON file holding any subset of the
+# settings. At construction the file is applied on top of the defaults, and
+# an invalid file is an error. While running, the file is watched by mtime
+# polling (a thread every poll_sec on the car, poll_due() from the loop
+# elsewhere): a changed file is parsed and validated off the control path and
+# only the settings whose value changed are queued. The loop swaps them in
+# between ticks with update(). A broken edit is logged and the running
+# config kept. Every applied change is kept in `changes` with its timestamp
+# and source ("file", "button", ...) for correlating with telemetry.
+
+import json
+import os
+import threading
+from collections import deque, namedtuple
+
+
+class ConfigError(ValueError):
+    pass
+
+
+class ConfigService:
+    def __init__(self, defaults, path=None, choices=None, limits=None, restart=(),
+                 poll_sec=0.5, log=print, order=()):
+        self.Config = namedtuple("Config", list(defaults))
+        self.defaults = dict(defaults)
+        self.choices = choices or {}
+        self.limits = limits or {}
+        self.order = tuple(order)
+        self.restart = frozenset(restart)
+        self.path = path
+        self.poll_sec = poll_sec
+        self.log = log
+
+        self.changes = []           # (t, source, {name: (old, new)}), oldest first
+        self._queue = deque()       # validated {name: value} from the watcher
+        self._stat = None
+        self._next_poll = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.default_config = self._build({})
+        self.file_values = {}
+        if path is not None and os.path.exists(path):
+            self._stat = self._file_stat()
+            self.file_values = self.read_file()
+        self.current = self._build(self.file_values)
+
+    # ---- validation ----
+    def check(self, name, value):
+        """value as the setting's type, or ConfigError."""
+        if name not in self.defaults:
+            raise ConfigError(f"unknown setting {name}")
+        default = self.defaults[name]
+        if isinstance(default, bool):
+            ok = isinstance(value, bool)
+        elif isinstance(default, int):
+            ok = isinstance(value, int) and not isinstance(value, bool)
+        elif isinstance(default, float):
+            ok = isinstance(value, (int, float)) and not isinstance(value, bool)
+            value = float(value) if ok else value
+        elif isinstance(default, str):
+            ok = isinstance(value, str) or (value is None and name not in self.choices)
+        else:
+            ok = value is None or isinstance(value, (str, int, float))
+        if not ok:
+            raise ConfigError(f"{name}: expected {type(default).__name__}, got {value!r}")
+        if name in self.choices and value not in self.choices[name]:
+            raise ConfigError(f"{name}: {value!r} is not one of {', '.join(map(repr, self.choices[name]))}")
+        if name in self.limits:
+            lo, hi = self.limits[name]
+            if not lo <= value <= hi:
+                raise ConfigError(f"{name}: {value!r} outside {lo}..{hi}")
+        return value
+
+    def validate(self, values):
+        """{name: value} as the settings' types, checked together on top of the defaults, or ConfigError."""
+        config = self._build(values)
+        return {name: getattr(config, name) for name in values}
+
+    def _build(self, values):
+        """Config of the defaults with values on top; all problems in one ConfigError."""
+        merged = dict(self.defaults)
+        errors = []
+        for name, value in list(self.defaults.items()) + list(values.items()):
+            try:
+                merged[name] = self.check(name, value)
+            except ConfigError as e:
+                errors.append(str(e))
+        if not errors:
+            errors = self._misordered(merged)
+        if errors:
+            raise ConfigError("; ".join(errors))
+        return self.Config(**merged)
+
+    def _misordered(self, values):
+        """Problems with the order pairs in {name: value}."""
+        return [f"{lo} ({values[lo]!r}) must not be over {hi} ({values[hi]!r})"
+                for lo, hi in self.order if values[lo] > values[hi]]
+
+    # ---- file ----
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def read_file(self):
+        """{name: value} from the JSON file (raises ConfigError)."""
+        try:
+            with open(self.path) as f:
+                values = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ConfigError(f"{self.path}: {e}")
+        if not isinstance(values, dict):
+            raise ConfigError(f"{self.path}: expected a JSON object of settings")
+        return values
+
+    def poll(self):
+        """Check the file once; queue the settings its new contents change."""
+        stat = self._file_stat()
+        if stat == self._stat:
+            return False
+        self._stat = stat
+        try:
+            values = self.read_file() if stat is not None else {}     # deleted: back to defaults
+            target = self._build(values)
+        except ConfigError as e:
+            self.log(f"[CONFIG] {e} (keeping the running settings)")
+            return False
+        # Only what the edit changed, so e.g. a STOP_DISTANCE_CM set from the
+        # buttons survives an unrelated edit
+        before = self._build(self.file_values)
+        self.file_values = values
+        delta = {}
+        for name, value in target._asdict().items():
+            if value == getattr(before, name):
+                continue
+            if name in self.restart:
+                self.log(f"[CONFIG] {name} = {value!r} takes effect on restart")
+                continue
+            delta[name] = value
+        if delta:
+            self._queue.append(delta)
+        return bool(delta)
+
+    def poll_due(self, now):
+        """poll() at most every poll_sec (for loops without the watcher thread)."""
+        if self.path is None or now < self._next_poll:
+            return
+        self._next_poll = now + self.poll_sec
+        self.poll()
+
+    def start(self):
+        """Watch the file from a background thread."""
+        if self.path is None or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="config", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_sec):
+            self.poll()
+
+    # ---- applying (control thread only) ----
+    def push(self, values):
+        """Queue already-recorded changes, e.g. when replaying a session."""
+        self._queue.append({name: self.check(name, value) for name, value in values.items()})
+
+    def update(self, now):
+        """Swap in everything queued; {name: (old, new)} if anything changed, else None."""
+        if not self._queue:
+            return None
+        values = {}
+        while self._queue:
+            values.update(self._queue.popleft())
+        try:
+            return self._apply(now, "file", values)
+        except ConfigError as e:
+            self.log(f"[CONFIG] {e} (keeping the running settings)")
+            return None
+
+    def set(self, now, source, **values):
+        """Change settings right away (validated); {name: (old, new)} or None. ConfigError if invalid."""
+        return self._apply(now, source, {name: self.check(name, value) for name, value in values.items()})
+
+    def _apply(self, now, source, values):
+        old = self.current
+        changed = {name: (getattr(old, name), value) for name, value in values.items()
+                   if getattr(old, name) != value}
+        if not changed:
+            return None
+        new = old._replace(**{name: new for name, (_, new) in changed.items()})
+        errors = self._misordered(new._asdict())
+        if errors:
+            raise ConfigError("; ".join(errors))
+        self.current = new
+        self.changes.append((now, source, changed))
+        return changed
+
+
+def format_changes(changes):
+    return ", ".join(f"{name} {old!r} -> {new!r}" for name, (old, new) in changes.items())
@@ -0,0 +1,167 @@
+# controller_input.py
+#
+# Controller input subsystem: one writer turns gamepad input into an
+# immutable state snapshot + a queue of button edges.
+#
+# The control loop used to pump pygame, build a fresh list of every button
+# and compare it with last tick's list, and poll get_count() to notice a
+# lost controller. Now:
+#
+#   - backends that deliver events (hal.PygameGamepad: JOYBUTTONDOWN/UP,
+#     JOYAXISMOTION, JOYDEVICEADDED/REMOVED) are consumed on a thread that
+#     blocks in wait_events(), so a press is seen within microseconds and a
+#     hot-plugged controller is picked up without the loop ever waiting
+#   - polling backends (sim.ScriptedGamepad, ...) are diffed against the
+#     last state instead; that also works inline, one poll per tick
+#
+# Readers get:
+#   state   - ControllerState(connected, buttons bitmask, axes tuple, seq, t),
+#             rebound atomically by the writer (same scheme as LidarChannel)
+#   events  - deque of (t, button, down) edges; the loop drains it each tick,
+#             so a press shorter than a tick is never lost
+
+import threading
+from collections import deque, namedtuple
+
+NUM_AXES = 6            # axes kept in the snapshot (covers both sticks + triggers)
+NUM_BUTTONS = 32        # buttons kept (bits of the held / pressed masks)
+
+ControllerState = namedtuple("ControllerState", "connected buttons axes seq t")
+
+_new_state = tuple.__new__
+
+_ZERO_AXES = (0.0,) * NUM_AXES
+
+
+class ControllerInput:
+    def __init__(self, gamepad, clock, reconnect_sec=0.5, poll_sec=0.005, wait_sec=0.05,
+                 max_events=256):
+        self.pad = gamepad
+        self.clock = clock
+        self.reconnect_sec = reconnect_sec
+        self.poll_sec = poll_sec        # thread period for polling backends
+        self.wait_sec = wait_sec        # longest block in wait_events()
+
+        self.events = deque(maxlen=max_events)
+        self.name = None
+        self.reconnects = 0
+
+        self._connected = False
+        self._buttons = 0
+        self._axes = list(_ZERO_AXES)
+        self._reconnect_at = 0.0
+        self._seq = 0
+        self.state = _new_state(ControllerState, (False, 0, _ZERO_AXES, 0, 0.0))
+
+        self._thread = None
+        self._stop = False
+
+    # ---- lifecycle ----
+    def connect(self):
+        """Blocking first connect (before the loop starts). True if ready."""
+        if not self.pad.reconnect():
+            return False
+        self._attach(self.clock.monotonic())
+        return True
+
+    def start(self):
+        """Service the gamepad on its own thread."""
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="controller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop = True
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop:
+            if not self.poll(self.wait_sec):
+                self.clock.sleep(self.poll_sec)
+
+    # ---- writer side ----
+    def poll(self, timeout=0.0):
+        """One service pass. Returns False for polling backends (caller paces)."""
+        evs = self.pad.wait_events(timeout)
+        if evs is None:
+            self._poll_state()
+            return False
+        if evs:
+            self._apply(evs)
+        return True
+
+    def _publish(self, t):
+        self._seq += 1
+        self.state = _new_state(ControllerState,
+                                (self._connected, self._buttons, tuple(self._axes), self._seq, t))
+
+    def _attach(self, t):
+        self._connected = True
+        self._buttons = 0
+        self._axes[:] = _ZERO_AXES
+        self.name = self.pad.get_name()
+        self.reconnects += 1
+        self._publish(t)
+
+    def _detach(self, t):
+        self._connected = False
+        self._buttons = 0
+        self._axes[:] = _ZERO_AXES
+        self._reconnect_at = t
+        self._publish(t)
+
+    def _button(self, t, i, down):
+        bit = 1 << i
+        if down:
+            if not self._buttons & bit:
+                self._buttons |= bit
+                self.events.append((t, i, 1))
+        elif self._buttons & bit:
+            self._buttons &= ~bit
+            self.events.append((t, i, 0))
+
+    def _apply(self, evs):
+        t = self.clock.monotonic()
+        for kind, index, value in evs:
+            if kind == "button":
+                if self._connected and index < NUM_BUTTONS:
+                    self._button(t, index, value)
+            elif kind == "axis":
+                if self._connected and index < NUM_AXES:
+                    self._axes[index] = value
+            elif kind == "added":
+                if not self._connected:
+                    self._attach(t)
+            elif kind == "removed":
+                if self._connected:
+                    self._detach(t)
+        self._publish(t)
+
+    def _poll_state(self):
+        pad = self.pad
+        pad.pump()
+        t = self.clock.monotonic()
+        if self._connected and not pad.connected():
+            self._detach(t)
+        if not self._connected:
+            if t < self._reconnect_at:
+                return
+            self._reconnect_at = t + self.reconnect_sec
+            if not pad.reconnect():
+                return
+            self._attach(t)
+
+        before = self._buttons
+        for i in range(min(NUM_BUTTONS, pad.get_numbuttons())):
+            self._button(t, i, pad.get_button(i))
+        changed = self._buttons != before
+        axes = self._axes
+        for i in range(min(NUM_AXES, pad.get_numaxes())):
+            v = pad.get_axis(i)
+            if axes[i] != v:
+                axes[i] = v
+                changed = True
+        if changed:
+            self._publish(t)
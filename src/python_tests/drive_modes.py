@@ -0,0 +1,97 @@
+# drive_modes.py
+#
+# Drive modes as plugins: ControlLoop runs whichever mode is current, and X
+# steps to the next one in the registry (MANUAL -> GUARD -> AUTO -> ...).
+#
+# A mode is a DriveMode with three hooks:
+#   enter(inp)       it just became current (inp: this tick's snapshot)
+#   exit(inp)        it is about to stop being current
+#   tick(inp, out)   one armed tick: read the snapshot, write out.left /
+#                    out.right (-MAX_SPEED..MAX_SPEED, like the motor layer)
+# and, for the telemetry state stream, `state` (its own state machine, 0 if
+# it has none) and `turn_dir`. `min_hz_setting` names the setting with the
+# lowest TF-Luna frame rate it wants while armed (tfluna_commands.py).
+#
+# DriveInput is filled in place by the loop once per tick, before the mode
+# runs, and DriveOutput is written in place by the mode: both are
+# preallocated with __slots__ and reused, so handing a tick to a mode
+# allocates nothing. ModeRegistry keeps the modes in X order; switching is an
+# exit, an index and an enter, the same however many modes are registered.
+#
+# Modes are registered by index, and the index is what telemetry records as
+# `mode`: append new modes, don't reorder the existing ones.
+
+
+class DriveInput:
+    """What a mode sees of one tick."""
+
+    __slots__ = ("now", "axes", "dist", "fresh", "behind", "prev_left", "prev_right")
+
+    def __init__(self):
+        self.now = 0.0
+        self.axes = ()          # controller axes (ControllerInput state, not copied)
+        self.dist = None        # cm ahead (filtered, fused), None = no sample yet
+        self.fresh = False      # the forward LiDAR sample is recent enough to act on
+        self.behind = float("inf")     # cm behind (inf without rear sensors)
+        self.prev_left = 0      # last tick's command
+        self.prev_right = 0
+
+
+class DriveOutput:
+    """What a mode asks of the motors."""
+
+    __slots__ = ("left", "right")
+
+    def __init__(self):
+        self.left = 0
+        self.right = 0
+
+    def set(self, left, right):
+        self.left = left
+        self.right = right
+
+
+class DriveMode:
+    name = "MODE"
+    min_hz_setting = "LIDAR_MANUAL_MIN_HZ"
+
+    def __init__(self):
+        self.state = 0
+        self.turn_dir = 0
+
+    def enter(self, inp):
+        pass
+
+    def exit(self, inp):
+        pass
+
+    def tick(self, inp, out):
+        raise NotImplementedError
+
+
+class ModeRegistry:
+    """The drive modes in X order, and which one is current."""
+
+    def __init__(self, modes):
+        self.modes = list(modes)
+        if not self.modes:
+            raise ValueError("no drive modes")
+        self.index = 0
+        self.current = self.modes[0]
+
+    def __len__(self):
+        return len(self.modes)
+
+    def names(self):
+        return [m.name for m in self.modes]
+
+    def select(self, index, inp):
+        """Make modes[index] current (exit the old one, enter the new one); returns it."""
+        self.current.exit(inp)
+        self.index = index % len(self.modes)
+        self.current = self.modes[self.index]
+        self.current.enter(inp)
+        return self.current
+
+    def next(self, inp):
+        return self.select(self.index + 1, inp)
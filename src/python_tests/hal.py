@@ -0,0 +1,382 @@
+# hal.py
+#
+# Hardware abstraction layer for the RC car.
+#
+# The control script only talks to four things (five with encoders):
+#   - a clock         (time / sleep)
+#   - motor pins      (direction GPIOs + PWM duty, pigpio-style calls)
+#   - a LiDAR port    (pyserial-style byte stream from the TF-Luna)
+#   - a gamepad       (buttons / axes / connect state)
+#   - wheel encoders  (optional, for SPEED_CONTROL: wheel_speed.py)
+#   - range sensors   (optional, more TF-Lunas around the car: sensors.py)
+#
+# The real backends (pigpio, pyserial, pygame) live here and import their
+# libraries lazily, so this module (and the simulator in sim.py) can be used
+# on any Linux box without the robot's packages installed. Constructing them
+# is free; the slow part (connecting to pigpiod, initialising pygame) is in
+# open(), which the control loop runs for all devices in parallel
+# (bringup.py).
+
+import os
+import time
+
+
+# -----------------------------
+# Interfaces
+# -----------------------------
+class Clock:
+    """Wall clock. The simulator swaps in a virtual one."""
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def monotonic_ns(self):
+        return time.monotonic_ns()
+
+    def sleep(self, sec):
+        if sec > 0:
+            time.sleep(sec)
+
+    def watch(self, watchdog):
+        """Have watchdog.check() run as time passes (virtual clocks; in real time it has a thread)."""
+
+
+class MotorPins:
+    """Direction + PWM pins of the SN754410 (same method names as pigpio.pi)."""
+
+    def open(self):
+        """Connect to the driver (may block; called once before set_output())."""
+
+    def set_output(self, pin):
+        raise NotImplementedError
+
+    def write(self, pin, level):
+        raise NotImplementedError
+
+    def set_PWM_dutycycle(self, pin, duty):
+        """duty: 0..255"""
+        raise NotImplementedError
+
+    def set_bank_1(self, bits):
+        """Drive every GPIO 0-31 whose bit is set high (one call on pigpio)."""
+        for pin in range(32):
+            if bits >> pin & 1:
+                self.write(pin, 1)
+
+    def clear_bank_1(self, bits):
+        """Drive every GPIO 0-31 whose bit is set low."""
+        for pin in range(32):
+            if bits >> pin & 1:
+                self.write(pin, 0)
+
+    def stop(self):
+        pass
+
+
+class LidarPort:
+    """The subset of pyserial.Serial that the TF-Luna code uses."""
+
+    @property
+    def in_waiting(self):
+        raise NotImplementedError
+
+    def read(self, n=1):
+        raise NotImplementedError
+
+    def write(self, data):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Gamepad:
+    """Controller state, polled once per control tick."""
+
+    def open(self):
+        """Initialise the input backend (may block; called once before reconnect())."""
+
+    def pump(self):
+        """Process pending input events."""
+
+    def wait_events(self, timeout):
+        """Block up to timeout seconds for input; returns a list of events.
+
+        Events are (kind, index, value) with kind "button" (value 0/1),
+        "axis" (value -1..1), "added" or "removed". Returns None if the
+        backend can only be polled (pump() + get_button()/get_axis()).
+        """
+        return None
+
+    def connected(self):
+        raise NotImplementedError
+
+    def reconnect(self):
+        """Try to (re)open the first controller. Returns True if one is ready."""
+        raise NotImplementedError
+
+    def get_name(self):
+        return "?"
+
+    def get_numbuttons(self):
+        raise NotImplementedError
+
+    def get_button(self, i):
+        raise NotImplementedError
+
+    def get_axis(self, i):
+        raise NotImplementedError
+
+    def get_numaxes(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class Encoders:
+    """Quadrature wheel encoders: running counts per side."""
+
+    def open(self):
+        """Start counting (called once the motors are up)."""
+
+    def counts(self):
+        """(left, right) counts since open(); + = the way a positive motor command turns the wheel."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class Hardware:
+    """Bundle of backends handed to the control loop.
+
+    realtime=True: LiDAR is read by its own thread and the loop really sleeps.
+    realtime=False: the loop services the LiDAR inline every tick, so a
+    simulated run is deterministic and as fast as the CPU allows.
+    """
+
+    def __init__(self, clock, motors, open_lidar, gamepad, realtime=True, encoders=None, range_sensors=()):
+        self.clock = clock
+        self.motors = motors
+        self.open_lidar = open_lidar    # () -> LidarPort, called by the reader
+        self.gamepad = gamepad
+        self.realtime = realtime
+        self.encoders = encoders        # Encoders, or None if the car has none
+        self.range_sensors = list(range_sensors)   # [(name, sensors.Mount, () -> LidarPort)] besides the forward one
+
+    def close(self):
+        if self.encoders is not None:
+            self.encoders.close()
+        self.motors.stop()
+        self.gamepad.close()
+
+
+# -----------------------------
+# Real backends
+# -----------------------------
+class PigpioMotors(MotorPins):
+    def __init__(self):
+        self._pigpio = None
+        self.pi = None
+
+    def open(self):
+        import pigpio
+
+        self._pigpio = pigpio
+        self.pi = pigpio.pi()
+        if not self.pi.connected:
+            raise RuntimeError("Failed to connect to pigpio daemon!")
+
+    def set_output(self, pin):
+        self.pi.set_mode(pin, self._pigpio.OUTPUT)
+
+    def write(self, pin, level):
+        self.pi.write(pin, level)
+
+    def set_PWM_dutycycle(self, pin, duty):
+        self.pi.set_PWM_dutycycle(pin, duty)
+
+    def set_bank_1(self, bits):
+        self.pi.set_bank_1(bits)
+
+    def clear_bank_1(self, bits):
+        self.pi.clear_bank_1(bits)
+
+    def stop(self):
+        if self.pi is not None:
+            self.pi.stop()
+
+
+# Quadrature state (a << 1 | b) transitions: (old << 2 | new) -> step
+_QUAD_STEP = (0, 1, -1, 0, -1, 0, 0, 1, 1, 0, 0, -1, 0, -1, 1, 0)
+
+
+class PigpioEncoders(Encoders):
+    """A/B quadrature decoding in pigpio edge callbacks (pigpio's callback thread).
+
+    Shares the PigpioMotors connection. Swap a side's A/B pins if its counts
+    run backwards.
+    """
+
+    def __init__(self, motors, pins):
+        """pins: ((left_a, left_b), (right_a, right_b))"""
+        self.motors = motors
+        self.pins = pins
+        self._counts = [0, 0]
+        self._state = [0, 0]
+        self._callbacks = []
+
+    def open(self):
+        pigpio = self.motors._pigpio
+        pi = self.motors.pi
+        for side, (a, b) in enumerate(self.pins):
+            for pin in (a, b):
+                pi.set_mode(pin, pigpio.INPUT)
+                pi.set_pull_up_down(pin, pigpio.PUD_UP)
+            self._state[side] = pi.read(a) << 1 | pi.read(b)
+            self._callbacks.append(pi.callback(a, pigpio.EITHER_EDGE, self._edge(side, 1)))
+            self._callbacks.append(pi.callback(b, pigpio.EITHER_EDGE, self._edge(side, 0)))
+
+    def _edge(self, side, shift):
+        mask = 1 << shift
+        counts = self._counts
+        state = self._state
+
+        def cb(gpio, level, tick):
+            old = state[side]
+            new = (old | mask) if level else (old & ~mask)
+            state[side] = new
+            counts[side] += _QUAD_STEP[old << 2 | new]
+        return cb
+
+    def counts(self):
+        c = self._counts
+        return c[0], c[1]
+
+    def close(self):
+        for cb in self._callbacks:
+            cb.cancel()
+        self._callbacks = []
+
+
+def open_serial_lidar(port, baud, timeout=0.05):
+    """pyserial.Serial already implements LidarPort."""
+    import serial
+
+    return serial.Serial(port, baud, timeout=timeout)
+
+
+class PygameGamepad(Gamepad):
+    def __init__(self):
+        self._pygame = None
+        self.joy = None
+
+    def open(self):
+        # Only what joystick events need: the event queue lives in the video
+        # subsystem (no window with the dummy driver) - not pygame.init(),
+        # which also brings up audio, fonts, ...
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        import pygame
+
+        pygame.display.init()
+        pygame.joystick.init()
+        self._pygame = pygame
+
+    def pump(self):
+        self._pygame.event.pump()
+
+    def wait_events(self, timeout):
+        pygame = self._pygame
+        out = []
+        # wait(0) would block for good: a zero timeout is a plain poll
+        ev = pygame.event.wait(int(timeout * 1000)) if timeout > 0 else pygame.event.poll()
+        while ev.type != pygame.NOEVENT:
+            self._translate(ev, out)
+            ev = pygame.event.poll()
+        return out
+
+    def _translate(self, ev, out):
+        pygame = self._pygame
+        if ev.type == pygame.JOYDEVICEADDED:
+            # Also sent at startup for pads that are already plugged in
+            if self.joy is None:
+                j = pygame.joystick.Joystick(ev.device_index)
+                j.init()
+                self.joy = j
+                out.append(("added", ev.device_index, 0))
+            return
+        joy = self.joy
+        if joy is None or getattr(ev, "instance_id", None) != joy.get_instance_id():
+            return      # not our controller
+        if ev.type == pygame.JOYBUTTONDOWN:
+            out.append(("button", ev.button, 1))
+        elif ev.type == pygame.JOYBUTTONUP:
+            out.append(("button", ev.button, 0))
+        elif ev.type == pygame.JOYAXISMOTION:
+            out.append(("axis", ev.axis, ev.value))
+        elif ev.type == pygame.JOYDEVICEREMOVED:
+            self.joy = None
+            out.append(("removed", ev.instance_id, 0))
+
+    def connected(self):
+        return self.joy is not None and self._pygame.joystick.get_count() > 0
+
+    def reconnect(self):
+        pygame = self._pygame
+        pygame.joystick.quit()
+        pygame.joystick.init()
+        self.joy = None
+        if pygame.joystick.get_count() == 0:
+            return False
+        j = pygame.joystick.Joystick(0)
+        j.init()
+        self.joy = j
+        return True
+
+    def get_name(self):
+        return self.joy.get_name()
+
+    def get_numbuttons(self):
+        return self.joy.get_numbuttons()
+
+    def get_button(self, i):
+        return self.joy.get_button(i)
+
+    def get_axis(self, i):
+        return self.joy.get_axis(i)
+
+    def get_numaxes(self):
+        return self.joy.get_numaxes()
+
+    def close(self):
+        if self._pygame is not None:
+            self._pygame.quit()
+
+
+def robot_hardware(lidar_port, lidar_baud, encoder_pins=None, range_sensors=()):
+    """pigpio + /dev/serial0 + pygame: the real car (nothing is opened yet).
+
+    encoder_pins: ((left_a, left_b), (right_a, right_b)) if it has wheel encoders.
+    range_sensors: [(name, port, mount)] of more TF-Lunas (sensors.parse_sensors()).
+    """
+    motors = PigpioMotors()
+    return Hardware(
+        clock=Clock(),
+        motors=motors,
+        open_lidar=lambda: open_serial_lidar(lidar_port, lidar_baud),
+        gamepad=PygameGamepad(),
+        realtime=True,
+        encoders=PigpioEncoders(motors, encoder_pins) if encoder_pins else None,
+        range_sensors=[(name, mount, lambda port=port: open_serial_lidar(port, lidar_baud))
+                       for name, port, mount in range_sensors],
+    )
@@ -0,0 +1,59 @@
+# lidar_channel.py
+#
+# Single-writer LiDAR sample slot shared by the reader thread and the control loop.
+#
+# The old design took lidar_lock for every frame (even bad ones, just to bump
+# a counter) and again on every control tick. There is exactly one producer,
+# so no lock is needed:
+#
+# - the writer builds an immutable LidarSample and rebinds one attribute;
+#   under the GIL that store is atomic, so a reader can never see a torn
+#   sample (dist from one frame, timestamp from another)
+# - counters are plain ints written only by the writer
+# - every sample carries a sequence number, so a reader can tell how many
+#   new samples arrived since it last looked
+#
+# A classic seqlock (odd/even counter + retry) is NOT used on purpose: in
+# CPython a reader that catches the writer mid-update would spin holding the
+# GIL until the interpreter forces a switch (5 ms by default), which is a
+# quarter of a control tick.
+
+from collections import namedtuple
+
+# t is clock.monotonic() seconds at publish time; seq starts at 1
+LidarSample = namedtuple("LidarSample", "dist_cm strength temp_c t seq")
+
+# Skips namedtuple's Python-level __new__ (~2x cheaper per publish)
+_new_sample = tuple.__new__
+
+
+class LidarChannel:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Only call while the writer is stopped."""
+        self._latest = None
+        self.seq = 0        # samples published (== OK count)
+        self.bad = 0        # frames rejected by the parser or the strength filter
+
+    # ---- writer side (LiDAR thread only) ----
+    def publish(self, dist_cm, strength, temp_c, t):
+        seq = self.seq + 1
+        self._latest = _new_sample(LidarSample, (dist_cm, strength, temp_c, t, seq))
+        self.seq = seq
+
+    def reject(self, n=1):
+        self.bad += n
+
+    # ---- reader side (any thread, never blocks) ----
+    def snapshot(self):
+        """Latest LidarSample, or None if nothing was published yet."""
+        return self._latest
+
+    def read(self, last_seq=0):
+        """(sample, new) where new = samples published since last_seq."""
+        s = self._latest
+        if s is None:
+            return None, 0
+        return s, s.seq - last_seq
@@ -0,0 +1,201 @@
+# lidar_history.py
+#
+# Fixed-size NumPy ring buffer of recent TF-Luna samples + filters.
+#
+# GUARD and AUTO used to act on the single newest distance, so one spurious
+# reading could trigger a reverse/turn or a false stop. The LiDAR reader now
+# pushes every sample here and the control loop asks for a filtered value:
+#
+#   "raw"      - newest sample (old behaviour)
+#   "median"   - median of the last `window` samples (kills single spikes);
+#                push() keeps the window sorted (bisect: drop the sample
+#                leaving it, insert the new one) and publishes the median,
+#                so reading it is O(1)
+#   "ema"      - exponential moving average, time constant ema_tau_sec,
+#                updated in O(1) on every push
+#   "weighted" - strength-weighted mean of the last `window` samples
+#
+# closing_speed() fits a line to distance vs time over the last
+# `velocity_sec` seconds and returns how fast the obstacle is approaching
+# (one refit with outliers dropped, so spikes don't fake a closing speed).
+#
+# One writer (the LiDAR thread), any number of readers: push() fills the
+# slot first and bumps `count` last, and readers only look at slots below
+# the count they read, so as long as windows stay well under `size` a reader
+# never sees a half-written sample.
+
+import math
+from bisect import bisect_left, insort
+
+import numpy as np
+
+FILTERS = ("raw", "median", "ema", "weighted")
+
+OUTLIER_MIN_CM = 5.0    # closing_speed(): residuals below this are never outliers
+
+
+class LidarHistory:
+    def __init__(self, size=512, window=5, ema_tau_sec=0.05, velocity_sec=0.2):
+        self.size = size
+        self.window = window
+        self.ema_tau = ema_tau_sec
+        self.velocity_sec = velocity_sec
+
+        self.t = np.zeros(size)
+        self.dist = np.zeros(size)
+        self.strength = np.zeros(size)
+        self.reset()
+
+    def tune(self, window, ema_tau_sec):
+        """New filter window / EMA time constant. Only call while the writer is stopped."""
+        self.window = window
+        self.ema_tau = ema_tau_sec
+        self._sorted = sorted(self._last(self.dist, window, self.count).tolist())
+        self._median = _middle(self._sorted)
+
+    def reset(self):
+        """Only call while the writer is stopped."""
+        self.count = 0          # total samples ever pushed
+        self.ema = None
+        self._ema_t = 0.0
+        self._sorted = []       # the last min(window, size) distances, sorted
+        self._median = None
+
+    # ---- writer side ----
+    def push(self, t, dist_cm, strength):
+        i = self.count % self.size
+        w = self._sorted
+        k = min(self.window, self.size)
+        if self.count >= k:         # the sample leaving the window (before its slot is reused)
+            del w[bisect_left(w, self.dist[(self.count - k) % self.size])]
+        insort(w, float(dist_cm))
+        self._median = _middle(w)
+
+        self.t[i] = t
+        self.dist[i] = dist_cm
+        self.strength[i] = strength
+
+        if self.ema is None:
+            self.ema = float(dist_cm)
+        else:
+            dt = t - self._ema_t
+            a = 1.0 - math.exp(-dt / self.ema_tau) if self.ema_tau > 0 else 1.0
+            self.ema += a * (dist_cm - self.ema)
+        self._ema_t = t
+
+        self.count += 1
+
+    # ---- reader side ----
+    def _last(self, arr, k, n):
+        """Last k values (oldest first) of arr given a count snapshot n."""
+        k = min(k, n, self.size)
+        end = n % self.size
+        start = end - k
+        if start >= 0:
+            return arr[start:end]
+        return np.concatenate((arr[start:], arr[:end]))
+
+    def since(self, count):
+        """(t, dist) of the samples pushed after a count snapshot, oldest first.
+
+        Capped at half the buffer; pair with .count to fetch only new samples.
+        """
+        n = self.count
+        k = min(n - count, self.size // 2)
+        if k <= 0:
+            return self.t[:0], self.dist[:0]
+        return self._last(self.t, k, n), self._last(self.dist, k, n)
+
+    def latest(self):
+        n = self.count
+        if not n:
+            return None
+        return float(self.dist[(n - 1) % self.size])
+
+    def median(self, window=None):
+        n = self.count
+        if not n:
+            return None
+        if window is None or window == self.window:
+            return self._median
+        # Another window: np.sort beats np.median ~10x on a handful of samples
+        d = np.sort(self._last(self.dist, window or self.window, n))
+        k = d.size
+        if k % 2:
+            return float(d[k // 2])
+        return float(0.5 * (d[k // 2 - 1] + d[k // 2]))
+
+    def weighted(self, window=None):
+        n = self.count
+        if not n:
+            return None
+        k = window or self.window
+        d = self._last(self.dist, k, n)
+        w = self._last(self.strength, k, n)
+        total = w.sum()
+        if total <= 0:
+            return float(d[-1])
+        return float(np.dot(d, w) / total)
+
+    def filtered(self, kind):
+        if kind == "median":
+            return self.median()
+        if kind == "ema":
+            return self.ema
+        if kind == "weighted":
+            return self.weighted()
+        return self.latest()
+
+    def closing_speed(self, window_sec=None):
+        """cm/s the obstacle is approaching at (negative = moving away).
+
+        Least-squares slope of distance over the last window_sec seconds.
+        Returns 0.0 if there are not enough samples.
+        """
+        n = self.count
+        if n < 3:
+            return 0.0
+        window_sec = window_sec or self.velocity_sec
+        # Enough samples for 250 Hz, trimmed by timestamp below
+        k = min(n, self.size // 2, max(3, int(window_sec * 250) + 1))
+        t = self._last(self.t, k, n)
+        d = self._last(self.dist, k, n)
+        keep = t >= t[-1] - window_sec
+        t = t[keep]
+        d = d[keep]
+        if t.size < 3:
+            return 0.0
+        slope, resid = _fit_slope(t, d)
+        if slope is None:
+            return 0.0
+
+        # One refit without outliers so a single spike can't fake a closing speed
+        absres = np.abs(resid)
+        mad = np.partition(absres, absres.size // 2)[absres.size // 2]
+        keep = absres <= max(3.0 * 1.4826 * mad, OUTLIER_MIN_CM)
+        if 3 <= keep.sum() < t.size:
+            refit, _ = _fit_slope(t[keep], d[keep])
+            if refit is not None:
+                slope = refit
+        return float(-slope)
+
+
+def _middle(w):
+    """Median of a sorted list (None if empty)."""
+    k = len(w)
+    if not k:
+        return None
+    if k % 2:
+        return w[k // 2]
+    return 0.5 * (w[k // 2 - 1] + w[k // 2])
+
+
+def _fit_slope(t, d):
+    """Least-squares slope of d over t and the residuals."""
+    tc = t - t.mean()
+    var = np.dot(tc, tc)
+    if var <= 0:
+        return None, None
+    dc = d - d.mean()
+    slope = np.dot(tc, dc) / var
+    return slope, dc - slope * tc
@@ -0,0 +1,193 @@
+# loop_timing.py
+#
+# Fixed-rate pacing for the control loop + cheap latency histograms.
+#
+# The old loop did its work and then time.sleep(LOOP_DT), so the real period
+# was LOOP_DT + work time and drifted with print / pygame / pigpio latency.
+# LoopScheduler paces on absolute deadlines from clock.monotonic_ns():
+#
+#   deadline_k = start + k * period
+#
+# so work time is absorbed instead of added. If a tick runs past the next
+# deadline it is counted as an overrun and the catch-up policy decides what
+# happens to the ticks that were missed:
+#   "skip"  - drop them and realign to the next future deadline (default,
+#             a late motor command is worse than a missing one)
+#   "burst" - run them back to back (at most max_burst), then realign
+#
+# Histograms (period, work, jitter) are kept live and can be queried with
+# stats() or printed with report().
+
+import bisect
+
+
+class Histogram:
+    """Fixed-bucket histogram of nanosecond values.
+
+    Buckets grow geometrically (default 5% wide) from lo_ns to hi_ns, so
+    record() is one bisect + one increment and never allocates. Percentiles
+    are reported as the upper edge of the bucket they fall in (capped at max).
+    """
+
+    def __init__(self, lo_ns=1_000, hi_ns=60_000_000_000, ratio=1.05):
+        bounds = []
+        b = float(lo_ns)
+        while b < hi_ns:
+            bounds.append(int(b))
+            b *= ratio
+        bounds.append(int(hi_ns))
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, ns):
+        self.counts[bisect.bisect_left(self.bounds, ns)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+        if self.min is None or ns < self.min:
+            self.min = ns
+
+    def percentile(self, p):
+        if not self.count:
+            return 0
+        want = p / 100.0 * self.count
+        seen = 0
+        bounds = self.bounds
+        for i, c in enumerate(self.counts):
+            seen += c
+            if c and seen >= want:
+                edge = bounds[i] if i < len(bounds) else self.max
+                return min(edge, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ns": self.mean(),
+            "p50_ns": self.percentile(50),
+            "p99_ns": self.percentile(99),
+            "max_ns": self.max,
+        }
+
+    def format(self, name):
+        if not self.count:
+            return f"{name:7s} (no samples)"
+        return (f"{name:7s} n={self.count:<8d} mean={self.mean() / 1e6:7.3f} ms  "
+                f"p50={self.percentile(50) / 1e6:7.3f} ms  p99={self.percentile(99) / 1e6:7.3f} ms  "
+                f"max={self.max / 1e6:7.3f} ms")
+
+
+class LoopScheduler:
+    """Absolute-deadline pacing with overrun accounting.
+
+    Usage:
+        sched = LoopScheduler(LOOP_DT, clock)
+        while running:
+            sched.wait()     # sleep until this tick's deadline
+            do_work()
+            sched.done()     # record work time
+    """
+
+    def __init__(self, period_sec, clock, catch_up="skip", max_burst=3):
+        if catch_up not in ("skip", "burst"):
+            raise ValueError(f"unknown catch_up policy: {catch_up}")
+        self.period_ns = int(round(period_sec * 1e9))
+        self.clock = clock
+        self.catch_up = catch_up
+        self.max_burst = max_burst
+
+        self.period = Histogram()   # time between consecutive tick starts
+        self.work = Histogram()     # wait() -> done()
+        self.jitter = Histogram()   # how late a tick started vs its deadline
+
+        self.ticks = 0
+        self.overruns = 0           # ticks whose work ran past the next deadline
+        self.skipped = 0            # deadlines dropped by the "skip" policy
+        self._deadline = None
+        self._tick_start = None
+        self._last_start = None
+        self._burst = 0
+
+    def start(self):
+        self._deadline = self.clock.monotonic_ns()
+        self._last_start = None
+
+    def wait(self):
+        """Sleep until the next deadline. Returns the tick start (ns)."""
+        remaining = self.delay()
+        if remaining > 0:
+            self.clock.sleep(remaining)
+        return self.begin()
+
+    def delay(self):
+        """Seconds until the next deadline (<= 0 if it has passed).
+
+        delay() + your own sleep (e.g. asyncio.sleep) + begin() is wait().
+        """
+        if self._deadline is None:
+            self.start()
+        return (self._deadline - self.clock.monotonic_ns()) / 1e9
+
+    def begin(self):
+        """Start this tick now. Returns the tick start (ns)."""
+        now = self.clock.monotonic_ns()
+        self.jitter.record(max(0, now - self._deadline))
+        if self._last_start is not None:
+            self.period.record(now - self._last_start)
+        self._last_start = now
+        self._tick_start = now
+        self.ticks += 1
+        return now
+
+    def done(self):
+        """Mark the end of this tick's work and schedule the next deadline."""
+        now = self.clock.monotonic_ns()
+        self.work.record(now - self._tick_start)
+
+        period = self.period_ns
+        nxt = self._deadline + period
+        if now > nxt:
+            self.overruns += 1
+            if self.catch_up == "burst" and self._burst < self.max_burst:
+                self._burst += 1        # run the missed tick right away
+            else:
+                missed = (now - nxt) // period + 1
+                self.skipped += missed
+                nxt += missed * period
+                self._burst = 0
+        else:
+            self._burst = 0
+        self._deadline = nxt
+
+    def stats(self):
+        return {
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "period": self.period.summary(),
+            "work": self.work.summary(),
+            "jitter": self.jitter.summary(),
+        }
+
+    def report(self):
+        target = self.period_ns / 1e6
+        lines = [
+            f"[LOOP] target={target:.3f} ms ticks={self.ticks} overruns={self.overruns} skipped={self.skipped}",
+            "       " + self.period.format("period"),
+            "       " + self.work.format("work"),
+            "       " + self.jitter.format("jitter"),
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,126 @@
+# motor_output.py
+#
+# Motor output stage for the SN754410: only sends pigpio what changed.
+#
+# The old set_motor() made three pigpio calls per motor (IN1, IN2, duty) on
+# every call - six per tick for two motors, and stop_motors() runs every tick
+# while disarmed. Each pigpio call is a socket round-trip to the daemon.
+#
+# MotorOutput remembers the direction levels and duty it last applied to
+# each channel and emits only the differences:
+#   - direction pins of all channels in one clear_bank_1 + one set_bank_1
+#     (clear first, so a reversing motor passes through coast, never brake)
+#   - one set_PWM_dutycycle per channel whose duty changed
+#
+# A motor sitting still or cruising at a constant speed costs zero calls.
+# If a call raises, the cache is dropped so the next update rewrites every pin.
+
+from hal import Clock
+
+
+class MotorOutput:
+    def __init__(self, pins, channels, clock=None):
+        """pins: hal.MotorPins. channels: sequence of (ena, in1, in2)."""
+        self.pins = pins
+        self.channels = [tuple(ch) for ch in channels]
+        self.clock = clock or Clock()
+
+        self.calls = 0          # pigpio calls made
+        self.bank_calls = 0
+        self.pwm_calls = 0
+        self.saved = 0          # calls the uncached path would have made on top
+        self._rate_t = None
+        self._rate_calls = 0
+        self._rate_saved = 0
+        self.invalidate()
+
+    def setup(self):
+        for _, in1, in2 in self.channels:
+            self.pins.set_output(in1)
+            self.pins.set_output(in2)
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget what the pins hold; the next update writes everything."""
+        self._levels = {}       # pin -> 0/1
+        self._duty = {}         # ena -> 0..255
+
+    @staticmethod
+    def duty_for(speed):
+        """speed -100..100 -> (in1, in2, duty 0..255)"""
+        if speed > 0:
+            return 1, 0, int(min(100, speed) * 2.55)
+        if speed < 0:
+            return 0, 1, int(min(100, -speed) * 2.55)
+        return 0, 0, 0
+
+    def set(self, ena, in1, in2, speed):
+        """One channel; returns the duty applied."""
+        return self._apply(((ena, in1, in2, speed),))[0]
+
+    def drive(self, *speeds):
+        """All channels at once, speeds in channel order; returns the duties."""
+        return self._apply([ch + (s,) for ch, s in zip(self.channels, speeds)])
+
+    def _apply(self, updates):
+        levels = self._levels
+        set_bits = 0
+        clear_bits = 0
+        duties = []
+        pwm = []
+        new_levels = []
+        for ena, in1, in2, speed in updates:
+            a, b, duty = self.duty_for(speed)
+            for pin, level in ((in1, a), (in2, b)):
+                new_levels.append((pin, level))
+                if levels.get(pin) != level:
+                    if level:
+                        set_bits |= 1 << pin
+                    else:
+                        clear_bits |= 1 << pin
+            if self._duty.get(ena) != duty:
+                pwm.append((ena, duty))
+            duties.append(duty)
+
+        pins = self.pins
+        made = 0
+        try:
+            if clear_bits:
+                pins.clear_bank_1(clear_bits)
+                made += 1
+            if set_bits:
+                pins.set_bank_1(set_bits)
+                made += 1
+            self.bank_calls += made
+            for ena, duty in pwm:
+                pins.set_PWM_dutycycle(ena, duty)
+                self._duty[ena] = duty
+                self.pwm_calls += 1
+                made += 1
+        except Exception:
+            self.invalidate()
+            raise
+        finally:
+            self.calls += made
+
+        levels.update(new_levels)
+        self.saved += 3 * len(updates) - made
+        return duties
+
+    # ---- counters ----
+    def rates(self):
+        """(calls/s, saved calls/s) since the previous rates() call."""
+        now = self.clock.monotonic()
+        if self._rate_t is None or now <= self._rate_t:
+            out = (0.0, 0.0)
+        else:
+            dt = now - self._rate_t
+            out = ((self.calls - self._rate_calls) / dt, (self.saved - self._rate_saved) / dt)
+        self._rate_t = now
+        self._rate_calls = self.calls
+        self._rate_saved = self.saved
+        return out
+
+    def report(self):
+        return (f"[MOTOR] pigpio calls={self.calls} (bank {self.bank_calls}, pwm {self.pwm_calls}) "
+                f"saved={self.saved}")
@@ -0,0 +1,409 @@
+# motor_shaping.py
+#
+# Output conditioning between the mode logic and the motor driver.
+#
+# The modes step their commands: AUTO goes from AUTO_FWD_SPEED to
+# AUTO_REV_SPEED (+60 -> -60) in one 20 ms tick, and a stick goes from rest
+# to full in one. On the SN754410 a reversal puts the supply in series with
+# the spinning motor's back-EMF, so for a moment the motor draws more than
+# its stall current. That is enough to brown out the Pi and spin the wheels,
+# and the odometry counts the spin as travel. MotorShaper turns the mode's
+# commands into what is sent to the driver:
+#
+#   slew      speeding up at most accel %/s, slowing down at most decel %/s
+#             (0 = at once; with decel 0 a stop is never delayed)
+#   jerk      the slew rate itself changes by at most jerk %/s^2, easing off
+#             so the command lands on the target without overshoot (0 = off;
+#             only on the slew-limited side)
+#   reverse   a side's command across zero stops the car at 0 first, and
+#             it coasts there for reverse_sec before going on
+#   dead band a compensation table "cmd:out, ..." applied last (compensate()),
+#             e.g. "1:18, 100:100" sends any non-zero command as at least 18,
+#             the static-friction dead band, and spreads the rest linearly
+#             up to 100. Commands are magnitudes; the sign is kept
+#
+# Each side has its own limits. A side slowing down only ever follows its
+# own decel limit, so a stop (or the LiDAR clamp cutting one side) is never
+# held back by the other side. Sides speeding up go the same fraction of the
+# way to their new commands every tick, at the pace of the slower one, so
+# the car keeps its curve: a spin from driving forward stops, then spins up
+# in place, instead of pivoting forward on one wheel while the other waits
+# to reverse.
+#
+# MotorShaper is the car's: two sides, plain floats, a few microseconds a
+# tick. BatchShaper runs the same steps on numpy arrays over "lanes", one
+# per side per profile, so a whole recorded session is conditioned by every
+# profile to compare in one pass over its ticks (evaluate()). The two give
+# the same commands to the last bit (bench_motor_shaping.py checks).
+# A numpy step costs tens of microseconds whatever the number of lanes, so
+# evaluate() only steps while a command is changing: 10 min of AUTO (31
+# changes) takes about 7 ms per profile in a grid of 18, 10 min of a stick
+# in GUARD (a change every 3 ticks) about 47 ms, vs about 175-200 ms for a
+# MotorShaper per profile.
+
+# evaluate() also scores each profile with a DC motor model: the wheel
+# follows the command with a first-order lag (tau_sec, like the odometry),
+# and the current is (command - wheel speed) / MAX_SPEED, as a fraction of
+# the stall current at full duty (0 while the command is 0: the driver
+# coasts). A +60 -> -60 reversal at speed is 1.2 of it.
+#
+#   python motor_shaping.py telemetry/session-... --accel 200,400,800 --jerk 0,4000
+# conditions the drive modes' commands in the session with every combination
+# and prints one row per profile. A session recorded with MOTOR_SHAPING or
+# SPEED_CONTROL on is replayed with both off first (mode_commands()): its
+# motor stream is already conditioned.
+
+import argparse
+import itertools
+import math
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+Profile = namedtuple("Profile", "accel decel jerk reverse_sec")
+
+EVAL_BLOCK = 4096        # ticks evaluate() takes at a time (memory: a few arrays of ticks x lanes)
+
+METRICS = np.dtype([("peak_current", "<f8"), ("rms_current", "<f8"), ("lag", "<f8"),
+                    ("reversals", "<i8"), ("max_step", "<f8")])
+
+
+def parse_deadband(spec):
+    """(cmds, outs) arrays from "cmd:out, ..."; None for "" / None. ValueError if malformed."""
+    if not spec or not spec.strip():
+        return None
+    cmds = []
+    outs = []
+    for entry in spec.split(","):
+        try:
+            c, o = (float(v) for v in entry.split(":"))
+        except ValueError:
+            raise ValueError(f"dead band entry {entry.strip()!r}: expected cmd:out") from None
+        if c <= 0 or o < 0 or (cmds and (c <= cmds[-1] or o < outs[-1])):
+            raise ValueError(f"dead band {spec!r}: cmd must be > 0 and rise, out must not fall")
+        cmds.append(c)
+        outs.append(o)
+    return np.array(cmds), np.array(outs)
+
+
+def _limit(value):
+    """A rate limit; 0 = none (inf)."""
+    return float(value) if value > 0 else math.inf
+
+
+def _limits(value, lanes):
+    """Per-lane rate limits; 0 = none (inf)."""
+    v = np.broadcast_to(np.asarray(value, dtype=float), (lanes,)).copy()
+    v[v <= 0] = np.inf
+    return v
+
+
+# -----------------------------
+# On the car
+# -----------------------------
+class MotorShaper:
+    """Output conditioning for the two sides, one tick at a time."""
+
+    def __init__(self, accel=0.0, decel=0.0, jerk=0.0, reverse_sec=0.0, deadband=None, dt=0.02):
+        self.dt = dt                # assumed for the first step after a reset
+        self.tune(accel, decel, jerk, reverse_sec, deadband)
+        self.reset()
+
+    def tune(self, accel, decel, jerk, reverse_sec, deadband=None):
+        """New limits (the state carries on); deadband: a table spec or parse_deadband()'s pair."""
+        self.accel = _limit(accel)
+        self.decel = _limit(decel)
+        self.jerk = _limit(jerk)
+        self.reverse_sec = float(reverse_sec)
+        self.table = parse_deadband(deadband) if isinstance(deadband, str) or deadband is None else deadband
+
+    def reset(self):
+        """Back to rest (disarmed, stopped behind its back)."""
+        self.u = [0.0, 0.0]         # conditioned command per side, %
+        self.rate = [0.0, 0.0]      # its slew rate, %/s
+        self.sign = [0.0, 0.0]      # direction of the last non-zero command
+        self.zero_t = [-math.inf, -math.inf]    # when it last came to 0
+        self.t = None
+
+    def step(self, now, left, right):
+        """(left, right) conditioned commands (floats, %) for this tick's."""
+        dt = self.dt if self.t is None else now - self.t
+        self.t = now
+        u = self.u
+        if dt <= 0:
+            return u[0], u[1]
+        targets = (float(left), float(right))
+
+        # Either side across zero: both to 0 first, then coast there for reverse_sec
+        hold = False
+        for i in (0, 1):
+            if targets[i] * self.sign[i] < 0 and (u[i] != 0 or now - self.zero_t[i] < self.reverse_sec):
+                hold = True
+        aims = (0.0, 0.0) if hold else targets
+
+        # How far each side may go toward its aim (slew, jerk). A side slowing
+        # down goes its own way; sides speeding up both go the smaller
+        # fraction of the way, so the car keeps its curve
+        fracs = [1.0, 1.0]
+        errs = [0.0, 0.0]
+        slowing = [False, False]
+        up = 1.0
+        for i in (0, 1):
+            err = errs[i] = aims[i] - u[i]
+            slowing[i] = abs(aims[i]) < abs(u[i])
+            limit = self.decel if slowing[i] else self.accel
+            if err == 0 or limit == math.inf:
+                continue
+            rate = min(max(err / dt, -limit), limit)
+            jerk = self.jerk
+            if jerk != math.inf:
+                eased = math.copysign(min(abs(rate), math.sqrt(2.0 * jerk * abs(err))), rate)
+                dv = jerk * dt
+                rate = self.rate[i] + min(max(eased - self.rate[i], -dv), dv)
+            fracs[i] = rate * dt / err
+            if not slowing[i]:
+                up = min(up, fracs[i])
+
+        for i in (0, 1):
+            u0 = u[i]
+            frac = max(fracs[i] if slowing[i] else up, 0.0)
+            if frac >= 1.0:
+                new = aims[i]
+                self.rate[i] = 0.0
+            else:
+                new = u0 + frac * errs[i]
+                self.rate[i] = frac * errs[i] / dt
+            if new == 0 and u0 != 0:
+                self.zero_t[i] = now
+            if new != 0:
+                self.sign[i] = 1.0 if new > 0 else -1.0
+            u[i] = new
+        return u[0], u[1]
+
+    def compensate(self, cmd):
+        """Driver command (int) for a conditioned command: the dead band table (if any) on |cmd|."""
+        table = self.table
+        if table is None or cmd == 0:
+            return cmd
+        out = round(float(np.interp(abs(cmd), table[0], table[1])))
+        return out if cmd > 0 else -out
+
+
+# -----------------------------
+# Batches of profiles
+# -----------------------------
+class BatchShaper:
+    """MotorShaper's steps on numpy arrays over lanes (left, right, left, right, ...).
+
+    Each parameter is a scalar or one value per lane; lanes 2k and 2k + 1
+    are one car's sides.
+    """
+
+    def __init__(self, lanes, accel=0.0, decel=0.0, jerk=0.0, reverse_sec=0.0, deadband=None, dt=0.02):
+        self.lanes = lanes
+        self.dt = dt
+        self.accel = _limits(accel, lanes)
+        self.decel = _limits(decel, lanes)
+        jerk = _limits(jerk, lanes)
+        self.jerk_on = np.isfinite(jerk)
+        self.jerk_any = bool(self.jerk_on.any())
+        self.jerk = np.where(self.jerk_on, jerk, 0.0)
+        self.reverse_sec = np.broadcast_to(np.asarray(reverse_sec, dtype=float), (lanes,)).copy()
+        self.table = parse_deadband(deadband) if isinstance(deadband, str) or deadband is None else deadband
+        self.u = np.zeros(lanes)
+        self.rate = np.zeros(lanes)
+        self.sign = np.zeros(lanes)
+        self.zero_t = np.full(lanes, -np.inf)
+        self.t = None
+
+    def step(self, now, target):
+        """Conditioned commands for this tick's targets (arrays over lanes, %); updated in place."""
+        dt = self.dt if self.t is None else now - self.t
+        self.t = now
+        u = self.u
+        if dt <= 0:
+            return u
+
+        hold = (target * self.sign < 0) & ((u != 0) | (now - self.zero_t < self.reverse_sec))
+        hold = np.repeat(hold[0::2] | hold[1::2], 2)
+        aim = np.where(hold, 0.0, target)
+        err = aim - u
+
+        slowing = np.abs(aim) < np.abs(u)
+        limit = np.where(slowing, self.decel, self.accel)
+        rate = np.minimum(np.maximum(err / dt, -limit), limit)
+        if self.jerk_any:
+            jerk = self.jerk
+            eased = np.copysign(np.minimum(np.abs(rate), np.sqrt(2.0 * jerk * np.abs(err))), rate)
+            dv = jerk * dt
+            rate = np.where(self.jerk_on, self.rate + np.minimum(np.maximum(eased - self.rate, -dv), dv), rate)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            frac = np.where((err == 0) | np.isinf(limit), 1.0, rate * dt / err)
+        up = np.where(slowing, 1.0, frac)
+        up = np.repeat(np.minimum(up[0::2], up[1::2]), 2)
+        frac = np.maximum(np.minimum(np.where(slowing, frac, up), 1.0), 0.0)
+        done = frac >= 1.0
+        new = np.where(done, aim, u + frac * err)
+        self.rate = np.where(done, 0.0, frac * err / dt)
+
+        self.zero_t[(new == 0) & (u != 0)] = now
+        np.copyto(self.sign, np.sign(new), where=new != 0)
+        u[:] = new
+        return u
+
+    def compensate(self, cmd):
+        table = self.table
+        if table is None:
+            return cmd
+        return np.sign(cmd) * np.rint(np.interp(np.abs(cmd), table[0], table[1]))
+
+
+# -----------------------------
+# Offline evaluation
+# -----------------------------
+def evaluate(t, left, right, profiles, deadband=None, tau_sec=0.08, max_speed=100, block=EVAL_BLOCK):
+    """Condition a per-tick command trace with every profile at once.
+
+    Returns a METRICS array, one row per profile plus a first row for the
+    commands as they are (no conditioning):
+      peak_current  largest |motor current|, fraction of stall at full duty
+      rms_current   its RMS over the trace (what heats the H-bridge)
+      lag           mean |conditioned - asked for|, % of MAX_SPEED
+      reversals     ticks where a command flips sign without passing 0
+      max_step      largest change of command between two ticks, %
+
+    The trace is taken block ticks at a time. In a block, BatchShaper is only
+    stepped while some lane is still on its way: once every lane holds its
+    command, the commands stay put until the trace's next change, so those
+    ticks are copied. The wheel model is one multiply-add per tick over all
+    lanes, and the metrics are computed on the whole block.
+    """
+    k = len(profiles) + 1
+    lanes = 2 * k
+    res = np.zeros(k, dtype=METRICS)
+    n = len(t)
+    if not n:
+        return res
+    p = np.array([tuple(pr) for pr in profiles], dtype=float).reshape(-1, 4)
+    shaper = BatchShaper(lanes - 2, *(np.repeat(p[:, i], 2) for i in range(4)), deadband=deadband)
+    t = np.asarray(t, dtype=float)
+    left = np.asarray(left, dtype=float)
+    right = np.asarray(right, dtype=float)
+    dt = np.diff(t, prepend=t[0] - shaper.dt)
+    gain = np.minimum(1.0, dt / tau_sec)
+    changes = np.flatnonzero((np.diff(left) != 0) | (np.diff(right) != 0)) + 1
+    changes = np.append(changes, n)
+
+    wheel = np.zeros(lanes)
+    prev = np.zeros(lanes)
+    peak = np.zeros(lanes)
+    heat = np.zeros(lanes)
+    lag = np.zeros(lanes)
+    flips = np.zeros(lanes, dtype=np.int64)
+    step = np.zeros(lanes)
+    for b0 in range(0, n, block):
+        b1 = min(b0 + block, n)
+        m = b1 - b0
+        target = np.empty((m, lanes))
+        target[:, 0::2] = left[b0:b1, None]
+        target[:, 1::2] = right[b0:b1, None]
+        cmd = target.copy()         # lanes 0, 1: as they are
+
+        # Conditioned commands, skipping the ticks where every lane holds
+        shaped = cmd[:, 2:]
+        aims = target[:, 2:]
+        u = shaper.u
+        i = 0
+        while i < m:
+            shaped[i] = np.rint(shaper.step(t[b0 + i], aims[i]))
+            i += 1
+            if i < m and not shaper.rate.any() and np.array_equal(u, aims[i - 1]):
+                j = min(changes[np.searchsorted(changes, b0 + i)], b1) - b0
+                if j > i:
+                    shaped[i:j] = shaped[i - 1]
+                    shaper.t = t[b0 + j - 1]
+                    i = j
+        out = cmd.copy()
+        out[:, 2:] = shaper.compensate(shaped)
+
+        # Motor model: the wheel lags the command (first order)
+        spin = np.empty((m, lanes))
+        for i in range(m):
+            spin[i] = wheel
+            wheel += (out[i] - wheel) * gain[b0 + i]
+        current = np.where(out != 0, np.abs(out - spin), 0.0) / max_speed     # 0: coasting
+        before = np.vstack((prev, cmd[:-1]))
+        bdt = dt[b0:b1, None]
+        np.maximum(peak, current.max(axis=0), out=peak)
+        heat += (current * current * bdt).sum(axis=0)
+        lag += (np.abs(cmd - target) * bdt).sum(axis=0)
+        flips += np.count_nonzero(cmd * before < 0, axis=0)
+        np.maximum(step, np.abs(cmd - before).max(axis=0), out=step)
+        prev = cmd[-1]
+
+    span = max(t[-1] - t[0] + shaper.dt, 1e-9)
+    res["peak_current"] = peak.reshape(k, 2).max(axis=1)
+    res["rms_current"] = np.sqrt(heat.reshape(k, 2).mean(axis=1) / span)
+    res["lag"] = lag.reshape(k, 2).mean(axis=1) / span / max_speed * 100.0
+    res["reversals"] = flips.reshape(k, 2).sum(axis=1)
+    res["max_step"] = step.reshape(k, 2).max(axis=1)
+    return res
+
+
+def format_row(name, row):
+    return (f"{name:28s} {row['peak_current']:6.2f} {row['rms_current']:6.3f} {row['lag']:6.2f} "
+            f"{row['reversals']:9d} {row['max_step']:8.0f}")
+
+
+def _floats(text):
+    return [float(v) for v in text.split(",")]
+
+
+def mode_commands(session):
+    """(per-tick trace of the drive modes' own commands, where they came from) for a recorded session.
+
+    The motor stream holds what was sent to the driver: with MOTOR_SHAPING
+    (the default) or SPEED_CONTROL on, that is already conditioned, and
+    conditioning it again would score the profiles on the wrong input. Those
+    sessions are replayed with both off, which gives the modes' commands for
+    the recorded inputs.
+    """
+    import rc_car_modes_bluetooth_fix_good as car
+    from replay import load_config_log, motor_trace, recorded_settings, replay_session, session_pins
+    from telemetry import load_session
+
+    started, _ = recorded_settings(load_config_log(session))
+    shaped = started.get("MOTOR_SHAPING", car.MOTOR_SHAPING) or started.get("SPEED_CONTROL", car.SPEED_CONTROL)
+    if not shaped:
+        data = load_session(session)
+        return motor_trace(data["motor"], data["state"]["t"], session_pins(started)), "as recorded"
+    res = replay_session(session, {"MOTOR_SHAPING": False, "SPEED_CONTROL": False})
+    return res.trace, "replayed with MOTOR_SHAPING and SPEED_CONTROL off (the session was recorded shaped)"
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Compare output conditioning profiles on a recorded session")
+    ap.add_argument("session", help="telemetry session folder")
+    ap.add_argument("--accel", type=_floats, default=[400.0], help="%%/s speeding up, comma separated")
+    ap.add_argument("--decel", type=_floats, default=[0.0], help="%%/s slowing down (0 = at once)")
+    ap.add_argument("--jerk", type=_floats, default=[0.0], help="%%/s^2 (0 = off)")
+    ap.add_argument("--reverse", type=_floats, default=[0.06], help="seconds at 0 before reversing")
+    ap.add_argument("--deadband", default="", help='table "cmd:out, ..."')
+    args = ap.parse_args(argv)
+
+    trace, source = mode_commands(args.session)
+    print(f"commands: {source}")
+    profiles = [Profile(*p) for p in itertools.product(args.accel, args.decel, args.jerk, args.reverse)]
+    res = evaluate(trace["t"], trace["left"], trace["right"], profiles, args.deadband or None)
+
+    print(f"{len(trace)} ticks, {len(profiles)} profiles")
+    print(f"{'accel / decel / jerk / reverse':28s} {'peak':>6s} {'rms':>6s} {'lag %':>6s} {'reversals':>9s} "
+          f"{'max step':>8s}")
+    print(format_row("unconditioned", res[0]))
+    for p, row in zip(profiles, res[1:]):
+        print(format_row(f"{p.accel:g} / {p.decel:g} / {p.jerk:g} / {p.reverse_sec:g}", row))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+# occupancy_grid.py
+#
+# Log-odds occupancy grid built from TF-Luna rays.
+#
+# The world is cut into square tiles of tile_cells x tile_cells cells
+# (cell_cm each). A tile is a float32 NumPy array allocated the first time a
+# ray touches it, so the map grows with the area actually driven, in any
+# direction, without a fixed size or origin.
+#
+# Each LiDAR sample is one ray from the sensor along the heading:
+#   - every cell the ray passes through gets l_free (evidence of free space)
+#   - the cell it ends in gets l_occ, unless the reading is at max range
+# Cell values are clamped to [l_min, l_max] so the map stays responsive to
+# things that move.
+#
+# update() takes all rays of a tick at once: the cells of every ray are
+# generated with one vectorized integer Bresenham walk, grouped by tile and
+# applied with np.add.at (repeated cells add up).
+#
+# save()/load() write a compressed .npz with tiles quantized to int8.
+
+import numpy as np
+
+L_OCC = 0.85
+L_FREE = -0.4
+L_MIN = -4.0
+L_MAX = 4.0
+KNOWN = 0.3     # |log-odds| above this counts as explored (one ray is enough)
+
+
+def ray_cells(x0, y0, x1, y1):
+    """Cells on the integer lines (x0, y0) -> (x1, y1), all rays at once.
+
+    Inputs are int arrays of equal length (one entry per ray). Returns
+    (xs, ys, ray, last): cell coordinates, which ray each cell belongs to,
+    and True for the final cell of each ray.
+    """
+    dx = x1 - x0
+    dy = y1 - y0
+    n = np.maximum(np.abs(dx), np.abs(dy))
+    counts = n + 1
+    ray = np.repeat(np.arange(len(n)), counts)
+    first = np.cumsum(counts) - counts
+    i = np.arange(int(counts.sum())) - first[ray]
+    steps = np.maximum(n, 1)[ray]
+    # Round-to-nearest in integer arithmetic == Bresenham's choice of cells
+    xs = x0[ray] + (2 * i * dx[ray] + steps) // (2 * steps)
+    ys = y0[ray] + (2 * i * dy[ray] + steps) // (2 * steps)
+    return xs, ys, ray, i == n[ray]
+
+
+class OccupancyGrid:
+    def __init__(self, cell_cm=5.0, tile_cells=64, l_occ=L_OCC, l_free=L_FREE,
+                 l_min=L_MIN, l_max=L_MAX):
+        if tile_cells & (tile_cells - 1):
+            raise ValueError("tile_cells must be a power of two")
+        self.cell = float(cell_cm)
+        self.tile = tile_cells
+        self._shift = tile_cells.bit_length() - 1
+        self.l_occ = l_occ
+        self.l_free = l_free
+        self.l_min = l_min
+        self.l_max = l_max
+        self.tiles = {}         # (tx, ty) -> float32[tile, tile], indexed [y, x]
+        self.rays = 0
+
+    def _tile(self, key):
+        t = self.tiles.get(key)
+        if t is None:
+            t = self.tiles[key] = np.zeros((self.tile, self.tile), dtype=np.float32)
+        return t
+
+    def to_cells(self, x_cm, y_cm):
+        return (np.floor(np.asarray(x_cm) / self.cell).astype(np.int64),
+                np.floor(np.asarray(y_cm) / self.cell).astype(np.int64))
+
+    # ---- updates ----
+    def update(self, ox, oy, ex, ey, hit):
+        """One batch of rays in cm: origins (ox, oy), ends (ex, ey), hit flags.
+
+        hit=False means the sensor saw nothing up to (ex, ey): the whole ray,
+        end included, is marked free.
+        """
+        hit = np.asarray(hit, dtype=bool)
+        if not hit.size:
+            return
+        cx1, cy1 = self.to_cells(ex, ey)
+        cx0, cy0 = self.to_cells(ox, oy)
+        if cx0.ndim == 0:
+            cx0 = np.full(cx1.shape, cx0)
+            cy0 = np.full(cy1.shape, cy0)
+        xs, ys, ray, last = ray_cells(cx0, cy0, cx1, cy1)
+        delta = np.where(last & hit[ray], self.l_occ, self.l_free).astype(np.float32)
+        self.rays += hit.size
+
+        # A ray never leaves the bounding box of its end points, so if all end
+        # points share a tile (the usual case) every cell does
+        shift = self._shift
+        tiles = {(x >> shift, y >> shift) for x, y in
+                 zip(np.concatenate((cx0, cx1)).tolist(), np.concatenate((cy0, cy1)).tolist())}
+        if len(tiles) == 1:
+            mask = self.tile - 1
+            self._add_tile(tiles.pop(), ys & mask, xs & mask, delta)
+        else:
+            self._add(xs, ys, delta)
+
+    def _add_tile(self, key, ly, lx, delta):
+        tile = self._tile(key)
+        np.add.at(tile, (ly, lx), delta)
+        np.clip(tile, self.l_min, self.l_max, out=tile)
+
+    def _add(self, xs, ys, delta):
+        shift = self._shift
+        mask = self.tile - 1
+        tx = xs >> shift
+        ty = ys >> shift
+        lx = xs & mask
+        ly = ys & mask
+        # Few tiles per batch: group by tile, one np.add.at each
+        key = (tx << 32) + (ty & 0xFFFFFFFF)
+        keys, inv = np.unique(key, return_inverse=True)
+        for j, k in enumerate(keys.tolist()):
+            sel = inv == j
+            self._add_tile((k >> 32, ((k & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000),
+                           ly[sel], lx[sel], delta[sel])
+
+    # ---- queries ----
+    def log_odds(self, x_cm, y_cm):
+        """Log-odds of the cells at the given points (0 where never observed)."""
+        cx, cy = self.to_cells(x_cm, y_cm)
+        cx = np.atleast_1d(cx)
+        cy = np.atleast_1d(cy)
+        out = np.zeros(cx.shape, dtype=np.float32)
+        shift = self._shift
+        mask = self.tile - 1
+        for i, (x, y) in enumerate(zip(cx.tolist(), cy.tolist())):
+            t = self.tiles.get((x >> shift, y >> shift))
+            if t is not None:
+                out[i] = t[y & mask, x & mask]
+        return out
+
+    def known_cells(self):
+        return int(sum(np.count_nonzero(np.abs(t) > KNOWN) for t in self.tiles.values()))
+
+    def explored_m2(self):
+        return self.known_cells() * self.cell * self.cell / 1e4
+
+    def to_dense(self):
+        """(log-odds array [y, x], x0_cm, y0_cm) covering every allocated tile."""
+        if not self.tiles:
+            return np.zeros((0, 0), dtype=np.float32), 0.0, 0.0
+        keys = np.array(list(self.tiles))
+        tx0, ty0 = keys.min(axis=0)
+        tx1, ty1 = keys.max(axis=0)
+        T = self.tile
+        out = np.zeros(((ty1 - ty0 + 1) * T, (tx1 - tx0 + 1) * T), dtype=np.float32)
+        for (tx, ty), t in self.tiles.items():
+            r = (ty - ty0) * T
+            c = (tx - tx0) * T
+            out[r:r + T, c:c + T] = t
+        return out, tx0 * T * self.cell, ty0 * T * self.cell
+
+    # ---- files ----
+    def save(self, path):
+        keys = np.array(list(self.tiles), dtype=np.int32).reshape(-1, 2)
+        scale = 127.0 / max(abs(self.l_min), abs(self.l_max))
+        tiles = np.zeros((len(keys), self.tile, self.tile), dtype=np.int8)
+        for i, t in enumerate(self.tiles.values()):
+            tiles[i] = np.round(t * scale)
+        np.savez_compressed(path, keys=keys, tiles=tiles,
+                            meta=np.array([self.cell, self.tile, self.l_occ, self.l_free,
+                                           self.l_min, self.l_max, self.rays]))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            cell, tile, l_occ, l_free, l_min, l_max, rays = f["meta"].tolist()
+            grid = cls(cell, int(tile), l_occ, l_free, l_min, l_max)
+            scale = max(abs(l_min), abs(l_max)) / 127.0
+            for (tx, ty), q in zip(f["keys"].tolist(), f["tiles"]):
+                grid.tiles[(tx, ty)] = q.astype(np.float32) * np.float32(scale)
+            grid.rays = int(rays)
+        return grid
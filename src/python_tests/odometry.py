@@ -0,0 +1,91 @@
+# odometry.py
+#
+# Dead-reckoning pose from the wheel speeds the loop commands.
+#
+# Without encoders, the pose is integrated from the signed motor commands
+# (-100..100) through a simple motor model: nothing below the static-friction
+# dead band, linear up to full_speed_cm_s, first-order lag of wheel_tau_sec.
+# Good for a few metres; it drifts with battery voltage, floor and wheel
+# slip, so treat it as a local frame, not a global one. With encoders
+# (SPEED_CONTROL), step_measured() integrates the measured wheel speeds
+# instead, which takes battery and floor out of it (slip stays).
+#
+# Pose: x, y in cm, heading in radians CCW from +x, starting at (0, 0, 0).
+
+import math
+
+
+class DeadReckoning:
+    def __init__(self, track_cm, full_speed_cm_s, max_cmd=100, deadband_pct=0.0,
+                 wheel_tau_sec=0.0, forward_sign=1):
+        """forward_sign: -1 if a negative command drives the wheel forward."""
+        self.track = track_cm
+        self.full_speed = full_speed_cm_s
+        self.max_cmd = max_cmd
+        self.deadband = deadband_pct
+        self.tau = wheel_tau_sec
+        self.sign = forward_sign
+        self.reset()
+
+    def reset(self, x=0.0, y=0.0, heading=0.0):
+        self.x = x
+        self.y = y
+        self.heading = heading
+        self.v_left = 0.0       # modelled wheel speeds, cm/s
+        self.v_right = 0.0
+        self.t = None
+        self.distance_cm = 0.0
+
+    def wheel_cm_s(self, cmd):
+        """Steady ground speed of one wheel for a motor command (+ = forward)."""
+        pct = abs(cmd) * 100.0 / self.max_cmd
+        if pct <= self.deadband:
+            return 0.0
+        v = (min(pct, 100.0) - self.deadband) / (100.0 - self.deadband) * self.full_speed
+        return v if self.sign * cmd > 0 else -v
+
+    def forward_cm_s(self):
+        """Modelled ground speed (+ = forward)."""
+        return 0.5 * (self.v_left + self.v_right)
+
+    def step(self, t, left_cmd, right_cmd):
+        """Integrate up to time t with the commands that were in effect until now."""
+        if self.t is None:
+            self.t = t
+            return
+        dt = t - self.t
+        self.t = t
+        if dt <= 0:
+            return
+
+        a = 1.0 - math.exp(-dt / self.tau) if self.tau > 0 else 1.0
+        vl0 = self.v_left
+        vr0 = self.v_right
+        self.v_left += (self.wheel_cm_s(left_cmd) - vl0) * a
+        self.v_right += (self.wheel_cm_s(right_cmd) - vr0) * a
+        self._integrate(dt, 0.5 * (vl0 + self.v_left), 0.5 * (vr0 + self.v_right))
+
+    def step_measured(self, t, left_cm_s, right_cm_s):
+        """Integrate up to time t with measured wheel speeds (+ = forward) since the last step."""
+        if self.t is None:
+            self.t = t
+            return
+        dt = t - self.t
+        self.t = t
+        if dt <= 0:
+            return
+        self.v_left = left_cm_s
+        self.v_right = right_cm_s
+        self._integrate(dt, left_cm_s, right_cm_s)
+
+    def _integrate(self, dt, vl, vr):
+        v = 0.5 * (vl + vr)
+        dth = (vr - vl) / self.track * dt
+        mid = self.heading + 0.5 * dth
+        self.x += v * math.cos(mid) * dt
+        self.y += v * math.sin(mid) * dt
+        self.heading = math.atan2(math.sin(self.heading + dth), math.cos(self.heading + dth))
+        self.distance_cm += abs(v) * dt
+
+    def pose(self):
+        return self.x, self.y, self.heading
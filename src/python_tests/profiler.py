@@ -0,0 +1,127 @@
+# profiler.py
+#
+# Per-stage timing spans for the control tick and the LiDAR reader.
+#
+# The loop's LoopScheduler only says how long a whole tick took. Profiler
+# splits it: each stage ends with one lap() call, which records the time
+# since the previous lap into that stage's fixed-bucket Histogram
+# (loop_timing.py) and returns the start of the next stage:
+#
+#   t = prof.now()
+#   ...controller input...
+#   t = prof.lap("tick;input", t)
+#   ...LiDAR...
+#   t = prof.lap("tick;lidar", t)
+#
+# A lap is one perf_counter_ns() + one dict lookup + one bisect, well under
+# a microsecond; nothing allocates after a stage's first lap.
+#
+# Stage names are folded stacks (frames joined with ";"), so the totals can
+# be written in the input format of flamegraph.pl / speedscope / inferno:
+#
+#   tick;lidar 18234
+#   tick;motors 40211
+#
+# one line per stack with its self time in microseconds (a parent's self time
+# is its total minus that of the stacks timed inside it). Each thread uses
+# its own stacks ("tick;..." for the control loop, "lidar;..." for the
+# reader thread), so every histogram has a single writer.
+#
+# Usage:
+#   flamegraph.pl telemetry/session-.../profile.folded > tick.svg
+
+from time import perf_counter_ns
+
+from loop_timing import Histogram
+
+LO_NS = 100                 # histogram resolution floor (stages can be sub-microsecond)
+
+
+class Profiler:
+    def __init__(self):
+        self.spans = {}     # folded stack -> Histogram (ns)
+        self.now = perf_counter_ns
+
+    def lap(self, stack, t0):
+        """Record now - t0 under stack; returns now (the next stage's t0)."""
+        t = perf_counter_ns()
+        h = self.spans.get(stack)
+        if h is None:
+            h = self.spans[stack] = Histogram(lo_ns=LO_NS)
+        h.record(t - t0)
+        return t
+
+    def reset(self):
+        for h in self.spans.values():
+            h.reset()
+
+    # ---- export ----
+    def self_times(self):
+        """{stack: self time ns}: its total minus that of the stacks timed inside it."""
+        spans = dict(self.spans)
+        out = {stack: h.total for stack, h in spans.items()}
+        for stack, h in spans.items():
+            parent = stack.rpartition(";")[0]
+            while parent and parent not in spans:
+                parent = parent.rpartition(";")[0]
+            if parent:
+                out[parent] -= h.total
+        return {stack: max(0, ns) for stack, ns in out.items()}
+
+    def folded(self):
+        """Folded-stack lines (self time in microseconds), flame-graph input."""
+        return [f"{stack} {ns // 1000}" for stack, ns in sorted(self.self_times().items()) if ns >= 1000]
+
+    def write_folded(self, path):
+        with open(path, "w") as f:
+            for line in self.folded():
+                f.write(line + "\n")
+
+    def report(self, root="tick", period_sec=None):
+        """Table of root and the stages under it.
+
+        share is of root's total (of its stages' sum if root itself isn't
+        timed); period_sec adds root's mean as a share of that period.
+        """
+        spans = {s: h for s, h in self.spans.items() if (s == root or s.startswith(root + ";")) and h.count}
+        if not spans:
+            return f"[PROFILE] {root}: no samples"
+        base = spans.get(root)
+        total = base.total if base is not None else sum(h.total for h in spans.values())
+        head = f"[PROFILE] {root}"
+        if base is not None:
+            head += f" n={base.count} mean={base.mean() / 1e6:.3f} ms"
+            if period_sec:
+                head += f" ({base.mean() / 1e9 / period_sec * 100:.2f}% of the {period_sec * 1000:.0f} ms period)"
+        lines = [head]
+        for stack in sorted(spans):
+            h = spans[stack]
+            share = h.total / total * 100 if total else 0.0
+            lines.append(f"          {h.format(f'{stack:22s}')}  share={share:5.1f}%")
+        return "\n".join(lines)
+
+
+class NullProfiler:
+    """Profiler interface that records nothing (profiling off)."""
+
+    spans = {}
+
+    @staticmethod
+    def now():
+        return 0
+
+    @staticmethod
+    def lap(stack, t0):
+        return 0
+
+    def reset(self):
+        pass
+
+    def folded(self):
+        return []
+
+    def write_folded(self, path):
+        pass
+
+    def report(self, root="tick", period_sec=None):
+        return "[PROFILE] off"
@@ -2,11 +2,21 @@
 #
 # One script with:
 # - Threaded TF-Luna LiDAR reader (smooth continuous stream)
+# - TF-Luna frame rate following arm state, mode and speed (tfluna_commands.py)
 # - MANUAL mode (tank drive)
-# - GUARD mode (soft slowdown + hard stop when obstacle ahead)
-# - AUTO mode (simple "roomba-lite" forward/avoid/turn)
+# - GUARD mode (time-to-collision braking + hard stop when obstacle ahead)
+# - AUTO mode ("roomba-lite" forward/avoid/turn, or scan-then-choose; AUTO_STRATEGY)
+# - Modes as plugins (drive_modes.py), X cycles through the registered ones
 # - Mode switching + safety controls via your confirmed Xbox button mapping
 # - Controller disconnect/reconnect handling (no need to restart the script)
+# - Optional closed-loop wheel speeds from wheel encoders (wheel_speed.py)
+# - Slew / jerk limited motor commands, through 0 before reversing (motor_shaping.py)
+# - Optional extra range sensors fused into obstacle sectors (sensors.py)
+# - Motor watchdog: PWM cut if the loop stalls (watchdog.py)
+# - Per-stage tick profile, dumped with Y or SIGUSR1 (profiler.py)
+# - Optional live telemetry to UDP subscribers on the LAN (telemetry_stream.py)
+# - Settings hot-reloaded from CONFIG_FILE between ticks (config.py)
+# - Runs on the real car (pigpio/pyserial/pygame) or on sim.py's simulator
 #
 # Your confirmed button mapping (pygame):
 #   A  = 0
@@ -22,18 +32,45 @@
 #   X  -> Cycle mode: MANUAL -> GUARD -> AUTO -> MANUAL
 #   LB -> Decrease STOP_DISTANCE_CM by 5
 #   RB -> Increase STOP_DISTANCE_CM by 5
-#   Y  -> currently unused (free to map later)
+#   Y  -> Dump the tick profile (log + profile.folded for flame graphs)
 #
 # Notes:
 # - If forward direction feels inverted, change FORWARD_IS_NEGATIVE.
 # - AUTO speeds increased so it won't "need a nudge" to start moving.
 
+import math
+import os
+import signal
 import time
-import serial
 import threading
 import random
-import pigpio
-import pygame
+
+import numpy as np
+
+from auto_scan import Footprint, SectorScan, wrap_angle
+from bringup import BringUp, BringUpError
+from config import ConfigError, ConfigService, format_changes
+import controller_input
+from controller_input import ControllerInput
+from drive_modes import DriveInput, DriveMode, DriveOutput, ModeRegistry
+from hal import robot_hardware
+from lidar_channel import LidarChannel
+from lidar_history import LidarHistory
+from loop_timing import LoopScheduler
+from motor_output import MotorOutput
+from motor_shaping import MotorShaper, parse_deadband
+from occupancy_grid import OccupancyGrid
+from odometry import DeadReckoning
+from profiler import NullProfiler, Profiler
+from sensors import Mount, RangeSensor, SectorFusion, SensorRegistry, parse_sensors
+from telemetry import TelemetryRecorder, TelemetryTee
+from telemetry_stream import TelemetryStreamer
+from tfluna import TFLunaParser
+from tfluna_commands import (
+    FORMAT_CM, FrameRatePolicy, TFLunaCommander, set_frame_rate, set_output, set_output_format,
+)
+from watchdog import Watchdog
+from wheel_speed import SpeedControl, SpeedTable
 
 # =============================
 # USER TUNABLE SETTINGS
@@ -54,7 +91,22 @@ RIGHT_AXIS_Y = 3
 # Joystick behavior
 DEADZONE = 0.12            # ignore tiny stick drift
 MAX_SPEED = 100            # -100..100
-LOOP_DT = 0.02             # main loop sleep (~50 Hz)
+LOOP_DT = 0.02             # main loop period (50 Hz, deadline paced)
+LOOP_CATCH_UP = "skip"     # on overrun: "skip" missed ticks or "burst" through them
+RUNTIME = "threads"        # "threads" (I/O threads + paced loop) or "asyncio" (async_runtime.py)
+CTRL_RECONNECT_SEC = 0.5   # how often to retry a lost controller
+WATCHDOG_TIMEOUT_SEC = 0.10   # cut the motors if the loop doesn't tick for this long (0 = off)
+
+# Full-rate binary telemetry (telemetry.py); one session folder per run. None = off
+TELEMETRY_DIR = "telemetry"
+PROFILE = True             # time each tick stage (profiler.py); Y / SIGUSR1 dumps it
+
+# Live telemetry to UDP subscribers (telemetry_stream.py). None = off
+STREAM_PORT = None         # e.g. 5600; watch with `python telemetry_stream.py <car> 5600`
+STREAM_BIND = "0.0.0.0"
+STREAM_MAX_HZ = 25         # packets/s per client, whatever it asks for
+STREAM_MAX_CLIENTS = 16
+STREAM_BUDGET_PPS = 200    # packets/s over all clients
 
 # If forward is negative on your controller (common), keep True
 FORWARD_IS_NEGATIVE = True
@@ -62,16 +114,81 @@ FORWARD_IS_NEGATIVE = True
 # LiDAR (TF-Luna)
 LIDAR_PORT = "/dev/serial0"
 LIDAR_BAUD = 115200
-CONTINUOUS_MODE_COMMAND = bytes([0x5A, 0x05, 0x07, 0x01, 0x00, 0x66])
 
 # Guard distances (cm)
 STOP_DISTANCE_CM = 30      # hard stop threshold (tune)
 SLOW_DISTANCE_CM = 60      # start slowing down when closer than this
 LIDAR_TIMEOUT_SEC = 0.25   # if lidar data older than this, treat stale
 
+# GUARD braking: "ttc" (closing-speed aware) or "linear" (old SLOW..STOP ramp)
+GUARD_BRAKING = "ttc"
+GUARD_DECEL_CM_S2 = 150.0  # deceleration the braking profile plans for
+GUARD_LATENCY_SEC = 0.10   # sensor filter + loop + motor lag before braking bites
+GUARD_TTC_STOP_SEC = 0.25  # hard stop if we'd reach STOP_DISTANCE_CM sooner than this
+FULL_SPEED_CM_S = 90.0     # ground speed at MAX_SPEED (measure on the floor)
+
 # Strength filter (optional) - set to 0 to disable
 MIN_STRENGTH = 0
 
+# Distance filter used by GUARD and AUTO: "raw", "median", "ema", "weighted"
+LIDAR_FILTER = "median"
+LIDAR_FILTER_WINDOW = 5    # samples for median / weighted (5 = 50 ms @ 100 Hz)
+LIDAR_EMA_TAU_SEC = 0.05
+
+# TF-Luna frame rate (tfluna_commands.py): low while disarmed, up with speed
+LIDAR_ADAPTIVE_RATE = True
+LIDAR_RATE_HZ = 100        # fixed rate with LIDAR_ADAPTIVE_RATE off (the sensor's default)
+LIDAR_IDLE_HZ = 20         # disarmed
+LIDAR_MANUAL_MIN_HZ = 50   # armed: at least this per mode...
+LIDAR_GUARD_MIN_HZ = 100
+LIDAR_AUTO_MIN_HZ = 100
+LIDAR_CM_PER_FRAME = 0.5   # ...and a sample every this many cm of (commanded) wheel travel
+LIDAR_RATE_HOLD_SEC = 1.0  # only lower the rate after wanting less for this long
+
+# Mapping: occupancy grid from LiDAR rays + dead reckoning of the motor commands
+MAP_ENABLED = True
+MAP_CELL_CM = 5.0
+MAP_MAX_RANGE_CM = 800     # TF-Luna readings at/over this are "nothing seen"
+TRACK_WIDTH_CM = 16.0      # wheel-to-wheel distance
+LIDAR_OFFSET_CM = 10.0     # TF-Luna ahead of the axle centre
+ODOM_DEADBAND_PCT = 16     # motor command below which the wheels don't turn
+ODOM_WHEEL_TAU_SEC = 0.08  # motor spin-up lag
+
+# More TF-Lunas around the car (sensors.py), read by the same reader as the
+# forward one and fused with it into obstacle sectors: GUARD and AUTO stop
+# for anything in the sectors ahead, and back off the ones behind.
+# "name=port@x,y,yaw; ..." - cm / degrees in the car frame (x forward, y left,
+# yaw CCW from straight ahead), e.g. "rear=/dev/ttyUSB0@-12,0,180". "" = none
+RANGE_SENSORS = ""
+RANGE_STALE_SEC = 0.25     # an extra sensor's reading older than this is stale...
+RANGE_STALE = "ignore"     # ...and "ignore"d, or "block"s its sectors (reads 0 cm)
+FUSION_SECTORS = 8         # obstacle sectors around the car (sector 0 straight ahead)
+FUSION_ARC_DEG = 20        # sectors this close to straight ahead / behind gate forward / reverse
+
+# Closed-loop wheel speeds (wheel_speed.py): needs quadrature wheel encoders.
+# Mode speeds become cm/s targets (speed / MAX_SPEED * FULL_SPEED_CM_S) and
+# the odometry uses the measured wheel speeds
+SPEED_CONTROL = False
+ENC_LEFT_A = 5             # encoder pins (BCM); swap a side's A/B if it counts backwards
+ENC_LEFT_B = 6
+ENC_RIGHT_A = 16
+ENC_RIGHT_B = 20
+ENCODER_COUNTS_PER_CM = 20.0   # counts (all 4 edges) per cm of wheel travel
+SPEED_KP = 1.0             # command % per cm/s of error
+SPEED_KI = 3.0             # command % per cm of accumulated error
+SPEED_KD = 0.0
+SPEED_CAL_FILE = "wheel_calibration.json"  # `python wheel_speed.py`; missing = the motor model above
+
+# Output conditioning between the modes and the motor driver (motor_shaping.py):
+# no more +60 -> -60 in one tick (current spikes, Pi brownouts, wheel slip).
+# With SPEED_CONTROL it shapes the wheel speed targets (no dead band table)
+MOTOR_SHAPING = True
+SHAPE_ACCEL_PCT_S = 400    # speed up by at most this many command % per second (0 = no limit)
+SHAPE_DECEL_PCT_S = 0      # slow down (0 = at once: stops are never delayed)
+SHAPE_JERK_PCT_S2 = 0      # how fast that rate itself may change (0 = off)
+SHAPE_REVERSE_SEC = 0.06   # coast at 0 this long before reversing
+SHAPE_DEADBAND = ""        # dead band compensation "cmd:out, ...", e.g. "1:18, 100:100" ("" = off)
+
 # AUTO mode behavior
 AUTO_FWD_SPEED = 60
 AUTO_REV_SPEED = -60
@@ -81,64 +198,234 @@ AUTO_REVERSE_SEC = 0.6
 AUTO_TURN_SEC_MIN = 0.4
 AUTO_TURN_SEC_MAX = 0.9
 
+# AUTO strategy after backing off an obstacle:
+#   "roomba" - turn a random direction for a random time (AUTO_TURN_SEC_*)
+#   "scan"   - spin once sampling ranges into sectors, then face the most open
+#              one, preferring floor it hasn't driven over yet; looks again at
+#              the end of each checked leg or when it stops making progress
+AUTO_STRATEGY = "roomba"
+AUTO_SCAN_SECTORS = 16     # angular histogram bins per turn
+AUTO_SCAN_SEC_MAX = 4.0    # give up the spin after this long (wheels slipping...)
+AUTO_SCAN_CAP_CM = 250     # clearance beyond this is "open enough"
+AUTO_SCAN_HALF_WIDTH_CM = 12   # half the car's width (path corridor)...
+AUTO_SCAN_SPREAD = 0.15    # ...widening per cm travelled (heading error)
+AUTO_SCAN_NOVELTY = 2.0    # weight of not-yet-driven floor in the choice (0 = off)
+AUTO_FOOTPRINT_CM = 20     # cell size of the driven-floor memory
+AUTO_STALL_SEC = 1.0       # "scan": look again if driving this long...
+AUTO_STALL_CM = 10         # ...without the range changing by this much
+AUTO_ALIGN_DEG = 3         # heading tolerance when turning to the chosen sector
+AUTO_ALIGN_SLOW_DEG = 30   # ...finishing the turn slower once this close
+AUTO_ALIGN_SLOW_SPEED = 30
+AUTO_ALIGN_SEC_MAX = 2.0
+
 # =============================
 # BUTTONS (YOUR CONFIRMED MAPPING)
 # =============================
 BTN_A  = 0   # Arm toggle
 BTN_B  = 1   # Emergency stop (disarm)
 BTN_X  = 3   # Cycle mode
-BTN_Y  = 4   # Unused (free)
+BTN_Y  = 4   # Dump the tick profile
 BTN_LB = 6   # Threshold down
 BTN_RB = 7   # Threshold up
 
+# =============================
+# RUNTIME CONFIG (config.py)
+# =============================
+# Everything above is the built-in default. CONFIG_FILE (JSON, any subset of
+# the settings above) overrides them at startup and is watched while running:
+# edits are validated and applied between control ticks.
+SETTINGS = tuple(k for k, v in list(globals().items())
+                 if k.isupper() and isinstance(v, (bool, int, float, str, type(None))))
+
+CONFIG_FILE = "rc_car_config.json"
+CONFIG_POLL_SEC = 0.5
+
+SETTING_CHOICES = {
+    "LOOP_CATCH_UP": ("skip", "burst"),
+    "RUNTIME": ("threads", "asyncio"),
+    "GUARD_BRAKING": ("ttc", "linear"),
+    "LIDAR_FILTER": ("raw", "median", "ema", "weighted"),
+    "AUTO_STRATEGY": ("roomba", "scan"),
+    "RANGE_STALE": ("ignore", "block"),
+}
+
+SETTING_LIMITS = {
+    "LEFT_AXIS_Y": (0, controller_input.NUM_AXES - 1),
+    "RIGHT_AXIS_Y": (0, controller_input.NUM_AXES - 1),
+    "BTN_A": (0, controller_input.NUM_BUTTONS - 1),
+    "BTN_B": (0, controller_input.NUM_BUTTONS - 1),
+    "BTN_X": (0, controller_input.NUM_BUTTONS - 1),
+    "BTN_Y": (0, controller_input.NUM_BUTTONS - 1),
+    "BTN_LB": (0, controller_input.NUM_BUTTONS - 1),
+    "BTN_RB": (0, controller_input.NUM_BUTTONS - 1),
+    "DEADZONE": (0.0, 0.9),
+    "MAX_SPEED": (1, 100),
+    "LOOP_DT": (0.001, 0.5),
+    "WATCHDOG_TIMEOUT_SEC": (0.0, 2.0),
+    "STOP_DISTANCE_CM": (5, 200),
+    "SLOW_DISTANCE_CM": (5, 800),
+    "LIDAR_TIMEOUT_SEC": (0.01, 5.0),
+    "GUARD_DECEL_CM_S2": (1.0, 5000.0),
+    "GUARD_LATENCY_SEC": (0.0, 2.0),
+    "GUARD_TTC_STOP_SEC": (0.0, 5.0),
+    "FULL_SPEED_CM_S": (1.0, 1000.0),
+    "LIDAR_FILTER_WINDOW": (1, 100),       # well under LidarHistory's 512 samples
+    "LIDAR_EMA_TAU_SEC": (0.0, 5.0),
+    "LIDAR_RATE_HZ": (1, 250),
+    "LIDAR_IDLE_HZ": (1, 250),
+    "LIDAR_MANUAL_MIN_HZ": (1, 250),
+    "LIDAR_GUARD_MIN_HZ": (1, 250),
+    "LIDAR_AUTO_MIN_HZ": (1, 250),
+    "LIDAR_CM_PER_FRAME": (0.05, 100.0),
+    "LIDAR_RATE_HOLD_SEC": (0.0, 60.0),
+    "MIN_STRENGTH": (0, 65535),
+    "MAP_CELL_CM": (1.0, 100.0),
+    "MAP_MAX_RANGE_CM": (10, 1200),
+    "TRACK_WIDTH_CM": (5.0, 100.0),
+    "LIDAR_OFFSET_CM": (-100.0, 100.0),
+    "ODOM_DEADBAND_PCT": (0, 99),
+    "ODOM_WHEEL_TAU_SEC": (0.0, 2.0),
+    "AUTO_FWD_SPEED": (0, 100),
+    "AUTO_REV_SPEED": (-100, 0),
+    "AUTO_TURN_SPEED": (0, 100),
+    "AUTO_STOP_CM": (5, 800),
+    "AUTO_REVERSE_SEC": (0.0, 10.0),
+    "AUTO_TURN_SEC_MIN": (0.0, 10.0),
+    "AUTO_TURN_SEC_MAX": (0.05, 10.0),
+    "AUTO_SCAN_SECTORS": (4, 360),
+    "AUTO_SCAN_SEC_MAX": (0.5, 30.0),
+    "AUTO_SCAN_CAP_CM": (10, 1200),
+    "AUTO_SCAN_HALF_WIDTH_CM": (1, 100),
+    "AUTO_SCAN_SPREAD": (0.0, 2.0),
+    "AUTO_SCAN_NOVELTY": (0.0, 100.0),
+    "AUTO_FOOTPRINT_CM": (1, 500),
+    "AUTO_STALL_SEC": (0.1, 30.0),
+    "AUTO_STALL_CM": (0, 200),
+    "AUTO_ALIGN_DEG": (1, 45),
+    "AUTO_ALIGN_SLOW_DEG": (0, 180),
+    "AUTO_ALIGN_SLOW_SPEED": (0, 100),
+    "AUTO_ALIGN_SEC_MAX": (0.1, 30.0),
+    "ENCODER_COUNTS_PER_CM": (0.1, 10000.0),
+    "SPEED_KP": (0.0, 20.0),
+    "SPEED_KI": (0.0, 200.0),
+    "SPEED_KD": (0.0, 5.0),
+    "SHAPE_ACCEL_PCT_S": (0.0, 100_000.0),
+    "SHAPE_DECEL_PCT_S": (0.0, 100_000.0),
+    "SHAPE_JERK_PCT_S2": (0.0, 10_000_000.0),
+    "SHAPE_REVERSE_SEC": (0.0, 2.0),
+    "RANGE_STALE_SEC": (0.01, 5.0),
+    "FUSION_SECTORS": (4, 360),
+    "FUSION_ARC_DEG": (0, 90),
+    "STREAM_MAX_HZ": (1, 50),
+    "STREAM_MAX_CLIENTS": (1, 1024),
+    "STREAM_BUDGET_PPS": (1, 100_000),
+}
+
+# (lo, hi) pairs: lo must not be over hi
+SETTING_ORDER = (
+    ("AUTO_TURN_SEC_MIN", "AUTO_TURN_SEC_MAX"),
+)
+
+# Only read when the loop starts (hardware, sizes of things built once)
+RESTART_SETTINGS = (
+    "ENA", "IN1", "IN2", "ENB", "IN3", "IN4", "LIDAR_PORT", "LIDAR_BAUD", "LOOP_DT",
+    "LOOP_CATCH_UP", "RUNTIME", "CTRL_RECONNECT_SEC", "TELEMETRY_DIR", "PROFILE", "FORWARD_IS_NEGATIVE",
+    "LIDAR_FILTER_WINDOW", "LIDAR_EMA_TAU_SEC", "MAP_ENABLED", "MAP_CELL_CM",
+    "TRACK_WIDTH_CM", "FULL_SPEED_CM_S", "MAX_SPEED", "ODOM_DEADBAND_PCT",
+    "ODOM_WHEEL_TAU_SEC", "AUTO_SCAN_SECTORS", "AUTO_FOOTPRINT_CM", "SPEED_CONTROL",
+    "ENC_LEFT_A", "ENC_LEFT_B", "ENC_RIGHT_A", "ENC_RIGHT_B", "ENCODER_COUNTS_PER_CM", "SPEED_CAL_FILE",
+    "STREAM_PORT", "STREAM_BIND", "STREAM_MAX_HZ", "STREAM_MAX_CLIENTS", "STREAM_BUDGET_PPS",
+    "RANGE_SENSORS", "FUSION_SECTORS", "FUSION_ARC_DEG",
+)
+
+def make_config(path=None, log=print):
+    """ConfigService over the settings above (as they are now), plus the file at path."""
+    return ConfigService({k: globals()[k] for k in SETTINGS}, path, SETTING_CHOICES,
+                         SETTING_LIMITS, RESTART_SETTINGS, CONFIG_POLL_SEC, log, SETTING_ORDER)
+
 # =============================
 # INTERNALS
 # =============================
+# Index of each drive mode in ControlLoop.make_modes() (X order)
 MODE_MANUAL = 0
 MODE_GUARD  = 1
 MODE_AUTO   = 2
-MODE_NAMES = {0: "MANUAL", 1: "GUARD", 2: "AUTO"}
-
-# pigpio setup
-pi = pigpio.pi()
-if not pi.connected:
-    print("Failed to connect to pigpio daemon!")
-    raise SystemExit(1)
-
-for pin in [IN1, IN2, IN3, IN4]:
-    pi.set_mode(pin, pigpio.OUTPUT)
-
-def set_motor(ena, in1, in2, speed):
-    """speed: -100..100"""
-    if speed > 0:
-        pi.write(in1, 1)
-        pi.write(in2, 0)
-    elif speed < 0:
-        pi.write(in1, 0)
-        pi.write(in2, 1)
-        speed = -speed
-    else:
-        pi.write(in1, 0)
-        pi.write(in2, 0)
 
-    duty = int(max(0, min(100, speed)) * 2.55)
-    pi.set_PWM_dutycycle(ena, duty)
+# Startup (bringup.py)
+LIDAR_READY_SEC = 1.0          # first TF-Luna sample expected within this
+CTRL_CONNECT_POLL_SEC = 0.05   # retry period while waiting for the controller
+
+# The running settings (a config.ConfigService Config); ControlLoop swaps in
+# a new one between ticks. Read as cfg.NAME, never cache it across ticks
+cfg = make_config().current
+
+# Motor backend (hal.PigpioMotors on the car, sim.SimMotors off it)
+pi = None
+
+# motor_output.MotorOutput over `pi`: only changed pins/duty reach pigpio
+motor_out = None
+
+# Last (left, right) speeds sent to the motors
+motor_cmd = [0, 0]
+
+# telemetry.TelemetryRecorder while recording, else None
+telemetry = None
+
+# profiler.Profiler of the running loop (NullProfiler with PROFILE off)
+profiler = NullProfiler()
+
+def setup_motors(motors, clock=None):
+    global pi, motor_out
+    pi = motors
+    motor_out = MotorOutput(pi, [(cfg.ENA, cfg.IN1, cfg.IN2), (cfg.ENB, cfg.IN3, cfg.IN4)], clock)
+    motor_out.setup()
+
+def encoder_pins():
+    """((left A, left B), (right A, right B)) for hal.robot_hardware()."""
+    return (cfg.ENC_LEFT_A, cfg.ENC_LEFT_B), (cfg.ENC_RIGHT_A, cfg.ENC_RIGHT_B)
+
+def speed_table(c):
+    """SPEED_CAL_FILE if it's there, else the odometry's motor model."""
+    if c.SPEED_CAL_FILE and os.path.exists(c.SPEED_CAL_FILE):
+        return SpeedTable.load(c.SPEED_CAL_FILE)
+    return SpeedTable.model(c.ODOM_DEADBAND_PCT, c.FULL_SPEED_CM_S, c.MAX_SPEED)
+
+def set_motors(left_speed, right_speed):
+    """Both motors in one update (direction pins share one banked write)."""
+    duty_l, duty_r = motor_out.drive(left_speed, right_speed)
+    motor_cmd[0] = left_speed
+    motor_cmd[1] = right_speed
+    if telemetry is not None:
+        t = telemetry.now()
+        telemetry.motor(t, cfg.ENA, duty_l, left_speed)
+        telemetry.motor(t, cfg.ENB, duty_r, right_speed)
 
 def stop_motors():
-    set_motor(ENA, IN1, IN2, 0)
-    set_motor(ENB, IN3, IN4, 0)
+    set_motors(0, 0)
 
-def apply_deadzone(x, dz=DEADZONE):
+def cut_motors():
+    """Watchdog trip (watchdog thread): both duties to 0 straight on the pins.
+
+    Bypasses motor_out; the loop drops its cache when it runs again. pigpio's
+    pi object serialises calls made from several threads.
+    """
+    if pi is not None:
+        pi.set_PWM_dutycycle(cfg.ENA, 0)
+        pi.set_PWM_dutycycle(cfg.ENB, 0)
+
+def apply_deadzone(x, dz=None):
+    if dz is None:
+        dz = cfg.DEADZONE
     if abs(x) < dz:
         return 0.0
     return x
 
 def axis_to_speed(axis_val):
     v = apply_deadzone(axis_val)
-    return int(max(-1.0, min(1.0, v)) * MAX_SPEED)
+    return int(max(-1.0, min(1.0, v)) * cfg.MAX_SPEED)
 
 def forward_commanded(left_speed, right_speed):
-    if FORWARD_IS_NEGATIVE:
+    if cfg.FORWARD_IS_NEGATIVE:
         return (left_speed < 0) or (right_speed < 0)
     else:
         return (left_speed > 0) or (right_speed > 0)
@@ -148,288 +435,965 @@ def clamp_forward_by_lidar(speed, dist_cm):
     if dist_cm is None:
         return speed
 
-    is_fwd = (speed < 0) if FORWARD_IS_NEGATIVE else (speed > 0)
+    is_fwd = (speed < 0) if cfg.FORWARD_IS_NEGATIVE else (speed > 0)
     if not is_fwd:
         return speed
 
-    if dist_cm <= STOP_DISTANCE_CM:
+    if dist_cm <= cfg.STOP_DISTANCE_CM:
         return 0
 
-    if dist_cm < SLOW_DISTANCE_CM:
-        span = max(1, (SLOW_DISTANCE_CM - STOP_DISTANCE_CM))
-        factor = (dist_cm - STOP_DISTANCE_CM) / span
+    if dist_cm < cfg.SLOW_DISTANCE_CM:
+        span = max(1, (cfg.SLOW_DISTANCE_CM - cfg.STOP_DISTANCE_CM))
+        factor = (dist_cm - cfg.STOP_DISTANCE_CM) / span
         factor = max(0.0, min(1.0, factor))
         return int(speed * factor)
 
     return speed
 
-# -----------------------------
-# Controller reconnect helpers
-# -----------------------------
-def init_joystick():
-    """Return an initialized joystick or None if none present."""
-    pygame.joystick.quit()
-    pygame.joystick.init()
-    if pygame.joystick.get_count() == 0:
-        return None
-    j = pygame.joystick.Joystick(0)
-    j.init()
-    print("Joystick connected:", j.get_name())
-    return j
-
-# -----------------------------
-# TF-Luna threaded reader
-# -----------------------------
-lidar_lock = threading.Lock()
-lidar_dist_cm = None
-lidar_strength = None
-lidar_last_time = 0.0
-lidar_ok = 0
-lidar_bad = 0
-stop_threads = False
+def clamp_reverse_by_range(speed, dist_cm):
+    """clamp_forward_by_lidar() for reversing, on the range behind (no rear sensor: inf)."""
+    is_rev = (speed > 0) if cfg.FORWARD_IS_NEGATIVE else (speed < 0)
+    if not is_rev or dist_cm >= cfg.SLOW_DISTANCE_CM:
+        return speed
+    if dist_cm <= cfg.STOP_DISTANCE_CM:
+        return 0
+    span = max(1, (cfg.SLOW_DISTANCE_CM - cfg.STOP_DISTANCE_CM))
+    return int(speed * (dist_cm - cfg.STOP_DISTANCE_CM) / span)
+
+def forward_cm_s(left_speed, right_speed):
+    """Ground speed (cm/s) the commanded wheel speeds should give, forward only."""
+    sign = -1 if cfg.FORWARD_IS_NEGATIVE else 1
+    pct = 0.5 * (sign * left_speed + sign * right_speed)
+    return max(0.0, pct) / cfg.MAX_SPEED * cfg.FULL_SPEED_CM_S
+
+def guard_closing_speed(lidar_closing_cm_s, own_cm_s):
+    """Closing speed (cm/s) toward the obstacle ahead.
+
+    The LiDAR slope catches moving obstacles and coasting; the last commanded
+    speed covers the first ticks of an approach, before the slope settles.
+    Take the larger one (fail safe, not optimistic).
+    """
+    return max(lidar_closing_cm_s, own_cm_s)
+
+def clamp_forward_by_ttc(speed, dist_cm, closing_cm_s, own_cm_s):
+    """Limit forward speed so we can still stop at STOP_DISTANCE_CM.
+
+    Allowed ground speed v satisfies v*latency + v^2/(2*decel) <= room left,
+    minus whatever the obstacle itself adds to the closing speed. A predicted
+    time-to-collision under GUARD_TTC_STOP_SEC is a hard stop. Reverse is
+    always allowed.
+    """
+    if dist_cm is None:
+        return speed
 
-def read_tfluna_frame_sync(ser):
-    b = ser.read(1)
-    if not b:
-        return None
-    while b[0] != 0x59:
-        b = ser.read(1)
-        if not b:
-            return None
+    is_fwd = (speed < 0) if cfg.FORWARD_IS_NEGATIVE else (speed > 0)
+    if not is_fwd:
+        return speed
 
-    b2 = ser.read(1)
-    if not b2 or b2[0] != 0x59:
-        return None
+    room = dist_cm - cfg.STOP_DISTANCE_CM
+    if room <= 0:
+        return 0
 
-    payload = ser.read(7)
-    if len(payload) != 7:
-        return None
+    if closing_cm_s > 0 and room / closing_cm_s < cfg.GUARD_TTC_STOP_SEC:
+        return 0
 
-    frame = bytes([0x59, 0x59]) + payload
-    chk = sum(frame[:8]) & 0xFF
-    if chk != frame[8]:
-        return None
+    a = cfg.GUARD_DECEL_CM_S2
+    lat = cfg.GUARD_LATENCY_SEC
+    v_allowed = a * (math.sqrt(lat * lat + 2.0 * room / a) - lat)
+    v_allowed -= max(0.0, closing_cm_s - own_cm_s)     # obstacle coming at us
 
-    dist_cm = frame[2] + (frame[3] << 8)
-    strength = frame[4] + (frame[5] << 8)
-    return dist_cm, strength
+    cap = int(max(0.0, v_allowed) / cfg.FULL_SPEED_CM_S * cfg.MAX_SPEED)
+    if abs(speed) <= cap:
+        return speed
+    return -cap if speed < 0 else cap
 
-def lidar_thread_fn():
-    global lidar_dist_cm, lidar_strength, lidar_last_time, lidar_ok, lidar_bad
+# -----------------------------
+# TF-Luna threaded reader
+# -----------------------------
+# Written only by the LiDAR thread, read lock-free by the control loop
+lidar = LidarChannel()
+lidar_history = LidarHistory(window=LIDAR_FILTER_WINDOW, ema_tau_sec=LIDAR_EMA_TAU_SEC)
+stop_threads = False
 
-    ser = serial.Serial(LIDAR_PORT, LIDAR_BAUD, timeout=0.05)
-    time.sleep(0.2)
+def open_lidar(hw, clock, log=print):
+    """Open the port and force continuous streaming in cm.
 
-    # Force continuous streaming
+    Returns (port, parser, commander); the commands are confirmed as their
+    responses come in (TFLunaCommander.poll() every tick). No settle sleeps:
+    the parser resyncs on whatever arrives first, and the loop treats the
+    LiDAR as stale until a good sample is published.
+    """
+    ser = hw.open_lidar()
     ser.reset_input_buffer()
-    ser.write(CONTINUOUS_MODE_COMMAND)
+    parser = TFLunaParser()
+    commander = TFLunaCommander(ser, parser.responses, clock, log=log)
+    commander.send(set_output_format(FORMAT_CM))
+    commander.send(set_output(True))
     ser.flush()
-    time.sleep(0.1)
-
-    while not stop_threads:
-        out = read_tfluna_frame_sync(ser)
-        now = time.time()
-        with lidar_lock:
-            if out:
-                d, s = out
-                if MIN_STRENGTH and s < MIN_STRENGTH:
-                    lidar_bad += 1
-                else:
-                    lidar_ok += 1
-                    lidar_dist_cm = d
-                    lidar_strength = s
-                    lidar_last_time = now
-            else:
-                lidar_bad += 1
+    return ser, parser, commander
+
+# Profile stages of lidar_poll() (profiler.py): in the reader thread, or
+# inside the tick when the loop services the LiDAR inline
+LIDAR_SPANS = ("lidar;read", "lidar;parse", "lidar;publish")
+INLINE_LIDAR_SPANS = tuple("tick;io;" + s for s in LIDAR_SPANS)
+
+def lidar_poll(ser, parser, clock, spans=LIDAR_SPANS):
+    """Read everything the sensor has sent and publish each good sample."""
+    prof = profiler
+    t = prof.now()
+    bad_before = parser.bad
+    data = parser.read_bytes(ser)
+    t = prof.lap(spans[0], t)
+    if not data:
+        return
+    frames = parser.feed(data)
+    t = prof.lap(spans[1], t)
+    now = clock.monotonic()
+    for d, s, temp in frames:
+        if telemetry is not None:
+            telemetry.lidar(now, d, s, temp)
+        if cfg.MIN_STRENGTH and s < cfg.MIN_STRENGTH:
+            lidar.reject()
+        else:
+            lidar.publish(d, s, temp, now)
+            lidar_history.push(now, d, s)
+    if parser.bad != bad_before:
+        lidar.reject(parser.bad - bad_before)
+    prof.lap(spans[2], t)
+
+def lidar_thread_fn(ser, parser, clock, sensors=None):
+    if sensors is not None and sensors.sensors:
+        # Every port from one selector loop, not a thread each
+        sensors.attach(ser, lambda: lidar_poll(ser, parser, clock))
+        sensors.serve(clock, lambda: stop_threads)
+    else:
+        while not stop_threads:
+            lidar_poll(ser, parser, clock)
 
     ser.close()
 
-def get_lidar():
-    with lidar_lock:
-        dist = lidar_dist_cm
-        strength = lidar_strength
-        age = (time.time() - lidar_last_time) if lidar_last_time else 999.0
-        ok = lidar_ok
-        bad = lidar_bad
-    return dist, strength, age, ok, bad
+def get_lidar(now, last_seq=0):
+    """Latest sample as (dist, strength, age, ok, bad, seq, new).
+
+    new = samples published since last_seq. Never blocks the caller.
+    """
+    sample, new = lidar.read(last_seq)
+    if sample is None:
+        return None, None, 999.0, 0, lidar.bad, 0, 0
+    return sample.dist_cm, sample.strength, now - sample.t, lidar.seq, lidar.bad, sample.seq, new
 
 # -----------------------------
-# AUTO state machine
+# Drive modes (drive_modes.py)
 # -----------------------------
 AUTO_STATE_FWD = 0
 AUTO_STATE_REV = 1
 AUTO_STATE_TURN = 2
-
-def main():
-    global stop_threads, STOP_DISTANCE_CM
-
-    # Start LiDAR thread
-    t = threading.Thread(target=lidar_thread_fn, daemon=True)
-    t.start()
-
-    # Init pygame + joystick
-    pygame.init()
-    pygame.joystick.init()
-
-    joy = init_joystick()
-    while joy is None:
-        print("Waiting for controller...")
-        time.sleep(1)
-        joy = init_joystick()
-
-    armed = False
-    mode = MODE_MANUAL
-
-    # Button edge detection (reinitialized on reconnect)
-    prev_buttons = [0] * joy.get_numbuttons()
-
-    # Auto state
-    auto_state = AUTO_STATE_FWD
-    auto_state_until = 0.0
-    auto_turn_dir = 1
-
-    last_status = 0.0
-
-    try:
-        while True:
-            pygame.event.pump()
-
-            # ---- Controller disconnect / reconnect handling ----
-            if pygame.joystick.get_count() == 0:
-                if armed:
-                    armed = False
-                    stop_motors()
-                    print("[CTRL] Controller disconnected -> DISARMED + MOTORS STOPPED")
-
-                # Wait and attempt reconnect
-                time.sleep(0.5)
-                joy = init_joystick()
-                if joy is not None:
-                    prev_buttons = [0] * joy.get_numbuttons()
-                    print("[CTRL] Controller reconnected")
-                continue
-
-            # Read buttons with edge detect
-            buttons = [joy.get_button(i) for i in range(joy.get_numbuttons())]
-
-            def pressed(btn):
-                return btn < len(buttons) and buttons[btn] == 1 and prev_buttons[btn] == 0
-
-            # A toggles arm
-            if pressed(BTN_A):
-                armed = not armed
-                if not armed:
-                    stop_motors()
-                print(f"[ARM] {'ARMED' if armed else 'DISARMED'}")
-
-            # B emergency stop
-            if pressed(BTN_B):
-                armed = False
-                stop_motors()
-                print("[E-STOP] DISARMED + MOTORS STOPPED")
-
-            # X cycles mode
-            if pressed(BTN_X):
-                mode = (mode + 1) % 3
-                print(f"[MODE] {MODE_NAMES[mode]}")
-                if mode == MODE_AUTO:
-                    auto_state = AUTO_STATE_FWD
-                    auto_state_until = 0.0
-
-            # RB/LB tune stop distance
-            if pressed(BTN_RB):
-                STOP_DISTANCE_CM = min(200, STOP_DISTANCE_CM + 5)
-                print(f"[TUNE] STOP_DISTANCE_CM = {STOP_DISTANCE_CM}")
-
-            if pressed(BTN_LB):
-                STOP_DISTANCE_CM = max(5, STOP_DISTANCE_CM - 5)
-                print(f"[TUNE] STOP_DISTANCE_CM = {STOP_DISTANCE_CM}")
-
-            prev_buttons = buttons
-
-            # Read LiDAR
-            dist, strength, age, ok, bad = get_lidar()
-            lidar_fresh = age <= LIDAR_TIMEOUT_SEC
-
+AUTO_STATE_SCAN = 3
+AUTO_STATE_ALIGN = 4
+
+TURN_DIRS = (-1, 1)
+
+def turn_speeds(turn_dir, base=None):
+    """(left, right) for spinning in place (default AUTO_TURN_SPEED); turn_dir is +1 or -1."""
+    if base is None:
+        base = cfg.AUTO_TURN_SPEED
+    if cfg.FORWARD_IS_NEGATIVE:
+        return (-base) * turn_dir, (base) * turn_dir
+    return (base) * turn_dir, (-base) * turn_dir
+
+def ccw_turn_dir(odom):
+    """The turn_dir that rotates the car counter-clockwise (heading increasing)."""
+    left, right = turn_speeds(1)
+    return 1 if odom.wheel_cm_s(right) > odom.wheel_cm_s(left) else -1
+
+class ManualMode(DriveMode):
+    """Tank drive: right stick -> left motors, left stick -> right motors (as wired)."""
+
+    name = "MANUAL"
+    min_hz_setting = "LIDAR_MANUAL_MIN_HZ"
+
+    def tick(self, inp, out):
+        axes = inp.axes
+        out.set(axis_to_speed(axes[cfg.RIGHT_AXIS_Y]), axis_to_speed(axes[cfg.LEFT_AXIS_Y]))
+
+class GuardMode(DriveMode):
+    """Tank drive with forward motion braked / blocked by the range ahead (and reversing by the one behind)."""
+
+    name = "GUARD"
+    min_hz_setting = "LIDAR_GUARD_MIN_HZ"
+
+    def tick(self, inp, out):
+        axes = inp.axes
+        left_speed = axis_to_speed(axes[cfg.RIGHT_AXIS_Y])
+        right_speed = axis_to_speed(axes[cfg.LEFT_AXIS_Y])
+        dist = inp.dist
+        if forward_commanded(left_speed, right_speed) and not inp.fresh:
             left_speed = 0
             right_speed = 0
+        elif cfg.GUARD_BRAKING == "ttc":
+            own = forward_cm_s(inp.prev_left, inp.prev_right)
+            closing = guard_closing_speed(lidar_history.closing_speed(), own)
+            left_speed = clamp_forward_by_ttc(left_speed, dist, closing, own)
+            right_speed = clamp_forward_by_ttc(right_speed, dist, closing, own)
+        else:
+            left_speed = clamp_forward_by_lidar(left_speed, dist)
+            right_speed = clamp_forward_by_lidar(right_speed, dist)
+        behind = inp.behind
+        if behind < math.inf:
+            left_speed = clamp_reverse_by_range(left_speed, behind)
+            right_speed = clamp_reverse_by_range(right_speed, behind)
+        out.set(left_speed, right_speed)
+
+class AutoMode(DriveMode):
+    """AUTO_STRATEGY "roomba" (FWD -> REV -> random TURN) or "scan" (SCAN -> ALIGN -> FWD leg)."""
+
+    name = "AUTO"
+    min_hz_setting = "LIDAR_AUTO_MIN_HZ"
+
+    def __init__(self, rng, odom, footprint, scan_sectors):
+        super().__init__()
+        self.rng = rng
+        self.odom = odom
+        self.footprint = footprint      # where the car has been (the loop marks it every tick)
+        self.state = AUTO_STATE_FWD
+        self.turn_dir = 1
+        self.until = 0.0
+        self.target = 0.0
+        self.leg_cm = 0.0
+        self.leg_end = math.inf
+        self.scan = SectorScan(scan_sectors)
+        self.scan_count = 0
+        self.stall_dist = 0.0
+        self.stall_t = 0.0
+
+    def enter(self, inp):
+        self.state = AUTO_STATE_FWD
+        self.until = 0.0
+        if cfg.AUTO_STRATEGY == "scan":
+            self.begin_scan(inp.now)
+
+    def begin_scan(self, now):
+        """"scan": spin in place once, binning LiDAR samples by heading."""
+        self.state = AUTO_STATE_SCAN
+        self.until = now + cfg.AUTO_SCAN_SEC_MAX
+        self.turn_dir = ccw_turn_dir(self.odom)
+        self.scan.reset(now, self.odom.heading)
+        self.scan_count = lidar_history.count
+
+    def end_scan(self, now):
+        """Pick the most open sector (weighted by how much of it is undriven) and turn to it."""
+        scan = self.scan
+        clear = scan.clearance(cfg.AUTO_SCAN_HALF_WIDTH_CM, cfg.AUTO_SCAN_SPREAD)
+        weights = None
+        if cfg.AUTO_SCAN_NOVELTY:
+            odom = self.odom
+            reach = np.minimum(clear, cfg.AUTO_SCAN_CAP_CM)
+            weights = 1.0 + cfg.AUTO_SCAN_NOVELTY * self.footprint.unvisited(odom.x, odom.y, scan.headings(), reach)
+        best = scan.choose(clear, cfg.AUTO_SCAN_CAP_CM, weights)
+        if best is None or best[1] <= cfg.AUTO_STOP_CM:
+            # Boxed in, or nothing seen (the spin never happened): back off and look again
+            self.state = AUTO_STATE_REV
+            self.until = now + cfg.AUTO_REVERSE_SEC
+            return
+        self.target = best[0]
+        self.leg_cm = max(0.0, min(best[1], cfg.AUTO_SCAN_CAP_CM) - cfg.AUTO_STOP_CM)
+        self.state = AUTO_STATE_ALIGN
+        self.until = now + cfg.AUTO_ALIGN_SEC_MAX
+
+    def begin_fwd(self, now, leg_cm):
+        """Drive on; "scan" re-scans after leg_cm (the checked clearance) to stay on fresh data."""
+        self.state = AUTO_STATE_FWD
+        self.leg_end = self.odom.distance_cm + leg_cm
+        self.stall_dist = -1.0
+        self.stall_t = now
+
+    def stalled(self, now, dist):
+        """True if the range hasn't changed by AUTO_STALL_CM for AUTO_STALL_SEC."""
+        if abs(dist - self.stall_dist) >= cfg.AUTO_STALL_CM:
+            self.stall_dist = dist
+            self.stall_t = now
+            return False
+        return now - self.stall_t >= cfg.AUTO_STALL_SEC
+
+    def tick(self, inp, out):
+        dist = inp.dist
+        if not inp.fresh or dist is None:
+            out.set(0, 0)
+            return
+        now = inp.now
+        odom = self.odom
+        state = self.state
+
+        if state == AUTO_STATE_FWD:
+            fwd = cfg.AUTO_FWD_SPEED if not cfg.FORWARD_IS_NEGATIVE else -cfg.AUTO_FWD_SPEED
+            out.set(fwd, fwd)
+
+            if cfg.AUTO_STRATEGY == "scan":
+                # Obstacle ahead, end of the checked leg, or wedged against
+                # something the LiDAR can't see: look around again (in place;
+                # reversing blind tends to wedge us again)
+                if dist <= cfg.AUTO_STOP_CM or odom.distance_cm >= self.leg_end or self.stalled(now, dist):
+                    self.begin_scan(now)
+            elif dist <= cfg.AUTO_STOP_CM:
+                self.state = AUTO_STATE_REV
+                self.until = now + cfg.AUTO_REVERSE_SEC
+
+        elif state == AUTO_STATE_REV:
+            rev = cfg.AUTO_REV_SPEED if not cfg.FORWARD_IS_NEGATIVE else -cfg.AUTO_REV_SPEED
+            out.set(rev, rev)
+
+            # Backed off long enough, or about to back into something
+            backed_off = now >= self.until or inp.behind <= cfg.AUTO_STOP_CM
+            if backed_off and cfg.AUTO_STRATEGY == "scan":
+                self.begin_scan(now)
+            elif backed_off:
+                self.state = AUTO_STATE_TURN
+                self.turn_dir = self.rng.choice(TURN_DIRS)
+                self.until = now + self.rng.uniform(cfg.AUTO_TURN_SEC_MIN, cfg.AUTO_TURN_SEC_MAX)
+
+        elif state == AUTO_STATE_TURN:
+            out.set(*turn_speeds(self.turn_dir))
+
+            if now >= self.until:
+                self.state = AUTO_STATE_FWD
+
+        elif state == AUTO_STATE_SCAN:
+            out.set(*turn_speeds(self.turn_dir))
+            ts, d = lidar_history.since(self.scan_count)
+            self.scan_count = lidar_history.count
+            self.scan.add(now, odom.heading, ts, d)
+
+            if abs(self.scan.turned) >= 2 * math.pi or now >= self.until:
+                self.end_scan(now)
+
+        elif state == AUTO_STATE_ALIGN:
+            err = wrap_angle(self.target - odom.heading)
+            # Stop early by what the wheels will still turn while spinning down
+            coast = abs(odom.v_right - odom.v_left) / cfg.TRACK_WIDTH_CM * cfg.ODOM_WHEEL_TAU_SEC
+            if abs(err) <= math.radians(cfg.AUTO_ALIGN_DEG) + coast or now >= self.until:
+                self.begin_fwd(now, self.leg_cm)
+                out.set(0, 0)
+            else:
+                self.turn_dir = ccw_turn_dir(odom) * (1 if err > 0 else -1)
+                slow = abs(err) < math.radians(cfg.AUTO_ALIGN_SLOW_DEG)
+                out.set(*turn_speeds(self.turn_dir, cfg.AUTO_ALIGN_SLOW_SPEED if slow else None))
+
+        else:
+            out.set(0, 0)
+
+class ControlLoop:
+    """The main loop, one tick at a time.
+
+    tick() does one pass of controller / LiDAR / mode logic / motors and
+    never sleeps; run() paces it with a LoopScheduler on absolute deadlines.
+    The same code drives the real car (hal.robot_hardware) and the simulator
+    (sim.Simulator).
+    """
+
+    def __init__(self, hw, log=print, rng=random, telemetry=None, config=None):
+        self.hw = hw
+        self.clock = hw.clock
+        self.log = log
+        self.rng = rng
+        self.telemetry = telemetry
+
+        # Settings: config.ConfigService (default: the module settings as they are now)
+        self.config = config if config is not None else make_config(log=log)
+        c = self.config.current
+
+        self.armed = False
+
+        # Controller snapshot + button edges (own thread on the car, inline in the simulator)
+        self.input = ControllerInput(hw.gamepad, self.clock, reconnect_sec=c.CTRL_RECONNECT_SEC)
+        self.ctrl_connected = False
+
+        self.left_speed = 0
+        self.right_speed = 0
+        self.last_status = 0.0
+        self.lidar_seq = 0
+
+        self.sched = LoopScheduler(c.LOOP_DT, self.clock, catch_up=c.LOOP_CATCH_UP)
+
+        # Stage timing (tick() + the LiDAR reader); dumped on Y / SIGUSR1
+        self.prof = Profiler() if c.PROFILE else NullProfiler()
+        self.dump_requested = False
+
+        # Fed every tick; cuts the motors from its own thread if the ticks stop
+        self.watchdog = Watchdog(self.clock, c.WATCHDOG_TIMEOUT_SEC, cut_motors, self.record_trip)
+
+        self.io = None          # see start()
+        self.bringup = None     # bringup.BringUp of the last parallel start()
+        self.lidar_thread = None
+        self.lidar_ser = None
+        self.lidar_parser = None
+        self.lidar_cmd = None   # tfluna_commands.TFLunaCommander on the open port
+        self.lidar_rate = FrameRatePolicy(c.LIDAR_IDLE_HZ, {}, c.LIDAR_CM_PER_FRAME, c.LIDAR_RATE_HOLD_SEC)
+
+        # The other range sensors (hw.range_sensors) and the obstacle sectors of all of them
+        self.sensors = SensorRegistry(RangeSensor(name, mount, open_port) for name, mount, open_port in hw.range_sensors)
+        self.fusion = SectorFusion(c.FUSION_SECTORS, c.FUSION_ARC_DEG)
+        self.lidar_mount = None
+        self.behind = math.inf  # nearest range behind (inf without rear sensors)
+        self.tune_sensors(c)
+
+        # Map (pose is relative to where start() was called)
+        self.odom = DeadReckoning(c.TRACK_WIDTH_CM, c.FULL_SPEED_CM_S, c.MAX_SPEED, c.ODOM_DEADBAND_PCT,
+                                  c.ODOM_WHEEL_TAU_SEC, forward_sign=-1 if c.FORWARD_IS_NEGATIVE else 1)
+        self.grid = OccupancyGrid(c.MAP_CELL_CM) if c.MAP_ENABLED else None
+        self.map_count = 0
+        self.footprint = Footprint(c.AUTO_FOOTPRINT_CM)
+
+        # Drive modes (X cycles them) and the per-tick hand-over, both reused every tick
+        self.modes = ModeRegistry(self.make_modes(c))
+        self.mode_in = DriveInput()
+        self.mode_out = DriveOutput()
+        self.tune_lidar_rate(c)
+
+        # Closed-loop wheel speeds (SPEED_CONTROL with encoders), else raw duty
+        self.speed = None
+        if c.SPEED_CONTROL:
+            if hw.encoders is None:
+                log("[SPEED] SPEED_CONTROL is on but there are no wheel encoders -> open loop")
+            else:
+                self.speed = SpeedControl(hw.encoders, speed_table(c), c.ENCODER_COUNTS_PER_CM,
+                                          c.SPEED_KP, c.SPEED_KI, c.SPEED_KD)
+
+        # Output conditioning of the mode's speeds (MOTOR_SHAPING)
+        self.shaper = MotorShaper(dt=c.LOOP_DT)
+        self.tune_shaper(c)
+
+    @property
+    def mode(self):
+        """Index of the current drive mode (MODE_*)."""
+        return self.modes.index
+
+    def make_modes(self, c):
+        """The drive modes X cycles through, in order: their index is MODE_* and what telemetry records."""
+        return [ManualMode(), GuardMode(), AutoMode(self.rng, self.odom, self.footprint, c.AUTO_SCAN_SECTORS)]
+
+    def start(self, io=None):
+        """Bring the hardware up, ready to tick.
+
+        io: what services the LiDAR, controller and config file:
+          "threads" - their own threads (default on the car)
+          "inline"  - tick() itself, in order (default in the simulator, so
+                      a simulated run is deterministic)
+          "tasks"   - the caller, e.g. async_runtime's asyncio tasks
+        """
+        global stop_threads, telemetry, cfg, profiler
+
+        if io is None:
+            io = "threads" if self.hw.realtime else "inline"
+        self.io = io
+
+        cfg = self.config.current
+        if self.telemetry is not None:
+            self.telemetry.start(writer=io != "tasks")
+            self.telemetry.config(self.clock.monotonic(), "start", cfg._asdict())
+        telemetry = self.telemetry
+        profiler = self.prof
+
+        lidar.reset()
+        lidar_history.tune(cfg.LIDAR_FILTER_WINDOW, cfg.LIDAR_EMA_TAU_SEC)
+        lidar_history.reset()
+        self.odom.reset()
+        if self.speed is not None:
+            self.speed.reset()
+            if self.session_dir() is not None:
+                self.speed.table.save(os.path.join(self.session_dir(), "speed_table.json"))
+        self.footprint.reset()
+        self.map_count = 0
+        stop_threads = False
+
+        if io != "inline":
+            # Motor driver, LiDAR and controller side by side; ticking starts
+            # once it can be armed (the LiDAR counts as stale until it streams)
+            up = self.bringup = BringUp(self.clock)
+            up.phase("motors", self.bring_up_motors)
+            up.phase("controller", self.bring_up_controller)
+            lidar_ready = up.phase("lidar", self.bring_up_lidar if io == "threads" else self.open_lidar_port)
+            try:
+                up.ready("motors", "controller")
+            except BringUpError:
+                stop_threads = True
+                up.close()
+                raise
+            up.mark("armable")
+            self.log(up.report())
+            lidar_ready.add_done_callback(lambda f: self.log(
+                f"[STARTUP] lidar: {f.exception()}" if f.exception() else up.report()))
+            up.close()
+            if io == "threads":
+                self.input.start()
+                self.config.start()
+        else:
+            self.bring_up_motors()
+            self.hw.gamepad.open()
+            self.open_lidar_port()
+            self.connect_controller()
+        self.log(f"Joystick connected: {self.input.name}")
+        self.ctrl_connected = True
+
+        self.watchdog.timeout = cfg.WATCHDOG_TIMEOUT_SEC
+        if io == "inline":
+            self.hw.clock.watch(self.watchdog)
+        else:
+            self.watchdog.start()
+
+    def bring_up_motors(self):
+        self.hw.motors.open()
+        setup_motors(self.hw.motors, self.clock)
+        if self.speed is not None:
+            self.hw.encoders.open()
+
+    def open_lidar_port(self):
+        """Open the TF-Luna for whoever services it (tick() or an asyncio task)."""
+        self.lidar_ser, self.lidar_parser, self.lidar_cmd = open_lidar(self.hw, self.clock, self.log)
+        self.lidar_rate.reset()
+        self.sensors.open()
+
+    def bring_up_lidar(self):
+        """Open the TF-Luna, start its reader and wait for the first good sample."""
+        ser, parser, self.lidar_cmd = open_lidar(self.hw, self.clock, self.log)
+        self.lidar_rate.reset()
+        self.sensors.open()
+        self.lidar_thread = threading.Thread(target=lidar_thread_fn, args=(ser, parser, self.clock, self.sensors),
+                                             daemon=True)
+        self.lidar_thread.start()
+        end = self.clock.monotonic() + LIDAR_READY_SEC
+        while lidar.seq == 0 and not stop_threads:
+            if self.clock.monotonic() >= end:
+                raise BringUpError(f"no samples after {LIDAR_READY_SEC} s (GUARD/AUTO hold until it streams)")
+            self.clock.sleep(0.005)
+
+    def bring_up_controller(self):
+        self.hw.gamepad.open()
+        self.connect_controller()
+
+    def connect_controller(self):
+        """Block until a controller is connected (or the loop is stopped)."""
+        next_log = self.clock.monotonic() + 1.0
+        while not self.input.connect():
+            if stop_threads:
+                raise BringUpError("stopped while waiting for the controller")
+            if self.clock.monotonic() >= next_log:
+                self.log("Waiting for controller...")
+                next_log += 1.0
+            self.clock.sleep(CTRL_CONNECT_POLL_SEC)
+
+    def shutdown(self):
+        global stop_threads, telemetry, profiler
 
-            # If not armed, always stop motors
-            if not armed:
+        stop_threads = True
+        self.watchdog.stop()
+        self.input.stop()
+        self.config.stop()
+        if self.lidar_thread is not None:
+            self.lidar_thread.join(1.0)     # leaves its read loop within one serial timeout
+            self.lidar_thread = None
+        if motor_out is not None:       # None if start() failed before the motors came up
+            stop_motors()
+        if self.lidar_ser is not None:
+            self.lidar_ser.close()
+        self.sensors.close()
+        self.hw.close()
+        if self.telemetry is not None:
+            telemetry = None
+            self.telemetry.close()
+            if self.telemetry.dir is not None:
+                lost = {k: n for k, n in self.telemetry.dropped.items() if n}
+                self.log(f"[TELEMETRY] {self.telemetry.dir}: {self.telemetry.written}"
+                         + (f", dropped {lost}" if lost else ""))
+        if self.grid is not None:
+            msg = f"[MAP] {self.grid.explored_m2():.1f} m^2 explored, {len(self.grid.tiles)} tiles"
+            if self.session_dir() is not None:
+                path = os.path.join(self.session_dir(), "map.npz")
+                self.grid.save(path)
+                msg += f" -> {path}"
+            self.log(msg)
+        if motor_out is not None:
+            self.log(motor_out.report())
+        self.log(self.sched.report())
+        self.log(self.watchdog.report())
+        if self.lidar_cmd is not None:
+            self.log(self.lidar_cmd.report())
+        if self.session_dir() is not None:
+            self.prof.write_folded(os.path.join(self.session_dir(), "profile.folded"))
+        profiler = NullProfiler()
+
+    def run(self, ticks=None, seconds=None):
+        """start(), tick at LOOP_DT until stopped (or ticks/seconds run out), shutdown()."""
+        n = 0
+        try:
+            self.start()
+            sched = self.sched
+            sched.start()
+            end = self.clock.monotonic() + seconds if seconds is not None else None
+            while (ticks is None or n < ticks) and (end is None or self.clock.monotonic() < end):
+                sched.wait()
+                self.tick()
+                sched.done()
+                n += 1
+        finally:
+            self.shutdown()
+        return n
+
+    def update_map(self, now):
+        """Cast every LiDAR sample since last tick from the dead-reckoned pose."""
+        odom = self.odom
+        _, d = lidar_history.since(self.map_count)
+        self.map_count = lidar_history.count
+        d = d[d > 0]
+        if not d.size:
+            return
+        c = math.cos(odom.heading)
+        s = math.sin(odom.heading)
+        ox = odom.x + c * cfg.LIDAR_OFFSET_CM
+        oy = odom.y + s * cfg.LIDAR_OFFSET_CM
+        r = np.minimum(d, cfg.MAP_MAX_RANGE_CM)
+        self.grid.update(ox, oy, ox + c * r, oy + s * r, d < cfg.MAP_MAX_RANGE_CM)
+
+    def update_config(self, now, source=None, **values):
+        """Swap in queued file edits (or set values, from source); publish, log and record them."""
+        global cfg
+        if source is None:
+            source = "file"
+            changed = self.config.update(now)
+        else:
+            changed = self.config.set(now, source, **values)
+        if changed is None:
+            return
+        cfg = self.config.current
+        self.watchdog.timeout = cfg.WATCHDOG_TIMEOUT_SEC
+        if self.speed is not None:
+            self.speed.tune(cfg.SPEED_KP, cfg.SPEED_KI, cfg.SPEED_KD)
+        self.tune_lidar_rate(cfg)
+        self.tune_sensors(cfg)
+        self.tune_shaper(cfg)
+        self.log(f"[CONFIG] {source}: {format_changes(changed)}")
+        if self.telemetry is not None:
+            self.telemetry.config(now, source, {name: new for name, (_, new) in changed.items()})
+
+    def tune_lidar_rate(self, c):
+        policy = self.lidar_rate
+        policy.idle_hz = c.LIDAR_IDLE_HZ
+        policy.mode_min_hz = {i: getattr(c, m.min_hz_setting) for i, m in enumerate(self.modes.modes)}
+        policy.cm_per_frame = c.LIDAR_CM_PER_FRAME
+        policy.hold_sec = c.LIDAR_RATE_HOLD_SEC
+
+    def tune_sensors(self, c):
+        self.lidar_mount = Mount(c.LIDAR_OFFSET_CM, 0.0, 0.0)
+        for s in self.sensors.sensors:
+            s.max_age_sec = c.RANGE_STALE_SEC
+            s.stale = c.RANGE_STALE
+            s.min_strength = c.MIN_STRENGTH
+
+    def tune_shaper(self, c):
+        shaper = self.shaper
+        try:
+            table = parse_deadband(c.SHAPE_DEADBAND)
+        except ValueError as e:
+            self.log(f"[SHAPE] SHAPE_DEADBAND: {e} -> keeping the previous table")
+            table = shaper.table
+        shaper.tune(c.SHAPE_ACCEL_PCT_S, c.SHAPE_DECEL_PCT_S, c.SHAPE_JERK_PCT_S2, c.SHAPE_REVERSE_SEC, table)
+        if not c.MOTOR_SHAPING:
+            shaper.reset()      # starts from rest when turned back on
+
+    def fuse_ranges(self, now, dist, fresh):
+        """Obstacle sectors from the forward distance and the other sensors; returns the distance ahead."""
+        fusion = self.fusion
+        fusion.clear()
+        if fresh and dist is not None:
+            fusion.add(self.lidar_mount, dist)
+        if not self.sensors.sensors:
+            return dist
+        self.sensors.fuse(now, fusion)
+        self.behind = fusion.behind()
+        if fresh and dist is not None:
+            dist = min(dist, fusion.ahead())
+        return dist
+
+    def update_lidar_rate(self, now):
+        """Match the TF-Luna's responses; set the frame rate the policy wants for the last tick's command."""
+        lc = self.lidar_cmd
+        if lc is None:
+            return
+        lc.poll(now)
+        policy = self.lidar_rate
+        if cfg.LIDAR_ADAPTIVE_RATE:
+            cm_s = max(abs(self.left_speed), abs(self.right_speed)) / cfg.MAX_SPEED * cfg.FULL_SPEED_CM_S
+            hz = policy.update(now, self.armed, self.mode, cm_s)
+        else:
+            hz = policy.hold(cfg.LIDAR_RATE_HZ)
+        if hz is not None:
+            lc.send(set_frame_rate(hz), now)
+
+    def record_trip(self, trip):
+        """Watchdog thread: keep the trip (logged once the loop runs again)."""
+        if self.telemetry is not None:
+            self.telemetry.watchdog(trip.t, trip.fed, trip.reaction)
+
+    def watchdog_tripped(self, now, trip, stalled):
+        """First tick after a watchdog trip: stay stopped until re-armed."""
+        motor_out.invalidate()      # the duties were zeroed behind its back
+        self.armed = False
+        stop_motors()
+        self.log(f"[WATCHDOG] loop stalled {stalled * 1000:.0f} ms -> MOTORS CUT "
+                 f"{trip.reaction * 1000:.1f} ms after the deadline, DISARMED")
+
+    def record_state(self, now, dist):
+        if self.telemetry is not None:
+            m = self.modes.current
+            self.telemetry.state(now, self.modes.index, self.armed, m.state, m.turn_dir, cfg.STOP_DISTANCE_CM, dist)
+
+    def session_dir(self):
+        """The telemetry session folder, or None if nothing is recorded to disk."""
+        folder = self.telemetry.dir if self.telemetry is not None else None
+        return folder if folder is not None and os.path.isdir(folder) else None
+
+    def request_dump(self, *_):
+        """Dump the profile after the current tick (Y button, SIGUSR1 handler)."""
+        self.dump_requested = True
+
+    def dump_profile(self):
+        """Log the per-stage table and write profile.folded (session folder, else cwd)."""
+        self.dump_requested = False
+        folder = self.session_dir() or "."
+        path = os.path.join(folder, "profile.folded")
+        self.prof.write_folded(path)
+        self.log(self.prof.report("tick", cfg.LOOP_DT))
+        if self.io != "inline":
+            self.log(self.prof.report("lidar"))
+        self.log(f"[PROFILE] flame graph input -> {path}")
+
+    def tick(self):
+        prof = self.prof
+        t0 = prof.now()
+        self.tick_stages(prof, t0)
+        prof.lap("tick", t0)
+        if self.dump_requested:
+            self.dump_profile()
+
+    def tick_stages(self, prof, t):
+        """One tick; t = prof.now() at its start, each stage ends with a lap."""
+        inp = self.input
+        inline = self.io == "inline"
+        if inline:
+            inp.poll()
+            lidar_poll(self.lidar_ser, self.lidar_parser, self.clock, INLINE_LIDAR_SPANS)
+            if self.sensors.sensors:
+                self.sensors.poll(self.clock.monotonic())
+            t = prof.lap("tick;io", t)
+
+        # One timestamp per tick: everything it records lands at or after it
+        now = self.clock.monotonic()
+        mode_in = self.mode_in
+        mode_in.now = now
+        tripped = self.watchdog.feed(now)
+        if tripped is not None:
+            self.watchdog_tripped(now, *tripped)
+        if inline:
+            self.config.poll_due(now)
+        self.update_config(now)
+        t = prof.lap("tick;config", t)
+        ctrl = inp.state
+        odom = self.odom
+        speed = self.speed
+        if speed is not None:
+            vl, vr = speed.measure(now)
+            odom.step_measured(now, odom.sign * vl, odom.sign * vr)
+            if self.telemetry is not None:
+                self.telemetry.wheels(now, *speed.counts)
+        else:
+            odom.step(now, motor_cmd[0], motor_cmd[1])
+        self.footprint.mark(odom.x, odom.y)
+        t = prof.lap("tick;odom", t)
+        if self.grid is not None:
+            self.update_map(now)
+            t = prof.lap("tick;map", t)
+
+        # ---- Controller disconnect / reconnect handling ----
+        # (the input side re-opens the controller; the loop never waits for it)
+        if not ctrl.connected:
+            if self.armed:
+                self.armed = False
                 stop_motors()
-                time.sleep(LOOP_DT)
-                continue
-
-            # MODE: MANUAL / GUARD
-            if mode in (MODE_MANUAL, MODE_GUARD):
-                left_speed = axis_to_speed(joy.get_axis(RIGHT_AXIS_Y))
-                right_speed = axis_to_speed(joy.get_axis(LEFT_AXIS_Y))
-
-                if mode == MODE_GUARD:
-                    if forward_commanded(left_speed, right_speed) and not lidar_fresh:
-                        left_speed = 0
-                        right_speed = 0
-                    else:
-                        left_speed = clamp_forward_by_lidar(left_speed, dist)
-                        right_speed = clamp_forward_by_lidar(right_speed, dist)
-
-            # MODE: AUTO
-            elif mode == MODE_AUTO:
-                now = time.time()
-
-                if not lidar_fresh or dist is None:
-                    left_speed = 0
-                    right_speed = 0
-                else:
-                    if auto_state == AUTO_STATE_FWD:
-                        fwd = AUTO_FWD_SPEED if not FORWARD_IS_NEGATIVE else -AUTO_FWD_SPEED
-                        left_speed = fwd
-                        right_speed = fwd
-
-                        if dist <= AUTO_STOP_CM:
-                            auto_state = AUTO_STATE_REV
-                            auto_state_until = now + AUTO_REVERSE_SEC
-
-                    elif auto_state == AUTO_STATE_REV:
-                        rev = AUTO_REV_SPEED if not FORWARD_IS_NEGATIVE else -AUTO_REV_SPEED
-                        left_speed = rev
-                        right_speed = rev
-
-                        if now >= auto_state_until:
-                            auto_state = AUTO_STATE_TURN
-                            auto_turn_dir = random.choice([-1, 1])
-                            auto_state_until = now + random.uniform(AUTO_TURN_SEC_MIN, AUTO_TURN_SEC_MAX)
-
-                    elif auto_state == AUTO_STATE_TURN:
-                        base = AUTO_TURN_SPEED
-                        if FORWARD_IS_NEGATIVE:
-                            left_speed = (-base) * auto_turn_dir
-                            right_speed = (base) * auto_turn_dir
-                        else:
-                            left_speed = (base) * auto_turn_dir
-                            right_speed = (-base) * auto_turn_dir
-
-                        if now >= auto_state_until:
-                            auto_state = AUTO_STATE_FWD
-
-            # Apply motors
-            set_motor(ENA, IN1, IN2, left_speed)
-            set_motor(ENB, IN3, IN4, right_speed)
-
-            # Status print (2x/sec)
-            now = time.time()
-            if now - last_status > 0.5:
-                last_status = now
-                print(f"[{MODE_NAMES[mode]}] armed={armed} dist={dist}cm age={age:.2f}s OK/Bad={ok}/{bad} STOP={STOP_DISTANCE_CM} L={left_speed} R={right_speed}")
-
-            time.sleep(LOOP_DT)
+                self.log("[CTRL] Controller disconnected -> DISARMED + MOTORS STOPPED")
+            self.ctrl_connected = False
+            inp.events.clear()
+            self.record_state(now, None)
+            prof.lap("tick;input", t)
+            return
+        if not self.ctrl_connected:
+            self.ctrl_connected = True
+            self.log(f"Joystick connected: {inp.name}")
+            self.log("[CTRL] Controller reconnected")
+
+        # Buttons pressed since last tick (a tap shorter than a tick still counts)
+        pressed = 0
+        events = inp.events
+        while events:
+            _, btn, down = events.popleft()
+            if down:
+                pressed |= 1 << btn
+        if self.telemetry is not None:
+            self.telemetry.controller(now, ctrl.axes, ctrl.buttons, pressed)
+
+        # A toggles arm
+        if pressed & (1 << cfg.BTN_A):
+            self.armed = not self.armed
+            if not self.armed:
+                stop_motors()
+            self.log(f"[ARM] {'ARMED' if self.armed else 'DISARMED'}")
+
+        # B emergency stop
+        if pressed & (1 << cfg.BTN_B):
+            self.armed = False
+            stop_motors()
+            self.log("[E-STOP] DISARMED + MOTORS STOPPED")
+
+        # X cycles mode
+        if pressed & (1 << cfg.BTN_X):
+            self.modes.next(mode_in)
+            self.log(f"[MODE] {self.modes.current.name}")
+
+        # RB/LB tune stop distance
+        if pressed & (1 << cfg.BTN_RB):
+            self.update_config(now, "button", STOP_DISTANCE_CM=min(200, cfg.STOP_DISTANCE_CM + 5))
+
+        if pressed & (1 << cfg.BTN_LB):
+            self.update_config(now, "button", STOP_DISTANCE_CM=max(5, cfg.STOP_DISTANCE_CM - 5))
+
+        # Y dumps the profile
+        if pressed & (1 << cfg.BTN_Y):
+            self.request_dump()
+        t = prof.lap("tick;input", t)
+
+        # Read LiDAR
+        dist, strength, age, ok, bad, self.lidar_seq, _new = get_lidar(now, self.lidar_seq)
+        lidar_fresh = age <= cfg.LIDAR_TIMEOUT_SEC
+        if dist is not None:
+            dist = lidar_history.filtered(cfg.LIDAR_FILTER)
+        self.update_lidar_rate(now)
+        t = prof.lap("tick;lidar", t)
+        dist = self.fuse_ranges(now, dist, lidar_fresh)
+        t = prof.lap("tick;fusion", t)
+
+        # If not armed, always stop motors
+        if not self.armed:
+            self.left_speed = 0
+            self.right_speed = 0
+            if speed is not None:
+                speed.reset()
+            self.shaper.reset()
+            stop_motors()
+            t = prof.lap("tick;motors", t)
+            self.record_state(now, dist)
+            prof.lap("tick;telemetry", t)
+            return
+
+        # The current mode's speeds (drive_modes.py)
+        mode = self.modes.current
+        mode_in.axes = ctrl.axes
+        mode_in.dist = dist
+        mode_in.fresh = lidar_fresh
+        mode_in.behind = self.behind
+        mode_in.prev_left = self.left_speed
+        mode_in.prev_right = self.right_speed
+        out = self.mode_out
+        mode.tick(mode_in, out)
+        left_speed = out.left
+        right_speed = out.right
+        t = prof.lap("tick;mode", t)
+
+        # Output conditioning: slew / jerk limits, a pause at 0 before reversing
+        shaping = cfg.MOTOR_SHAPING
+        if shaping:
+            shaper = self.shaper
+            left_speed, right_speed = shaper.step(now, left_speed, right_speed)
+            left_speed = round(left_speed)
+            right_speed = round(right_speed)
+            t = prof.lap("tick;shape", t)
+
+        # Apply motors (speed control: the mode's speeds are wheel speed targets)
+        if speed is not None:
+            k = cfg.FULL_SPEED_CM_S / cfg.MAX_SPEED
+            out_l, out_r = speed.update(left_speed * k, right_speed * k)
+            t = prof.lap("tick;speed", t)
+            set_motors(out_l, out_r)
+        elif shaping:
+            set_motors(shaper.compensate(left_speed), shaper.compensate(right_speed))
+        else:
+            set_motors(left_speed, right_speed)
+        self.left_speed = left_speed
+        self.right_speed = right_speed
+        t = prof.lap("tick;motors", t)
+        self.record_state(now, dist)
+        t = prof.lap("tick;telemetry", t)
+
+        # Status print (2x/sec)
+        if now - self.last_status > 0.5:
+            self.last_status = now
+            gpio_rate, _ = motor_out.rates()
+            lost = sum(self.telemetry.dropped.values()) if self.telemetry is not None else 0
+            self.log(f"[{mode.name}] armed={self.armed} dist={None if dist is None else int(dist)}cm({cfg.LIDAR_FILTER}) age={age:.2f}s@{self.lidar_rate.rate}Hz OK/Bad={ok}/{bad} STOP={cfg.STOP_DISTANCE_CM} L={left_speed} R={right_speed} GPIO={gpio_rate:.0f}/s"
+                     + (f" TLM_DROPPED={lost}" if lost else ""))
+            prof.lap("tick;status", t)
+
+def main(hw=None, config_file=CONFIG_FILE, runtime=None):
+    global cfg
+    try:
+        config = make_config(config_file)
+    except ConfigError as e:
+        print(f"[CONFIG] {e}")
+        raise SystemExit(1)
+    cfg = config.current
+    if config.file_values:
+        print(f"[CONFIG] {config_file}: {', '.join(sorted(config.file_values))}")
 
+    try:
+        parse_deadband(cfg.SHAPE_DEADBAND)
+    except ValueError as e:
+        print(f"[CONFIG] SHAPE_DEADBAND: {e}")
+        raise SystemExit(1)
+
+    if hw is None:
+        try:
+            extra = parse_sensors(cfg.RANGE_SENSORS)
+        except ValueError as e:
+            print(f"[CONFIG] RANGE_SENSORS: {e}")
+            raise SystemExit(1)
+        hw = robot_hardware(cfg.LIDAR_PORT, cfg.LIDAR_BAUD, encoder_pins() if cfg.SPEED_CONTROL else None, extra)
+
+    recorder = None
+    if cfg.TELEMETRY_DIR:
+        session = os.path.join(cfg.TELEMETRY_DIR, time.strftime("session-%Y%m%d-%H%M%S"))
+        recorder = TelemetryRecorder(session, hw.clock)
+        print(f"[TELEMETRY] recording to {session}")
+
+    streamer = None
+    if cfg.STREAM_PORT is not None:
+        streamer = TelemetryStreamer(hw.clock, cfg.STREAM_BIND, cfg.STREAM_PORT, cfg.ENA, cfg.STREAM_MAX_HZ,
+                                     cfg.STREAM_MAX_CLIENTS, cfg.STREAM_BUDGET_PPS)
+        print(f"[STREAM] udp {cfg.STREAM_BIND}:{cfg.STREAM_PORT}")
+
+    sinks = [s for s in (recorder, streamer) if s is not None]
+    sink = sinks[0] if len(sinks) == 1 else TelemetryTee(*sinks) if sinks else None
+
+    loop = ControlLoop(hw, telemetry=sink, config=config)
+    signal.signal(signal.SIGUSR1, loop.request_dump)
+    try:
+        if (runtime or cfg.RUNTIME) == "asyncio":
+            import async_runtime
+            async_runtime.run(loop)
+        else:
+            loop.run()
+    except BringUpError as e:
+        print(f"[STARTUP] {e}")
+        raise SystemExit(1)
     finally:
-        stop_threads = True
-        time.sleep(0.1)
-        stop_motors()
-        pi.stop()
-        pygame.quit()
+        if streamer is not None:
+            print(streamer.report())
 
 if __name__ == "__main__":
     main()
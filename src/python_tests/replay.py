@@ -0,0 +1,544 @@
+# replay.py
+#
+# Deterministic replay of recorded telemetry sessions through the real
+# control logic.
+#
+# A session (telemetry.py) holds every TF-Luna sample, every controller
+# snapshot and one state record per control tick. Replay rebuilds the
+# inputs from those streams and feeds them to the unmodified ControlLoop:
+#
+#   ReplayClock    - virtual time, jumps straight to each recorded event
+#   ReplayLidar    - re-encodes the recorded samples as TF-Luna frames, so
+#                    they go through the same parser / strength filter /
+#                    history as on the car
+#   ReplayGamepad  - axes, held buttons and button presses of the tick
+#                    being replayed, as controller events; ticks with no
+#                    controller record are "disconnected"
+#   ReplayRng      - hands AUTO the turn directions / durations the car
+#                    actually picked (from the state stream)
+#   ReplayEncoders - the wheel encoder counts each tick read (SPEED_CONTROL
+#                    sessions; the duty -> speed table is in speed_table.json)
+#
+# Settings come from the session's config.jsonl when it has one: the config
+# the car started with, and config-file edits queued for the tick they were
+# applied at (button tweaks replay from the button presses themselves).
+# Motor watchdog trips are replayed at their recorded times rather than
+# re-timed, since the recorded tick gaps don't say when its thread woke up.
+#
+# LiDAR polls happen at the recorded sample times and ticks at the recorded
+# tick times, so a replay with unchanged settings reproduces the recorded
+# motor commands exactly; with overrides (AUTO_STOP_CM=40, ...) it shows
+# what the new settings would have done with the same inputs.
+#
+# Usage:
+#   python replay.py telemetry/session-20250101-120000
+#   python replay.py telemetry --set AUTO_STOP_CM=40 --set SLOW_DISTANCE_CM=80
+#   python replay.py SESSION --save trace.npy
+
+import argparse
+import ast
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+import rc_car_modes_bluetooth_fix_good as car
+from hal import Clock, Encoders, Gamepad, Hardware, LidarPort, MotorPins
+from lidar_history import LidarHistory
+from telemetry import load_config_log, load_session
+from tfluna import encode_frame
+
+NUM_BUTTONS = 32        # width of the recorded button bitmask
+
+TRACE = np.dtype([("t", "<f8"), ("left", "<i2"), ("right", "<i2")])
+
+
+class ReplayClock(Clock):
+    def __init__(self, start):
+        self.t = start
+
+    def time(self):
+        return self.t
+
+    def monotonic(self):
+        return self.t
+
+    def monotonic_ns(self):
+        return int(self.t * 1e9)
+
+    def sleep(self, sec):
+        if sec > 0:
+            self.t += sec
+
+
+class NullMotors(MotorPins):
+    """Pins go nowhere; the trace is taken from the motor records."""
+
+    def set_output(self, pin):
+        pass
+
+    def write(self, pin, level):
+        pass
+
+    def set_PWM_dutycycle(self, pin, duty):
+        pass
+
+
+class ReplayLidar(LidarPort):
+    """Releases the recorded samples with t <= clock time as TF-Luna bytes."""
+
+    def __init__(self, clock, records):
+        self.clock = clock
+        self.t = records["t"]
+        self.records = records
+        self.next = 0
+        self.buf = bytearray()
+        self.written = bytearray()
+
+    def _release(self):
+        end = int(np.searchsorted(self.t, self.clock.t, side="right"))
+        if end > self.next:
+            rec = self.records[self.next:end]
+            self.buf += b"".join(encode_frame(d, s, temp) for d, s, temp in
+                                 zip(rec["dist"].tolist(), rec["strength"].tolist(), rec["temp"].tolist()))
+            self.next = end
+
+    @property
+    def in_waiting(self):
+        self._release()
+        return len(self.buf)
+
+    def read(self, n=1):
+        self._release()
+        out = bytes(self.buf[:n])
+        del self.buf[:n]
+        return out
+
+    def write(self, data):
+        self.written += data
+        return len(data)
+
+    def reset_input_buffer(self):
+        self._release()
+        self.buf.clear()
+
+
+class ReplayEncoders(Encoders):
+    """The last recorded counts at or before clock time (0, 0 before the first)."""
+
+    def __init__(self, clock, records):
+        self.clock = clock
+        self.t = records["t"]
+        self.left = records["left"].tolist()
+        self.right = records["right"].tolist()
+
+    def counts(self):
+        i = int(np.searchsorted(self.t, self.clock.t, side="right")) - 1
+        if i < 0:
+            return 0, 0
+        return self.left[i], self.right[i]
+
+
+class ReplayGamepad(Gamepad):
+    """Event-style gamepad that plays back one recorded tick at a time.
+
+    A tick counts as connected if a controller record was taken during it.
+    Each tick yields the recorded button presses first, then whatever brings
+    the held buttons and axes to the recorded snapshot, so ControllerInput
+    hands the loop the same state and the same edges as on the car.
+    """
+
+    def __init__(self, clock, controller, tick_t):
+        self.clock = clock
+        self.tick_t = tick_t
+        idx = np.searchsorted(controller["t"], tick_t, side="right") - 1
+        prev = np.concatenate(([-np.inf], tick_t[:-1]))
+        ok = idx >= 0
+        ok[ok] = controller["t"][idx[ok]] > prev[ok]
+        self.idx = idx
+        self.ok = ok
+        self.axes_rec = controller["axes"]
+        self.buttons_rec = controller["buttons"]
+        self.pressed_rec = controller["pressed"]
+
+        self.k = -1
+        self.plugged = True
+        self.mask = 0
+
+    def wait_events(self, timeout):
+        k = int(np.searchsorted(self.tick_t, self.clock.t, side="right")) - 1
+        if k == self.k:
+            return []
+        self.k = k
+        out = []
+        if k < 0:
+            return out
+        if not self.ok[k]:
+            if self.plugged:
+                self.plugged = False
+                out.append(("removed", 0, 0))
+            return out
+        if not self.plugged:
+            self.plugged = True
+            self.mask = 0
+            out.append(("added", 0, 0))
+
+        i = self.idx[k]
+        pressed = int(self.pressed_rec[i])
+        mask = self.mask
+        for b in range(NUM_BUTTONS):
+            if pressed >> b & 1:
+                if mask >> b & 1:
+                    out.append(("button", b, 0))    # released and pressed again within the tick
+                out.append(("button", b, 1))
+                mask |= 1 << b
+        held = int(self.buttons_rec[i])
+        for b in range(NUM_BUTTONS):
+            if (mask ^ held) >> b & 1:
+                out.append(("button", b, held >> b & 1))
+        self.mask = held
+        for a, v in enumerate(self.axes_rec[i].tolist()):
+            out.append(("axis", a, v))
+        return out
+
+    def connected(self):
+        return self.plugged
+
+    def reconnect(self):
+        return True
+
+    def get_name(self):
+        return "Replayed controller"
+
+
+class ReplayRng:
+    """Stands in for `random` in ControlLoop: recorded AUTO turns first.
+
+    Each REV -> TURN transition in the state stream gives the turn direction
+    that was drawn and a turn duration ending between the last TURN tick and
+    the first tick after it. Once those run out (or settings changed the
+    number of turns) draws fall back to a seeded Random.
+    """
+
+    def __init__(self, state, seed=0):
+        self.dirs = []
+        self.durations = []
+        self.fallback = random.Random(seed)
+
+        st = state["auto_state"]       # the current drive mode's state: AUTO's only in AUTO
+        t = state["t"]
+        auto = state["mode"][1:] == car.MODE_AUTO
+        starts = np.flatnonzero(auto & (st[1:] == car.AUTO_STATE_TURN) & (st[:-1] == car.AUTO_STATE_REV)) + 1
+        for k in starts.tolist():
+            turn_dir = int(state["turn_dir"][k])
+            if turn_dir == 0:       # not recorded
+                continue
+            rest = np.flatnonzero(st[k:] != car.AUTO_STATE_TURN)
+            if not rest.size:
+                continue
+            j = k + int(rest[0])
+            self.dirs.append(turn_dir)
+            self.durations.append(0.5 * (t[j - 1] + t[j]) - t[k])
+        self.dirs.reverse()
+        self.durations.reverse()
+
+    def choice(self, seq):
+        if self.dirs and self.dirs[-1] in seq:
+            return self.dirs.pop()
+        return self.fallback.choice(seq)
+
+    def uniform(self, a, b):
+        if self.durations:
+            return max(a, min(b, self.durations.pop()))
+        return self.fallback.uniform(a, b)
+
+
+class TraceRecorder:
+    """Just enough of TelemetryRecorder to capture motor updates."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.dir = "(replay)"
+        self.motors = []
+        self.written = {"motor": 0}
+        self.dropped = {}
+
+    def start(self, writer=True):
+        return self
+
+    def close(self):
+        self.written["motor"] = len(self.motors)
+
+    def now(self):
+        return self.clock.monotonic()
+
+    def lidar(self, t, dist, strength, temp):
+        pass
+
+    def controller(self, t, axes, buttons, pressed=0):
+        pass
+
+    def state(self, t, mode, armed, auto_state, turn_dir, stop_cm, dist):
+        pass
+
+    def motor(self, t, ena, duty, speed):
+        self.motors.append((t, ena, duty, speed))
+
+    def watchdog(self, t, fed, reaction):
+        pass
+
+    def wheels(self, t, left, right):
+        pass
+
+    def config(self, t, source, values):
+        pass
+
+
+# -----------------------------
+# Traces
+# -----------------------------
+def motor_trace(motor, tick_t, pins):
+    """Per-tick (t, left, right): last speed sent to each of pins = (ENA, ENB) during each tick."""
+    trace = np.zeros(len(tick_t), dtype=TRACE)
+    trace["t"] = tick_t
+    bounds = np.append(tick_t[1:], np.inf)
+    for field, ena in zip(("left", "right"), pins):
+        rec = motor[motor["ena"] == ena]
+        i = np.searchsorted(rec["t"], bounds, side="left") - 1
+        have = i >= 0
+        trace[field][have] = rec["speed"][i[have]]
+    return trace
+
+
+def diff_traces(a, b):
+    """Mismatch summary between two per-tick traces of the same session."""
+    dl = np.abs(a["left"].astype(np.int32) - b["left"])
+    dr = np.abs(a["right"].astype(np.int32) - b["right"])
+    bad = np.flatnonzero((dl != 0) | (dr != 0))
+    return {
+        "ticks": len(a),
+        "mismatched": int(bad.size),
+        "first_mismatch_t": float(a["t"][bad[0]] - a["t"][0]) if bad.size else None,
+        "max_diff": int(max(dl.max(initial=0), dr.max(initial=0))),
+    }
+
+
+# -----------------------------
+# Replay
+# -----------------------------
+def apply_overrides(overrides):
+    """Set module-level settings of the control script; returns the old values."""
+    old = {}
+    for name, value in (overrides or {}).items():
+        if name not in car.SETTINGS:
+            raise ValueError(f"unknown setting: {name}")
+        old[name] = getattr(car, name)
+        setattr(car, name, value)
+    return old
+
+
+@contextmanager
+def settings(overrides):
+    """Run the control script with overrides, restoring everything afterwards.
+
+    Also covers what the loop publishes (cfg) or builds from settings at
+    import time (lidar_history), so runs in one process don't leak into each
+    other.
+    """
+    saved = apply_overrides(overrides)
+    saved_cfg = car.cfg
+    saved_history = car.lidar_history
+    car.lidar_history = LidarHistory(window=car.LIDAR_FILTER_WINDOW, ema_tau_sec=car.LIDAR_EMA_TAU_SEC)
+    try:
+        yield
+    finally:
+        car.lidar_history = saved_history
+        car.cfg = saved_cfg
+        apply_overrides(saved)
+
+
+class ReplayResult:
+    def __init__(self, session, trace, recorded, summary, state=None):
+        self.session = session
+        self.trace = trace          # per-tick replayed motor commands (TRACE dtype)
+        self.recorded = recorded    # same, from the recorded motor stream
+        self.summary = summary
+        self.state = state          # the recorded per-tick state records
+
+
+def recorded_settings(config_log):
+    """(settings at start, [(t, {name: value}) of config-file edits]) from a config log."""
+    started = {}
+    edits = []
+    for entry in config_log:
+        values = {name: v for name, v in entry["values"].items() if name in car.SETTINGS}
+        if entry["source"] == "start":
+            started = values
+        elif entry["source"] == "file":
+            edits.append((entry["t"], values))
+    return started, edits
+
+
+def session_pins(started):
+    """(ENA, ENB) a session's motor records are keyed by, from its recorded start settings."""
+    return started.get("ENA", car.ENA), started.get("ENB", car.ENB)
+
+
+def replay_session(session_dir, overrides=None, seed=0, log=None):
+    """Run one session through ControlLoop; returns a ReplayResult."""
+    data = load_session(session_dir)
+    tick_t = np.asarray(data["state"]["t"], dtype=np.float64)
+    if not len(tick_t):
+        raise ValueError(f"{session_dir}: no state records")
+    lidar_rec = data["lidar"]
+    lidar_t = np.unique(np.asarray(lidar_rec["t"]))
+    trips = np.asarray(data["watchdog"]["t"], dtype=np.float64).tolist()
+
+    # Recorded settings, under the overrides
+    overrides = overrides or {}
+    started, edits = recorded_settings(load_config_log(session_dir))
+    recorded_pins = session_pins(started)
+    table = os.path.join(session_dir, "speed_table.json")
+    if os.path.exists(table):
+        started["SPEED_CAL_FILE"] = table
+    started = {name: value for name, value in started.items() if name not in overrides}
+    edits = [(t, {name: v for name, v in values.items() if name not in overrides}) for t, values in edits]
+    edits = [(t, values) for t, values in edits if values]
+
+    with settings(dict(started, **overrides)):
+        clock = ReplayClock(tick_t[0] - 1.0)
+        hw = Hardware(
+            clock=clock,
+            motors=NullMotors(),
+            open_lidar=lambda: ReplayLidar(clock, lidar_rec),
+            gamepad=ReplayGamepad(clock, data["controller"], tick_t),
+            realtime=False,
+            encoders=ReplayEncoders(clock, data["wheels"]),
+        )
+        rec = TraceRecorder(clock)
+        loop = car.ControlLoop(hw, log=log or (lambda msg: None), rng=ReplayRng(data["state"], seed), telemetry=rec)
+
+        pins = (car.ENA, car.ENB)
+        t0 = time.perf_counter()
+        try:
+            loop.start()
+            ser, parser = loop.lidar_ser, loop.lidar_parser
+            li = int(np.searchsorted(lidar_t, clock.t, side="right"))
+            ei = 0
+            wi = 0
+            for t in tick_t.tolist():
+                # LiDAR reads exactly where the recorded ones happened...
+                while li < len(lidar_t) and lidar_t[li] <= t:
+                    clock.t = float(lidar_t[li])
+                    car.lidar_poll(ser, parser, clock)
+                    li += 1
+                # ...config-file edits for the tick that applied them...
+                while ei < len(edits) and edits[ei][0] <= t:
+                    loop.config.push(edits[ei][1])
+                    ei += 1
+                # ...watchdog trips during the stall before it...
+                while wi < len(trips) and trips[wi] <= t:
+                    loop.watchdog.trip(trips[wi])
+                    wi += 1
+                # ...then the tick itself
+                clock.t = t
+                loop.tick()
+        finally:
+            loop.shutdown()
+    sec = time.perf_counter() - t0
+
+    motors = np.array(rec.motors, dtype=[("t", "<f8"), ("ena", "u1"), ("duty", "u1"), ("speed", "<i2")])
+    trace = motor_trace(motors, tick_t, pins)
+    recorded = motor_trace(data["motor"], tick_t, recorded_pins)
+    summary = diff_traces(trace, recorded)
+    summary["session"] = session_dir
+    summary["sec"] = sec
+    return ReplayResult(session_dir, trace, recorded, summary, data["state"])
+
+
+def _replay_summary(args):
+    session_dir, overrides, seed = args
+    return replay_session(session_dir, overrides, seed).summary
+
+
+def find_sessions(root):
+    """Session folders (containing session.json) at or below root."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if "session.json" in filenames:
+            found.append(dirpath)
+            dirnames[:] = []
+    return sorted(found)
+
+
+def replay_many(sessions, overrides=None, seed=0, workers=None):
+    """Replay many sessions in a process pool; returns their summaries in order."""
+    jobs = [(s, overrides, seed) for s in sessions]
+    if workers == 1 or len(jobs) <= 1:
+        return [_replay_summary(j) for j in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_replay_summary, jobs))
+
+
+def format_summary(s):
+    first = "-" if s["first_mismatch_t"] is None else f"{s['first_mismatch_t']:.2f}s"
+    rate = s["ticks"] / s["sec"] if s["sec"] > 0 else 0.0
+    return (f"{s['session']}: {s['ticks']} ticks, {s['mismatched']} mismatched "
+            f"(first {first}, max diff {s['max_diff']}), {s['sec']:.2f} s ({rate:.0f} ticks/s)")
+
+
+def _parse_override(text):
+    name, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {text!r}")
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass        # plain string, e.g. LIDAR_FILTER=ema
+    return name, value
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Replay telemetry sessions through the control loop.")
+    ap.add_argument("path", help="a session folder, or a folder of sessions")
+    ap.add_argument("--set", dest="overrides", action="append", type=_parse_override, default=[],
+                    metavar="NAME=VALUE", help="override a setting of the control script")
+    ap.add_argument("--workers", type=int, default=None, help="processes for batch replay")
+    ap.add_argument("--seed", type=int, default=0, help="seed for AUTO draws not in the recording")
+    ap.add_argument("--save", help="write the replayed per-tick motor trace here (.npy, single session)")
+    args = ap.parse_args(argv)
+
+    overrides = dict(args.overrides)
+    sessions = find_sessions(args.path)
+    if not sessions:
+        print(f"no sessions under {args.path}")
+        return 1
+    if overrides:
+        print("overrides: " + ", ".join(f"{k}={v!r}" for k, v in overrides.items()))
+
+    if len(sessions) == 1:
+        result = replay_session(sessions[0], overrides, args.seed)
+        print(format_summary(result.summary))
+        if args.save:
+            np.save(args.save, result.trace)
+            print(f"trace -> {args.save}")
+        return 0
+
+    if args.save:
+        print("--save only applies to a single session")
+    t0 = time.perf_counter()
+    summaries = replay_many(sessions, overrides, args.seed, args.workers)
+    for s in summaries:
+        print(format_summary(s))
+    ticks = sum(s["ticks"] for s in summaries)
+    sec = time.perf_counter() - t0
+    print(f"{len(summaries)} sessions, {ticks} ticks in {sec:.2f} s ({ticks / sec:.0f} ticks/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
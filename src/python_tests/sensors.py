@@ -0,0 +1,257 @@
+# sensors.py
+#
+# More than one range sensor: a registry of TF-Lunas around the car, one
+# reader loop for all of their ports, and their fusion into obstacle sectors
+# for the mode logic.
+#
+# The forward TF-Luna keeps its own path in the control script (lidar_poll,
+# LidarChannel `lidar`, filters, adaptive frame rate). Every other sensor is
+# a RangeSensor:
+#   reader    a TF-Luna byte stream (pyserial port, or sim.SimTFLuna) parsed
+#             by its own TFLunaParser
+#   mount     where it sits and where it looks, in the car frame: x_cm
+#             forward, y_cm left of the axle centre, yaw_deg CCW from
+#             straight ahead
+#   channel   a LidarChannel of its samples (lock-free, one writer)
+#   staleness a sample older than max_age_sec is stale; a stale sensor is
+#             either ignored (its sectors read as clear) or blocks them
+#             (they read 0 cm: nothing moves toward a blind side)
+#
+# SensorRegistry.serve() reads every port from one selector loop (epoll on
+# Linux) in one thread, instead of a thread per port: the forward TF-Luna is
+# attached to the same loop with its own callback. Ports without a file
+# descriptor (the simulator) are polled by the caller instead (poll()).
+#
+# SectorFusion bins readings by the bearing of the obstacle from the axle
+# centre into `sectors` equal sectors (sector 0 straight ahead, counting
+# CCW) and keeps the nearest reading per sector, in a preallocated array:
+#   ranges[i]   cm to the nearest obstacle in sector i, inf = nothing seen
+# The value is the sensor's own reading, i.e. the clearance from the body
+# where it's mounted - the same scale as STOP_DISTANCE_CM and AUTO_STOP_CM.
+# ahead() / behind() are the nearest range over the sectors within arc_deg
+# of straight ahead / behind.
+#
+# RANGE_SENSORS spec (parse_sensors()): "name=port@x,y,yaw" entries
+# separated by ";", e.g. "left=/dev/ttyAMA1@0,8,90; rear=/dev/ttyUSB0@-12,0,180"
+
+import math
+import selectors
+from collections import namedtuple
+
+import numpy as np
+
+from lidar_channel import LidarChannel
+from tfluna import TFLunaParser
+from tfluna_commands import FORMAT_CM, set_output, set_output_format
+
+Mount = namedtuple("Mount", "x_cm y_cm yaw_deg")
+
+STALE_POLICIES = ("ignore", "block")
+SERVE_TIMEOUT_SEC = 0.05    # selector wait; also how often ports without an fd are polled
+
+
+def parse_sensors(spec):
+    """[(name, port, Mount)] from a RANGE_SENSORS spec; ValueError if malformed."""
+    out = []
+    for entry in (spec or "").split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            name, rest = entry.split("=", 1)
+            port, pose = rest.rsplit("@", 1)
+            x, y, yaw = (float(v) for v in pose.split(","))
+        except ValueError:
+            raise ValueError(f"range sensor {entry!r}: expected name=port@x,y,yaw") from None
+        name = name.strip()
+        if not name or any(name == n for n, _, _ in out):
+            raise ValueError(f"range sensor {entry!r}: empty or repeated name")
+        out.append((name, port.strip(), Mount(x, y, yaw)))
+    return out
+
+
+# -----------------------------
+# Sensors
+# -----------------------------
+class RangeSensor:
+    """One TF-Luna besides the forward one: reader, mount, sample channel, staleness policy."""
+
+    def __init__(self, name, mount, open_port, max_age_sec=0.25, stale="ignore", min_strength=0):
+        if stale not in STALE_POLICIES:
+            raise ValueError(f"{name}: stale policy {stale!r} is not one of {STALE_POLICIES}")
+        self.name = name
+        self.mount = mount
+        self.open_port = open_port
+        self.max_age_sec = max_age_sec
+        self.stale = stale
+        self.min_strength = min_strength
+        self.channel = LidarChannel()
+        self.parser = TFLunaParser()
+        self.port = None
+
+    def open(self):
+        """Open the port and start continuous output in cm (not confirmed: the frames are)."""
+        self.channel.reset()
+        self.parser.reset()
+        self.port = self.open_port()
+        self.port.reset_input_buffer()
+        self.port.write(set_output_format(FORMAT_CM))
+        self.port.write(set_output(True))
+
+    def close(self):
+        if self.port is not None:
+            self.port.close()
+            self.port = None
+
+    def fileno(self):
+        """The port's file descriptor, or None (poll() it)."""
+        fileno = getattr(self.port, "fileno", None)
+        return fileno() if fileno is not None else None
+
+    def poll(self, now):
+        """Read and publish whatever the port has; never waits."""
+        port = self.port
+        if port is not None and port.in_waiting:
+            self.feed(now, self.parser.read_bytes(port))
+
+    def feed(self, now, data):
+        """Parse raw bytes and publish every good frame at now."""
+        parser = self.parser
+        channel = self.channel
+        bad = parser.bad
+        for d, s, temp in parser.feed(data):
+            if self.min_strength and s < self.min_strength:
+                channel.reject()
+            else:
+                channel.publish(d, s, temp, now)
+        if parser.bad != bad:
+            channel.reject(parser.bad - bad)
+        parser.responses.clear()        # nothing waits for them
+
+    def reading(self, now):
+        """cm if fresh; stale: None ("ignore") or 0.0 ("block")."""
+        s = self.channel.snapshot()
+        if s is not None and now - s.t <= self.max_age_sec:
+            return s.dist_cm
+        return 0.0 if self.stale == "block" else None
+
+
+class SensorRegistry:
+    """The range sensors of a car, read together."""
+
+    def __init__(self, sensors=()):
+        self.sensors = list(sensors)
+        self._attached = []     # (port, callback) of ports read elsewhere too (the forward TF-Luna)
+
+    def add(self, sensor):
+        self.sensors.append(sensor)
+        return sensor
+
+    def attach(self, port, callback):
+        """Have serve() also call callback() whenever port has data."""
+        self._attached.append((port, callback))
+
+    def open(self):
+        for s in self.sensors:
+            s.open()
+
+    def close(self):
+        for s in self.sensors:
+            s.close()
+        self._attached = []
+
+    def poll(self, now):
+        """Read every sensor once (inline servicing, or ports without a file descriptor)."""
+        for s in self.sensors:
+            s.poll(now)
+
+    def serve(self, clock, stopped, timeout=SERVE_TIMEOUT_SEC):
+        """Reader loop for every port until stopped() (one thread for all of them)."""
+        sel = selectors.DefaultSelector()
+        polled = []
+        for port, callback in self._attached:
+            fileno = getattr(port, "fileno", None)
+            if fileno is not None:
+                sel.register(fileno(), selectors.EVENT_READ, (port, callback))
+            else:
+                polled.append((port, callback))
+        for s in self.sensors:
+            fd = s.fileno()
+            if fd is not None:
+                sel.register(fd, selectors.EVENT_READ, s)
+            else:
+                polled.append((s.port, s))
+        try:
+            while not stopped():
+                events = sel.select(timeout) if sel.get_map() else None
+                now = clock.monotonic()
+                for key, _ in events or ():
+                    target = key.data
+                    if isinstance(target, RangeSensor):
+                        target.poll(now)
+                    elif target[0].in_waiting:
+                        target[1]()
+                for port, target in polled:
+                    if isinstance(target, RangeSensor):
+                        target.poll(now)
+                    elif port.in_waiting:
+                        target()
+                if events is None:
+                    clock.sleep(timeout if not polled else 0.002)
+        finally:
+            sel.close()
+
+    def fuse(self, now, fusion):
+        """Add every sensor's reading (or its stale policy) to fusion."""
+        for s in self.sensors:
+            d = s.reading(now)
+            if d is not None:
+                fusion.add(s.mount, d)
+
+
+# -----------------------------
+# Fusion
+# -----------------------------
+class SectorFusion:
+    def __init__(self, sectors=8, arc_deg=20.0):
+        self.n = sectors
+        self.width = 2.0 * math.pi / sectors
+        self.ranges = np.full(sectors, np.inf)
+        arc = math.radians(arc_deg)
+        half = self.width / 2.0
+
+        def within(i, centre):
+            off = abs(math.remainder(i * self.width - centre, 2.0 * math.pi))
+            return off < half + arc
+
+        self.front = [i for i in range(sectors) if within(i, 0.0)]
+        self.rear = [i for i in range(sectors) if within(i, math.pi)]
+        self._trig = {}         # mount -> (cos, sin) of its yaw
+
+    def clear(self):
+        self.ranges.fill(np.inf)
+
+    def sector(self, mount, dist):
+        """Sector of an obstacle dist cm along the mount's beam."""
+        cs = self._trig.get(mount)
+        if cs is None:
+            a = math.radians(mount.yaw_deg)
+            cs = self._trig[mount] = (math.cos(a), math.sin(a))
+        d = max(dist, 1.0)      # a sensor at the centre reading 0 still has a direction
+        bearing = math.atan2(mount.y_cm + d * cs[1], mount.x_cm + d * cs[0])
+        return round(bearing / self.width) % self.n
+
+    def add(self, mount, dist):
+        i = self.sector(mount, dist)
+        if dist < self.ranges[i]:
+            self.ranges[i] = dist
+
+    def nearest(self, sectors):
+        r = self.ranges
+        return float(min(r[i] for i in sectors))
+
+    def ahead(self):
+        return self.nearest(self.front)
+
+    def behind(self):
+        return self.nearest(self.rear)
@@ -0,0 +1,428 @@
+# session_archive.py
+#
+# Compact, indexed archive of a telemetry session (telemetry.py), one file:
+#
+#   python session_archive.py pack telemetry/session-20250101-120000
+#   python session_archive.py windows session-20250101-120000.rca --event estop --before 2
+#
+# A session folder keeps fixed-size records, uncompressed, as the recorder
+# wrote them: cheap to write on the car, big to keep. The archive stores each
+# stream in row groups of block_rows records, and each column of a group as
+# its own zlib block:
+#
+#   t, and the wheel encoder counts, are delta encoded (t on its raw IEEE
+#   bits, so decoding gives the recorded doubles back exactly)
+#   every column is byte shuffled before compression (all the low bytes,
+#   then all the next bytes, ...), which is what lets zlib at level 1 find
+#   the runs in slowly changing numbers
+#
+# At the end of the file are the index and a footer pointing at it:
+#
+#   groups   per row group: stream, first row, rows, t min / max, its first
+#            column block and which events happen in it
+#   chunks   per column block: file offset and length
+#   events   mode changes (state stream), E-stops (BTN_B) and arm toggles
+#            (BTN_A) from the controller's button presses: t, kind, value,
+#            stream and row
+#   meta     JSON: dtypes, settings, and the session's small files
+#            (session.json, config.jsonl, speed_table.json)
+#
+# Archive maps the file and reads only the index up front. A time range
+# decompresses only the groups that overlap it, and only the columns asked
+# for, so "the 2 s before every E-stop" reads a few blocks of a long session.
+# unpack() writes a session folder back that replay.py reads as recorded.
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+from telemetry import HEADER, MAGIC as SEGMENT_MAGIC, STREAMS, VERSION as SEGMENT_VERSION, load_config_log, \
+    load_session
+
+MAGIC = b"RCARC001"
+VERSION = 1
+FILE_HEADER = struct.Struct("<8sI4x")              # magic, version
+FOOTER = struct.Struct("<QI QI QI QI 8s")          # meta, groups, chunks, events (offset, count), magic
+
+BLOCK_ROWS = 1024       # records per row group (LiDAR: 4 to 50 s)
+LEVEL = 1               # zlib level: 1 is fast enough for the car, 6+ buys a few %
+
+ARM_BUTTON = 0          # BTN_A, unless the session's settings say otherwise
+ESTOP_BUTTON = 1        # BTN_B
+
+# Event kinds, as bits (a group's `events` is the OR of the kinds in it)
+EVENT_MODE = 1
+EVENT_ESTOP = 2
+EVENT_ARM = 4
+EVENTS = {"mode": EVENT_MODE, "estop": EVENT_ESTOP, "arm": EVENT_ARM}
+
+STREAM_IDS = {name: i for i, name in enumerate(STREAMS)}
+DELTA_COLUMNS = {("wheels", "left"), ("wheels", "right")} | {(name, "t") for name in STREAMS}
+SESSION_FILES = ("session.json", "config.jsonl", "speed_table.json")
+
+GROUP = np.dtype([("stream", "u1"), ("events", "u1"), ("rows", "<u4"), ("row0", "<u8"), ("t_min", "<f8"),
+                  ("t_max", "<f8"), ("chunk0", "<u4")])
+CHUNK = np.dtype([("offset", "<u8"), ("length", "<u4")])
+EVENT = np.dtype([("t", "<f8"), ("kind", "u1"), ("stream", "u1"), ("value", "<i4"), ("row", "<u8")])
+
+
+# -----------------------------
+# Column blocks
+# -----------------------------
+def _base(dtype):
+    """The scalar dtype of a column (axes is 6 x f4 per record)."""
+    return dtype.subdtype[0] if dtype.subdtype else dtype
+
+
+def encode_column(col, delta=False, level=LEVEL):
+    """One column (array) -> a compressed block."""
+    base = _base(col.dtype)
+    a = np.ascontiguousarray(col).view(base).reshape(-1)
+    if delta:
+        bits = a.view(f"<i{base.itemsize}")
+        a = np.diff(bits, prepend=bits.dtype.type(0))      # wraps, and cumsum wraps back
+    shuffled = a.view(np.uint8).reshape(-1, base.itemsize).T
+    return zlib.compress(shuffled.tobytes(), level)
+
+
+def decode_column(block, dtype, rows, delta=False):
+    """A block from encode_column -> rows values of dtype (a field's dtype)."""
+    base = _base(dtype)
+    raw = np.frombuffer(zlib.decompress(block), dtype=np.uint8)
+    a = raw.reshape(base.itemsize, -1).T.copy().view(base).reshape(-1)
+    if delta:
+        bits = a.view(f"<i{base.itemsize}")
+        a = np.cumsum(bits, dtype=bits.dtype).view(base)
+    return a.reshape((rows,) + dtype.shape)
+
+
+# -----------------------------
+# Writer
+# -----------------------------
+class ArchiveWriter:
+    """Streams' records in, row groups out; close() writes the index.
+
+    append() takes each stream's records in time order, in any number of
+    calls; groups are written as soon as block_rows records are buffered.
+    """
+
+    def __init__(self, path, block_rows=BLOCK_ROWS, level=LEVEL, arm_button=ARM_BUTTON,
+                 estop_button=ESTOP_BUTTON):
+        self.path = path
+        self.block_rows = block_rows
+        self.level = level
+        self.arm_bit = 1 << arm_button
+        self.estop_bit = 1 << estop_button
+        self.f = open(path, "wb")
+        self.f.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self.offset = FILE_HEADER.size
+
+        self.groups = []
+        self.chunks = []
+        self.events = []
+        self.rows = {name: 0 for name in STREAMS}
+        self.raw_bytes = 0
+        self._buf = {name: [] for name in STREAMS}
+        self._buffered = {name: 0 for name in STREAMS}
+        self._group_events = {name: {} for name in STREAMS}    # group number -> event bits
+        self._mode = None
+
+    def append(self, stream, rows):
+        """Records of one stream (a STREAMS[stream] array), after the ones already appended."""
+        rows = np.asarray(rows, dtype=STREAMS[stream])
+        if not len(rows):
+            return
+        self._find_events(stream, rows)
+        self._buf[stream].append(rows)
+        self._buffered[stream] += len(rows)
+        self.rows[stream] += len(rows)
+        self.raw_bytes += rows.nbytes
+        if self._buffered[stream] >= self.block_rows:
+            self._flush(stream, final=False)
+
+    def close(self, meta=None):
+        """Write the rest, the index and the footer. meta: extra JSON-able metadata."""
+        for name in STREAMS:
+            self._flush(name, final=True)
+        self.events.sort(key=lambda e: e[0])
+        head = {
+            "version": VERSION,
+            "block_rows": self.block_rows,
+            "level": self.level,
+            "streams": {name: str(dtype.descr) for name, dtype in STREAMS.items()},
+            "rows": self.rows,
+        }
+        head.update(meta or {})
+        parts = [json.dumps(head).encode(), np.array(self.groups, dtype=GROUP).tobytes(),
+                 np.array(self.chunks, dtype=CHUNK).tobytes(), np.array(self.events, dtype=EVENT).tobytes()]
+        counts = (len(parts[0]), len(self.groups), len(self.chunks), len(self.events))
+        footer = []
+        for part, count in zip(parts, counts):
+            footer += [self.offset, count]
+            self.f.write(part)
+            self.offset += len(part)
+        self.f.write(FOOTER.pack(*footer, MAGIC))
+        self.f.close()
+        self.offset += FOOTER.size
+        return self.offset
+
+    def _find_events(self, stream, rows):
+        row0 = self.rows[stream]
+        sid = STREAM_IDS[stream]
+        found = []
+        if stream == "state":
+            mode = rows["mode"]
+            prev = np.empty_like(mode)
+            prev[1:] = mode[:-1]
+            prev[0] = mode[0] if self._mode is None else self._mode
+            self._mode = mode[-1]
+            for i in np.flatnonzero(mode != prev):
+                found.append((rows["t"][i], EVENT_MODE, sid, int(mode[i]), row0 + i))
+        elif stream == "controller":
+            pressed = rows["pressed"]
+            for i in np.flatnonzero(pressed & (self.estop_bit | self.arm_bit)):
+                if pressed[i] & self.estop_bit:
+                    found.append((rows["t"][i], EVENT_ESTOP, sid, 0, row0 + i))
+                if pressed[i] & self.arm_bit:
+                    found.append((rows["t"][i], EVENT_ARM, sid, 0, row0 + i))
+        marks = self._group_events[stream]
+        for e in found:
+            g = e[4] // self.block_rows
+            marks[g] = marks.get(g, 0) | e[1]
+        self.events += found
+
+    def _flush(self, stream, final):
+        if not self._buffered[stream]:
+            return
+        rows = np.concatenate(self._buf[stream]) if len(self._buf[stream]) > 1 else self._buf[stream][0]
+        n = len(rows)
+        row0 = self.rows[stream] - n
+        stop = n if final else n - n % self.block_rows
+        for start in range(0, stop, self.block_rows):
+            self._write_group(stream, row0 + start, rows[start:start + self.block_rows])
+        rest = rows[stop:]
+        self._buf[stream] = [rest] if len(rest) else []
+        self._buffered[stream] = len(rest)
+
+    def _write_group(self, stream, row0, rows):
+        t = rows["t"]
+        events = self._group_events[stream].pop(row0 // self.block_rows, 0)
+        self.groups.append((STREAM_IDS[stream], events, len(rows), row0, t.min(), t.max(), len(self.chunks)))
+        for field in STREAMS[stream].names:
+            block = encode_column(rows[field], (stream, field) in DELTA_COLUMNS, self.level)
+            self.f.write(block)
+            self.chunks.append((self.offset, len(block)))
+            self.offset += len(block)
+
+
+# -----------------------------
+# Reader
+# -----------------------------
+class Archive:
+    """A memory-mapped archive; read() / windows() decompress only what they need."""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "rb")
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = FILE_HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a session archive")
+        if version != VERSION:
+            raise ValueError(f"{path}: archive version {version}, this reader handles {VERSION}")
+        *index, tail = FOOTER.unpack_from(self.mm, len(self.mm) - FOOTER.size)
+        if tail != MAGIC:
+            raise ValueError(f"{path}: truncated archive (no footer)")
+        meta_off, meta_len, groups_off, n_groups, chunks_off, n_chunks, events_off, n_events = index
+        self.meta = json.loads(self.mm[meta_off:meta_off + meta_len])
+        self.groups = np.frombuffer(self.mm, GROUP, n_groups, groups_off).copy()
+        self.chunks = np.frombuffer(self.mm, CHUNK, n_chunks, chunks_off).copy()
+        self.events = np.frombuffer(self.mm, EVENT, n_events, events_off).copy()
+        self.rows = self.meta["rows"]
+
+        self.blocks_read = 0        # column blocks decompressed so far
+        self.bytes_read = 0         # compressed bytes of those
+        self._cache = None
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def files(self):
+        """{name: text} of the session's small files (session.json, config.jsonl, ...)."""
+        return self.meta.get("files", {})
+
+    def config_log(self):
+        """The session's settings changes, as telemetry.load_config_log gives them."""
+        text = self.files().get("config.jsonl", "")
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    def event_times(self, kind):
+        """Times of every event of a kind ("mode", "estop", "arm")."""
+        return self.events["t"][self.events["kind"] == EVENTS[kind]]
+
+    def read(self, stream, t0=-np.inf, t1=np.inf, columns=None):
+        """Records of a stream with t0 <= t < t1; columns: the fields to decode (default all)."""
+        dtype = self._dtype(stream, columns)
+        g = self.groups
+        hit = np.flatnonzero((g["stream"] == STREAM_IDS[stream]) & (g["t_max"] >= t0) & (g["t_min"] < t1))
+        parts = []
+        for gi in hit:
+            rows = self._group(stream, gi, dtype)
+            t = rows["t"]
+            if t0 <= g["t_min"][gi] and g["t_max"][gi] < t1:
+                parts.append(rows)
+            else:
+                parts.append(rows[(t >= t0) & (t < t1)])
+        if not parts:
+            return np.zeros(0, dtype=dtype)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def windows(self, stream, kind, before, after=0.0, columns=None):
+        """[(event t, records of stream from t - before to t + after)] for every event of a kind.
+
+        A group that several windows overlap is decompressed once.
+        """
+        self._cache = {}
+        try:
+            return [(t, self.read(stream, t - before, t + after, columns)) for t in self.event_times(kind)]
+        finally:
+            self._cache = None
+
+    def load(self):
+        """{stream: records} of the whole session, like telemetry.load_session."""
+        return {name: self.read(name) for name in STREAMS}
+
+    def _dtype(self, stream, columns):
+        full = STREAMS[stream]
+        if columns is None:
+            return full
+        names = ["t"] + [c for c in columns if c != "t"]
+        return np.dtype([(n, full.fields[n][0]) for n in names])
+
+    def _group(self, stream, gi, dtype):
+        key = (gi, dtype)
+        if self._cache is not None and key in self._cache:
+            return self._cache[key]
+        n = int(self.groups["rows"][gi])
+        chunk0 = int(self.groups["chunk0"][gi])
+        names = STREAMS[stream].names
+        out = np.empty(n, dtype=dtype)
+        for field in dtype.names:
+            off, length = (int(v) for v in self.chunks[chunk0 + names.index(field)])
+            block = self.mm[off:off + length]
+            out[field] = decode_column(block, dtype.fields[field][0], n, (stream, field) in DELTA_COLUMNS)
+            self.blocks_read += 1
+            self.bytes_read += length
+        if self._cache is not None:
+            self._cache[key] = out
+        return out
+
+
+# -----------------------------
+# Sessions <-> archives
+# -----------------------------
+def pack_session(session_dir, path, block_rows=BLOCK_ROWS, level=LEVEL):
+    """Archive a session folder; returns the ArchiveWriter (rows, raw_bytes) and the file size."""
+    buttons = {}
+    for entry in load_config_log(session_dir):
+        if entry["source"] == "start":
+            buttons = entry["values"]
+    w = ArchiveWriter(path, block_rows, level, buttons.get("BTN_A", ARM_BUTTON), buttons.get("BTN_B", ESTOP_BUTTON))
+    for name, records in load_session(session_dir).items():
+        w.append(name, records)
+    files = {}
+    for fname in SESSION_FILES:
+        p = os.path.join(session_dir, fname)
+        if os.path.exists(p):
+            with open(p) as f:
+                files[fname] = f.read()
+    size = w.close({"files": files})
+    return w, size
+
+
+def unpack(path, session_dir):
+    """Write an archive back as a session folder (one segment per stream)."""
+    os.makedirs(session_dir, exist_ok=True)
+    with Archive(path) as arc:
+        for name, records in arc.load().items():
+            if not len(records):
+                continue
+            with open(os.path.join(session_dir, f"{name}.0000.bin"), "wb") as f:
+                f.write(HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, records.dtype.itemsize, len(records),
+                                    name.encode()))
+                f.write(records.tobytes())
+        for fname, text in arc.files().items():
+            with open(os.path.join(session_dir, fname), "w") as f:
+                f.write(text)
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def _info(arc):
+    size = len(arc.mm)
+    raw = sum(STREAMS[name].itemsize * n for name, n in arc.rows.items())
+    print(f"{arc.path}: {size / 1e6:.2f} MB, {raw / max(size, 1):.1f}x smaller than the records, "
+          f"{len(arc.groups)} row groups of up to {arc.meta['block_rows']}")
+    for name, n in arc.rows.items():
+        mine = arc.groups["stream"] == STREAM_IDS[name]
+        packed = sum(int(arc.chunks["length"][c:c + len(STREAMS[name])].sum())
+                     for c in arc.groups["chunk0"][mine])
+        print(f"  {name:10s} {n:8d} records  {STREAMS[name].itemsize * n / 1e6:7.2f} MB -> {packed / 1e6:6.2f} MB")
+    for kind, bit in EVENTS.items():
+        print(f"  {kind:6s} events: {np.count_nonzero(arc.events['kind'] == bit)}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Pack telemetry sessions into indexed archives and query them")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("pack", help="archive a session folder")
+    p.add_argument("session")
+    p.add_argument("out", nargs="?", help="archive file (default: <session>.rca)")
+    p.add_argument("--block-rows", type=int, default=BLOCK_ROWS)
+    p.add_argument("--level", type=int, default=LEVEL, help="zlib level")
+    p = sub.add_parser("unpack", help="write an archive back as a session folder")
+    p.add_argument("archive")
+    p.add_argument("session")
+    p = sub.add_parser("info", help="sizes and events")
+    p.add_argument("archive")
+    p = sub.add_parser("windows", help="records around every event of a kind")
+    p.add_argument("archive")
+    p.add_argument("--event", choices=sorted(EVENTS), default="estop")
+    p.add_argument("--stream", choices=list(STREAMS), default="lidar")
+    p.add_argument("--before", type=float, default=2.0, help="seconds before each event")
+    p.add_argument("--after", type=float, default=0.0, help="seconds after each event")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "pack":
+        out = args.out or os.path.normpath(args.session) + ".rca"
+        w, size = pack_session(args.session, out, args.block_rows, args.level)
+        print(f"{out}: {sum(w.rows.values())} records, {w.raw_bytes / 1e6:.2f} MB -> {size / 1e6:.2f} MB, "
+              f"{len(w.events)} events")
+    elif args.cmd == "unpack":
+        unpack(args.archive, args.session)
+    elif args.cmd == "info":
+        with Archive(args.archive) as arc:
+            _info(arc)
+    else:
+        with Archive(args.archive) as arc:
+            for t, rows in arc.windows(args.stream, args.event, args.before, args.after):
+                print(f"{args.event} at {t:10.3f} s: {len(rows)} {args.stream} records")
+            print(f"{arc.blocks_read} of {len(arc.chunks)} blocks read ({arc.bytes_read / 1e3:.1f} kB)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
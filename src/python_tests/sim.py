@@ -0,0 +1,502 @@
+# sim.py
+#
+# Pure-software simulator backend for the RC car (see hal.py).
+#
+# - SimClock:      virtual time, sleep() advances the world instead of waiting
+#                  (and checks the motor watchdog every physics step)
+# - World:         2D room made of wall segments + a differential-drive robot
+# - SimMotors:     decodes the SN754410 pins (IN1..IN4, ENA/ENB duty) into wheel commands
+# - SimTFLuna:     ray-casts the forward range (or any mount's, add_range_sensor())
+#                  and streams real TF-Luna frames, answering commands (frame
+#                  rate, format, ...) via tfluna_emulator
+# - ScriptedGamepad: timed button/axis/connect events
+# - SimEncoders:   quadrature counts from the simulated wheel speeds
+# - Coverage:      floor swept by the robot (for AUTO / sweep metrics)
+#
+# Everything is deterministic for a given seed and runs much faster than real
+# time, so the MANUAL/GUARD/AUTO logic can be exercised for millions of ticks:
+#
+#   import rc_car_modes_bluetooth_fix_good as car
+#   sim = Simulator(World.room(400, 300), car_pins(car), script=[...])
+#   loop = car.ControlLoop(sim.hardware(), log=lambda msg: None)
+#   sim.run(loop, seconds=600)     # == loop.run(seconds=600) on the virtual clock
+
+import math
+import random
+
+import numpy as np
+
+from hal import Clock, Encoders, Gamepad, Hardware, LidarPort, MotorPins
+from tfluna_emulator import TFLunaEmulator
+
+# Robot model defaults (roughly the current chassis)
+ROBOT_RADIUS_CM = 12.0
+TRACK_WIDTH_CM = 16.0
+MAX_WHEEL_SPEED_CM_S = 90.0     # at duty 255
+DEADBAND_DUTY = 40              # static friction: below this the wheels don't turn
+WHEEL_TAU_SEC = 0.08            # first-order motor/wheel lag
+SENSOR_OFFSET_CM = 10.0         # TF-Luna sits this far ahead of the centre
+LIDAR_MAX_RANGE_CM = 800
+ENCODER_COUNTS_PER_CM = 20.0    # must match the control script's ENCODER_COUNTS_PER_CM
+
+
+class SimClock(Clock):
+    def __init__(self, sim, start=1000.0):
+        self.sim = sim
+        self.t = start
+        self.watchdog = None
+
+    def time(self):
+        return self.t
+
+    def monotonic(self):
+        return self.t
+
+    def monotonic_ns(self):
+        return int(self.t * 1e9)
+
+    def sleep(self, sec):
+        if sec > 0:
+            self.sim.advance(sec)
+
+    def watch(self, watchdog):
+        self.watchdog = watchdog
+
+
+# -----------------------------
+# World
+# -----------------------------
+class World:
+    """Wall segments (cm) plus the robot pose. heading is radians, CCW from +x."""
+
+    def __init__(self, segments, start=(50.0, 50.0, 0.0),
+                 radius_cm=ROBOT_RADIUS_CM, track_cm=TRACK_WIDTH_CM,
+                 max_speed_cm_s=MAX_WHEEL_SPEED_CM_S, deadband_duty=DEADBAND_DUTY,
+                 wheel_tau_sec=WHEEL_TAU_SEC, sensor_offset_cm=SENSOR_OFFSET_CM):
+        self.segments = [tuple(float(v) for v in seg) for seg in segments]
+        self.x, self.y, self.heading = start
+        self.radius = radius_cm
+        self.track = track_cm
+        self.max_speed = max_speed_cm_s
+        self.deadband = deadband_duty
+        self.tau = wheel_tau_sec
+        self.sensor_offset = sensor_offset_cm
+
+        self.v_left = 0.0       # actual wheel speeds, cm/s
+        self.v_right = 0.0
+        self.in_contact = False
+        self.collisions = 0
+        self.odometer_cm = 0.0
+
+    @classmethod
+    def room(cls, width_cm, height_cm, boxes=(), start=None, **kw):
+        """Rectangular room with axis-aligned box obstacles (x, y, w, h)."""
+        segs = _box_segments(0, 0, width_cm, height_cm)
+        for bx, by, bw, bh in boxes:
+            segs += _box_segments(bx, by, bw, bh)
+        if start is None:
+            start = (width_cm / 2.0, height_cm / 2.0, 0.0)
+        return cls(segs, start=start, **kw)
+
+    def duty_to_speed(self, duty):
+        """Signed duty (-255..255, + = physically forward) -> steady wheel speed."""
+        mag = abs(duty)
+        if mag <= self.deadband:
+            return 0.0
+        v = (mag - self.deadband) / (255.0 - self.deadband) * self.max_speed
+        return v if duty > 0 else -v
+
+    def step(self, dt, left_duty, right_duty):
+        a = min(1.0, dt / self.tau) if self.tau > 0 else 1.0
+        self.v_left += (self.duty_to_speed(left_duty) - self.v_left) * a
+        self.v_right += (self.duty_to_speed(right_duty) - self.v_right) * a
+
+        v = 0.5 * (self.v_left + self.v_right)
+        w = (self.v_right - self.v_left) / self.track
+        heading = self.heading + w * dt
+        nx = self.x + v * math.cos(heading) * dt
+        ny = self.y + v * math.sin(heading) * dt
+        self.heading = math.atan2(math.sin(heading), math.cos(heading))
+
+        if self._hits_wall(nx, ny):
+            # Blocked: stay put, wheels stall
+            self.v_left = 0.0
+            self.v_right = 0.0
+            if not self.in_contact:
+                self.collisions += 1
+            self.in_contact = True
+        else:
+            self.odometer_cm += abs(v) * dt
+            self.x = nx
+            self.y = ny
+            self.in_contact = False
+
+    def clearance(self):
+        """Gap (cm) between the robot's body and the nearest wall (0 = touching)."""
+        d2 = min(_point_segment_dist2(self.x, self.y, *seg) for seg in self.segments)
+        return max(0.0, math.sqrt(d2) - self.radius)
+
+    def place_randomly(self, rng, boxes=(), margin_cm=30.0):
+        """Random free pose in a room() world (not inside a box, not touching a wall)."""
+        xs = [v for seg in self.segments for v in (seg[0], seg[2])]
+        ys = [v for seg in self.segments for v in (seg[1], seg[3])]
+        while True:
+            x = rng.uniform(min(xs) + margin_cm, max(xs) - margin_cm)
+            y = rng.uniform(min(ys) + margin_cm, max(ys) - margin_cm)
+            inside = any(bx <= x <= bx + bw and by <= y <= by + bh for bx, by, bw, bh in boxes)
+            if not inside and not self._hits_wall(x, y):
+                break
+        self.x, self.y, self.heading = x, y, rng.uniform(-math.pi, math.pi)
+
+    def _hits_wall(self, x, y):
+        r2 = self.radius * self.radius
+        for x1, y1, x2, y2 in self.segments:
+            if _point_segment_dist2(x, y, x1, y1, x2, y2) < r2:
+                return True
+        return False
+
+    def raycast(self, x, y, heading, max_range=LIDAR_MAX_RANGE_CM):
+        dx = math.cos(heading)
+        dy = math.sin(heading)
+        best = max_range
+        for x1, y1, x2, y2 in self.segments:
+            ex = x2 - x1
+            ey = y2 - y1
+            den = dx * ey - dy * ex
+            if den == 0.0:
+                continue
+            qx = x1 - x
+            qy = y1 - y
+            t = (qx * ey - qy * ex) / den
+            if t < 0.0 or t >= best:
+                continue
+            u = (qx * dy - qy * dx) / den
+            if 0.0 <= u <= 1.0:
+                best = t
+        return best
+
+    def range_ahead(self):
+        """Distance (cm) the forward TF-Luna would see right now."""
+        c = math.cos(self.heading)
+        s = math.sin(self.heading)
+        return self.raycast(self.x + c * self.sensor_offset,
+                            self.y + s * self.sensor_offset, self.heading)
+
+    def range_from(self, mount):
+        """Distance (cm) a sensor at mount (sensors.Mount, car frame) would see right now."""
+        c = math.cos(self.heading)
+        s = math.sin(self.heading)
+        x = self.x + c * mount.x_cm - s * mount.y_cm
+        y = self.y + s * mount.x_cm + c * mount.y_cm
+        return self.raycast(x, y, self.heading + math.radians(mount.yaw_deg))
+
+
+def _box_segments(x, y, w, h):
+    return [(x, y, x + w, y), (x + w, y, x + w, y + h),
+            (x + w, y + h, x, y + h), (x, y + h, x, y)]
+
+
+def _point_segment_dist2(px, py, x1, y1, x2, y2):
+    ex = x2 - x1
+    ey = y2 - y1
+    l2 = ex * ex + ey * ey
+    t = 0.0 if l2 == 0 else ((px - x1) * ex + (py - y1) * ey) / l2
+    t = max(0.0, min(1.0, t))
+    dx = x1 + t * ex - px
+    dy = y1 + t * ey - py
+    return dx * dx + dy * dy
+
+
+class Coverage:
+    """Floor swept by the robot's body: cell_cm squares of a width x height room."""
+
+    def __init__(self, width_cm, height_cm, radius_cm, cell_cm=5.0):
+        self.cell = cell_cm
+        self.seen = np.zeros((int(height_cm / cell_cm) + 1, int(width_cm / cell_cm) + 1), dtype=bool)
+        r = int(math.ceil(radius_cm / cell_cm))
+        dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+        keep = (dx * dx + dy * dy) * cell_cm * cell_cm <= radius_cm * radius_cm
+        self.dx = dx[keep]
+        self.dy = dy[keep]
+
+    def mark(self, x, y):
+        cx = np.clip(int(x / self.cell) + self.dx, 0, self.seen.shape[1] - 1)
+        cy = np.clip(int(y / self.cell) + self.dy, 0, self.seen.shape[0] - 1)
+        self.seen[cy, cx] = True
+
+    def m2(self):
+        return np.count_nonzero(self.seen) * self.cell * self.cell / 1e4
+
+    def free_m2(self, boxes=()):
+        """Floor area not covered by boxes (what could be swept at most)."""
+        free = np.ones_like(self.seen)
+        c = self.cell
+        for bx, by, bw, bh in boxes:
+            free[int(by / c):int((by + bh) / c), int(bx / c):int((bx + bw) / c)] = False
+        return np.count_nonzero(free) * c * c / 1e4
+
+
+# -----------------------------
+# Devices
+# -----------------------------
+class SimMotors(MotorPins):
+    """Remembers pin levels / duty and turns them into signed wheel duty."""
+
+    def __init__(self, left_pins, right_pins, forward_is_negative=True):
+        self.left_pins = left_pins      # (ena, in1, in2)
+        self.right_pins = right_pins
+        # FORWARD_IS_NEGATIVE: a negative speed (IN2 high) moves the car forward
+        self.sign = -1 if forward_is_negative else 1
+        self.levels = {}
+        self.duty = {}
+        self.calls = 0
+
+    def set_output(self, pin):
+        self.levels.setdefault(pin, 0)
+
+    def write(self, pin, level):
+        self.calls += 1
+        self.levels[pin] = 1 if level else 0
+
+    def set_PWM_dutycycle(self, pin, duty):
+        self.calls += 1
+        self.duty[pin] = max(0, min(255, int(duty)))
+
+    def set_bank_1(self, bits):
+        self._bank(bits, 1)
+
+    def clear_bank_1(self, bits):
+        self._bank(bits, 0)
+
+    def _bank(self, bits, level):
+        self.calls += 1
+        for pin in range(32):
+            if bits >> pin & 1:
+                self.levels[pin] = level
+
+    def signed_duty(self, pins):
+        ena, in1, in2 = pins
+        a = self.levels.get(in1, 0)
+        b = self.levels.get(in2, 0)
+        direction = a - b          # both high/low = brake/coast -> 0
+        return self.sign * direction * self.duty.get(ena, 0)
+
+    def wheel_duty(self):
+        return self.signed_duty(self.left_pins), self.signed_duty(self.right_pins)
+
+
+class SimEncoders(Encoders):
+    """Integrates the world's wheel speeds into whole encoder counts (command sign)."""
+
+    def __init__(self, world, counts_per_cm=ENCODER_COUNTS_PER_CM, forward_is_negative=True):
+        self.world = world
+        self.counts_per_cm = counts_per_cm
+        self.sign = -1 if forward_is_negative else 1
+        self.pos = [0.0, 0.0]
+
+    def advance(self, dt):
+        k = self.sign * self.counts_per_cm * dt
+        self.pos[0] += self.world.v_left * k
+        self.pos[1] += self.world.v_right * k
+
+    def counts(self):
+        return math.floor(self.pos[0]), math.floor(self.pos[1])
+
+
+class SimTFLuna(LidarPort):
+    """Streams TF-Luna output generated from the world at the emulated sensor's frame rate.
+
+    rate_hz is its saved (power-on) rate; commands written to it change it.
+    mount: where it sits (sensors.Mount); None is the forward TF-Luna.
+    """
+
+    def __init__(self, sim, rate_hz=100, noise_cm=1.0, spike_prob=0.0, seed=0,
+                 max_buffer=4095, mount=None):
+        self.sim = sim
+        self.mount = mount
+        self.emulator = TFLunaEmulator(rate_hz)
+        self.noise_cm = noise_cm
+        self.spike_prob = spike_prob
+        self.rng = random.Random(seed)
+        self.max_buffer = max_buffer
+        self.buf = bytearray()
+        self.next_t = None
+        self.frames_sent = 0
+        self.written = bytearray()
+
+    def measure(self):
+        world = self.sim.world
+        d = world.range_ahead() if self.mount is None else world.range_from(self.mount)
+        if self.noise_cm:
+            d += self.rng.gauss(0.0, self.noise_cm)
+        if self.spike_prob and self.rng.random() < self.spike_prob:
+            d = self.rng.uniform(5.0, d)
+        d = max(0.0, d)
+        strength = int(max(50, 30000 * 100 / (100 + d)))
+        data = self.emulator.output(d, strength, 40.0)
+        if data:
+            self.buf += data
+            self.frames_sent += 1
+
+    def sample(self, t):
+        em = self.emulator
+        if self.next_t is None or em.period is None:
+            self.next_t = t
+        while em.triggers:
+            em.triggers -= 1
+            self.measure()
+        period = em.period
+        while period is not None and self.next_t <= t:
+            self.measure()
+            self.next_t += period
+        if len(self.buf) > self.max_buffer:
+            del self.buf[:len(self.buf) - self.max_buffer]     # UART overrun
+
+    @property
+    def in_waiting(self):
+        return len(self.buf)
+
+    def read(self, n=1):
+        out = bytes(self.buf[:n])
+        del self.buf[:n]
+        return out
+
+    def write(self, data):
+        self.written += data
+        self.buf += self.emulator.receive(data)
+        return len(data)
+
+    def reset_input_buffer(self):
+        self.buf.clear()
+
+
+class ScriptedGamepad(Gamepad):
+    """Replays (t, kind, index, value) events, t in seconds from sim start.
+
+    kind: "button", "axis", "disconnect", "connect". Harnesses can also call
+    set_button()/set_axis() directly for closed-loop driving.
+    """
+
+    def __init__(self, clock, script=(), num_buttons=16, num_axes=6):
+        self.clock = clock
+        self.t0 = clock.time()
+        self.events = sorted(script, key=lambda e: e[0])
+        self.next_event = 0
+        self.buttons = [0] * num_buttons
+        self.axes = [0.0] * num_axes
+        self.plugged = True
+
+    def pump(self):
+        t = self.clock.time() - self.t0
+        events = self.events
+        while self.next_event < len(events) and events[self.next_event][0] <= t:
+            _, kind, index, value = events[self.next_event]
+            self.next_event += 1
+            if kind == "button":
+                self.buttons[index] = value
+            elif kind == "axis":
+                self.axes[index] = value
+            elif kind == "disconnect":
+                self.plugged = False
+            elif kind == "connect":
+                self.plugged = True
+
+    def set_button(self, i, value):
+        self.buttons[i] = value
+
+    def set_axis(self, i, value):
+        self.axes[i] = value
+
+    def connected(self):
+        return self.plugged
+
+    def reconnect(self):
+        self.pump()
+        if self.plugged:
+            self.buttons = [0] * len(self.buttons)
+            self.axes = [0.0] * len(self.axes)
+        return self.plugged
+
+    def get_name(self):
+        return "Simulated controller"
+
+    def get_numbuttons(self):
+        return len(self.buttons)
+
+    def get_button(self, i):
+        return self.buttons[i]
+
+    def get_axis(self, i):
+        return self.axes[i]
+
+    def get_numaxes(self):
+        return len(self.axes)
+
+
+def press(t, btn, hold=0.1):
+    """Script helper: press and release a button."""
+    return [(t, "button", btn, 1), (t + hold, "button", btn, 0)]
+
+
+def car_pins(car):
+    """((ENA, IN1, IN2), (ENB, IN3, IN4)) from the control module's constants."""
+    return (car.ENA, car.IN1, car.IN2), (car.ENB, car.IN3, car.IN4)
+
+
+# -----------------------------
+# Simulator
+# -----------------------------
+class Simulator:
+    """Owns the world and the simulated devices and advances them together."""
+
+    def __init__(self, world, pins, script=(), forward_is_negative=True,
+                 lidar_rate_hz=100, noise_cm=1.0, spike_prob=0.0, seed=0,
+                 step_sec=0.01, encoder_counts_per_cm=ENCODER_COUNTS_PER_CM):
+        self.world = world
+        self.step_sec = step_sec
+        self.clock = SimClock(self)
+        left_pins, right_pins = pins
+        self.motors = SimMotors(left_pins, right_pins, forward_is_negative)
+        self.lidar = SimTFLuna(self, lidar_rate_hz, noise_cm, spike_prob, seed)
+        self.gamepad = ScriptedGamepad(self.clock, script)
+        self.encoders = SimEncoders(world, encoder_counts_per_cm, forward_is_negative)
+        self.range_sensors = []     # (name, mount, SimTFLuna) besides the forward one
+        self.noise_cm = noise_cm
+        self.seed = seed
+
+    def add_range_sensor(self, name, mount, rate_hz=100):
+        """Another simulated TF-Luna at mount (sensors.Mount); returns it."""
+        dev = SimTFLuna(self, rate_hz, self.noise_cm, 0.0, self.seed + 1 + len(self.range_sensors), mount=mount)
+        self.range_sensors.append((name, mount, dev))
+        return dev
+
+    def hardware(self):
+        return Hardware(
+            clock=self.clock,
+            motors=self.motors,
+            open_lidar=lambda: self.lidar,
+            gamepad=self.gamepad,
+            realtime=False,
+            encoders=self.encoders,
+            range_sensors=[(name, mount, lambda dev=dev: dev) for name, mount, dev in self.range_sensors],
+        )
+
+    def advance(self, sec):
+        clock = self.clock
+        end = clock.t + sec
+        while clock.t < end - 1e-12:
+            h = min(self.step_sec, end - clock.t)
+            left, right = self.motors.wheel_duty()
+            self.world.step(h, left, right)
+            self.encoders.advance(h)
+            clock.t += h
+            self.lidar.sample(clock.t)
+            for _, _, dev in self.range_sensors:
+                dev.sample(clock.t)
+            if clock.watchdog is not None:
+                clock.watchdog.check(clock.t)
+        clock.t = end
+
+    def run(self, loop, seconds=None, ticks=None):
+        """Run the control loop for a virtual duration or tick count."""
+        return loop.run(ticks=ticks, seconds=seconds)
@@ -0,0 +1,383 @@
+# sweep.py
+#
+# Batch parameter sweeps of the control script's tunables.
+#
+# Every configuration (a dict of NAME -> value overrides) is evaluated
+# headless through the real ControlLoop against:
+#
+#   simulated scenarios  - "<mode>-<world>", e.g. auto-boxes, guard-large:
+#                          AUTO left to itself, or GUARD driven by a scripted
+#                          "full stick at the walls, spin, repeat" pattern.
+#                          Metrics from the simulator's ground truth.
+#   recorded sessions    - replay.py with the overrides applied: how much
+#                          the output changes and how close it would still
+#                          drive forward toward what the LiDAR saw.
+#
+# Configurations come from a grid (--grid NAME=a,b,c, all combinations) and/or
+# random search (--random NAME=lo:hi, --samples N). Every configuration runs
+# the same seeds (same start poses, sensor noise, AUTO draws), so differences
+# come from the settings alone, and a given command line always produces the
+# same results, whatever the worker count.
+#
+# Runs are spread over a ProcessPoolExecutor. Results are one row per
+# (configuration, scenario/session, seed) in a columnar .npz: one array per
+# column (config, target, seed, each swept setting, each metric; NaN where a
+# metric doesn't apply) plus the sweep description as JSON. It is rewritten
+# every --checkpoint seconds, so a long sweep can be inspected while running.
+#
+# Usage:
+#   python sweep.py --grid AUTO_FWD_SPEED=50,60,70 --grid AUTO_STOP_CM=25,35,45
+#   python sweep.py --random AUTO_REVERSE_SEC=0.3:1.0 --random AUTO_STOP_CM=20:60 \
+#                   --samples 2000 --scenario auto-boxes --scenario auto-large --seeds 3
+#   python sweep.py --sessions telemetry --grid STOP_DISTANCE_CM=25,30,40
+#   python sweep.py --show sweep.npz --rank coverage_m2
+
+import argparse
+import ast
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import rc_car_modes_bluetooth_fix_good as car
+from bench_sim_modes import BOXES, scenario_auto
+from config import ConfigError
+from replay import find_sessions, replay_session, settings
+from sim import Coverage, Simulator, World, car_pins
+
+WORLDS = {
+    "empty": (400, 300, []),
+    "boxes": (400, 300, BOXES),
+    "large": (600, 500, [(150, 100, 60, 60), (380, 80, 40, 120), (100, 320, 120, 40),
+                         (400, 330, 50, 50), (270, 230, 30, 30)]),
+}
+MODES = ("auto", "guard")
+
+SIM_METRICS = ("collisions", "min_clear_cm", "mean_speed_cm_s", "coverage_m2", "coverage_pct")
+SESSION_METRICS = ("changed_pct", "mean_cmd", "min_fwd_cm")
+METRICS = SIM_METRICS + SESSION_METRICS
+
+
+# -----------------------------
+# Scenarios
+# -----------------------------
+def guard_script(seconds, seed):
+    """Arm, GUARD, then: full stick forward 1.5..4 s, spin 0.3..1.0 s, repeat."""
+    rng = random.Random(seed)
+    fwd = -1.0 if car.FORWARD_IS_NEGATIVE else 1.0
+    script = [(0.5, "button", car.BTN_A, 1), (0.6, "button", car.BTN_A, 0),
+              (1.0, "button", car.BTN_X, 1), (1.1, "button", car.BTN_X, 0)]
+    t = 2.0
+    while t < seconds:
+        script += [(t, "axis", car.LEFT_AXIS_Y, fwd), (t, "axis", car.RIGHT_AXIS_Y, fwd)]
+        t += rng.uniform(1.5, 4.0)
+        spin = rng.choice([-0.7, 0.7])
+        script += [(t, "axis", car.LEFT_AXIS_Y, spin), (t, "axis", car.RIGHT_AXIS_Y, -spin)]
+        t += rng.uniform(0.3, 1.0)
+    return script
+
+
+def run_scenario(scenario, seed, seconds):
+    """One simulated run with the current settings; returns its metrics."""
+    mode, _, world_name = scenario.partition("-")
+    if mode not in MODES or world_name not in WORLDS:
+        raise ValueError(f"unknown scenario: {scenario}")
+    w, h, boxes = WORLDS[world_name]
+    world = World.room(w, h, boxes=boxes)
+    world.place_randomly(random.Random(seed), boxes)
+    script = scenario_auto() if mode == "auto" else guard_script(seconds, seed)
+    sim = Simulator(world, car_pins(car), script=script, spike_prob=0.01, seed=seed)
+    loop = car.ControlLoop(sim.hardware(), log=lambda msg: None, rng=random.Random(seed))
+
+    cov = Coverage(w, h, world.radius)
+    min_clear = math.inf
+    loop.start()
+    try:
+        for _ in range(int(round(seconds / car.LOOP_DT))):
+            loop.tick()
+            sim.clock.sleep(car.LOOP_DT)
+            cov.mark(world.x, world.y)
+            min_clear = min(min_clear, world.clearance())
+    finally:
+        loop.shutdown()
+    return {
+        "collisions": world.collisions,
+        "min_clear_cm": min_clear,
+        "mean_speed_cm_s": world.odometer_cm / seconds,
+        "coverage_m2": cov.m2(),
+        "coverage_pct": 100.0 * cov.m2() / cov.free_m2(boxes),
+    }
+
+
+def run_session(path, seed, overrides=None):
+    """Replay one recorded session with overrides on its recorded settings; returns its metrics."""
+    result = replay_session(path, overrides, seed)
+    trace = result.trace
+    s = result.summary
+    sign = -1 if car.FORWARD_IS_NEGATIVE else 1
+    fwd = (sign * trace["left"] > 0) | (sign * trace["right"] > 0)
+    dist = np.asarray(result.state["dist"], dtype=np.float64)
+    seen = fwd & (dist > 0)
+    return {
+        "changed_pct": 100.0 * s["mismatched"] / max(1, s["ticks"]),
+        "mean_cmd": float(np.mean(0.5 * (np.abs(trace["left"]) + np.abs(trace["right"])))),
+        "min_fwd_cm": float(dist[seen].min()) if seen.any() else math.nan,
+    }
+
+
+# -----------------------------
+# Configurations
+# -----------------------------
+def grid_configs(grid):
+    """All combinations of {NAME: [values]}."""
+    names = list(grid)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(grid[n] for n in names))]
+
+
+def random_configs(ranges, samples, seed):
+    """samples draws from {NAME: (lo, hi)}; ints stay ints."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(samples):
+        cfg = {}
+        for name, (lo, hi) in ranges.items():
+            if isinstance(lo, int) and isinstance(hi, int):
+                cfg[name] = rng.randint(lo, hi)
+            else:
+                cfg[name] = round(rng.uniform(lo, hi), 4)
+        out.append(cfg)
+    return out
+
+
+def build_configs(grid, ranges, samples, seed):
+    base = grid_configs(grid) if grid else [{}]
+    if not ranges:
+        return base
+    return [dict(g, **r) for g in base for r in random_configs(ranges, samples, seed)]
+
+
+# -----------------------------
+# Running
+# -----------------------------
+def evaluate(job):
+    """Worker entry point: (config index, overrides, target, seed, seconds) -> row."""
+    index, overrides, target, seed, seconds = job
+    with settings(overrides):
+        if os.path.isdir(target):
+            metrics = run_session(target, seed, overrides)
+        else:
+            metrics = run_scenario(target, seed, seconds)
+    return index, target, seed, metrics
+
+
+def make_jobs(configs, targets, seeds, seconds):
+    return [(i, cfg, target, seed, seconds)
+            for i, cfg in enumerate(configs) for target in targets for seed in seeds]
+
+
+def run_sweep(configs, targets, seeds, seconds, workers=None, out=None, meta=None,
+              checkpoint_sec=60.0, log=print):
+    """Evaluate every job, in order; writes `out` periodically and at the end."""
+    jobs = make_jobs(configs, targets, seeds, seconds)
+    rows = []
+    t0 = last = time.perf_counter()
+    pool = None
+    if workers != 1 and len(jobs) > 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(evaluate, jobs)
+    else:
+        results = map(evaluate, jobs)
+    try:
+        for row in results:
+            rows.append(row)
+            now = time.perf_counter()
+            if now - last >= checkpoint_sec:
+                last = now
+                if out:
+                    save_results(out, configs, rows, meta)
+                log(f"  {len(rows)}/{len(jobs)} runs, {now - t0:.0f} s")
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    if out:
+        save_results(out, configs, rows, meta)
+    return rows
+
+
+# -----------------------------
+# Results file
+# -----------------------------
+def to_columns(configs, rows):
+    """Rows of (config, target, seed, metrics) -> {column: array}."""
+    names = sorted({n for cfg in configs for n in cfg})
+    cols = {
+        "config": np.array([r[0] for r in rows], dtype=np.int32),
+        "target": np.array([r[1] for r in rows], dtype=str),
+        "seed": np.array([r[2] for r in rows], dtype=np.int32),
+    }
+    for n in names:
+        values = [configs[r[0]].get(n) for r in rows]
+        if all(isinstance(v, (int, float)) or v is None for v in values):
+            cols[n] = np.array([math.nan if v is None else float(v) for v in values], dtype=np.float64)
+        else:               # string settings (LIDAR_FILTER=ema); "" where a config doesn't set it
+            cols[n] = np.array(["" if v is None else str(v) for v in values], dtype=str)
+    for m in METRICS:
+        cols[m] = np.array([float(r[3].get(m, math.nan)) for r in rows], dtype=np.float64)
+    return cols
+
+
+def save_results(path, configs, rows, meta=None):
+    cols = to_columns(configs, rows)
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, meta=np.array(json.dumps(meta or {})), **cols)
+    os.replace(tmp, path)
+
+
+def load_results(path):
+    """(columns dict, meta dict) from save_results()."""
+    with np.load(path) as f:
+        meta = json.loads(str(f["meta"]))
+        cols = {k: f[k] for k in f.files if k != "meta"}
+    return cols, meta
+
+
+def summarize(cols, rank, top=10, lower_is_better=False):
+    """Per-configuration means, best `top` by `rank`. Returns a list of dicts."""
+    configs = np.unique(cols["config"])
+    params = [k for k in cols if k not in ("config", "target", "seed") and k not in METRICS]
+    out = []
+    for c in configs.tolist():
+        sel = cols["config"] == c
+        row = {"config": c}
+        for p in params:
+            row[p] = cols[p][sel][0].item()
+        for m in METRICS:
+            v = cols[m][sel]
+            v = v[~np.isnan(v)]
+            row[m] = float(v.mean()) if v.size else math.nan
+        out.append(row)
+    key = (lambda r: r[rank]) if lower_is_better else (lambda r: -r[rank])
+    out = [r for r in out if not math.isnan(r[rank])]
+    out.sort(key=key)
+    return out[:top], params
+
+
+def format_summary(best, params):
+    lines = []
+    for r in best:
+        setting = " ".join(f"{p}={r[p]:g}" if isinstance(r[p], float) else f"{p}={r[p]}" for p in params)
+        metrics = " ".join(f"{m}={r[m]:.2f}" for m in METRICS if not math.isnan(r[m]))
+        lines.append(f"  #{r['config']:<5d} {setting}  |  {metrics}")
+    return "\n".join(lines)
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def _parse_value(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text         # plain string, e.g. LIDAR_FILTER=ema
+
+
+def _parse_grid(text):
+    name, sep, values = text.partition("=")
+    if not sep or not values:
+        raise argparse.ArgumentTypeError(f"expected NAME=a,b,c, got {text!r}")
+    return name, [_parse_value(v) for v in values.split(",")]
+
+
+def _parse_range(text):
+    name, sep, values = text.partition("=")
+    lo, colon, hi = values.partition(":")
+    if not sep or not colon:
+        raise argparse.ArgumentTypeError(f"expected NAME=lo:hi, got {text!r}")
+    lo, hi = _parse_value(lo), _parse_value(hi)
+    if not all(isinstance(v, (int, float)) for v in (lo, hi)):
+        raise argparse.ArgumentTypeError(f"range bounds must be numbers: {text!r}")
+    return name, (lo, hi)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Parameter sweeps of the control script's tunables.")
+    ap.add_argument("--grid", action="append", type=_parse_grid, default=[], metavar="NAME=a,b,c")
+    ap.add_argument("--random", action="append", type=_parse_range, default=[], metavar="NAME=lo:hi")
+    ap.add_argument("--samples", type=int, default=100, help="random draws (with --random)")
+    ap.add_argument("--scenario", action="append", default=[],
+                    help=f"<mode>-<world>, mode in {MODES}, world in {tuple(WORLDS)} "
+                         "(default: auto-boxes, guard-boxes)")
+    ap.add_argument("--sessions", help="evaluate on recorded sessions under this folder instead")
+    ap.add_argument("--seeds", type=int, default=2, help="seeds per configuration and target")
+    ap.add_argument("--seed", type=int, default=0, help="first seed; also seeds the random search")
+    ap.add_argument("--seconds", type=float, default=120.0, help="simulated seconds per run")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--out", default="sweep.npz")
+    ap.add_argument("--checkpoint", type=float, default=60.0, help="rewrite --out every this many s")
+    ap.add_argument("--rank", default="coverage_m2", help="metric to rank configurations by")
+    ap.add_argument("--lower", action="store_true", help="lower --rank is better")
+    ap.add_argument("--show", metavar="FILE", help="only summarize an existing results file")
+    args = ap.parse_args(argv)
+
+    if args.rank not in METRICS:
+        ap.error(f"--rank must be one of {METRICS}")
+    if args.show:
+        cols, meta = load_results(args.show)
+        best, params = summarize(cols, args.rank, lower_is_better=args.lower)
+        print(f"{args.show}: {len(cols['config'])} runs, {meta.get('configs')} configurations")
+        print(format_summary(best, params))
+        return 0
+
+    grid = dict(args.grid)
+    ranges = dict(args.random)
+    configs = build_configs(grid, ranges, args.samples, args.seed)
+    # Same checks as the car's config file: a config it would reject isn't worth a run
+    validate = car.make_config(log=lambda msg: None).validate
+    errors = set()
+    for cfg in configs:
+        try:
+            cfg.update(validate(cfg))
+        except ConfigError as e:
+            errors.add(str(e))
+    if errors:
+        ap.error("; ".join(sorted(errors)))
+
+    if args.sessions:
+        targets = find_sessions(args.sessions)
+        if not targets:
+            print(f"no sessions under {args.sessions}")
+            return 1
+        seeds = [args.seed]         # replay is deterministic; the seed only covers extra AUTO draws
+    else:
+        targets = args.scenario or ["auto-boxes", "guard-boxes"]
+        for t in targets:
+            mode, _, world = t.partition("-")
+            if mode not in MODES or world not in WORLDS:
+                ap.error(f"unknown scenario: {t}")
+        seeds = list(range(args.seed, args.seed + args.seeds))
+
+    meta = {"argv": sys.argv[1:] if argv is None else list(argv), "configs": len(configs),
+            "targets": targets, "seeds": seeds, "seconds": args.seconds,
+            "grid": grid, "random": {k: list(v) for k, v in ranges.items()}, "samples": args.samples}
+    runs = len(configs) * len(targets) * len(seeds)
+    print(f"{len(configs)} configurations x {len(targets)} targets x {len(seeds)} seeds = {runs} runs")
+    t0 = time.perf_counter()
+    run_sweep(configs, targets, seeds, args.seconds, args.workers, args.out, meta, args.checkpoint)
+    sec = time.perf_counter() - t0
+    print(f"{runs} runs in {sec:.1f} s ({runs / sec:.2f} runs/s) -> {args.out}")
+
+    cols, _ = load_results(args.out)
+    best, params = summarize(cols, args.rank, lower_is_better=args.lower)
+    print(f"best by {args.rank}:")
+    print(format_summary(best, params))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
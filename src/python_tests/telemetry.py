@@ -0,0 +1,374 @@
+# telemetry.py
+#
+# Full-rate binary telemetry recorder + zero-copy session reader.
+#
+# The control loop used to print one status line every 0.5 s and throw the
+# rest away. TelemetryRecorder keeps everything as fixed-layout records:
+#
+#   lidar       every accepted TF-Luna frame   (t, dist, strength, temp)
+#   controller  every control tick             (t, axes[6], buttons held, buttons pressed)
+#   state       every control tick             (t, mode, armed, auto_state, turn_dir, stop_cm, dist)
+#   motor       every motor update             (t, ena pin, duty, speed)
+#   watchdog    every motor watchdog trip      (t, last heartbeat, reaction s)
+#   wheels      every tick with SPEED_CONTROL  (t, left / right encoder counts)
+#
+# t is clock.monotonic() seconds. Producers (control loop, LiDAR thread) only
+# append a tuple to a deque - no I/O, no locks. A deque holds max_backlog
+# records; if the writer falls that far behind, the oldest go, and the
+# producer counts them in `dropped` (per stream; written to session.json on
+# close and shown on the car's status line). A background writer thread
+# drains the deques every flush_sec into preallocated, memory-mapped segment
+# files, one series per stream:
+#
+#   <session>/lidar.0000.bin, lidar.0001.bin, ...
+#
+# Each segment is a 64-byte header followed by packed records, so a segment
+# maps straight onto a NumPy structured array. When a segment is full the
+# writer rotates to the next one and deletes the oldest beyond max_segments,
+# so disk use is bounded.
+#
+# Settings changes (config.py: the config at start, file edits, button
+# tweaks) are rare and variable-sized, so they go to <session>/config.jsonl
+# instead, one JSON line per change: {"t", "source", "values"}.
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+MAGIC = b"RCTLM001"
+HEADER = struct.Struct("<8sI I Q 16s 24x")    # magic, version, record size, count, stream
+HEADER_SIZE = HEADER.size                      # 64
+VERSION = 2
+NUM_AXES = 6
+
+STREAMS = {
+    "lidar": np.dtype([("t", "<f8"), ("dist", "<u2"), ("strength", "<u2"), ("temp", "<f4")]),
+    "controller": np.dtype([("t", "<f8"), ("axes", "<f4", (NUM_AXES,)), ("buttons", "<u4"),
+                            ("pressed", "<u4")]),
+    "state": np.dtype([("t", "<f8"), ("mode", "u1"), ("armed", "u1"), ("auto_state", "u1"),
+                       ("turn_dir", "i1"), ("stop_cm", "<u2"), ("dist", "<f4")]),
+    "motor": np.dtype([("t", "<f8"), ("ena", "u1"), ("duty", "u1"), ("speed", "<i2")]),
+    "watchdog": np.dtype([("t", "<f8"), ("fed", "<f8"), ("reaction", "<f4")]),
+    "wheels": np.dtype([("t", "<f8"), ("left", "<i4"), ("right", "<i4")]),
+}
+
+
+def buttons_mask(buttons):
+    mask = 0
+    for i, b in enumerate(buttons):
+        if b:
+            mask |= 1 << i
+    return mask
+
+
+class _Segment:
+    """One preallocated, memory-mapped segment file."""
+
+    def __init__(self, path, stream, dtype, capacity):
+        self.path = path
+        self.dtype = dtype
+        self.capacity = capacity
+        self.count = 0
+        size = HEADER_SIZE + capacity * dtype.itemsize
+        self.f = open(path, "w+b")
+        self.f.truncate(size)
+        self.mm = mmap.mmap(self.f.fileno(), size)
+        self.name = stream.encode()
+        self.records = np.frombuffer(self.mm, dtype=dtype, count=capacity, offset=HEADER_SIZE)
+        self._write_header()
+
+    def _write_header(self):
+        HEADER.pack_into(self.mm, 0, MAGIC, VERSION, self.dtype.itemsize, self.count, self.name)
+
+    def append(self, rows):
+        """Write as many rows as fit; returns how many were written."""
+        n = min(len(rows), self.capacity - self.count)
+        if n:
+            self.records[self.count:self.count + n] = rows[:n]
+            self.count += n
+            self._write_header()     # count last: a crash never exposes garbage rows
+        return n
+
+    def close(self):
+        del self.records
+        self.mm.flush()
+        self.mm.close()
+        # Give back the unused preallocation
+        self.f.truncate(HEADER_SIZE + self.count * self.dtype.itemsize)
+        self.f.close()
+
+
+class TelemetryRecorder:
+    def __init__(self, session_dir, clock, segment_bytes=8 << 20, max_segments=32,
+                 flush_sec=0.1, max_backlog=200_000):
+        self.dir = session_dir
+        self.clock = clock
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.flush_sec = flush_sec
+        self.max_backlog = max_backlog
+
+        self._queues = {name: deque(maxlen=max_backlog) for name in STREAMS}
+        self._config_q = deque()
+        self._segments = {}
+        self._seg_index = {name: 0 for name in STREAMS}
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.written = {name: 0 for name in STREAMS}
+        self.enqueued = {name: 0 for name in STREAMS}
+        self.dropped = {name: 0 for name in STREAMS}   # pushed out of a full queue, unwritten
+        self._started = {}
+
+        # Queues cached for the hot path
+        self._lidar_q = self._queues["lidar"]
+        self._controller_q = self._queues["controller"]
+        self._state_q = self._queues["state"]
+        self._motor_q = self._queues["motor"]
+        self._watchdog_q = self._queues["watchdog"]
+        self._wheels_q = self._queues["wheels"]
+
+    # ---- lifecycle ----
+    def start(self, writer=True):
+        """writer=False: no writer thread; the owner calls flush() every flush_sec."""
+        os.makedirs(self.dir, exist_ok=True)
+        self._started = {
+            "version": VERSION,
+            "started_wall": time.time(),
+            "started_monotonic": self.clock.monotonic(),
+            "streams": {k: str(v.descr) for k, v in STREAMS.items()},
+        }
+        self._write_info(self._started)
+        if writer:
+            self._thread = threading.Thread(target=self._writer, name="telemetry", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        for seg in self._segments.values():
+            seg.close()
+        self._segments.clear()
+        if self._started:
+            self._write_info(dict(self._started, written=self.written, dropped=self.dropped))
+
+    def _write_info(self, info):
+        with open(os.path.join(self.dir, "session.json"), "w") as f:
+            json.dump(info, f, indent=1)
+
+    def _put(self, name, q, record):
+        # A full deque drops its oldest on append: count it (the writer may
+        # drain in between, so this can over-count by a record or so)
+        if len(q) == self.max_backlog:
+            self.dropped[name] += 1
+        q.append(record)
+
+    # ---- producers (never block) ----
+    def now(self):
+        return self.clock.monotonic()
+
+    def lidar(self, t, dist, strength, temp):
+        self._put("lidar", self._lidar_q, (t, dist, strength, temp))
+
+    def controller(self, t, axes, buttons, pressed=0):
+        """axes: sequence of up to NUM_AXES floats.
+
+        buttons: bitmask of buttons held (see buttons_mask), pressed: bitmask
+        of button-down edges the loop acted on this tick.
+        """
+        self._put("controller", self._controller_q, (t, axes, buttons, pressed))
+
+    def state(self, t, mode, armed, auto_state, turn_dir, stop_cm, dist):
+        self._put("state", self._state_q,
+                  (t, mode, armed, auto_state, turn_dir, stop_cm, float("nan") if dist is None else dist))
+
+    def motor(self, t, ena, duty, speed):
+        self._put("motor", self._motor_q, (t, ena, duty, speed))
+
+    def watchdog(self, t, fed, reaction):
+        """A watchdog trip (from the watchdog thread): see watchdog.Trip."""
+        self._put("watchdog", self._watchdog_q, (t, fed, reaction))
+
+    def wheels(self, t, left, right):
+        """Encoder counts read at t (the speed controller's input)."""
+        self._put("wheels", self._wheels_q, (t, left, right))
+
+    def config(self, t, source, values):
+        """values: {setting: new value} applied at t."""
+        self._config_q.append({"t": t, "source": source, "values": dict(values)})
+
+    # ---- writer thread ----
+    def _writer(self):
+        while not self._stop.wait(self.flush_sec):
+            self.flush()
+
+    def flush(self):
+        """Drain every queue into its segment files (writer thread / close only)."""
+        if self._config_q:
+            with open(os.path.join(self.dir, "config.jsonl"), "a") as f:
+                while self._config_q:
+                    f.write(json.dumps(self._config_q.popleft()) + "\n")
+        for name, q in self._queues.items():
+            n = len(q)
+            if not n:
+                continue
+            batch = [q.popleft() for _ in range(n)]
+            if name == "controller":
+                batch = [(t, _pad_axes(axes), b, p) for t, axes, b, p in batch]
+            rows = np.array(batch, dtype=STREAMS[name])
+            self.enqueued[name] += n
+            while len(rows):
+                seg = self._segment(name)
+                k = seg.append(rows)
+                rows = rows[k:]
+                self.written[name] += k
+                if seg.count == seg.capacity:
+                    self._rotate(name)
+
+    def _segment(self, name):
+        seg = self._segments.get(name)
+        if seg is None:
+            dtype = STREAMS[name]
+            idx = self._seg_index[name]
+            path = os.path.join(self.dir, f"{name}.{idx:04d}.bin")
+            capacity = max(1, (self.segment_bytes - HEADER_SIZE) // dtype.itemsize)
+            seg = _Segment(path, name, dtype, capacity)
+            self._segments[name] = seg
+        return seg
+
+    def _rotate(self, name):
+        self._segments.pop(name).close()
+        self._seg_index[name] += 1
+        old = self._seg_index[name] - self.max_segments
+        if old >= 0:
+            path = os.path.join(self.dir, f"{name}.{old:04d}.bin")
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _pad_axes(axes):
+    axes = tuple(axes[:NUM_AXES])
+    if len(axes) < NUM_AXES:
+        axes += (0.0,) * (NUM_AXES - len(axes))
+    return axes
+
+
+class TelemetryTee:
+    """Several telemetry sinks as one (e.g. the recorder + telemetry_stream's streamer).
+
+    dir / written / dropped / now() are the first sink's; flush() flushes all of them.
+    """
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+        self.dir = sinks[0].dir
+        self.written = sinks[0].written
+        self.dropped = sinks[0].dropped
+        self.flush_sec = min(s.flush_sec for s in sinks)
+
+    def start(self, writer=True):
+        for s in self.sinks:
+            s.start(writer)
+        return self
+
+    def close(self):
+        for s in self.sinks:
+            s.close()
+
+    def flush(self):
+        for s in self.sinks:
+            s.flush()
+
+    def now(self):
+        return self.sinks[0].now()
+
+    def lidar(self, t, dist, strength, temp):
+        for s in self.sinks:
+            s.lidar(t, dist, strength, temp)
+
+    def controller(self, t, axes, buttons, pressed=0):
+        for s in self.sinks:
+            s.controller(t, axes, buttons, pressed)
+
+    def state(self, t, mode, armed, auto_state, turn_dir, stop_cm, dist):
+        for s in self.sinks:
+            s.state(t, mode, armed, auto_state, turn_dir, stop_cm, dist)
+
+    def motor(self, t, ena, duty, speed):
+        for s in self.sinks:
+            s.motor(t, ena, duty, speed)
+
+    def watchdog(self, t, fed, reaction):
+        for s in self.sinks:
+            s.watchdog(t, fed, reaction)
+
+    def wheels(self, t, left, right):
+        for s in self.sinks:
+            s.wheels(t, left, right)
+
+    def config(self, t, source, values):
+        for s in self.sinks:
+            s.config(t, source, values)
+
+
+# -----------------------------
+# Reader
+# -----------------------------
+def read_segment(path):
+    """Map one segment file as a read-only structured array (no copy)."""
+    with open(path, "rb") as f:
+        head = f.read(HEADER_SIZE)
+    magic, version, recsize, count, name = HEADER.unpack(head)
+    if magic != MAGIC:
+        raise ValueError(f"{path}: not a telemetry segment")
+    if version != VERSION:
+        raise ValueError(f"{path}: segment version {version}, this reader handles {VERSION}")
+    stream = name.rstrip(b"\0").decode()
+    dtype = STREAMS[stream]
+    if recsize != dtype.itemsize:
+        raise ValueError(f"{path}: record size {recsize} != {dtype.itemsize} for {stream}")
+    if count == 0:
+        return stream, np.zeros(0, dtype=dtype)
+    return stream, np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+def load_session(session_dir):
+    """{stream: structured array} for a whole session.
+
+    A stream that fits in one segment comes back as a memmap of the file
+    (zero copy). Streams that rotated across segments are concatenated.
+    """
+    parts = {name: [] for name in STREAMS}
+    for fname in sorted(os.listdir(session_dir)):
+        if not fname.endswith(".bin"):
+            continue
+        stream, arr = read_segment(os.path.join(session_dir, fname))
+        parts[stream].append(arr)
+    out = {}
+    for name, arrs in parts.items():
+        if not arrs:
+            out[name] = np.zeros(0, dtype=STREAMS[name])
+        elif len(arrs) == 1:
+            out[name] = arrs[0]
+        else:
+            out[name] = np.concatenate(arrs)
+    return out
+
+
+def load_config_log(session_dir):
+    """Settings changes of a session, oldest first ([] if none were recorded)."""
+    path = os.path.join(session_dir, "config.jsonl")
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,444 @@
+# telemetry_stream.py
+#
+# Live telemetry over UDP: LiDAR, mode / arm state and motor outputs to any
+# number of subscribers on the LAN (a laptop plotting the range, a phone
+# showing the mode, ...), without the control loop noticing them.
+#
+# TelemetryStreamer is a telemetry sink like telemetry.TelemetryRecorder
+# (same producer calls; telemetry.TelemetryTee feeds both). Producers only
+# append to bounded deques or replace the latest state - the oldest samples
+# are dropped if the sender falls behind, nothing ever blocks the loop or the
+# LiDAR thread. A sender thread (or the owner's flush(), like the recorder)
+# does everything else on one non-blocking socket:
+#
+#   requests  JSON datagrams from clients
+#               {"op": "subscribe", "rate_hz": 10, "streams": ["lidar", "state", "motor"],
+#                "lidar": "minmax"}
+#               {"op": "unsubscribe"}
+#             answered with {"op": "subscribed", "rate_hz": <granted>, "lease_sec", "sent",
+#             "dropped", ...} or {"op": "busy", "reason"}. The granted rate is
+#             the highest of STREAM_RATES within what was asked, max_hz and
+#             what's left of budget_pps (packets per second over all
+#             clients). A subscription is a lease: clients repeat the
+#             subscribe within lease_sec or are dropped.
+#   packets   one JSON datagram per client per period:
+#               {"seq", "t",
+#                "lidar": {"n", "min", "max", "mean", "last"}   ("minmax": the whole window)
+#                         {"n", "last"}                          ("decimate": newest sample only)
+#                "state": {"mode", "armed", "auto_state", "stop_cm", "dist", "trips"},
+#                "motor": {"left": [last, min, max], "right": [last, min, max]}}
+#             Clients with the same rate / streams / LiDAR reduction share a
+#             group: its packet is built once per period and queued to each
+#             of them. A client's queue holds queue_len packets; a full one
+#             drops its oldest (counted), so a blocked socket costs memory
+#             bounded by clients x queue_len and never stalls the sender.
+#
+# WebSocket isn't offered: it needs a package the car doesn't have, and
+# datagrams are the better fit for "latest value wins" anyway.
+#
+# Usage (watch a car; prints one line per packet):
+#   python telemetry_stream.py <car host> [port] [rate_hz] [minmax|decimate]
+
+import json
+import math
+import select
+import socket
+import sys
+import threading
+import time
+from collections import deque
+
+STREAM_RATES = (1, 2, 5, 10, 25, 50)      # Hz a client can be granted
+STREAMS = ("lidar", "state", "motor")
+LIDAR_REDUCTIONS = ("minmax", "decimate")
+LEASE_SEC = 5.0
+QUEUE_LEN = 4               # packets waiting per client
+POLL_SEC = 0.05             # sender wakes at least this often (requests, leases)
+MAX_DATAGRAM = 2048
+DEFAULT_PORT = 5600
+
+
+def _pack(msg):
+    return json.dumps(msg, separators=(",", ":")).encode()
+
+
+def subscribe_request(rate_hz, streams=STREAMS, lidar="minmax"):
+    """The datagram a client sends to subscribe (and every lease_sec / 2 to stay subscribed)."""
+    return _pack({"op": "subscribe", "rate_hz": rate_hz, "streams": list(streams), "lidar": lidar})
+
+
+def unsubscribe_request():
+    return _pack({"op": "unsubscribe"})
+
+
+def granted_rate(asked, limit, rates=STREAM_RATES):
+    """The highest supported rate <= min(asked, limit), or None if there's none."""
+    best = None
+    for r in rates:
+        if r <= asked and r <= limit:
+            best = r
+    return best
+
+
+# -----------------------------
+# Server
+# -----------------------------
+class _Client:
+    def __init__(self, addr, queue_len):
+        self.addr = addr
+        self.group = None
+        self.rate_hz = 0
+        self.expires = 0.0
+        self.out = deque()
+        self.queue_len = queue_len
+        self.sent = 0
+        self.dropped = 0
+
+    def queue(self, packet):
+        if len(self.out) >= self.queue_len:
+            self.out.popleft()
+            self.dropped += 1
+        self.out.append(packet)
+
+
+class _Group:
+    """Clients with the same subscription: one packet per period for all of them."""
+
+    def __init__(self, key, now):
+        self.key = key
+        rate_hz, self.streams, self.reduce = key
+        self.period = 1.0 / rate_hz
+        self.next_t = math.ceil(now / self.period) * self.period     # on the rate's grid
+        self.clients = []
+        self.seq = 0
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.lo = math.inf
+        self.hi = -math.inf
+        self.sum = 0.0
+        self.motor = [None, None]   # [lo, hi] per side over the window
+
+    def add_lidar(self, dists):
+        self.n += len(dists)
+        if self.reduce == "minmax":
+            self.lo = min(self.lo, min(dists))
+            self.hi = max(self.hi, max(dists))
+            self.sum += sum(dists)
+
+    def add_motor(self, side, speeds):
+        lo, hi = min(speeds), max(speeds)
+        m = self.motor[side]
+        self.motor[side] = [lo, hi] if m is None else [min(m[0], lo), max(m[1], hi)]
+
+    def packet(self, now, last_dist, state, trips, motor_last):
+        self.seq += 1
+        msg = {"seq": self.seq, "t": round(now, 4)}
+        if "lidar" in self.streams:
+            if self.reduce == "minmax" and self.n:
+                msg["lidar"] = {"n": self.n, "min": self.lo, "max": self.hi,
+                                "mean": round(self.sum / self.n, 1), "last": last_dist}
+            else:
+                msg["lidar"] = {"n": self.n, "last": last_dist}
+        if "state" in self.streams and state is not None:
+            mode, armed, auto_state, stop_cm, dist = state
+            msg["state"] = {"mode": mode, "armed": armed, "auto_state": auto_state, "stop_cm": stop_cm,
+                            "dist": None if dist is None else round(dist, 1), "trips": trips}
+        if "motor" in self.streams:
+            motor = {}
+            for side, name in enumerate(("left", "right")):
+                m = self.motor[side]
+                last = motor_last[side]
+                motor[name] = [last, last, last] if m is None else [last, m[0], m[1]]
+            msg["motor"] = motor
+        self.reset()
+        return _pack(msg)
+
+
+class TelemetryStreamer:
+    def __init__(self, clock, bind="0.0.0.0", port=DEFAULT_PORT, left_ena=None, max_hz=25, max_clients=16,
+                 budget_pps=200, lease_sec=LEASE_SEC, queue_len=QUEUE_LEN, max_backlog=4096):
+        """left_ena: the left motor's enable pin (motor() says which side by pin)."""
+        self.clock = clock
+        self.bind = bind
+        self.port = port
+        self.left_ena = left_ena
+        self.max_hz = max_hz
+        self.max_clients = max_clients
+        self.budget_pps = budget_pps
+        self.lease_sec = lease_sec
+        self.queue_len = queue_len
+        self.flush_sec = POLL_SEC
+        self.dir = None             # nothing on disk
+
+        self._lidar_q = deque(maxlen=max_backlog)
+        self._motor_q = deque(maxlen=max_backlog)
+        self._state = None          # (mode, armed, auto_state, stop_cm, dist), latest wins
+        self._trips = 0
+        self._last_dist = None
+        self._motor_last = [0, 0]
+
+        self.clients = {}           # addr -> _Client
+        self.groups = {}            # (rate, streams, reduce) -> _Group
+        self.sock = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.written = {"packets": 0, "dropped": 0, "busy": 0, "bad": 0}
+        self.dropped = {}           # records lost on the way to disk: none, nothing is recorded
+        self._append_lidar = self._lidar_q.append
+        self._append_motor = self._motor_q.append
+
+    # ---- lifecycle ----
+    def open(self):
+        """Bind the socket (start() does if it isn't yet); returns the port."""
+        if self.sock is None:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.sock.bind((self.bind, self.port))
+            self.sock.setblocking(False)
+            self.port = self.sock.getsockname()[1]      # port 0: whatever the OS picked
+        return self.port
+
+    def start(self, writer=True):
+        """writer=False: no sender thread; the owner calls flush() every flush_sec."""
+        self.open()
+        if writer:
+            self._thread = threading.Thread(target=self._sender, name="telemetry-stream", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    # ---- producers (never block) ----
+    def now(self):
+        return self.clock.monotonic()
+
+    def lidar(self, t, dist, strength, temp):
+        self._append_lidar(dist)
+
+    def controller(self, t, axes, buttons, pressed=0):
+        pass
+
+    def state(self, t, mode, armed, auto_state, turn_dir, stop_cm, dist):
+        self._state = (mode, armed, auto_state, stop_cm, dist)
+
+    def motor(self, t, ena, duty, speed):
+        self._append_motor((ena, speed))
+
+    def watchdog(self, t, fed, reaction):
+        self._trips += 1
+
+    def wheels(self, t, left, right):
+        pass
+
+    def config(self, t, source, values):
+        pass
+
+    # ---- sender ----
+    def _sender(self):
+        while not self._stop.is_set():
+            wait = POLL_SEC
+            if self.groups:
+                due = min(g.next_t for g in self.groups.values()) - self.clock.monotonic()
+                wait = max(0.0, min(wait, due))
+            try:
+                select.select([self.sock], [], [], wait)
+            except (OSError, ValueError):
+                break
+            self.flush()
+
+    def flush(self):
+        """One sender pass: requests, new samples, packets that are due, expired leases."""
+        if self.sock is None:
+            return
+        now = self.clock.monotonic()
+        self._requests(now)
+        self._drain()
+        self._send_due(now)
+        self._send_queued()
+        for addr in [a for a, c in self.clients.items() if c.expires < now]:
+            self._remove(addr)
+
+    def _drain(self):
+        q = self._lidar_q
+        n = len(q)
+        if n:
+            dists = [q.popleft() for _ in range(n)]
+            self._last_dist = dists[-1]
+            for g in self.groups.values():
+                g.add_lidar(dists)
+        q = self._motor_q
+        n = len(q)
+        if n:
+            sides = ([], [])
+            for ena, speed in [q.popleft() for _ in range(n)]:
+                sides[0 if ena == self.left_ena else 1].append(speed)
+            for side, speeds in enumerate(sides):
+                if speeds:
+                    self._motor_last[side] = speeds[-1]
+                    for g in self.groups.values():
+                        g.add_motor(side, speeds)
+
+    def _send_due(self, now):
+        for g in self.groups.values():
+            if now < g.next_t:
+                continue
+            g.next_t += g.period
+            if g.next_t <= now:
+                g.next_t = (math.floor(now / g.period) + 1) * g.period     # behind: skip, don't burst
+            packet = g.packet(now, self._last_dist, self._state, self._trips, self._motor_last)
+            for c in g.clients:
+                c.queue(packet)
+
+    def _send_queued(self):
+        sock = self.sock
+        for c in self.clients.values():
+            out = c.out
+            while out:
+                try:
+                    sock.sendto(out[0], c.addr)
+                except BlockingIOError:
+                    return          # socket buffer full: the rest waits (or is dropped) next pass
+                except OSError:
+                    out.clear()     # unreachable client: its lease runs out
+                    break
+                out.popleft()
+                c.sent += 1
+                self.written["packets"] += 1
+
+    # ---- requests ----
+    def _requests(self, now):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue            # e.g. an ICMP error from an earlier send
+            try:
+                req = json.loads(data)
+                op = req["op"]
+            except (ValueError, TypeError, KeyError):
+                self.written["bad"] += 1
+                continue
+            if op == "subscribe":
+                self._reply(addr, self._subscribe(addr, req, now))
+            elif op == "unsubscribe":
+                self._remove(addr)
+            else:
+                self.written["bad"] += 1
+
+    def _subscribe(self, addr, req, now):
+        try:
+            asked = float(req.get("rate_hz", self.max_hz))
+            streams = tuple(s for s in STREAMS if s in req.get("streams", STREAMS))
+            reduce = req.get("lidar", "minmax")
+        except (TypeError, ValueError, AttributeError):
+            self.written["bad"] += 1
+            return {"op": "busy", "reason": "bad request"}
+        if reduce not in LIDAR_REDUCTIONS or not streams:
+            self.written["bad"] += 1
+            return {"op": "busy", "reason": f"streams from {list(STREAMS)}, lidar one of {list(LIDAR_REDUCTIONS)}"}
+        c = self.clients.get(addr)
+        if c is None and len(self.clients) >= self.max_clients:
+            self.written["busy"] += 1
+            return {"op": "busy", "reason": f"{self.max_clients} clients"}
+        used = sum(o.rate_hz for o in self.clients.values() if o is not c)
+        rate = granted_rate(asked, min(self.max_hz, self.budget_pps - used))
+        if rate is None:
+            self.written["busy"] += 1
+            return {"op": "busy", "reason": f"budget {self.budget_pps} packets/s used up"}
+        if c is None:
+            c = self.clients[addr] = _Client(addr, self.queue_len)
+        key = (rate, streams, reduce)
+        if c.group is None or c.group.key != key:
+            self._leave(c)
+            g = self.groups.get(key)
+            if g is None:
+                g = self.groups[key] = _Group(key, now)
+            g.clients.append(c)
+            c.group = g
+            c.rate_hz = rate
+        c.expires = now + self.lease_sec
+        return {"op": "subscribed", "rate_hz": rate, "streams": list(streams), "lidar": reduce,
+                "lease_sec": self.lease_sec, "sent": c.sent, "dropped": c.dropped}
+
+    def _reply(self, addr, msg):
+        try:
+            self.sock.sendto(_pack(msg), addr)
+        except OSError:
+            pass
+
+    def _leave(self, c):
+        g = c.group
+        if g is None:
+            return
+        g.clients.remove(c)
+        if not g.clients:
+            del self.groups[g.key]
+        c.group = None
+
+    def _remove(self, addr):
+        c = self.clients.pop(addr, None)
+        if c is not None:
+            self._leave(c)
+            self.written["dropped"] += c.dropped
+
+    def report(self):
+        dropped = self.written["dropped"] + sum(c.dropped for c in self.clients.values())
+        return (f"[STREAM] udp {self.bind}:{self.port} clients={len(self.clients)} "
+                f"packets={self.written['packets']} dropped={dropped} busy={self.written['busy']} "
+                f"bad={self.written['bad']}")
+
+
+# -----------------------------
+# Client
+# -----------------------------
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print("usage: python telemetry_stream.py <car host> [port] [rate_hz] [minmax|decimate]")
+        raise SystemExit(2)
+    host = argv[0]
+    port = int(argv[1]) if len(argv) > 1 else DEFAULT_PORT
+    rate = float(argv[2]) if len(argv) > 2 else 10
+    reduce = argv[3] if len(argv) > 3 else "minmax"
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(0.5)
+    request = subscribe_request(rate, STREAMS, reduce)
+    renew = 0.0
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= renew:
+                sock.sendto(request, (host, port))
+                renew = now + LEASE_SEC / 2
+            try:
+                data, _ = sock.recvfrom(MAX_DATAGRAM)
+            except socket.timeout:
+                continue
+            msg = json.loads(data)
+            if "op" in msg:
+                print(f"[{msg['op']}] {msg}")
+                continue
+            state = msg.get("state") or {}
+            lidar = msg.get("lidar") or {}
+            motor = msg.get("motor") or {}
+            print(f"{msg['seq']:6d} mode={state.get('mode')} armed={state.get('armed')} "
+                  f"dist={lidar.get('last')} [{lidar.get('min')}..{lidar.get('max')}] n={lidar.get('n')} "
+                  f"L={motor.get('left')} R={motor.get('right')}")
+    except KeyboardInterrupt:
+        sock.sendto(unsubscribe_request(), (host, port))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ import time
 import serial
 import threading
 
+from tfluna import TFLunaParser, CONTINUOUS_MODE_COMMAND
+
 # -----------------------------
 # Motor GPIO Pins
 # -----------------------------
@@ -20,7 +22,6 @@ IN4 = 26
 # -----------------------------
 LIDAR_PORT = "/dev/serial0"
 LIDAR_BAUD = 115200
-CONTINUOUS_MODE_COMMAND = bytes([0x5A, 0x05, 0x07, 0x01, 0x00, 0x66])
 
 STOP_DISTANCE_CM = 35
 LIDAR_TIMEOUT_SEC = 0.25  # if data older than this, treat as stale
@@ -55,36 +56,6 @@ def set_motor(ena, in1, in2, speed):
 def map_axis_to_duty(value):
     return int(value * 100)
 
-# -----------------------------
-# TF-Luna reader (robust sync)
-# -----------------------------
-def read_tfluna_frame_sync(ser):
-    b = ser.read(1)
-    if not b:
-        return None
-
-    while b[0] != 0x59:
-        b = ser.read(1)
-        if not b:
-            return None
-
-    b2 = ser.read(1)
-    if not b2 or b2[0] != 0x59:
-        return None
-
-    payload = ser.read(7)
-    if len(payload) != 7:
-        return None
-
-    frame = bytes([0x59, 0x59]) + payload
-    chk = sum(frame[:8]) & 0xFF
-    if chk != frame[8]:
-        return None
-
-    dist_cm = frame[2] + (frame[3] << 8)
-    strength = frame[4] + (frame[5] << 8)
-    return dist_cm, strength
-
 # Shared LiDAR state
 lidar_lock = threading.Lock()
 lidar_dist_cm = None
@@ -107,15 +78,18 @@ def lidar_thread_fn():
     ser.flush()
     time.sleep(0.1)
 
+    parser = TFLunaParser()
+    parser_bad = 0
+
     while not stop_threads:
-        out = read_tfluna_frame_sync(ser)
+        frames = parser.read(ser)
         with lidar_lock:
-            if out:
-                lidar_ok += 1
-                lidar_dist_cm, lidar_strength = out
+            if frames:
+                lidar_ok += len(frames)
+                lidar_dist_cm, lidar_strength, _temp = frames[-1]
                 lidar_last_time = time.time()
-            else:
-                lidar_bad += 1
+            lidar_bad += parser.bad - parser_bad
+        parser_bad = parser.bad
 
     ser.close()
 
@@ -0,0 +1,211 @@
+# tfluna.py
+#
+# TF-Luna UART protocol helpers shared by every script that talks to the sensor.
+#
+# Frame layout (9 bytes, little endian):
+#   0x59 0x59 | dist_L dist_H | strength_L strength_H | temp_L temp_H | checksum
+#   checksum = sum(bytes 0..7) & 0xFF
+#
+# TFLunaParser replaces the old byte-at-a-time read_tfluna_frame_sync():
+# - reads whatever the UART already has buffered in ONE ser.read() call
+# - keeps the bytes in a reusable bytearray (no bytes([...]) + payload per frame)
+# - finds every 0x59 0x59 header in the chunk and returns all complete frames
+# - counts resyncs / checksum errors so "OK/Bad" still means something
+# - picks command responses (0x5A ..., see tfluna_commands.py) out of the
+#   bytes between frames into parser.responses
+#
+# Responses only show up in the skip path (bytes that aren't a frame), so
+# the frame path costs the same as before. A response that contains a
+# 0x59 0x59 pair is lost to the frame search (no command we send gets one).
+
+import struct
+from collections import deque
+
+FRAME_HEADER = b"\x59\x59"
+FRAME_LEN = 9
+
+# Command / response framing (tfluna_commands.py): 0x5A | len | id | payload | checksum
+COMMAND_HEADER = 0x5A
+RESPONSE_MIN_LEN = 4
+RESPONSE_MAX_LEN = 8
+
+# Output enable (tfluna_commands.set_output(True))
+CONTINUOUS_MODE_COMMAND = bytes([0x5A, 0x05, 0x07, 0x01, 0x67])
+
+# unpack_from reads straight out of the bytearray, nothing is sliced or copied
+_header_bytes = struct.Struct("<8B").unpack_from
+_payload = struct.Struct("<HHH").unpack_from
+
+
+def encode_frame(dist_cm, strength, temp_c=25.0):
+    """Build one valid 9-byte frame (used by benchmarks and the simulator)."""
+    dist_cm = max(0, min(0xFFFF, int(dist_cm)))
+    strength = max(0, min(0xFFFF, int(strength)))
+    temp_raw = max(0, min(0xFFFF, int(round((temp_c + 256) * 8))))
+    frame = bytearray(FRAME_LEN)
+    frame[0] = 0x59
+    frame[1] = 0x59
+    frame[2] = dist_cm & 0xFF
+    frame[3] = dist_cm >> 8
+    frame[4] = strength & 0xFF
+    frame[5] = strength >> 8
+    frame[6] = temp_raw & 0xFF
+    frame[7] = temp_raw >> 8
+    frame[8] = sum(frame[:8]) & 0xFF
+    return bytes(frame)
+
+
+class TFLunaParser:
+    """Incremental TF-Luna frame parser.
+
+    Feed it raw chunks (or let it read the serial port itself) and it returns
+    a list of (dist_cm, strength, temp_c) tuples for every complete, valid
+    frame found. Partial frames are kept for the next call.
+    """
+
+    def __init__(self, bufsize=4096):
+        if bufsize < FRAME_LEN + RESPONSE_MAX_LEN:
+            raise ValueError("bufsize too small")
+        self._buf = bytearray(bufsize)
+        self._start = 0     # first unparsed byte
+        self._end = 0       # one past the last valid byte
+
+        self.frames_ok = 0
+        self.checksum_errors = 0
+        self.resyncs = 0          # times we had to throw bytes away to find a header
+        self.bytes_skipped = 0
+        self.responses = deque(maxlen=64)   # (command id, payload) from the sensor, oldest first
+
+    @property
+    def bad(self):
+        """Everything that did not turn into a frame (for OK/Bad style prints)."""
+        return self.checksum_errors + self.resyncs
+
+    def reset(self):
+        self._start = 0
+        self._end = 0
+
+    def read(self, ser):
+        """One serial read of everything waiting, parsed.
+
+        If nothing is waiting, block for up to one frame (ser.timeout) so the
+        reader thread does not spin.
+        """
+        data = self.read_bytes(ser)
+        if not data:
+            return []
+        return self.feed(data)
+
+    @staticmethod
+    def read_bytes(ser):
+        """The serial half of read(): raw bytes, not parsed yet."""
+        n = ser.in_waiting
+        return ser.read(n if n else FRAME_LEN)
+
+    def feed(self, data):
+        """Append raw bytes and return every complete frame now available."""
+        out = []
+        view = memoryview(data)
+        pos = 0
+        total = len(view)
+        cap = len(self._buf)
+        while pos < total:
+            self._make_room()
+            n = min(total - pos, cap - self._end)
+            self._buf[self._end:self._end + n] = view[pos:pos + n]
+            self._end += n
+            pos += n
+            self._parse(out)
+        return out
+
+    def _make_room(self):
+        # Slide the (at most FRAME_LEN or RESPONSE_MAX_LEN - 1 bytes of) leftover to the front.
+        start = self._start
+        if start == 0:
+            return
+        end = self._end
+        if end > start:
+            mv = memoryview(self._buf)
+            mv[0:end - start] = mv[start:end]
+            mv.release()
+        self._end = end - start
+        self._start = 0
+
+    def _parse(self, out):
+        b = self._buf
+        i = self._start
+        end = self._end
+        header_bytes = _header_bytes
+        payload = _payload
+
+        while True:
+            j = b.find(FRAME_HEADER, i, end)
+            if j < 0:
+                # Keep a trailing 0x59, it may be the first half of a header
+                keep = end - 1 if (end > i and b[end - 1] == 0x59) else end
+                if keep > i:
+                    if b.find(COMMAND_HEADER, i, keep) < 0:
+                        self.resyncs += 1
+                        self.bytes_skipped += keep - i
+                        i = keep
+                    else:
+                        i = self._skip(b, i, keep, True)
+                break
+
+            if j > i:
+                if b.find(COMMAND_HEADER, i, j) < 0:
+                    self.resyncs += 1
+                    self.bytes_skipped += j - i
+                else:
+                    self._skip(b, i, j, False)
+
+            if j + FRAME_LEN > end:
+                i = j           # partial frame, wait for more bytes
+                break
+
+            if (sum(header_bytes(b, j)) & 0xFF) != b[j + 8]:
+                # False header (e.g. 0x59 inside a payload) - rescan one byte later
+                self.checksum_errors += 1
+                i = j + 1
+                continue
+
+            dist, strength, temp_raw = payload(b, j + 2)
+            out.append((dist, strength, temp_raw / 8.0 - 256))
+            self.frames_ok += 1
+            i = j + FRAME_LEN
+
+        if i >= end:
+            self._start = 0
+            self._end = 0
+        else:
+            self._start = i
+
+    def _skip(self, b, i, j, tail):
+        """b[i:j] holds no frame: collect the responses in it, count the rest as skipped.
+
+        tail: j is the end of the data, so a response still arriving is kept.
+        Returns where parsing resumes (j, or the start of that response).
+        """
+        junk = 0
+        while i < j:
+            k = b.find(COMMAND_HEADER, i, j)
+            if k < 0:
+                junk += j - i
+                i = j
+                break
+            junk += k - i
+            n = b[k + 1] if k + 1 < j else 0
+            if tail and (k + 1 == j or RESPONSE_MIN_LEN <= n <= RESPONSE_MAX_LEN and k + n > j):
+                i = k
+                break
+            if (n < RESPONSE_MIN_LEN or n > RESPONSE_MAX_LEN or k + n > j
+                    or sum(b[k:k + n - 1]) & 0xFF != b[k + n - 1]):
+                junk += 1
+                i = k + 1
+                continue
+            self.responses.append((b[k + 2], bytes(b[k + 3:k + n - 1])))
+            i = k + n
+        if junk:
+            self.resyncs += 1
+            self.bytes_skipped += junk
+        return i
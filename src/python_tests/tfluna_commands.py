@@ -0,0 +1,259 @@
+# tfluna_commands.py
+#
+# TF-Luna configuration commands, their responses, and the frame-rate policy.
+#
+# Command layout (little endian):
+#   0x5A | len | id | payload... | checksum
+#   len = whole command in bytes, checksum = sum(bytes before it) & 0xFF
+#
+# The sensor answers on the same UART, in between its data frames, with a
+# response of the same layout and id: an echo of the payload for settings
+# (frame rate, output format, output on/off), a status byte (0 = ok) for
+# actions (save, reset, restore), the firmware version for get_version().
+# TFLunaParser picks the responses out of the stream (parser.responses), so
+# the reader that owns the port keeps reading; TFLunaCommander writes the
+# commands from the control loop and matches the responses in poll().
+#
+# The frame rate is only in RAM until save_settings(). The manual asks for
+# rates that divide 500 (FRAME_RATES); 0 is trigger mode (one frame per
+# trigger()).
+#
+# FrameRatePolicy picks the rate for what the car is doing: slow while
+# disarmed (fewer frames to parse for nothing), fast enough for a sample
+# every cm_per_frame of wheel travel while driving, never under the mode's
+# floor. Faster at once, slower only after hold_sec, so it doesn't flap.
+#
+# tfluna_emulator.py speaks the other end of this protocol (simulator, pty).
+
+from tfluna import COMMAND_HEADER
+
+# Command ids
+CMD_GET_VERSION = 0x01
+CMD_SOFT_RESET = 0x02
+CMD_FRAME_RATE = 0x03
+CMD_TRIGGER = 0x04
+CMD_OUTPUT_FORMAT = 0x05
+CMD_OUTPUT_ENABLE = 0x07
+CMD_RESTORE_DEFAULTS = 0x10
+CMD_SAVE_SETTINGS = 0x11
+
+# Output formats
+FORMAT_CM = 0x01        # 9-byte frames, distance in cm (what TFLunaParser expects)
+FORMAT_PIX = 0x02       # ASCII metres, "1.23\r\n"
+FORMAT_MM = 0x06        # 9-byte frames, distance in mm
+
+FRAME_RATES = (1, 2, 4, 5, 10, 20, 25, 50, 100, 125, 250)   # Hz, 500 / n
+DEFAULT_FRAME_RATE = 100
+
+ACK_TIMEOUT_SEC = 0.1       # a response normally takes a frame or two
+ACK_RETRIES = 2
+
+# Commands that answer with a status byte instead of an echo
+_STATUS_COMMANDS = (CMD_SOFT_RESET, CMD_RESTORE_DEFAULTS, CMD_SAVE_SETTINGS)
+
+COMMAND_NAMES = {
+    CMD_GET_VERSION: "get_version", CMD_SOFT_RESET: "soft_reset", CMD_FRAME_RATE: "frame_rate",
+    CMD_TRIGGER: "trigger", CMD_OUTPUT_FORMAT: "output_format", CMD_OUTPUT_ENABLE: "output_enable",
+    CMD_RESTORE_DEFAULTS: "restore_defaults", CMD_SAVE_SETTINGS: "save_settings",
+}
+
+
+# -----------------------------
+# Commands
+# -----------------------------
+def checksum(data):
+    return sum(data) & 0xFF
+
+
+def command(cmd_id, payload=b""):
+    """One complete command (or response): header, length, id, payload, checksum."""
+    out = bytearray((COMMAND_HEADER, len(payload) + 4, cmd_id))
+    out += payload
+    out.append(checksum(out))
+    return bytes(out)
+
+
+def get_version():
+    return command(CMD_GET_VERSION)
+
+
+def soft_reset():
+    return command(CMD_SOFT_RESET)
+
+
+def set_frame_rate(hz):
+    """hz: 0 (trigger mode) .. 250; see FRAME_RATES."""
+    hz = int(hz)
+    if not 0 <= hz <= FRAME_RATES[-1]:
+        raise ValueError(f"frame rate {hz} Hz out of range 0..{FRAME_RATES[-1]}")
+    return command(CMD_FRAME_RATE, hz.to_bytes(2, "little"))
+
+
+def trigger():
+    return command(CMD_TRIGGER)
+
+
+def set_output_format(fmt):
+    if fmt not in (FORMAT_CM, FORMAT_PIX, FORMAT_MM):
+        raise ValueError(f"unknown output format {fmt:#x}")
+    return command(CMD_OUTPUT_FORMAT, bytes((fmt,)))
+
+
+def set_output(enabled):
+    return command(CMD_OUTPUT_ENABLE, bytes((1 if enabled else 0,)))
+
+
+def save_settings():
+    return command(CMD_SAVE_SETTINGS)
+
+
+def restore_defaults():
+    return command(CMD_RESTORE_DEFAULTS)
+
+
+def parse_command(data):
+    """(id, payload) of one complete command/response, or None if it isn't one."""
+    if len(data) < 4 or data[0] != COMMAND_HEADER or data[1] != len(data):
+        return None
+    if checksum(data[:-1]) != data[-1]:
+        return None
+    return data[2], bytes(data[3:-1])
+
+
+def response_ok(cmd, payload):
+    """Does a response payload confirm this command (as sent)?"""
+    cmd_id = cmd[2]
+    if cmd_id in _STATUS_COMMANDS:
+        return payload == b"\x00"
+    if cmd_id == CMD_GET_VERSION:
+        return len(payload) == 3
+    return payload == cmd[3:-1]
+
+
+def format_version(payload):
+    return ".".join(str(v) for v in reversed(payload))
+
+
+# -----------------------------
+# Sending + acknowledgements
+# -----------------------------
+class TFLunaCommander:
+    """Writes commands to the LiDAR port and matches them with the sensor's responses.
+
+    responses: the reader's TFLunaParser.responses deque (appended by
+    whichever thread reads the port, drained here). One command per id is
+    outstanding; sending the same id again supersedes it.
+    """
+
+    def __init__(self, ser, responses, clock, timeout=ACK_TIMEOUT_SEC, retries=ACK_RETRIES, log=print):
+        self.ser = ser
+        self.responses = responses
+        self.clock = clock
+        self.timeout = timeout
+        self.retries = retries
+        self.log = log
+
+        self.pending = {}       # id -> [command, sent t, tries]
+        self.confirmed = {}     # id -> (command, response payload, t) of the last confirmed one
+        self.sent = 0
+        self.acked = 0
+        self.failed = 0
+        self.stray = 0          # responses nothing was waiting for (or not matching it)
+
+    def send(self, cmd, now=None):
+        now = self.clock.monotonic() if now is None else now
+        self.ser.write(cmd)
+        self.sent += 1
+        if cmd[2] != CMD_TRIGGER:       # answered with a frame, not a response
+            self.pending[cmd[2]] = [cmd, now, 1]
+
+    def poll(self, now):
+        """Match the responses received so far; resend (or give up on) overdue commands."""
+        responses = self.responses
+        pending = self.pending
+        while responses:
+            cmd_id, payload = responses.popleft()
+            p = pending.get(cmd_id)
+            if p is None or not response_ok(p[0], payload):
+                self.stray += 1
+                continue
+            del pending[cmd_id]
+            self.confirmed[cmd_id] = (p[0], payload, now)
+            self.acked += 1
+        for cmd_id, p in list(pending.items()):
+            if now - p[1] < self.timeout:
+                continue
+            name = COMMAND_NAMES.get(cmd_id, hex(cmd_id))
+            if p[2] > self.retries:
+                del pending[cmd_id]
+                self.failed += 1
+                self.log(f"[LIDAR] no response to {name} ({p[0].hex(' ')}) after {p[2]} tries")
+                continue
+            self.ser.write(p[0])
+            self.sent += 1
+            p[1] = now
+            p[2] += 1
+
+    def report(self):
+        return f"[LIDAR] commands sent={self.sent} acked={self.acked} failed={self.failed} stray={self.stray}"
+
+
+# -----------------------------
+# Frame-rate policy
+# -----------------------------
+def supported_rate(hz, rates=FRAME_RATES):
+    """The lowest supported rate >= hz (the highest one if none is)."""
+    for r in rates:
+        if r >= hz:
+            return r
+    return rates[-1]
+
+
+class FrameRatePolicy:
+    def __init__(self, idle_hz, mode_min_hz, cm_per_frame, hold_sec, rates=FRAME_RATES):
+        """mode_min_hz: {mode: floor while armed in it}."""
+        self.idle_hz = idle_hz
+        self.mode_min_hz = mode_min_hz
+        self.cm_per_frame = cm_per_frame
+        self.hold_sec = hold_sec
+        self.rates = rates
+        self.reset()
+
+    def reset(self):
+        self.rate = None        # last rate asked for (None: not set yet)
+        self.lower_since = None
+
+    def wanted(self, armed, mode, cm_s):
+        """Supported rate for this state; cm_s: fastest commanded wheel speed."""
+        if not armed:
+            hz = self.idle_hz
+        else:
+            hz = max(self.mode_min_hz.get(mode, 0), abs(cm_s) / self.cm_per_frame if self.cm_per_frame > 0 else 0)
+        return supported_rate(hz, self.rates)
+
+    def hold(self, hz):
+        """Fixed rate instead (adaptive off): the rate to switch to, or None."""
+        hz = supported_rate(hz, self.rates)
+        self.lower_since = None
+        if hz == self.rate:
+            return None
+        self.rate = hz
+        return hz
+
+    def update(self, now, armed, mode, cm_s):
+        """The rate to switch to now, or None to keep the current one."""
+        hz = self.wanted(armed, mode, cm_s)
+        if self.rate is None or hz > self.rate:
+            self.rate = hz
+            self.lower_since = None
+            return hz
+        if hz == self.rate:
+            self.lower_since = None
+            return None
+        if self.lower_since is None:
+            self.lower_since = now
+        if now - self.lower_since < self.hold_sec:
+            return None
+        self.rate = hz
+        self.lower_since = None
+        return hz
@@ -0,0 +1,225 @@
+# tfluna_emulator.py
+#
+# The TF-Luna's side of the UART protocol, for testing without the sensor.
+#
+# TFLunaEmulator keeps the sensor's settings (frame rate, output format,
+# output on/off, what's saved) and turns command bytes into response bytes
+# and distances into output bytes, exactly as tfluna.py / tfluna_commands.py
+# expect them from the real thing. It knows nothing about time:
+#   - sim.SimTFLuna drives it in virtual time
+#   - PtyTFLuna runs it on a pty in real time, so pyserial (and anything on
+#     top of it: the control loop, tf_luna_force_stream.py) talks to it like
+#     to /dev/serial0
+#
+# Commands with a bad checksum or an unknown id get no response, like on the
+# sensor; they are counted.
+#
+# Usage (prints the pty to point LIDAR_PORT at, streams until Ctrl+C):
+#   python tfluna_emulator.py [distance cm]
+
+import os
+import select
+import sys
+import threading
+import time
+import tty
+
+from tfluna import COMMAND_HEADER, RESPONSE_MAX_LEN, RESPONSE_MIN_LEN, encode_frame
+from tfluna_commands import (
+    CMD_FRAME_RATE, CMD_GET_VERSION, CMD_OUTPUT_ENABLE, CMD_OUTPUT_FORMAT, CMD_RESTORE_DEFAULTS,
+    CMD_SAVE_SETTINGS, CMD_SOFT_RESET, CMD_TRIGGER, DEFAULT_FRAME_RATE, FORMAT_CM, FORMAT_MM,
+    FORMAT_PIX, FRAME_RATES, command, parse_command,
+)
+
+FIRMWARE_VERSION = (3, 3, 0)        # major, minor, patch
+
+
+class TFLunaEmulator:
+    def __init__(self, rate_hz=DEFAULT_FRAME_RATE):
+        """rate_hz: the saved (power-on) frame rate."""
+        self.factory = {"rate_hz": DEFAULT_FRAME_RATE, "fmt": FORMAT_CM, "enabled": True}
+        self.saved = dict(self.factory, rate_hz=rate_hz)
+        self.rate_hz = rate_hz
+        self.fmt = FORMAT_CM
+        self.enabled = True
+        self.load(self.saved)
+
+        self.triggers = 0           # frames owed for trigger commands (trigger mode)
+        self.commands = 0
+        self.ignored = 0            # bad checksum / unknown id / malformed
+        self._rx = bytearray()
+
+    def load(self, settings):
+        self.rate_hz = settings["rate_hz"]
+        self.fmt = settings["fmt"]
+        self.enabled = settings["enabled"]
+
+    def settings(self):
+        return {"rate_hz": self.rate_hz, "fmt": self.fmt, "enabled": self.enabled}
+
+    @property
+    def period(self):
+        """Seconds between frames; None in trigger mode (rate 0)."""
+        return 1.0 / self.rate_hz if self.rate_hz else None
+
+    # ---- host -> sensor ----
+    def receive(self, data):
+        """Bytes written by the host; returns the response bytes to send back."""
+        rx = self._rx
+        rx += data
+        out = bytearray()
+        while True:
+            k = rx.find(COMMAND_HEADER)
+            if k < 0:
+                self.ignored += bool(rx)
+                rx.clear()
+                break
+            if k:
+                self.ignored += 1
+                del rx[:k]
+            if len(rx) < 2:
+                break
+            n = rx[1]
+            if not RESPONSE_MIN_LEN <= n <= RESPONSE_MAX_LEN:
+                self.ignored += 1
+                del rx[:1]
+                continue
+            if len(rx) < n:
+                break
+            parsed = parse_command(bytes(rx[:n]))
+            if parsed is None:
+                self.ignored += 1
+                del rx[:1]
+                continue
+            del rx[:n]
+            out += self.handle(*parsed)
+        return bytes(out)
+
+    def handle(self, cmd_id, payload):
+        """One valid command -> its response (b"" if it has none)."""
+        self.commands += 1
+        if cmd_id == CMD_GET_VERSION and not payload:
+            major, minor, patch = FIRMWARE_VERSION
+            return command(cmd_id, bytes((patch, minor, major)))
+        if cmd_id == CMD_FRAME_RATE and len(payload) == 2:
+            hz = int.from_bytes(payload, "little")
+            if hz <= FRAME_RATES[-1]:
+                self.rate_hz = hz
+                return command(cmd_id, payload)
+        elif cmd_id == CMD_OUTPUT_FORMAT and len(payload) == 1 and payload[0] in (FORMAT_CM, FORMAT_PIX, FORMAT_MM):
+            self.fmt = payload[0]
+            return command(cmd_id, payload)
+        elif cmd_id == CMD_OUTPUT_ENABLE and len(payload) == 1 and payload[0] in (0, 1):
+            self.enabled = bool(payload[0])
+            return command(cmd_id, payload)
+        elif cmd_id == CMD_TRIGGER and not payload:
+            self.triggers += 1
+            return b""
+        elif cmd_id == CMD_SAVE_SETTINGS and not payload:
+            self.saved = self.settings()
+            return command(cmd_id, b"\x00")
+        elif cmd_id == CMD_SOFT_RESET and not payload:
+            self.load(self.saved)
+            return command(cmd_id, b"\x00")
+        elif cmd_id == CMD_RESTORE_DEFAULTS and not payload:
+            self.saved = dict(self.factory)
+            self.load(self.saved)
+            return command(cmd_id, b"\x00")
+        self.commands -= 1
+        self.ignored += 1
+        return b""
+
+    # ---- sensor -> host ----
+    def output(self, dist_cm, strength, temp_c=25.0):
+        """One measurement in the current output format (b"" while output is off)."""
+        if not self.enabled:
+            return b""
+        if self.fmt == FORMAT_MM:
+            return encode_frame(dist_cm * 10, strength, temp_c)
+        if self.fmt == FORMAT_PIX:
+            return f"{dist_cm / 100.0:.2f}\r\n".encode()
+        return encode_frame(dist_cm, strength, temp_c)
+
+
+class PtyTFLuna:
+    """A TFLunaEmulator on the far end of a pty, in real time."""
+
+    def __init__(self, emulator=None, distance=lambda t: 100.0, strength=3000):
+        """distance(t): cm at t seconds after start()."""
+        self.emulator = emulator if emulator is not None else TFLunaEmulator()
+        self.distance = distance
+        self.strength = strength
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)          # no echo of our own output before the host opens it
+        self.name = os.ttyname(self.slave)
+        self.frames_sent = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tfluna-emulator", daemon=True)
+
+    def open(self, baud=115200, timeout=0.05):
+        import serial
+        return serial.Serial(self.name, baud, timeout=timeout)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def _run(self):
+        em = self.emulator
+        t0 = time.monotonic()
+        next_t = t0
+        while not self._stop.is_set():
+            now = time.monotonic()
+            period = em.period
+            if period is None:
+                wait = 0.0 if em.triggers else 0.05
+            else:
+                wait = max(0.0, next_t - now)
+            if select.select([self.master], [], [], wait)[0]:
+                out = em.receive(os.read(self.master, 256))
+                if out:
+                    os.write(self.master, out)
+                if period is None and em.period is not None:
+                    next_t = time.monotonic()       # left trigger mode: stream from now
+                continue
+            now = time.monotonic()
+            due = 0
+            if period is None:
+                due, em.triggers = em.triggers, 0
+            elif now >= next_t:
+                due = 1
+                next_t += period
+                if next_t < now:
+                    next_t = now + period           # fell behind (stopped, busy host): don't burst
+            for _ in range(due):
+                data = em.output(self.distance(now - t0), self.strength, 40.0)
+                if data:
+                    os.write(self.master, data)
+                    self.frames_sent += 1
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    dist = float(argv[0]) if argv else 100.0
+    pty = PtyTFLuna(distance=lambda t: dist).start()
+    print(f"TF-Luna emulator on {pty.name} ({dist:.0f} cm). Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1.0)
+            em = pty.emulator
+            print(f"  rate={em.rate_hz} Hz output={'on' if em.enabled else 'off'} fmt={em.fmt:#04x} "
+                  f"frames={pty.frames_sent} commands={em.commands} ignored={em.ignored}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pty.close()
+
+
+if __name__ == "__main__":
+    main()
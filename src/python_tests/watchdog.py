@@ -0,0 +1,124 @@
+# watchdog.py
+#
+# Motor watchdog: cuts the PWM if the control loop stops ticking.
+#
+# The loop only writes the motors when a tick runs, so if it blocks (a slow
+# print, pygame hanging in a Bluetooth reconnect, a long GC pause) the last
+# duty stays applied and the car keeps driving until something returns.
+#
+# The loop feeds a heartbeat every tick. A separate thread sleeps until the
+# heartbeat's deadline (fed + timeout); if no newer heartbeat came in by then
+# it trips: both ENA/ENB duties are zeroed straight on the pins, bypassing
+# the loop and motor_output's cache. The next feed() (the loop running
+# again) hands the trip to the loop, which disarms and re-syncs its outputs.
+#
+# Each trip is recorded with its reaction time (deadline -> duty zeroed)
+# and, once the loop is back, how long it was stalled.
+#
+# The thread only runs in real time. In the simulator, virtual time passes
+# inside clock.sleep(), and the simulator calls check() at every physics
+# step instead (sim.SimClock.watch()), so injected stalls trip
+# deterministically.
+
+import threading
+from collections import namedtuple
+
+from loop_timing import Histogram
+
+IDLE_POLL_SEC = 0.25        # re-check period while disabled (timeout 0) or not fed yet
+
+# t: when the duty was zeroed, fed: last heartbeat before it, reaction: t - (fed + timeout)
+Trip = namedtuple("Trip", "t fed reaction")
+
+
+class Watchdog:
+    def __init__(self, clock, timeout, cut, on_trip=None):
+        """cut(): zero the motor outputs (called from the watchdog thread).
+
+        on_trip(trip): also called from the watchdog thread; must not block.
+        timeout 0 disables the watchdog.
+        """
+        self.clock = clock
+        self.timeout = timeout
+        self.cut = cut
+        self.on_trip = on_trip
+
+        self.fed = None         # last heartbeat; None until the loop's first tick
+        self.tripped = False
+        self.trips = []
+        self.reaction = Histogram()     # ns, deadline -> duty zeroed
+        self.longest_stall = 0.0        # s, last heartbeat before a trip -> the next one
+        self._pending = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def feed(self, now):
+        """Heartbeat. Returns (trip, stalled seconds) if it tripped since the last one, else None."""
+        with self._lock:
+            fed = self.fed
+            self.fed = now
+            trip = self._pending
+            self._pending = None
+            self.tripped = False
+        if trip is None:
+            return None
+        stalled = now - fed
+        self.longest_stall = max(self.longest_stall, stalled)
+        return trip, stalled
+
+    def check(self, now):
+        """Trip if the heartbeat is overdue at now; returns the seconds until it would be."""
+        with self._lock:
+            if self.fed is None or self.tripped or self.timeout <= 0:
+                return IDLE_POLL_SEC if self.timeout <= 0 else self.timeout
+            due = self.fed + self.timeout - now
+            if due > 0:
+                return due
+        self.trip(now)
+        return self.timeout
+
+    def trip(self, now):
+        """Cut the motors now (also used by replay for recorded trips)."""
+        self.cut()
+        with self._lock:
+            t = max(now, self.clock.monotonic())
+            fed = self.fed if self.fed is not None else t
+            trip = Trip(t, fed, max(0.0, t - fed - self.timeout))
+            self.tripped = True
+            self._pending = trip
+            self.trips.append(trip)
+        self.reaction.record(int(trip.reaction * 1e9))
+        if self.on_trip is not None:
+            self.on_trip(trip)
+        return trip
+
+    # ---- real-time thread ----
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread; nothing trips again until the next feed()."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self.fed = None
+
+    def _run(self):
+        delay = self.timeout if self.timeout > 0 else IDLE_POLL_SEC
+        while not self._stop.wait(delay):
+            delay = self.check(self.clock.monotonic())
+
+    def report(self):
+        if self.timeout <= 0:
+            return "[WATCHDOG] off"
+        msg = f"[WATCHDOG] timeout={self.timeout * 1000:.0f} ms trips={len(self.trips)}"
+        r = self.reaction
+        if r.count:
+            msg += (f" reaction p50={r.percentile(50) / 1e6:.2f} ms max={r.max / 1e6:.2f} ms"
+                    f" longest stall={self.longest_stall * 1000:.0f} ms")
+        return msg
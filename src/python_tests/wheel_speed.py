@@ -0,0 +1,251 @@
+# wheel_speed.py
+#
+# Closed-loop wheel speed control: encoder feedback + one PID per side.
+#
+# Open loop, a motor command is a duty (speed * 2.55), so the wheel speed it
+# gives changes with battery voltage, load and floor - AUTO's 60 is a
+# different speed every run. With SPEED_CONTROL on, the speeds the mode logic
+# asks for become wheel speed targets (speed / MAX_SPEED * FULL_SPEED_CM_S,
+# the same scale forward_cm_s() and the odometry use) and SpeedControl turns
+# them into motor commands:
+#
+#   command = feed-forward   the calibrated duty -> speed table, inverted
+#           + PID            on target - measured (encoder counts per tick)
+#
+# The feed-forward does most of the work (and jumps the static-friction
+# dead band), so the PID only trims what the table gets wrong today.
+# Anti-windup: the integral only moves while the output is not saturated,
+# or when the error pulls it back out, so a wheel held against a wall does
+# not wind up a lurch for when it comes free. The derivative acts on the
+# measurement, not the error, so target steps don't kick. A zero target is
+# a plain stop (command 0, PID reset), so the car never creeps at rest.
+#
+# Speeds and counts are signed like motor commands (+ = a positive command),
+# not like "forward"; FORWARD_IS_NEGATIVE is the caller's business.
+#
+# Calibration (wheels off the ground, pigpiod running):
+#   python wheel_speed.py [wheel_calibration.json]
+# drives both wheels through a command sweep and saves the table that
+# SPEED_CAL_FILE points to. Without one, the odometry's linear motor model
+# (ODOM_DEADBAND_PCT, FULL_SPEED_CM_S) is the table.
+
+import bisect
+import json
+import sys
+
+CAL_CMDS = tuple(range(0, 101, 5))
+CAL_SETTLE_SEC = 0.6        # per command: spin-up before measuring
+CAL_MEASURE_SEC = 1.0
+
+
+# -----------------------------
+# Duty -> speed table
+# -----------------------------
+class SpeedTable:
+    """Steady wheel speed (cm/s) per motor command, per side; symmetric in sign."""
+
+    def __init__(self, cmds, left_cm_s, right_cm_s):
+        self.cmds = [float(c) for c in cmds]
+        self.speeds = ([float(v) for v in left_cm_s], [float(v) for v in right_cm_s])
+        for side in self.speeds:
+            for i in range(1, len(side)):
+                side[i] = max(side[i], side[i - 1])     # measurement noise: keep it invertible
+
+    @classmethod
+    def model(cls, deadband_pct, full_speed_cm_s, max_cmd=100):
+        """The odometry motor model: nothing up to the dead band, then linear."""
+        db = deadband_pct * max_cmd / 100.0
+        cmds = [0.0, db, float(max_cmd)]
+        speeds = [0.0, 0.0, float(full_speed_cm_s)]
+        return cls(cmds, speeds, speeds)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            d = json.load(f)
+        return cls(d["cmd"], d["left_cm_s"], d["right_cm_s"])
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"cmd": self.cmds, "left_cm_s": self.speeds[0], "right_cm_s": self.speeds[1]}, f, indent=1)
+
+    def speed(self, side, cmd):
+        """Steady speed of side (0 left, 1 right) for a command."""
+        cmds = self.cmds
+        speeds = self.speeds[side]
+        c = abs(cmd)
+        i = bisect.bisect_left(cmds, c)
+        if i == 0:
+            v = speeds[0]
+        elif i == len(cmds):
+            v = speeds[-1]
+        else:
+            c0, c1 = cmds[i - 1], cmds[i]
+            v = speeds[i - 1] + (speeds[i] - speeds[i - 1]) * (c - c0) / (c1 - c0)
+        return v if cmd >= 0 else -v
+
+    def command(self, side, cm_s):
+        """Feed-forward: the command that should give cm_s on side (the lowest one, past the dead band)."""
+        if cm_s == 0:
+            return 0.0
+        cmds = self.cmds
+        speeds = self.speeds[side]
+        v = abs(cm_s)
+        i = bisect.bisect_left(speeds, v)
+        if i == len(speeds):
+            c = cmds[-1]
+        elif i == 0:
+            c = cmds[0]
+        else:
+            v0, v1 = speeds[i - 1], speeds[i]
+            c = cmds[i - 1] + (cmds[i] - cmds[i - 1]) * (v - v0) / (v1 - v0)
+        return c if cm_s > 0 else -c
+
+
+# -----------------------------
+# PID
+# -----------------------------
+class WheelPID:
+    """PID in motor-command units with conditional-integration anti-windup."""
+
+    def __init__(self, kp, ki, kd=0.0, limit=100.0):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.limit = limit
+        self.reset()
+
+    def reset(self):
+        self.i = 0.0
+        self.prev = None        # previous measurement (derivative on measurement)
+        self.saturated = False
+
+    def update(self, target, measured, ff, dt):
+        err = target - measured
+        d = 0.0
+        if self.kd and self.prev is not None and dt > 0:
+            d = -self.kd * (measured - self.prev) / dt
+        self.prev = measured
+
+        u = ff + self.kp * err + self.i + d
+        lim = self.limit
+        out = max(-lim, min(lim, u))
+        self.saturated = out != u
+        # Integrate unless that would push further into saturation
+        if not self.saturated or (u > lim) != (err > 0):
+            self.i = max(-lim, min(lim, self.i + self.ki * err * dt))
+        return out
+
+
+# -----------------------------
+# Speed control stage
+# -----------------------------
+class SpeedControl:
+    def __init__(self, encoders, table, counts_per_cm, kp, ki, kd=0.0, limit=100.0):
+        """encoders: hal.Encoders. table: SpeedTable."""
+        self.encoders = encoders
+        self.table = table
+        self.counts_per_cm = counts_per_cm
+        self.pid = (WheelPID(kp, ki, kd, limit), WheelPID(kp, ki, kd, limit))
+        self.t = None
+        self.counts = (0, 0)
+        self.dt = 0.0
+        self.measured = (0.0, 0.0)      # cm/s over the last tick, command sign
+        self.targets = (0.0, 0.0)
+
+    def reset(self):
+        """Forget the PID state (disarmed / stopped)."""
+        for pid in self.pid:
+            pid.reset()
+
+    def tune(self, kp, ki, kd=0.0):
+        for pid in self.pid:
+            pid.kp = kp
+            pid.ki = ki
+            pid.kd = kd
+
+    def measure(self, now):
+        """Read the encoders; returns the wheel speeds (cm/s) since the last call."""
+        counts = self.encoders.counts()
+        if self.t is None:
+            self.t = now
+            self.counts = counts
+            return self.measured
+        dt = now - self.t
+        if dt <= 0:
+            return self.measured
+        k = 1.0 / (self.counts_per_cm * dt)
+        self.measured = ((counts[0] - self.counts[0]) * k, (counts[1] - self.counts[1]) * k)
+        self.t = now
+        self.counts = counts
+        self.dt = dt
+        return self.measured
+
+    def update(self, left_cm_s, right_cm_s):
+        """Motor commands for these targets, from the last measure()."""
+        self.targets = (left_cm_s, right_cm_s)
+        out = []
+        for side, target in enumerate(self.targets):
+            pid = self.pid[side]
+            if target == 0:
+                pid.reset()
+                out.append(0)
+                continue
+            u = pid.update(target, self.measured[side], self.table.command(side, target), self.dt)
+            out.append(int(round(u)))
+        return out[0], out[1]
+
+
+# -----------------------------
+# Calibration
+# -----------------------------
+def calibrate(motor_out, encoders, clock, counts_per_cm, cmds=CAL_CMDS,
+              settle_sec=CAL_SETTLE_SEC, measure_sec=CAL_MEASURE_SEC, log=print):
+    """Drive both wheels at each command and measure their steady speed -> SpeedTable.
+
+    motor_out: motor_output.MotorOutput over the two channels (left, right).
+    """
+    left = []
+    right = []
+    try:
+        for cmd in cmds:
+            motor_out.drive(cmd, cmd)
+            clock.sleep(settle_sec)
+            c0 = encoders.counts()
+            t0 = clock.monotonic()
+            clock.sleep(measure_sec)
+            c1 = encoders.counts()
+            dt = clock.monotonic() - t0
+            vl = (c1[0] - c0[0]) / counts_per_cm / dt
+            vr = (c1[1] - c0[1]) / counts_per_cm / dt
+            left.append(abs(vl))
+            right.append(abs(vr))
+            log(f"[CAL] cmd={cmd:3d}  left={vl:6.1f} cm/s  right={vr:6.1f} cm/s")
+    finally:
+        motor_out.drive(0, 0)
+    return SpeedTable(cmds, left, right)
+
+
+def main(argv=None):
+    import rc_car_modes_bluetooth_fix_good as car
+    from hal import robot_hardware
+    from motor_output import MotorOutput
+
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv[0] if argv else car.SPEED_CAL_FILE
+    hw = robot_hardware(car.LIDAR_PORT, car.LIDAR_BAUD, car.encoder_pins())
+    hw.motors.open()
+    hw.encoders.open()
+    out = MotorOutput(hw.motors, [(car.ENA, car.IN1, car.IN2), (car.ENB, car.IN3, car.IN4)], hw.clock)
+    out.setup()
+    try:
+        table = calibrate(out, hw.encoders, hw.clock, car.ENCODER_COUNTS_PER_CM)
+    finally:
+        hw.encoders.close()
+        hw.motors.stop()
+    table.save(path)
+    print(f"[CAL] saved {path}")
+
+
+if __name__ == "__main__":
+    main()